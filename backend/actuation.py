@@ -0,0 +1,284 @@
+"""
+Pilotage asynchrone des relais de vannes.
+
+Les commandes ne touchent jamais le matériel dans le gestionnaire de
+requête : elles sont déposées dans une file par zone qui ne garde que le
+dernier état demandé (les commandes redondantes sont fusionnées), limitée
+en fréquence pour ne pas faire claquer les relais. Le worker de la zone
+applique l'état via un driver puis confirme l'état réel du relais.
+
+Priorité des commandes : une commande manuelle (/toggle-valve, /toggle-valve/bulk)
+pose une retenue sur la zone pendant ACTUATION_MANUAL_HOLD_SECONDS. Tant
+qu'elle court, les commandes automatiques (décisions des capteurs, programmes
+d'arrosage) sont ignorées : ni relais, ni comptage de l'eau. Une nouvelle
+commande manuelle repart pour une retenue complète ; à son expiration, la
+décision de la lecture suivante reprend la main. Avec une retenue de 0, les
+décisions pilotent toujours le relais.
+
+Un échec du driver (exception, ou relais relu dans un autre état) ne perd
+pas la commande : l'état demandé est gardé et réessayé après
+ACTUATION_RETRY_SECONDS, délai doublé à chaque échec jusqu'à
+ACTUATION_RETRY_MAX_SECONDS ; une commande plus récente le remplace.
+Chaque échec est signalé au rappel `on_failure`, qui l'enregistre dans
+l'état de la vanne jusqu'à la confirmation suivante.
+"""
+import asyncio
+import os
+import time
+from abc import ABC, abstractmethod
+from collections import deque
+from datetime import datetime
+from typing import Awaitable, Callable, Dict, Optional
+
+# Intervalle minimal entre deux commutations d'un même relais
+ACTUATION_MIN_INTERVAL_SECONDS = float(os.getenv("ACTUATION_MIN_INTERVAL_SECONDS", "2.0"))
+# Durée pendant laquelle une commande manuelle l'emporte sur les commandes automatiques
+ACTUATION_MANUAL_HOLD_SECONDS = float(os.getenv("ACTUATION_MANUAL_HOLD_SECONDS", "1800"))
+# Attente avant de réessayer une commande en échec, doublée à chaque échec jusqu'au maximum
+ACTUATION_RETRY_SECONDS = float(os.getenv("ACTUATION_RETRY_SECONDS", "1.0"))
+ACTUATION_RETRY_MAX_SECONDS = float(os.getenv("ACTUATION_RETRY_MAX_SECONDS", "60"))
+# Driver utilisé : "simulated" ou "gpio"
+VALVE_DRIVER = os.getenv("VALVE_DRIVER", "simulated")
+# Correspondance zone → broche BCM, ex: "zone-1:17,zone-2:27"
+VALVE_GPIO_PINS = os.getenv("VALVE_GPIO_PINS", "")
+
+
+class ValveDriver(ABC):
+    """Interface d'un driver de relais : applique un état et retourne l'état relu."""
+
+    @abstractmethod
+    async def apply(self, zone_id: str, is_open: bool) -> bool:
+        ...
+
+
+class SimulatedValveDriver(ValveDriver):
+    """Driver sans matériel, pour les tests et le développement."""
+
+    def __init__(self, latency_seconds: float = 0.05, fail_zones=()):
+        self.latency_seconds = latency_seconds
+        self.fail_zones = set(fail_zones)
+        self.relays: Dict[str, bool] = {}
+        self.switches = 0
+
+    async def apply(self, zone_id: str, is_open: bool) -> bool:
+        await asyncio.sleep(self.latency_seconds)
+        if zone_id not in self.fail_zones:
+            if self.relays.get(zone_id, False) != is_open:
+                self.switches += 1
+            self.relays[zone_id] = is_open
+        return self.relays.get(zone_id, False)
+
+
+class GpioValveDriver(ValveDriver):
+    """Relais sur GPIO Raspberry Pi ; les appels bloquants passent par un thread."""
+
+    def __init__(self, pins: Dict[str, int]):
+        import RPi.GPIO as GPIO  # Dépendance optionnelle, présente seulement sur la carte
+
+        self.gpio = GPIO
+        self.pins = pins
+        GPIO.setmode(GPIO.BCM)
+        for pin in pins.values():
+            GPIO.setup(pin, GPIO.OUT, initial=GPIO.LOW)
+
+    def _apply_blocking(self, pin: int, is_open: bool) -> bool:
+        self.gpio.output(pin, self.gpio.HIGH if is_open else self.gpio.LOW)
+        return bool(self.gpio.input(pin))
+
+    async def apply(self, zone_id: str, is_open: bool) -> bool:
+        pin = self.pins.get(zone_id)
+        if pin is None:
+            raise KeyError(f"Aucune broche GPIO configurée pour {zone_id}")
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, self._apply_blocking, pin, is_open)
+
+
+def parse_pins(spec: str) -> Dict[str, int]:
+    pins = {}
+    for item in filter(None, (part.strip() for part in spec.split(","))):
+        zone_id, _, pin = item.rpartition(":")
+        pins[zone_id] = int(pin)
+    return pins
+
+
+def create_driver() -> ValveDriver:
+    if VALVE_DRIVER == "gpio":
+        return GpioValveDriver(parse_pins(VALVE_GPIO_PINS))
+    return SimulatedValveDriver()
+
+
+ConfirmCallback = Callable[[str, bool, datetime], Awaitable[None]]
+# zone, état demandé, état du relais connu (None si inconnu), erreur, date
+FailureCallback = Callable[[str, bool, Optional[bool], str, datetime], Awaitable[None]]
+
+
+class ZoneActuator:
+    """File à une place d'une zone : seul le dernier état demandé est conservé."""
+
+    __slots__ = ("desired", "requested_at", "applying", "confirmed", "last_switch", "failed_attempts", "wakeup", "task")
+
+    def __init__(self):
+        self.desired: Optional[bool] = None
+        self.requested_at = 0.0  # Instant (monotonic) de la première commande en attente
+        self.applying: Optional[bool] = None  # État en cours d'application par le driver
+        self.confirmed: Optional[bool] = None
+        self.last_switch = float("-inf")
+        self.failed_attempts = 0  # Échecs consécutifs de la commande en cours
+        self.wakeup = asyncio.Event()
+        self.task: Optional[asyncio.Task] = None
+
+
+class ActuationManager:
+    def __init__(self, driver: ValveDriver, min_interval: float = ACTUATION_MIN_INTERVAL_SECONDS,
+                 manual_hold: float = ACTUATION_MANUAL_HOLD_SECONDS, retry: float = ACTUATION_RETRY_SECONDS,
+                 retry_max: float = ACTUATION_RETRY_MAX_SECONDS):
+        self.driver = driver
+        self.min_interval = min_interval
+        self.manual_hold = manual_hold
+        self.retry = retry
+        self.retry_max = retry_max
+        self.zones: Dict[str, ZoneActuator] = {}
+        self.holds: Dict[str, float] = {}  # Fin (monotonic) de la retenue manuelle par zone
+        self.on_confirm: Optional[ConfirmCallback] = None
+        self.on_failure: Optional[FailureCallback] = None
+        self.running = False
+        # Métriques
+        self.commands = 0
+        self.coalesced = 0
+        self.actuations = 0
+        self.failures = 0
+        self.retries = 0
+        self.overridden = 0  # Commandes automatiques ignorées pendant une retenue manuelle
+        self.latencies = deque(maxlen=1000)  # Commande → relais confirmé (secondes)
+
+    def start(self, on_confirm: Optional[ConfirmCallback] = None, on_failure: Optional[FailureCallback] = None) -> None:
+        self.on_confirm = on_confirm
+        self.on_failure = on_failure
+        self.running = True
+
+    async def stop(self) -> None:
+        self.running = False
+        tasks = [zone.task for zone in self.zones.values() if zone.task]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        # Files liées à la boucle arrêtée : recréées au prochain démarrage
+        self.zones.clear()
+
+    def hold(self, zone_id: str) -> None:
+        """Commande manuelle : les commandes automatiques de la zone sont ignorées pendant la retenue."""
+        if self.manual_hold > 0:
+            self.holds[zone_id] = time.monotonic() + self.manual_hold
+
+    def allows_automatic(self, zone_id: str) -> bool:
+        """False (et comptée) si une retenue manuelle court sur la zone."""
+        until = self.holds.get(zone_id)
+        if until is None:
+            return True
+        if until <= time.monotonic():
+            del self.holds[zone_id]
+            return True
+        self.overridden += 1
+        return False
+
+    def submit(self, zone_id: str, is_open: bool) -> None:
+        """Dépose une commande sans attendre le matériel."""
+        if not self.running:
+            return
+        zone = self.zones.get(zone_id)
+        if zone is None:
+            zone = self.zones[zone_id] = ZoneActuator()
+            zone.task = asyncio.create_task(self._run(zone_id, zone))
+        self.commands += 1
+        if zone.desired is not None:
+            # Une commande attend déjà : la nouvelle la remplace
+            self.coalesced += 1
+        else:
+            target = zone.confirmed if zone.applying is None else zone.applying
+            if is_open == target:
+                self.coalesced += 1
+                return
+            zone.requested_at = time.monotonic()
+        zone.desired = is_open
+        zone.wakeup.set()
+
+    async def _run(self, zone_id: str, zone: ZoneActuator) -> None:
+        while True:
+            await zone.wakeup.wait()
+            zone.wakeup.clear()
+
+            # Limiter la fréquence de commutation ; les commandes reçues
+            # pendant l'attente sont fusionnées dans `desired`
+            delay = zone.last_switch + self.min_interval - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+
+            desired, zone.desired = zone.desired, None
+            if desired is None or desired == zone.confirmed:
+                if zone.failed_attempts:
+                    # Commande en échec remplacée par l'état actuel du relais : plus rien à réessayer
+                    zone.failed_attempts = 0
+                    await self._notify(self.on_confirm, zone_id, zone.confirmed, datetime.utcnow())
+                continue
+            zone.applying = desired
+            try:
+                confirmed = await self.driver.apply(zone_id, desired)
+                error = None if confirmed == desired else f"relais relu {'ouvert' if confirmed else 'fermé'}"
+            except Exception as e:
+                confirmed, error = None, str(e) or type(e).__name__
+            finally:
+                zone.applying = None
+
+            if confirmed is not None:
+                zone.last_switch = time.monotonic()
+                self.actuations += 1
+                zone.confirmed = confirmed
+                if error is None:
+                    zone.failed_attempts = 0
+                    self.latencies.append(zone.last_switch - zone.requested_at)
+                await self._notify(self.on_confirm, zone_id, confirmed, datetime.utcnow())
+            if error is None:
+                continue
+
+            # Échec : l'état demandé est gardé (sauf commande plus récente) et réessayé
+            self.failures += 1
+            zone.failed_attempts += 1
+            print(f"Actionneur {zone_id}: échec de commande ({zone.failed_attempts}) - {error}")
+            await self._notify(self.on_failure, zone_id, desired, zone.confirmed, error, datetime.utcnow())
+            if zone.desired is None:
+                zone.desired = desired
+            await asyncio.sleep(min(self.retry_max, self.retry * 2 ** (zone.failed_attempts - 1)))
+            self.retries += 1
+            zone.wakeup.set()
+
+    @staticmethod
+    async def _notify(callback, zone_id: str, *args) -> None:
+        if callback:
+            try:
+                await callback(zone_id, *args)
+            except Exception as e:
+                print(f"Actionneur {zone_id}: échec d'enregistrement de l'état - {e}")
+
+    def metrics(self) -> dict:
+        latencies = sorted(self.latencies)
+
+        def pct(p):
+            return round(latencies[min(len(latencies) - 1, int(len(latencies) * p / 100))] * 1000, 1) if latencies else None
+
+        return {
+            "driver": type(self.driver).__name__,
+            "zones": len(self.zones),
+            "commands": self.commands,
+            "coalesced": self.coalesced,
+            "actuations": self.actuations,
+            "failures": self.failures,
+            "retries": self.retries,
+            "failing_zones": sum(1 for zone in self.zones.values() if zone.failed_attempts),
+            "overridden": self.overridden,
+            "manual_holds": sum(1 for until in self.holds.values() if until > time.monotonic()),
+            "pending": sum(1 for zone in self.zones.values() if zone.desired is not None),
+            "latency_ms": {"p50": pct(50), "p95": pct(95), "max": pct(100)},
+        }
+
+
+actuator = ActuationManager(create_driver())
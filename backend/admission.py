@@ -0,0 +1,213 @@
+"""
+Contrôle d'admission : limites de débit et délestage en surcharge.
+
+- Seau à jetons par zone (/send-data, /toggle-valve) et par adresse client
+  (toutes les routes) : au-delà, 429 avec `Retry-After` (temps avant le
+  prochain jeton). Les seaux sont gardés dans un LRU borné ; un seau
+  oublié est équivalent à un seau plein.
+- Nombre maximal de requêtes simultanées sur les routes qui interrogent
+  MongoDB ; au-delà, attente bornée en nombre (ADMISSION_DB_MAX_WAITING) et
+  en durée (ADMISSION_DB_WAIT_SECONDS), puis 503 avec `Retry-After`.
+
+Actif par défaut : les outils qui envoient plus de ADMISSION_ZONE_RATE
+lectures/s par zone (replay_traffic.py en accéléré) reçoivent des 429 et
+les comptent à part ; soak_test.py le coupe sauf avec --admission.
+
+Coût par requête en O(1). Avec cluster.py, les limites s'appliquent dans
+chaque worker : par zone chez son propriétaire, par client dans le worker
+qui exécute la requête.
+"""
+import asyncio
+import json
+import math
+import os
+import time
+from collections import Counter, OrderedDict
+from typing import Optional, Tuple
+
+from cluster import ZONE_BODY_ROUTES, ZONE_PATH_GET_SUFFIXES, body_zone_id, client_address, read_body, replay
+
+ADMISSION_ENABLED = os.getenv("ADMISSION_ENABLED", "1").lower() in ("1", "true", "yes")
+# Débit soutenu (requêtes/s) et rafale autorisée ; 0 désactive la limite
+ADMISSION_ZONE_RATE = float(os.getenv("ADMISSION_ZONE_RATE", "5"))
+ADMISSION_ZONE_BURST = float(os.getenv("ADMISSION_ZONE_BURST", "20"))
+ADMISSION_CLIENT_RATE = float(os.getenv("ADMISSION_CLIENT_RATE", "200"))
+ADMISSION_CLIENT_BURST = float(os.getenv("ADMISSION_CLIENT_BURST", "400"))
+# Requêtes simultanées sur les routes MongoDB (à garder sous maxPoolSize, 100 par défaut)
+ADMISSION_DB_CONCURRENCY = int(os.getenv("ADMISSION_DB_CONCURRENCY", "64"))
+ADMISSION_DB_MAX_WAITING = int(os.getenv("ADMISSION_DB_MAX_WAITING", "256"))
+ADMISSION_DB_WAIT_SECONDS = float(os.getenv("ADMISSION_DB_WAIT_SECONDS", "2"))
+ADMISSION_MAX_BUCKETS = int(os.getenv("ADMISSION_MAX_BUCKETS", "10000"))
+
+DB_ROUTES = {"/send-data", "/toggle-valve", "/toggle-valve/bulk", "/history", "/history/changes", "/water-usage", "/alerts", "/schedules", "/calibrations/jobs", "/aggregates", "/reports/season"}
+# /alerts/stream (connexion longue, sans requête MongoDB) n'occupe pas de place
+DB_ROUTE_PREFIXES = ("/valve-state/", "/zones/", "/rules/", "/schedules/", "/calibrations/")
+
+
+class TokenBucket:
+    __slots__ = ("tokens", "updated")
+
+    def __init__(self, burst: float, now: float):
+        self.tokens = burst
+        self.updated = now
+
+
+class RateLimiter:
+    """Seaux à jetons par clé, dans un LRU de `max_buckets` entrées."""
+
+    def __init__(self, rate: float, burst: float, max_buckets: int = ADMISSION_MAX_BUCKETS):
+        self.rate = rate
+        self.burst = max(burst, 1.0)
+        self.max_buckets = max_buckets
+        self.buckets: "OrderedDict[str, TokenBucket]" = OrderedDict()
+
+    def acquire(self, key: str, now: float) -> float:
+        """Consomme un jeton ; 0 si la requête passe, sinon secondes avant le prochain jeton."""
+        if self.rate <= 0:
+            return 0.0
+        bucket = self.buckets.get(key)
+        if bucket is None:
+            bucket = self.buckets[key] = TokenBucket(self.burst, now)
+            if len(self.buckets) > self.max_buckets:
+                self.buckets.popitem(last=False)
+        else:
+            self.buckets.move_to_end(key)
+            bucket.tokens = min(self.burst, bucket.tokens + (now - bucket.updated) * self.rate)
+            bucket.updated = now
+        if bucket.tokens >= 1:
+            bucket.tokens -= 1
+            return 0.0
+        return (1 - bucket.tokens) / self.rate
+
+
+def is_db_route(path: str) -> bool:
+    if path.startswith("/zones/") and path.endswith(ZONE_PATH_GET_SUFFIXES):
+        # Résumés servis depuis la mémoire du propriétaire (/zones/{zone_id}/digest)
+        return False
+    return path in DB_ROUTES or path.startswith(DB_ROUTE_PREFIXES)
+
+
+class AdmissionController:
+    def __init__(self):
+        self.zones = RateLimiter(ADMISSION_ZONE_RATE, ADMISSION_ZONE_BURST)
+        self.clients = RateLimiter(ADMISSION_CLIENT_RATE, ADMISSION_CLIENT_BURST)
+        self.db_slots = asyncio.Semaphore(ADMISSION_DB_CONCURRENCY)
+        self.db_active = 0
+        self.db_waiting = 0
+        self.admitted = 0
+        self.shed = Counter()
+
+    def check_rates(self, client: str, zone_id: Optional[str]) -> Optional[Tuple[str, float]]:
+        """(motif, Retry-After) si la requête dépasse une limite de débit."""
+        now = time.monotonic()
+        wait = self.clients.acquire(client, now)
+        if wait:
+            return "client_rate", wait
+        if zone_id is not None:
+            wait = self.zones.acquire(zone_id, now)
+            if wait:
+                return "zone_rate", wait
+        return None
+
+    async def acquire_db(self) -> Optional[str]:
+        """Réserve une place parmi les requêtes MongoDB ; motif du refus sinon."""
+        if not self.db_slots.locked():
+            await self.db_slots.acquire()
+            return None
+        if self.db_waiting >= ADMISSION_DB_MAX_WAITING:
+            return "db_queue_full"
+        self.db_waiting += 1
+        # Acquisition suivie : une place obtenue au moment du délai ou de
+        # l'annulation de la requête est rendue, jamais perdue
+        acquire = asyncio.ensure_future(self.db_slots.acquire())
+        try:
+            await asyncio.wait({acquire}, timeout=ADMISSION_DB_WAIT_SECONDS)
+        except asyncio.CancelledError:
+            self.abandon(acquire)
+            raise
+        finally:
+            self.db_waiting -= 1
+        if acquire.done():
+            return None
+        self.abandon(acquire)
+        return "db_wait_timeout"
+
+    def abandon(self, acquire: asyncio.Future) -> None:
+        """Renonce à une acquisition en cours ; la place est rendue si elle a été obtenue quand même."""
+        if acquire.done():
+            if not acquire.cancelled():
+                self.db_slots.release()
+            return
+        acquire.cancel()
+        acquire.add_done_callback(lambda done: None if done.cancelled() else self.db_slots.release())
+
+    def stats(self) -> dict:
+        return {
+            "enabled": ADMISSION_ENABLED,
+            "admitted": self.admitted,
+            "shed": dict(self.shed),
+            "shed_total": sum(self.shed.values()),
+            "db_active": self.db_active,
+            "db_waiting": self.db_waiting,
+            "db_concurrency": ADMISSION_DB_CONCURRENCY,
+            "zone_buckets": len(self.zones.buckets),
+            "client_buckets": len(self.clients.buckets),
+            "limits": {
+                "zone": {"rate": ADMISSION_ZONE_RATE, "burst": ADMISSION_ZONE_BURST},
+                "client": {"rate": ADMISSION_CLIENT_RATE, "burst": ADMISSION_CLIENT_BURST},
+            },
+        }
+
+
+async def reject(send, status: int, reason: str, retry_after: float) -> None:
+    admission.shed[reason] += 1
+    body = json.dumps({"detail": f"Requête refusée ({reason}), réessayer plus tard"}).encode()
+    await send({"type": "http.response.start", "status": status, "headers": [
+        (b"content-type", b"application/json"),
+        (b"content-length", str(len(body)).encode()),
+        (b"retry-after", str(max(1, math.ceil(retry_after))).encode()),
+    ]})
+    await send({"type": "http.response.body", "body": body})
+
+
+class AdmissionMiddleware:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not ADMISSION_ENABLED or scope["method"] == "OPTIONS":
+            await self.app(scope, receive, send)
+            return
+
+        path = scope["path"]
+        zone_id = None
+        if scope["method"] == "POST" and path in ZONE_BODY_ROUTES:
+            body = await read_body(receive)
+            zone_id = body_zone_id(path, body)
+            receive = replay(body)
+
+        refused = admission.check_rates(client_address(scope), zone_id)
+        if refused is not None:
+            reason, wait = refused
+            await reject(send, 429, reason, wait)
+            return
+
+        if not is_db_route(path):
+            admission.admitted += 1
+            await self.app(scope, receive, send)
+            return
+
+        reason = await admission.acquire_db()
+        if reason is not None:
+            await reject(send, 503, reason, 1)
+            return
+        admission.admitted += 1
+        admission.db_active += 1
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            admission.db_active -= 1
+            admission.db_slots.release()
+
+
+admission = AdmissionController()
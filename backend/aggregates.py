@@ -0,0 +1,395 @@
+"""
+Agrégats des lectures par intervalle (heure, jour, mois) avec cache des résultats.
+
+Les graphiques longue durée (/aggregates) et les rapports de saison
+(/reports/season) découpent leur plage en intervalles alignés (UTC). Le
+résultat de chaque intervalle (nombre de lectures, nombre de valeurs et
+min / moyenne / max par champ, lectures de pluie et avec anomalie) est gardé dans un cache LRU
+indexé par (zone, résolution, intervalle) :
+
+- un intervalle clos ne change plus (created_at est fixé par /send-data) :
+  il reste en cache jusqu'à son éviction ;
+- l'intervalle ouvert est gardé avec la génération de la zone, incrémentée
+  par chaque lecture écrite : il est recalculé seulement après une
+  nouvelle lecture ;
+- un recalcul d'étalonnage, qui réécrit des lectures passées, vide le cache
+  de la zone.
+
+Seuls les intervalles absents du cache sont lus dans MongoDB, en un
+pipeline par suite d'intervalles contigus (index (zone_id, _id)). La taille
+du cache est bornée à AGGREGATES_CACHE_MAX_BYTES (taille estimée des
+résultats) ; les intervalles les moins récemment lus sont évincés.
+
+Avec DEADBAND_ENABLED (deadband.py), les agrégats portent sur la série
+reconstruite en escalier, comme /history : chaque lecture stockée compte
+pour les points de la grille DEADBAND_SAMPLE_SECONDS qu'elle tient jusqu'à
+la lecture suivante (un seul au-delà d'un écart de heartbeat), découpés aux
+bornes des intervalles. `count`, `n` et les moyennes sont donc pondérés par
+la durée, pas par les lignes écrites. Ces lectures, peu nombreuses, sont
+agrégées en Python ; un intervalle n'est clos qu'une fois la lecture
+suivante possible écrite (heartbeat en plus du délai de grâce).
+"""
+import math
+import os
+from collections import Counter, OrderedDict
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Set, Tuple
+
+from bson import ObjectId
+from motor.motor_asyncio import AsyncIOMotorDatabase
+
+from deadband import DEADBAND_ENABLED, DEADBAND_HEARTBEAT_SECONDS, DEADBAND_SAMPLE_SECONDS
+
+AGGREGATES_CACHE_MAX_BYTES = int(os.getenv("AGGREGATES_CACHE_MAX_BYTES", str(32 * 1024 * 1024)))
+# Délai après la fin d'un intervalle avant de le considérer clos (lectures en cours d'écriture)
+AGGREGATES_CLOSE_GRACE_SECONDS = float(os.getenv("AGGREGATES_CLOSE_GRACE_SECONDS", "60"))
+# Nombre maximal d'intervalles d'une requête
+AGGREGATES_MAX_BUCKETS = int(os.getenv("AGGREGATES_MAX_BUCKETS", "2000"))
+
+# Résolution → format de la clé d'intervalle ($dateToString et strftime)
+RESOLUTIONS = {"hour": "%Y-%m-%dT%H", "day": "%Y-%m-%d", "month": "%Y-%m"}
+AGGREGATED_FIELDS = (
+    "soil_moisture", "soil_moisture_10cm", "soil_moisture_30cm", "soil_moisture_60cm",
+    "temperature", "humidity", "light", "wind_speed",
+)
+
+CacheKey = Tuple[str, str, str]
+
+# Saisons météorologiques (hémisphère nord) : premier mois, nombre de mois
+SEASON_MONTHS = {"printemps": (3, 3), "ete": (6, 3), "automne": (9, 3), "hiver": (12, 3)}
+
+
+def bucket_start(at: datetime, resolution: str) -> datetime:
+    if resolution == "hour":
+        return at.replace(minute=0, second=0, microsecond=0)
+    if resolution == "day":
+        return datetime(at.year, at.month, at.day)
+    return datetime(at.year, at.month, 1)
+
+
+def next_bucket(start: datetime, resolution: str) -> datetime:
+    if resolution == "hour":
+        return start + timedelta(hours=1)
+    if resolution == "day":
+        return start + timedelta(days=1)
+    return datetime(start.year + start.month // 12, start.month % 12 + 1, 1)
+
+
+def bucket_starts(start: datetime, end: datetime, resolution: str) -> List[datetime]:
+    """Débuts des intervalles qui recouvrent [start, end[."""
+    starts = []
+    cursor = bucket_start(start, resolution)
+    while cursor < end:
+        starts.append(cursor)
+        if len(starts) > AGGREGATES_MAX_BUCKETS:
+            raise ValueError(f"Plus de {AGGREGATES_MAX_BUCKETS} intervalles : choisir une résolution plus large")
+        cursor = next_bucket(cursor, resolution)
+    return starts
+
+
+def season_range(season: str, year: int) -> Tuple[datetime, datetime]:
+    """[début, fin[ de la saison ; l'hiver `year` va de décembre `year` à février `year + 1`."""
+    first_month, months = SEASON_MONTHS[season]
+    start = datetime(year, first_month, 1)
+    end = start
+    for _ in range(months):
+        end = next_bucket(end, "month")
+    return start, end
+
+
+def empty_bucket() -> dict:
+    return {"count": 0, "rain_readings": 0, "anomaly_readings": 0, "fields": {}}
+
+
+def aggregation_pipeline(zone_id: str, start: datetime, end: datetime, resolution: str) -> List[dict]:
+    group = {
+        "_id": {"$dateToString": {"format": RESOLUTIONS[resolution], "date": "$created_at"}},
+        "count": {"$sum": 1},
+        "rain_readings": {"$sum": {"$cond": ["$rainfall", 1, 0]}},
+        "anomaly_readings": {"$sum": {"$cond": [{"$gt": [{"$size": {"$ifNull": ["$anomalies", []]}}, 0]}, 1, 0]}},
+    }
+    for field in AGGREGATED_FIELDS:
+        group[f"{field}__avg"] = {"$avg": f"${field}"}
+        # Lectures où le champ est renseigné (les champs optionnels manquent parfois)
+        group[f"{field}__n"] = {"$sum": {"$cond": [{"$gt": [f"${field}", None]}, 1, 0]}}
+        group[f"{field}__min"] = {"$min": f"${field}"}
+        group[f"{field}__max"] = {"$max": f"${field}"}
+    return [
+        {"$match": {
+            "zone_id": zone_id,
+            # Plage d'_id (index) élargie d'une seconde, bornes exactes sur created_at
+            "_id": {"$gte": ObjectId.from_datetime(start - timedelta(seconds=1)),
+                    "$lt": ObjectId.from_datetime(end + timedelta(seconds=1))},
+            "created_at": {"$gte": start, "$lt": end},
+        }},
+        {"$group": group},
+    ]
+
+
+def time_weighted_buckets(records: List[dict], start: datetime, end: datetime, resolution: str,
+                          sample_seconds: float = DEADBAND_SAMPLE_SECONDS,
+                          heartbeat_seconds: float = DEADBAND_HEARTBEAT_SECONDS) -> Dict[str, dict]:
+    """
+    Intervalles de [start, end[ de la série en escalier (deadband.reconstruct)
+    des lectures stockées `records` (ordre croissant, avec celles qui
+    précèdent start et suivent end de moins d'un heartbeat).
+    """
+    step = timedelta(seconds=sample_seconds)
+    max_gap = timedelta(seconds=heartbeat_seconds) + step
+    fmt = RESOLUTIONS[resolution]
+    sums: Dict[str, dict] = {}
+
+    def points_before(at: datetime, limit: datetime) -> int:
+        # Points at + k·step (k ≥ 0) antérieurs à limit
+        return max(0, math.ceil(round((limit - at) / step, 6)))
+
+    for index, record in enumerate(records):
+        at = record["created_at"]
+        following = records[index + 1]["created_at"] if index + 1 < len(records) else None
+        # Points tenus par la lecture, comme la reconstruction : jusqu'à la suivante moins un demi-pas
+        points = 1
+        if following is not None and following - at <= max_gap:
+            points = max(1, points_before(at, following - step / 2))
+        k = points_before(at, start)
+        last = min(points, points_before(at, end))
+        while k < last:
+            bucket = bucket_start(at + k * step, resolution)
+            upto = min(last, points_before(at, next_bucket(bucket, resolution)))
+            weight = upto - k
+            acc = sums.setdefault(bucket.strftime(fmt), {**empty_bucket(), "sums": {}})
+            acc["count"] += weight
+            if record.get("rainfall"):
+                acc["rain_readings"] += weight
+            if k == 0 and record.get("anomalies"):
+                # Les points reconstruits ne portent pas d'anomalie
+                acc["anomaly_readings"] += 1
+            for field in AGGREGATED_FIELDS:
+                value = record.get(field)
+                if value is None:
+                    continue
+                stats = acc["fields"].get(field)
+                if stats is None:
+                    acc["fields"][field] = {"n": weight, "min": value, "max": value}
+                    acc["sums"][field] = value * weight
+                else:
+                    stats["n"] += weight
+                    stats["min"] = min(stats["min"], value)
+                    stats["max"] = max(stats["max"], value)
+                    acc["sums"][field] += value * weight
+            k = upto
+
+    for acc in sums.values():
+        for field, stats in acc["fields"].items():
+            stats["avg"] = round(acc["sums"][field] / stats["n"], 2)
+        del acc["sums"]
+    return sums
+
+
+def bucket_from_group(row: dict) -> dict:
+    bucket = {
+        "count": row["count"],
+        "rain_readings": row["rain_readings"],
+        "anomaly_readings": row["anomaly_readings"],
+        "fields": {},
+    }
+    for field in AGGREGATED_FIELDS:
+        if row.get(f"{field}__avg") is not None:
+            bucket["fields"][field] = {
+                "n": row[f"{field}__n"],
+                "avg": round(row[f"{field}__avg"], 2),
+                "min": row[f"{field}__min"],
+                "max": row[f"{field}__max"],
+            }
+    return bucket
+
+
+def combine_buckets(buckets: List[dict]) -> dict:
+    """
+    Agrégat de plusieurs intervalles : moyennes pondérées par le nombre de
+    valeurs `n` de chaque champ, c'est-à-dire par la durée avec la bande morte.
+    """
+    total = empty_bucket()
+    sums: Dict[str, float] = {}
+    for bucket in buckets:
+        total["count"] += bucket["count"]
+        total["rain_readings"] += bucket["rain_readings"]
+        total["anomaly_readings"] += bucket["anomaly_readings"]
+        for field, stats in bucket["fields"].items():
+            current = total["fields"].get(field)
+            if current is None:
+                total["fields"][field] = {"n": stats["n"], "min": stats["min"], "max": stats["max"]}
+            else:
+                current["n"] += stats["n"]
+                current["min"] = min(current["min"], stats["min"])
+                current["max"] = max(current["max"], stats["max"])
+            sums[field] = sums.get(field, 0.0) + stats["avg"] * stats["n"]
+    for field, stats in total["fields"].items():
+        stats["avg"] = round(sums[field] / stats["n"], 2)
+    return total
+
+
+def estimated_size(bucket: dict) -> int:
+    """Taille approximative en mémoire d'un résultat d'intervalle (octets)."""
+    return 400 + 250 * len(bucket["fields"])
+
+
+class AggregateCache:
+    """Cache LRU des intervalles, borné en octets, avec générations par zone."""
+
+    def __init__(self, max_bytes: int = AGGREGATES_CACHE_MAX_BYTES, time_weighted: bool = DEADBAND_ENABLED):
+        self.max_bytes = max_bytes
+        # Série reconstruite de la bande morte plutôt que lignes stockées
+        self.time_weighted = time_weighted
+        # clé → (génération de la zone pour l'intervalle ouvert, None si clos ; résultat ; taille)
+        self.entries: "OrderedDict[CacheKey, Tuple[Optional[int], dict, int]]" = OrderedDict()
+        self.zone_keys: Dict[str, Set[CacheKey]] = {}
+        self.generations: Dict[str, int] = {}
+        self.bytes = 0
+        self.counters = Counter()
+
+    def bump(self, zone_id: str, *_) -> None:
+        """Lecture écrite pour la zone : son intervalle ouvert n'est plus à jour."""
+        self.generations[zone_id] = self.generations.get(zone_id, 0) + 1
+
+    def generation(self, zone_id: str) -> int:
+        return self.generations.get(zone_id, 0)
+
+    def get(self, key: CacheKey, closed: bool) -> Optional[dict]:
+        entry = self.entries.get(key)
+        if entry is None:
+            self.counters["misses"] += 1
+            return None
+        generation, bucket, size = entry
+        if generation is not None:
+            if generation != self.generation(key[0]):
+                self.counters["stale"] += 1
+                self.counters["misses"] += 1
+                return None
+            if closed:
+                # Mis en cache ouvert, sans lecture écrite depuis : définitif
+                self.entries[key] = (None, bucket, size)
+        self.entries.move_to_end(key)
+        self.counters["hits"] += 1
+        return bucket
+
+    def put(self, key: CacheKey, bucket: dict, generation: Optional[int]) -> None:
+        self._drop(key)
+        size = estimated_size(bucket)
+        self.entries[key] = (generation, bucket, size)
+        self.zone_keys.setdefault(key[0], set()).add(key)
+        self.bytes += size
+        while self.bytes > self.max_bytes and self.entries:
+            self._drop(next(iter(self.entries)))
+            self.counters["evictions"] += 1
+
+    def _drop(self, key: CacheKey) -> None:
+        entry = self.entries.pop(key, None)
+        if entry is None:
+            return
+        self.bytes -= entry[2]
+        keys = self.zone_keys.get(key[0])
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self.zone_keys[key[0]]
+
+    def invalidate_zone(self, zone_id: str, *_) -> int:
+        """Vide le cache de la zone (lectures passées réécrites)."""
+        keys = list(self.zone_keys.get(zone_id, ()))
+        for key in keys:
+            self._drop(key)
+        self.bump(zone_id)
+        self.counters["invalidations"] += 1
+        return len(keys)
+
+    def clear(self) -> int:
+        count = len(self.entries)
+        self.entries.clear()
+        self.zone_keys.clear()
+        self.bytes = 0
+        self.counters["invalidations"] += 1
+        return count
+
+    def stats(self) -> dict:
+        lookups = self.counters["hits"] + self.counters["misses"]
+        return {
+            "entries": len(self.entries),
+            "zones": len(self.zone_keys),
+            "bytes": self.bytes,
+            "max_bytes": self.max_bytes,
+            "hits": self.counters["hits"],
+            "misses": self.counters["misses"],
+            "stale_open_buckets": self.counters["stale"],
+            "hit_rate": round(self.counters["hits"] / lookups, 3) if lookups else 0.0,
+            "evictions": self.counters["evictions"],
+            "invalidations": self.counters["invalidations"],
+            "queries": self.counters["queries"],
+        }
+
+    async def buckets(self, db: AsyncIOMotorDatabase, zone_id: str, start: datetime, end: datetime,
+                      resolution: str, now: Optional[datetime] = None) -> List[Tuple[datetime, dict, bool]]:
+        """
+        (début, résultat, clos) de chaque intervalle de [start, end[ jusqu'à
+        l'intervalle ouvert ; seuls les intervalles absents du cache sont lus.
+        """
+        now = now or datetime.utcnow()
+        starts = bucket_starts(start, min(end, next_bucket(bucket_start(now, resolution), resolution)), resolution)
+        fmt = RESOLUTIONS[resolution]
+        generation = self.generation(zone_id)
+        closed_before = now - timedelta(seconds=AGGREGATES_CLOSE_GRACE_SECONDS)
+        if self.time_weighted:
+            # La dernière lecture d'un intervalle tient jusqu'à la suivante, écrite au plus tard au heartbeat
+            closed_before -= timedelta(seconds=DEADBAND_HEARTBEAT_SECONDS + DEADBAND_SAMPLE_SECONDS)
+
+        results: Dict[datetime, dict] = {}
+        missing: List[datetime] = []
+        for bucket in starts:
+            cached = self.get((zone_id, resolution, bucket.strftime(fmt)), next_bucket(bucket, resolution) <= closed_before)
+            if cached is None:
+                missing.append(bucket)
+            else:
+                results[bucket] = cached
+
+        # Une lecture MongoDB par suite d'intervalles manquants contigus
+        runs: List[List[datetime]] = []
+        for bucket in missing:
+            if runs and next_bucket(runs[-1][-1], resolution) == bucket:
+                runs[-1].append(bucket)
+            else:
+                runs.append([bucket])
+        for run in runs:
+            self.counters["queries"] += 1
+            run_end = next_bucket(run[-1], resolution)
+            if self.time_weighted:
+                rows = await self._time_weighted_rows(db, zone_id, run[0], run_end, resolution)
+            else:
+                rows = {
+                    row["_id"]: bucket_from_group(row)
+                    async for row in db.sensor_data.aggregate(aggregation_pipeline(zone_id, run[0], run_end, resolution))
+                }
+            for bucket in run:
+                key = bucket.strftime(fmt)
+                value = rows.get(key) or empty_bucket()
+                closed = next_bucket(bucket, resolution) <= closed_before
+                # Génération lue avant la requête : une lecture écrite pendant celle-ci rend l'entrée périmée
+                self.put((zone_id, resolution, key), value, None if closed else generation)
+                results[bucket] = value
+        return [(bucket, results[bucket], next_bucket(bucket, resolution) <= closed_before) for bucket in starts]
+
+    @staticmethod
+    async def _time_weighted_rows(db: AsyncIOMotorDatabase, zone_id: str, start: datetime, end: datetime,
+                                  resolution: str) -> Dict[str, dict]:
+        # Lectures voisines de la plage : valeur tenue au début, fin de la dernière lecture
+        margin = timedelta(seconds=DEADBAND_HEARTBEAT_SECONDS + DEADBAND_SAMPLE_SECONDS)
+        projection = {field: 1 for field in (*AGGREGATED_FIELDS, "created_at", "rainfall", "anomalies")}
+        records = await db.sensor_data.find({
+            "zone_id": zone_id,
+            "_id": {"$gte": ObjectId.from_datetime(start - margin - timedelta(seconds=1)),
+                    "$lt": ObjectId.from_datetime(end + margin + timedelta(seconds=1))},
+            "created_at": {"$gte": start - margin, "$lt": end + margin},
+        }, projection).to_list(None)
+        records.sort(key=lambda record: record["created_at"])
+        return time_weighted_buckets(records, start, end, resolution)
+
+
+aggregate_cache = AggregateCache()
@@ -0,0 +1,172 @@
+"""
+Détection en continu des capteurs défaillants sur le chemin d'ingestion.
+
+Chaque zone garde, par champ, la dernière valeur (sauts) et le début de
+la ligne plate en cours, mis à jour en O(1).
+
+Ligne plate : fenêtre en temps (date des lectures), indépendante de la
+cadence d'envoi. Un champ est signalé figé s'il n'a pas varié de plus de
+ANOMALY_FLATLINE_DELTA depuis ANOMALY_FLATLINE_MINUTES minutes. Hors
+arrosage, une ligne plate ne bloque pas la pompe : un sol stable est aussi
+un sol sain. Une sonde de décision restée plate pendant
+ANOMALY_FLATLINE_MINUTES d'arrosage ne répond pas à l'eau
+(`no_response:champ`) : la pompe est bloquée tant que la valeur ne bouge
+pas, même après l'arrêt de l'arrosage.
+"""
+import os
+import time
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+
+# Durée sans variation au-delà de laquelle un capteur est considéré figé
+ANOMALY_FLATLINE_MINUTES = float(os.getenv("ANOMALY_FLATLINE_MINUTES", "45"))
+# Variation maximale (unités du champ) d'un capteur figé
+ANOMALY_FLATLINE_DELTA = float(os.getenv("ANOMALY_FLATLINE_DELTA", "0.05"))
+# Écart 10cm → 60cm toléré avant de signaler une inversion de profondeur
+ANOMALY_DEPTH_MARGIN = float(os.getenv("ANOMALY_DEPTH_MARGIN", "25"))
+# Les anomalies sur l'humidité du sol bloquent la pompe
+ANOMALY_VETO_PUMP = os.getenv("ANOMALY_VETO_PUMP", "1") == "1"
+
+# Plages physiquement possibles et saut maximal entre deux lectures
+FIELD_LIMITS = {
+    "soil_moisture": (0.0, 100.0, 25.0),
+    "soil_moisture_10cm": (0.0, 100.0, 25.0),
+    "soil_moisture_30cm": (0.0, 100.0, 20.0),
+    "soil_moisture_60cm": (0.0, 100.0, 15.0),
+    "humidity": (0.0, 100.0, 40.0),
+    "temperature": (-40.0, 70.0, 15.0),
+    "light": (0.0, 150000.0, None),
+    "wind_speed": (0.0, 200.0, None),
+}
+
+# Champs dont une anomalie rend la décision d'irrigation douteuse
+VETO_FIELDS = ("soil_moisture", "soil_moisture_10cm")
+# Les capteurs météo peuvent rester stables longtemps (nuit, vent nul)
+FLATLINE_FIELDS = ("soil_moisture", "soil_moisture_10cm", "soil_moisture_30cm", "soil_moisture_60cm", "temperature")
+
+
+class FieldTrack:
+    """Dernière valeur d'un champ et ligne plate en cours."""
+
+    __slots__ = ("last", "steady_value", "steady_since", "unresponsive")
+
+    def __init__(self):
+        self.last: Optional[float] = None
+        # Début de la ligne plate en cours : valeur de référence et date de la lecture
+        self.steady_value: Optional[float] = None
+        self.steady_since: Optional[datetime] = None
+        # Ligne plate en cours restée plate pendant un arrosage
+        self.unresponsive = False
+
+    def steady_for(self, value: float, at: datetime, delta: float) -> timedelta:
+        """Durée depuis laquelle le champ reste à ±delta de la même valeur."""
+        if self.steady_since is None or abs(value - self.steady_value) > delta or at < self.steady_since:
+            self.steady_value = value
+            self.steady_since = at
+            self.unresponsive = False
+        return at - self.steady_since
+
+
+class SensorAnomalyDetector:
+    """Signale les lignes plates, sauts impossibles, inversions et valeurs hors plage."""
+
+    def __init__(self, flatline_minutes: float = ANOMALY_FLATLINE_MINUTES,
+                 flatline_delta: float = ANOMALY_FLATLINE_DELTA, depth_margin: float = ANOMALY_DEPTH_MARGIN):
+        self.flatline_duration = timedelta(minutes=flatline_minutes)
+        self.flatline_delta = flatline_delta
+        self.depth_margin = depth_margin
+        self.zones: Dict[str, Dict[str, FieldTrack]] = {}
+        # Début de l'arrosage en cours par zone
+        self.irrigating_since: Dict[str, datetime] = {}
+        self.latest: Dict[str, List[str]] = {}
+        # Mesure du coût ajouté par lecture
+        self.checked = 0
+        self.flagged = 0
+        self.total_ns = 0
+        self.max_ns = 0
+
+    def check(self, zone_id: str, reading: dict, irrigating: bool = False) -> List[str]:
+        """Analyse une lecture et retourne la liste des anomalies (`type:champ`)."""
+        started = time.perf_counter_ns()
+        tracks = self.zones.get(zone_id)
+        if tracks is None:
+            tracks = self.zones[zone_id] = {field: FieldTrack() for field in FIELD_LIMITS}
+
+        at = reading.get("created_at")
+        if not irrigating or at is None:
+            self.irrigating_since.pop(zone_id, None)
+        elif zone_id not in self.irrigating_since:
+            self.irrigating_since[zone_id] = at
+        irrigating_since = self.irrigating_since.get(zone_id)
+        flags = []
+        for field, (low, high, max_jump) in FIELD_LIMITS.items():
+            value = reading.get(field)
+            if value is None:
+                continue
+            if value < low or value > high:
+                flags.append(f"out_of_range:{field}")
+                continue
+            track = tracks[field]
+            if max_jump is not None and track.last is not None and abs(value - track.last) > max_jump:
+                flags.append(f"jump:{field}")
+            track.last = value
+            if field not in FLATLINE_FIELDS or at is None:
+                continue
+            if track.steady_for(value, at, self.flatline_delta) >= self.flatline_duration:
+                flags.append(f"flatline:{field}")
+            # L'arrosage doit faire monter l'humidité : une sonde de décision plate pendant
+            # toute une fenêtre d'arrosage est figée, jusqu'à ce que sa valeur bouge
+            if (field in VETO_FIELDS and irrigating_since is not None
+                    and at - max(track.steady_since, irrigating_since) >= self.flatline_duration):
+                track.unresponsive = True
+            if track.unresponsive:
+                flags.append(f"no_response:{field}")
+
+        # Le sol profond reste normalement plus humide que la surface,
+        # sauf pendant un arrosage ou une pluie
+        surface = reading.get("soil_moisture_10cm")
+        deep = reading.get("soil_moisture_60cm")
+        if (surface is not None and deep is not None and not irrigating
+                and not reading.get("rainfall") and surface - deep > self.depth_margin):
+            flags.append("depth_inversion")
+
+        self.latest[zone_id] = flags
+        elapsed = time.perf_counter_ns() - started
+        self.checked += 1
+        self.total_ns += elapsed
+        if elapsed > self.max_ns:
+            self.max_ns = elapsed
+        if flags:
+            self.flagged += 1
+        return flags
+
+    def forget(self, zone_id: str) -> None:
+        """Oublie les fenêtres d'une zone (changement d'échelle des valeurs, ex. nouvel étalonnage)."""
+        self.zones.pop(zone_id, None)
+        self.latest.pop(zone_id, None)
+        self.irrigating_since.pop(zone_id, None)
+
+    @staticmethod
+    def vetoes_pump(flags: List[str]) -> bool:
+        """
+        Vrai si une anomalie touche le capteur utilisé pour la décision ; une
+        ligne plate seule ne bloque pas, une absence de réponse à l'arrosage si.
+        """
+        if not ANOMALY_VETO_PUMP:
+            return False
+        return any(
+            flag == "depth_inversion" or (not flag.startswith("flatline:") and flag.split(":", 1)[-1] in VETO_FIELDS)
+            for flag in flags
+        )
+
+    def stats(self) -> dict:
+        return {
+            "zones": len(self.zones),
+            "readings_checked": self.checked,
+            "readings_flagged": self.flagged,
+            "mean_latency_us": round(self.total_ns / self.checked / 1000, 2) if self.checked else 0.0,
+            "max_latency_us": round(self.max_ns / 1000, 2),
+        }
+
+
+detector = SensorAnomalyDetector()
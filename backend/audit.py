@@ -0,0 +1,106 @@
+"""
+Journal d'audit des commandes de vannes, écrit par lots.
+
+Les entrées sont accumulées en mémoire et insérées avec un seul
+`insert_many` quand le lot est plein ou à intervalle régulier. Un lot en
+échec est gardé pour la tentative suivante avec son `_id` : une entrée déjà
+insérée par une tentative précédente revient en clé dupliquée et compte
+comme écrite. Après un échec partiel, seules les entrées refusées sont
+gardées. Pendant une panne de MongoDB,
+au-delà de AUDIT_MAX_PENDING entrées en attente, les plus anciennes sont
+abandonnées et comptées.
+"""
+import asyncio
+import os
+from typing import List, Optional
+
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from pymongo.errors import BulkWriteError
+
+AUDIT_BATCH_SIZE = int(os.getenv("AUDIT_BATCH_SIZE", "200"))
+AUDIT_FLUSH_SECONDS = float(os.getenv("AUDIT_FLUSH_SECONDS", "2.0"))
+AUDIT_MAX_PENDING = int(os.getenv("AUDIT_MAX_PENDING", "10000"))
+
+
+class ValveAuditLog:
+    def __init__(self, batch_size: int = AUDIT_BATCH_SIZE, flush_seconds: float = AUDIT_FLUSH_SECONDS,
+                 max_pending: int = AUDIT_MAX_PENDING):
+        self.batch_size = batch_size
+        self.flush_seconds = flush_seconds
+        self.max_pending = max_pending
+        self.pending: List[dict] = []
+        self.written = 0
+        self.failed_flushes = 0
+        self.dropped = 0
+        self.db: Optional[AsyncIOMotorDatabase] = None
+        self._task: Optional[asyncio.Task] = None
+
+    def append(self, entries: List[dict]) -> None:
+        self.pending.extend(entries)
+        self._trim()
+        if len(self.pending) >= self.batch_size and self.db is not None:
+            asyncio.create_task(self._safe_flush())
+
+    async def flush(self) -> None:
+        if not self.pending or self.db is None:
+            return
+        batch, self.pending = self.pending, []
+        try:
+            await self.db.valve_audit.insert_many(batch, ordered=False)
+        except BulkWriteError as e:
+            # Clé dupliquée : entrée déjà écrite par une tentative précédente
+            rejected = [error["index"] for error in e.details.get("writeErrors", []) if error.get("code") != 11000]
+            self.written += len(batch) - len(rejected)
+            if rejected:
+                self._requeue([batch[index] for index in rejected])
+                raise
+        except Exception:
+            self._requeue(batch)
+            raise
+        else:
+            self.written += len(batch)
+
+    def _requeue(self, entries: List[dict]) -> None:
+        # Conserver les entrées pour la prochaine tentative, dans la limite de max_pending
+        self.failed_flushes += 1
+        self.pending[:0] = entries
+        self._trim()
+
+    def _trim(self) -> None:
+        excess = len(self.pending) - self.max_pending
+        if excess > 0:
+            del self.pending[:excess]
+            self.dropped += excess
+
+    def stats(self) -> dict:
+        return {
+            "pending": len(self.pending),
+            "max_pending": self.max_pending,
+            "written": self.written,
+            "failed_flushes": self.failed_flushes,
+            "dropped": self.dropped,
+        }
+
+    async def _safe_flush(self) -> None:
+        try:
+            await self.flush()
+        except Exception as e:
+            print(f"Audit des vannes: échec d'écriture - {e}")
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.flush_seconds)
+            await self._safe_flush()
+
+    def start(self, db: AsyncIOMotorDatabase) -> None:
+        self.db = db
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task:
+            self._task.cancel()
+            self._task = None
+        await self.flush()
+
+
+valve_audit = ValveAuditLog()
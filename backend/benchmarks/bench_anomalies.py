@@ -0,0 +1,106 @@
+"""
+Mesure du coût ajouté par le détecteur d'anomalies sur chaque lecture.
+
+    python benchmarks/bench_anomalies.py                      # en mémoire
+    python benchmarks/bench_anomalies.py --url http://127.0.0.1:8000 --threads 16
+
+Le mode --url envoie du trafic concurrent à /send-data puis lit
+/anomalies/stats : la latence est alors mesurée sous charge réelle.
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from anomalies import SensorAnomalyDetector  # noqa: E402
+
+
+def random_reading(zone_id):
+    soil = random.uniform(20, 80)
+    return {
+        "zone_id": zone_id,
+        "humidity": random.uniform(30, 90),
+        "temperature": random.uniform(10, 40),
+        "soil_moisture": soil,
+        "soil_moisture_10cm": soil,
+        "soil_moisture_30cm": soil * 1.05,
+        "soil_moisture_60cm": soil * 1.1,
+        "light": random.uniform(0, 80000),
+        "wind_speed": random.uniform(0, 20),
+        "rainfall": False,
+    }
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p / 100))]
+
+
+def bench_in_process(zones, readings):
+    detector = SensorAnomalyDetector()
+    payloads = [random_reading(f"zone-{z}") for z in range(zones)]
+    latencies = []
+    for i in range(readings):
+        payload = payloads[i % zones]
+        payload["soil_moisture"] += random.uniform(-0.5, 0.5)
+        started = time.perf_counter_ns()
+        detector.check(payload["zone_id"], payload)
+        latencies.append(time.perf_counter_ns() - started)
+
+    print(f"📊 {readings} lectures sur {zones} zones (en mémoire)")
+    print(f"   p50: {percentile(latencies, 50) / 1000:.2f} µs")
+    print(f"   p99: {percentile(latencies, 99) / 1000:.2f} µs")
+    print(f"   moyenne: {statistics.mean(latencies) / 1000:.2f} µs")
+
+
+def bench_http(url, zones, readings, threads):
+    import requests
+
+    per_thread = readings // threads
+    latencies = []
+    lock = threading.Lock()
+
+    def worker(index):
+        session = requests.Session()
+        local = []
+        for i in range(per_thread):
+            payload = random_reading(f"zone-{(index * per_thread + i) % zones}")
+            started = time.perf_counter()
+            session.post(f"{url}/send-data", json=payload, timeout=10)
+            local.append(time.perf_counter() - started)
+        with lock:
+            latencies.extend(local)
+
+    before = requests.get(f"{url}/anomalies/stats", timeout=5).json()
+    started = time.perf_counter()
+    pool = [threading.Thread(target=worker, args=(i,)) for i in range(threads)]
+    for t in pool:
+        t.start()
+    for t in pool:
+        t.join()
+    elapsed = time.perf_counter() - started
+    after = requests.get(f"{url}/anomalies/stats", timeout=5).json()
+
+    checked = after["readings_checked"] - before["readings_checked"]
+    print(f"📊 {len(latencies)} requêtes /send-data, {threads} clients, {elapsed:.1f}s ({len(latencies) / elapsed:.0f} req/s)")
+    print(f"   Requête p50: {percentile(latencies, 50) * 1000:.2f} ms | p99: {percentile(latencies, 99) * 1000:.2f} ms")
+    print(f"   Détecteur (serveur): moyenne {after['mean_latency_us']} µs, max {after['max_latency_us']} µs sur {checked} lectures")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--zones", type=int, default=1000)
+    parser.add_argument("--readings", type=int, default=200000)
+    parser.add_argument("--url", help="Backend à charger (ex: http://127.0.0.1:8000)")
+    parser.add_argument("--threads", type=int, default=8)
+    args = parser.parse_args()
+
+    if args.url:
+        bench_http(args.url.rstrip("/"), args.zones, args.readings, args.threads)
+    else:
+        bench_in_process(args.zones, args.readings)
@@ -0,0 +1,114 @@
+"""
+Gain du stockage en bande morte sur des données enregistrées.
+
+    python benchmarks/bench_deadband.py [--db irrigation.db] [--heartbeat 300]
+                                        [--epsilons soil_moisture_30cm:0.2,humidity:5]
+
+Rejoue les lectures de la base SQLite dans le filtre deadband, zone par zone
+et dans l'ordre chronologique, puis rapporte la réduction du nombre
+d'écritures et du volume BSON stocké, ainsi que l'erreur de reconstruction
+(escalier et linéaire) de chaque champ aux horodatages d'origine.
+Un epsilon `inf` exclut le champ du déclenchement des écritures.
+"""
+import argparse
+import bisect
+import math
+import os
+import sqlite3
+import statistics
+import sys
+from datetime import datetime
+
+import bson
+from bson import ObjectId
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from deadband import DeadbandFilter, NUMERIC_FIELDS, parse_epsilons  # noqa: E402
+from models import apply_reading_defaults  # noqa: E402
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def load_readings(path):
+    connection = sqlite3.connect(path)
+    connection.row_factory = sqlite3.Row
+    rows = connection.execute("SELECT * FROM sensor_data ORDER BY zone_id, created_at, id").fetchall()
+    connection.close()
+    readings = []
+    for row in rows:
+        doc = apply_reading_defaults({
+            "zone_id": row["zone_id"],
+            "humidity": row["humidity"],
+            "temperature": row["temperature"],
+            "soil_moisture": row["soil_moisture"],
+            "soil_moisture_10cm": row["soil_moisture_10cm"],
+            "soil_moisture_30cm": row["soil_moisture_30cm"],
+            "soil_moisture_60cm": row["soil_moisture_60cm"],
+            "light": row["light"],
+            "wind_speed": row["wind_speed"],
+            "rainfall": bool(row["rainfall"]),
+            "rainfall_intensity": row["rainfall_intensity"] or "none",
+            "flow_rate": None,
+        })
+        doc["_id"] = ObjectId()
+        doc["anomalies"] = []
+        doc["created_at"] = datetime.fromisoformat(row["created_at"])
+        readings.append(doc)
+    return readings
+
+
+def value_at(stored, times, at, field, method):
+    """Valeur reconstruite de `field` à l'instant `at` à partir des lectures stockées."""
+    index = bisect.bisect_right(times, at) - 1
+    a = stored[index]
+    if method == "step" or index + 1 >= len(stored) or a["created_at"] == at:
+        return a[field]
+    b = stored[index + 1]
+    ratio = (at - a["created_at"]) / (b["created_at"] - a["created_at"])
+    return a[field] + (b[field] - a[field]) * ratio
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--db", default=os.path.join(BACKEND_DIR, "irrigation.db"))
+    parser.add_argument("--heartbeat", type=float, default=300)
+    parser.add_argument("--epsilons", default="", help="champ:epsilon,... (surcharge les valeurs par défaut)")
+    args = parser.parse_args()
+
+    readings = load_readings(args.db)
+    db_filter = DeadbandFilter(parse_epsilons(args.epsilons), heartbeat_seconds=args.heartbeat)
+    stored = [r for r in readings if db_filter.should_store(r["zone_id"], r)]
+
+    size_all = sum(len(bson.encode(r)) for r in readings)
+    size_stored = sum(len(bson.encode(r)) for r in stored)
+    stats = db_filter.stats()
+    print(f"📊 {len(readings)} lectures rejouées depuis {os.path.basename(args.db)} (heartbeat {args.heartbeat:g} s)")
+    print(f"   Écritures: {len(stored)} / {len(readings)} (réduction {stats['write_reduction'] * 100:.1f} %)")
+    print(f"   Volume BSON: {size_stored / 1024:.1f} KiB / {size_all / 1024:.1f} KiB "
+          f"(réduction {(1 - size_stored / size_all) * 100:.1f} %)")
+
+    by_zone = {}
+    for r in stored:
+        by_zone.setdefault(r["zone_id"], []).append(r)
+    times = {zone_id: [r["created_at"] for r in records] for zone_id, records in by_zone.items()}
+
+    print("\n   Erreur de reconstruction aux horodatages d'origine (RMSE / max)")
+    print(f"   {'champ':<20} {'epsilon':>8} {'Δ médian':>9} {'escalier':>18} {'linéaire':>18}")
+    for field in NUMERIC_FIELDS:
+        # Variation typique entre deux lectures consécutives d'une zone, à comparer à epsilon
+        steps = [
+            abs(b[field] - a[field]) for a, b in zip(readings, readings[1:]) if a["zone_id"] == b["zone_id"]
+        ]
+        errors = {"step": [], "linear": []}
+        for r in readings:
+            zone_stored = by_zone[r["zone_id"]]
+            for method in errors:
+                estimate = value_at(zone_stored, times[r["zone_id"]], r["created_at"], field, method)
+                errors[method].append(abs(estimate - r[field]))
+        cells = [
+            f"{math.sqrt(sum(e * e for e in values) / len(values)):8.3f} / {max(values):7.3f}"
+            for values in errors.values()
+        ]
+        median_step = statistics.median(steps) if steps else 0.0
+        print(f"   {field:<20} {db_filter.epsilons[field]:>8g} {median_step:>9.2f} {cells[0]:>18} {cells[1]:>18}")
@@ -0,0 +1,102 @@
+"""
+Débit du modèle d'évapotranspiration FAO-56 vectorisé.
+
+    python benchmarks/bench_evapotranspiration.py [--zones 1000] [--heures 8760] [--repetitions 3]
+
+Génère une météo horaire synthétique (zones × heures) et compare :
+- reference_et (termes dépendant de la température lus dans les tables) ;
+- le même calcul avec les exponentielles évaluées directement (référence) ;
+- l'appel scalaire par lecture utilisé dans /send-data.
+Rapporte les valeurs calculées par seconde et l'écart maximal dû aux tables.
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import evapotranspiration as et  # noqa: E402
+
+
+def direct_reference_et(temperature, humidity, light, wind_speed):
+    """ET0 FAO-56 sans tables (formules exactes), pour mesurer l'écart et le gain."""
+    t = np.asarray(temperature, dtype=np.float64)
+    es = 0.6108 * np.exp(17.27 * t / (t + 237.3))
+    delta = 4098 * es / (t + 237.3) ** 2
+    ea = es * (np.clip(humidity, 0.0, 100.0) / 100.0)
+    u2 = np.maximum(wind_speed, 0.0) / 3.6
+    rs = np.maximum(light, 0.0) * (0.0036 / et.LUX_PER_WM2)
+    rnl = et.STEFAN_BOLTZMANN_HOURLY * (t + 273.16) ** 4 * (0.34 - 0.14 * np.sqrt(ea)) \
+        * (1.35 * et.ET_CLEAR_SKY_RATIO - 0.35)
+    rn = (1 - et.ALBEDO) * rs - rnl
+    g = np.where(rs > 0, 0.1, 0.5) * rn
+    numerator = 0.408 * delta * (rn - g) + et.PSYCHROMETRIC * 37 / (t + 273) * u2 * (es - ea)
+    return np.maximum(numerator / (delta + et.PSYCHROMETRIC * (1 + 0.34 * u2)), 0.0)
+
+
+def synthetic_weather(zones, hours, seed=0):
+    rng = np.random.default_rng(seed)
+    hour = np.arange(hours) % 24
+    day = np.arange(hours) / 24
+    season = 8 * np.sin(2 * np.pi * (day - 80) / 365)
+    temperature = 20 + season + 8 * np.cos((hour - 14) * np.pi / 12) + rng.normal(0, 2, (zones, hours))
+    humidity = np.clip(65 - 20 * np.cos((hour - 14) * np.pi / 12) + rng.normal(0, 8, (zones, hours)), 10, 100)
+    light = np.where((hour >= 6) & (hour <= 18), 80000 * np.sin(np.clip(hour - 6, 0, 12) * np.pi / 12), 20.0)
+    light = light * rng.uniform(0.6, 1.2, (zones, hours))
+    wind_speed = rng.gamma(2.0, 5.0, (zones, hours))
+    return temperature, humidity, light, wind_speed
+
+
+def best_of(repetitions, function, *args):
+    durations = []
+    for _ in range(repetitions):
+        start = time.perf_counter()
+        result = function(*args)
+        durations.append(time.perf_counter() - start)
+    return min(durations), result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--zones", type=int, default=1000)
+    parser.add_argument("--heures", type=int, default=8760, help="pas horaires par zone (8760 = un an)")
+    parser.add_argument("--repetitions", type=int, default=3)
+    parser.add_argument("--scalaires", type=int, default=20000, help="appels reading_et chronométrés")
+    args = parser.parse_args()
+
+    weather = synthetic_weather(args.zones, args.heures)
+    count = args.zones * args.heures
+    print(f"Météo synthétique : {args.zones} zones × {args.heures} h = {count:,} valeurs")
+
+    table_time, table_et0 = best_of(args.repetitions, et.reference_et, *weather)
+    direct_time, direct_et0 = best_of(args.repetitions, direct_reference_et, *weather)
+    error = np.abs(table_et0 - direct_et0)
+    print(f"{'méthode':<22}{'temps (s)':>12}{'valeurs/s':>16}")
+    print(f"{'tables':<22}{table_time:>12.3f}{count / table_time:>16,.0f}")
+    print(f"{'formules directes':<22}{direct_time:>12.3f}{count / direct_time:>16,.0f}")
+    print(f"Écart tables/direct : max {error.max():.5f} mm/h, moyen {error.mean():.6f} mm/h "
+          f"(ET0 moyenne {direct_et0.mean():.3f} mm/h)")
+
+    kc = np.array([et.crop_coefficient(crop) for crop in et.KC_CULTURES])
+    kc_zones = np.resize(kc, args.zones)[:, None]
+    etc_time, etc = best_of(args.repetitions, et.crop_et, *weather, kc_zones)
+    print(f"ETc par zone (Kc diffusé) : {etc_time:.3f} s, {count / etc_time:,.0f} valeurs/s, "
+          f"cumul annuel moyen {etc.sum(axis=1).mean() * 8760 / args.heures:.0f} mm")
+
+    readings = [
+        {"temperature": float(t), "humidity": float(h), "light": float(l), "wind_speed": float(w)}
+        for t, h, l, w in zip(*(field[0, :args.scalaires] for field in weather))
+    ]
+    start = time.perf_counter()
+    for reading in readings:
+        et.reading_et(reading, 1.15)
+    scalar_time = time.perf_counter() - start
+    print(f"reading_et scalaire : {len(readings) / scalar_time:,.0f} appels/s "
+          f"({scalar_time / len(readings) * 1e6:.1f} µs/lecture)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,165 @@
+"""
+Taille des réponses et temps de décodage client : lignes vs colonnaire.
+
+    python benchmarks/bench_history_formats.py [--points 1000 10000 100000]
+
+Pour chaque taille, mesure la taille brute, gzip et brotli (si le module
+`brotli` est installé) des deux formats, puis le temps côté client sous
+Node.js s'il est disponible (sinon json.loads en Python seul) :
+- décodage : JSON.parse + objets SensorData (`toSensorData` de
+  apiService.ts pour les lignes, reconstruction des colonnes sinon) ;
+- fusion : ajout au ring d'une zone comme `fetchBackendData` de
+  backendService.ts (dédoublonnage par id, tri par horodatage), la première
+  moitié des lectures étant déjà connue (fenêtre relue avant le curseur).
+"""
+import argparse
+import gzip
+import json
+import os
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+from bson import ObjectId
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from compression import brotli  # noqa: E402
+from history_format import format_reading, to_columnar  # noqa: E402
+
+NODE_DECODE = r"""
+const fs = require('fs');
+const [rowsPath, columnarPath, repeat] = process.argv.slice(1);
+const rowsText = fs.readFileSync(rowsPath, 'utf8');
+const columnarText = fs.readFileSync(columnarPath, 'utf8');
+const KEYS = ['moisture', 'temperature', 'humidity', 'soilMoisture10cm', 'soilMoisture30cm',
+              'soilMoisture60cm', 'light', 'windSpeed', 'rainfall', 'rainfallIntensity'];
+// toSensorData de apiService.ts
+function toSensorData(d) {
+  return {
+    id: d.id, timestamp: d.timestamp, moisture: d.moisture, temperature: d.temperature, humidity: d.humidity,
+    soilMoisture10cm: d.soilMoisture10cm, soilMoisture30cm: d.soilMoisture30cm,
+    soilMoisture60cm: d.soilMoisture60cm, light: d.light, windSpeed: d.windSpeed, rainfall: d.rainfall,
+    rainfallIntensity: d.rainfallIntensity
+  };
+}
+function decodeColumnar(payload) {
+  const out = new Array(payload.count);
+  let ts = payload.timestamp.base;
+  for (let i = 0; i < payload.count; i++) {
+    if (i > 0) ts += payload.timestamp.deltas[i - 1];
+    const row = { id: payload.id[i], timestamp: ts };
+    for (const key of KEYS) row[key] = payload.columns[key][i];
+    out[i] = row;
+  }
+  return out;
+}
+// Fusion de fetchBackendData (backendService.ts), sans la troncature au ring
+function merge(previous, items) {
+  const known = new Set(previous.map(r => r.id));
+  return [...previous, ...items.filter(r => !known.has(r.id))].sort((a, b) => a.timestamp - b.timestamp);
+}
+function bench(fn) {
+  let best = Infinity;
+  for (let i = 0; i < Number(repeat); i++) {
+    const t = process.hrtime.bigint();
+    fn();
+    best = Math.min(best, Number(process.hrtime.bigint() - t) / 1e6);
+  }
+  return best;
+}
+const decodeRows = () => JSON.parse(rowsText).map(toSensorData);
+const items = decodeRows();
+const previous = items.slice(0, items.length >> 1);
+console.log(JSON.stringify({
+  rows: bench(decodeRows),
+  columnar: bench(() => decodeColumnar(JSON.parse(columnarText))),
+  merge: bench(() => merge(previous, items)),
+}));
+"""
+
+
+def synthetic_records(count):
+    start = datetime(2025, 6, 1)
+    moisture = 60.0
+    records = []
+    for i in range(count):
+        moisture = max(15.0, min(95.0, moisture + random.uniform(-0.3, 0.25)))
+        records.append({
+            "_id": ObjectId(),
+            "zone_id": "zone-1",
+            "humidity": round(random.uniform(40, 70), 1),
+            "temperature": round(random.uniform(18, 32), 1),
+            "soil_moisture": round(moisture, 1),
+            "soil_moisture_10cm": round(moisture, 1),
+            "soil_moisture_30cm": round(moisture * 1.05, 1),
+            "soil_moisture_60cm": round(moisture * 1.1, 1),
+            "light": float(random.randint(0, 80000)),
+            "wind_speed": round(random.uniform(0, 15), 1),
+            "rainfall": False,
+            "rainfall_intensity": "none",
+            "anomalies": [],
+            "created_at": start + timedelta(seconds=5 * i),
+        })
+    return records
+
+
+def python_decode_ms(text, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        json.loads(text)
+        best = min(best, time.perf_counter() - started)
+    return best * 1000
+
+
+def kib(size):
+    return f"{size / 1024:9.1f} KiB"
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--points", type=int, nargs="+", default=[1000, 10000, 100000])
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    node = shutil.which("node")
+    print(f"Décodage client mesuré avec: {'Node.js' if node else 'Python json.loads'}")
+    for count in args.points:
+        records = synthetic_records(count)
+        payloads = {
+            "lignes": json.dumps([format_reading(r) for r in records], separators=(",", ":")).encode(),
+            "colonnaire": json.dumps(to_columnar(records), separators=(",", ":")).encode(),
+        }
+
+        if node:
+            with tempfile.TemporaryDirectory() as tmp:
+                paths = []
+                for name, body in payloads.items():
+                    path = os.path.join(tmp, f"{name}.json")
+                    with open(path, "wb") as handle:
+                        handle.write(body)
+                    paths.append(path)
+                result = subprocess.run(
+                    [node, "-e", NODE_DECODE, *paths, str(args.repeat)],
+                    capture_output=True, text=True, check=True
+                )
+                timings = json.loads(result.stdout)
+                parse_ms = {"lignes": timings["rows"], "colonnaire": timings["columnar"]}
+                merge_ms = timings["merge"]
+        else:
+            parse_ms = {name: python_decode_ms(body, args.repeat) for name, body in payloads.items()}
+            merge_ms = None
+
+        print(f"\n📊 {count} points")
+        for name, body in payloads.items():
+            line = f"   {name:<11} brut {kib(len(body))} | gzip {kib(len(gzip.compress(body, 6)))}"
+            if brotli is not None:
+                line += f" | br {kib(len(brotli.compress(body, quality=5)))}"
+            print(f"{line} | décodage {parse_ms[name]:8.2f} ms")
+        if merge_ms is not None:
+            print(f"   fusion dans le ring (même coût quel que soit le format) {merge_ms:8.2f} ms")
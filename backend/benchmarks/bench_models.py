@@ -0,0 +1,92 @@
+"""
+Coût de validation et de sérialisation d'une lecture sur le chemin /send-data.
+
+    python benchmarks/bench_models.py [--iterations 100000]
+
+Compare l'ancien chemin (modèle SensorData complet avec un ObjectId généré,
+puis reconverti en dict) au document construit directement depuis la
+requête validée.
+"""
+import argparse
+import json
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from irrigation_logic import irrigation_decision  # noqa: E402
+from models import IrrigationDecision, SensorData, SensorDataCreate  # noqa: E402
+
+BODY = json.dumps({
+    "zone_id": "zone-1",
+    "humidity": 55.2,
+    "temperature": 24.8,
+    "soil_moisture": 42.1,
+    "soil_moisture_10cm": 42.1,
+    "soil_moisture_30cm": 48.7,
+    "soil_moisture_60cm": 55.0,
+    "light": 31000,
+    "wind_speed": 6.4,
+    "rainfall": False,
+    "rainfall_intensity": "none",
+    "pump_was_active": False,
+}).encode()
+
+
+def validate():
+    return SensorDataCreate.model_validate_json(BODY)
+
+
+DATA = validate()
+
+
+def document_before():
+    # Chemin historique : SensorData complet puis dict(by_alias=True)
+    record = SensorData(
+        zone_id=DATA.zone_id,
+        humidity=DATA.humidity,
+        temperature=DATA.temperature,
+        soil_moisture=DATA.soil_moisture,
+        soil_moisture_10cm=DATA.soil_moisture_10cm or DATA.soil_moisture * 0.9,
+        soil_moisture_30cm=DATA.soil_moisture_30cm or DATA.soil_moisture,
+        soil_moisture_60cm=DATA.soil_moisture_60cm or DATA.soil_moisture * 1.1,
+        light=DATA.light or 450.0,
+        wind_speed=DATA.wind_speed or 8.0,
+        rainfall=DATA.rainfall,
+        rainfall_intensity=DATA.rainfall_intensity,
+        flow_rate=DATA.flow_rate,
+    )
+    return record.model_dump(by_alias=True)
+
+
+def document_after():
+    return DATA.to_document()
+
+
+DECISION = irrigation_decision(DATA.soil_moisture, DATA.pump_was_active)
+
+
+def encode_response():
+    return IrrigationDecision.model_validate(DECISION).model_dump_json()
+
+
+def measure(label, func, iterations):
+    seconds = min(timeit.repeat(func, number=iterations, repeat=3))
+    per_call = seconds / iterations * 1e6
+    print(f"   {label:<38} {per_call:8.2f} µs")
+    return per_call
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--iterations", type=int, default=100000)
+    args = parser.parse_args()
+
+    print(f"📊 Coût par lecture ({args.iterations} itérations, meilleur de 3)")
+    validation = measure("Validation JSON (SensorDataCreate)", validate, args.iterations)
+    before = measure("Document - avant (SensorData + dict)", document_before, args.iterations)
+    after = measure("Document - après (to_document)", document_after, args.iterations)
+    response = measure("Réponse (IrrigationDecision JSON)", encode_response, args.iterations)
+    print(f"   Total avant: {validation + before + response:.2f} µs | après: {validation + after + response:.2f} µs "
+          f"({before / after:.1f}x plus rapide pour le document)")
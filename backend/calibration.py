@@ -0,0 +1,382 @@
+"""
+Étalonnage des sondes capacitives d'humidité du sol, par zone et profondeur.
+
+Une courbe (collection `calibrations`) convertit la valeur brute d'une
+sonde en humidité étalonnée :
+
+    x = brut - temperature_coefficient × (température - reference_temperature)
+    étalonné = courbe(x) + offset, borné à [0, 100]
+
+avec `courbe` linéaire par morceaux (`points` (brut, étalonné), bornée aux
+extrémités) ou polynomiale (`coefficients` c0 + c1·x + c2·x² …) ; `offset`
+corrige le type de sol. Les profondeurs sont `soil_moisture` (valeur
+principale), `10cm`, `30cm` et `60cm`.
+
+À l'ingestion, chaque lecture est étalonnée avant la décision ; les valeurs
+brutes sont gardées dans `raw` et la version de chaque courbe appliquée
+dans `calibration`. Un lot de lectures (import, recalcul) est étalonné par
+évaluation vectorisée NumPy, une courbe à la fois.
+
+Une courbe créée, modifiée ou supprimée lance un recalcul en tâche de fond
+des seules lectures concernées (zone, profondeur, depuis le plus ancien des
+`valid_from` de l'ancienne et de la nouvelle courbe ; les lectures
+antérieures au `valid_from` de la nouvelle reprennent leur valeur brute), par
+paquets de CALIBRATION_RECALC_CHUNK lectures parcourus selon l'index
+(zone_id, _id), à partir des valeurs brutes. L'avancement est stocké dans
+`calibration_jobs` : un redémarrage reprend au dernier paquet écrit. À la
+fin d'un recalcul, les abonnés (historique récent en mémoire…) rechargent
+la zone. Avec cluster.py, seul le worker propriétaire de la zone recalcule.
+"""
+import asyncio
+import bisect
+import os
+import time
+from collections import Counter
+from datetime import datetime
+from typing import Awaitable, Callable, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+from bson import ObjectId
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from pymongo import UpdateOne
+
+CALIBRATION_RECALC_CHUNK = int(os.getenv("CALIBRATION_RECALC_CHUNK", "1000"))
+# Pause entre deux paquets du recalcul (laisse passer les requêtes de l'ingestion)
+CALIBRATION_RECALC_PAUSE_SECONDS = float(os.getenv("CALIBRATION_RECALC_PAUSE_SECONDS", "0.05"))
+CALIBRATIONS_REFRESH_SECONDS = float(os.getenv("CALIBRATIONS_REFRESH_SECONDS", "30"))
+
+# Profondeur → champ de la lecture
+CALIBRATED_FIELDS = {
+    "soil_moisture": "soil_moisture",
+    "10cm": "soil_moisture_10cm",
+    "30cm": "soil_moisture_30cm",
+    "60cm": "soil_moisture_60cm",
+}
+
+Listener = Callable[[str, str], Awaitable[None]]
+
+
+class Curve:
+    __slots__ = ("kind", "xs", "ys", "coefficients", "offset", "temperature_coefficient",
+                 "reference_temperature", "valid_from", "version")
+
+    def __init__(self, doc: dict):
+        self.kind = doc["kind"]
+        points = sorted(doc.get("points") or [])
+        self.xs = [float(x) for x, _ in points]
+        self.ys = [float(y) for _, y in points]
+        self.coefficients = [float(c) for c in doc.get("coefficients") or []]
+        self.offset = float(doc.get("offset") or 0.0)
+        self.temperature_coefficient = float(doc.get("temperature_coefficient") or 0.0)
+        self.reference_temperature = float(doc.get("reference_temperature", 25.0))
+        self.valid_from: Optional[datetime] = doc.get("valid_from")
+        self.version = doc["version"]
+
+    def apply(self, raw: float, temperature: Optional[float]) -> float:
+        """Valeur étalonnée d'une lecture (chemin scalaire de /send-data)."""
+        x = raw
+        if self.temperature_coefficient and temperature is not None:
+            x -= self.temperature_coefficient * (temperature - self.reference_temperature)
+        if self.kind == "piecewise":
+            xs, ys = self.xs, self.ys
+            if x <= xs[0]:
+                y = ys[0]
+            elif x >= xs[-1]:
+                y = ys[-1]
+            else:
+                i = bisect.bisect_right(xs, x)
+                y = ys[i - 1] + (ys[i] - ys[i - 1]) * (x - xs[i - 1]) / (xs[i] - xs[i - 1])
+        else:
+            y = 0.0
+            for coefficient in reversed(self.coefficients):
+                y = y * x + coefficient
+        return round(min(100.0, max(0.0, y + self.offset)), 2)
+
+    def apply_array(self, raw: np.ndarray, temperature: np.ndarray) -> np.ndarray:
+        """Même calcul sur des tableaux (température NaN : pas de compensation)."""
+        x = np.asarray(raw, dtype=np.float64)
+        if self.temperature_coefficient:
+            t = np.asarray(temperature, dtype=np.float64)
+            x = x - self.temperature_coefficient * np.where(np.isnan(t), 0.0, t - self.reference_temperature)
+        if self.kind == "piecewise":
+            y = np.interp(x, self.xs, self.ys)
+        else:
+            y = np.polynomial.polynomial.polyval(x, self.coefficients)
+        return np.round(np.clip(y + self.offset, 0.0, 100.0), 2)
+
+
+def earliest(*dates: Optional[datetime]) -> Optional[datetime]:
+    """Plus ancienne des dates de début ; None (depuis le début) l'emporte."""
+    if any(date is None for date in dates):
+        return None
+    return min(dates)
+
+
+def calibrate_batch(records: List[dict], curves: Dict[Tuple[str, str], Curve]) -> int:
+    """
+    Étalonne un lot de lectures en place, par évaluation vectorisée par
+    (zone, champ) ; renvoie le nombre de valeurs étalonnées.
+    """
+    groups: Dict[Tuple[str, str], List[int]] = {}
+    for index, record in enumerate(records):
+        for field in CALIBRATED_FIELDS.values():
+            key = (record["zone_id"], field)
+            curve = curves.get(key)
+            if curve is None or record.get(field) is None:
+                continue
+            # Lectures antérieures à la courbe (import d'historique) : laissées brutes
+            if curve.valid_from is None or record.get("created_at") is None or record["created_at"] >= curve.valid_from:
+                groups.setdefault(key, []).append(index)
+    for (zone_id, field), indices in groups.items():
+        curve = curves[(zone_id, field)]
+        raw = np.fromiter((records[i][field] for i in indices), dtype=np.float64, count=len(indices))
+        temperature = np.fromiter(
+            (np.nan if records[i].get("temperature") is None else records[i]["temperature"] for i in indices),
+            dtype=np.float64, count=len(indices)
+        )
+        for i, value in zip(indices, curve.apply_array(raw, temperature).tolist()):
+            record = records[i]
+            record.setdefault("raw", {})[field] = record[field]
+            record.setdefault("calibration", {})[field] = curve.version
+            record[field] = value
+    return sum(map(len, groups.values()))
+
+
+def curves_from_documents(docs: Iterable[dict]) -> Dict[Tuple[str, str], Curve]:
+    return {(doc["zone_id"], CALIBRATED_FIELDS[doc["depth"]]): Curve(doc) for doc in docs}
+
+
+class CalibrationRegistry:
+    def __init__(self):
+        self.docs: Dict[Tuple[str, str], dict] = {}
+        self.curves: Dict[Tuple[str, str], Curve] = {}
+        # zone → champ → courbe (chemin de l'ingestion)
+        self.by_zone: Dict[str, Dict[str, Curve]] = {}
+        self.listeners: List[Listener] = []
+        self.counters = Counter()
+        self.owns: Callable[[str], bool] = lambda zone_id: True
+        self._queue: Optional[asyncio.Queue] = None
+        self._queued: set = set()
+        self._tasks: List[asyncio.Task] = []
+
+    def subscribe(self, listener: Listener) -> None:
+        """`await listener(zone_id, field)` à la fin de chaque recalcul."""
+        self.listeners.append(listener)
+
+    def _set_docs(self, docs: Dict[Tuple[str, str], dict]) -> None:
+        self.docs = docs
+        self.curves = curves_from_documents(docs.values())
+        by_zone: Dict[str, Dict[str, Curve]] = {}
+        for (zone_id, field), curve in self.curves.items():
+            by_zone.setdefault(zone_id, {})[field] = curve
+        self.by_zone = by_zone
+
+    def calibrate(self, record: dict) -> None:
+        """Étalonne une lecture en place ; valeurs brutes dans `raw`."""
+        curves = self.by_zone.get(record["zone_id"])
+        if not curves:
+            return
+        raw, versions = {}, {}
+        temperature = record.get("temperature")
+        for field, curve in curves.items():
+            value = record.get(field)
+            if value is not None and (curve.valid_from is None or record["created_at"] >= curve.valid_from):
+                raw[field] = value
+                versions[field] = curve.version
+                record[field] = curve.apply(value, temperature)
+        if not raw:
+            return
+        record["raw"] = raw
+        record["calibration"] = versions
+        self.counters["calibrated_readings"] += 1
+
+    def calibrate_many(self, records: List[dict]) -> int:
+        return calibrate_batch(records, self.curves)
+
+    # ---------- Courbes ----------
+
+    async def upsert(self, db: AsyncIOMotorDatabase, zone_id: str, depth: str, curve: dict) -> dict:
+        doc = {"zone_id": zone_id, "depth": depth, **curve, "version": time.time_ns() // 1_000_000}
+        await db.calibrations.replace_one({"zone_id": zone_id, "depth": depth}, doc, upsert=True)
+        doc.pop("_id", None)
+        key = (zone_id, CALIBRATED_FIELDS[depth])
+        previous = self.docs.get(key)
+        # Lectures étalonnées par l'ancienne courbe comprises, même avant le nouveau valid_from
+        since = doc.get("valid_from") if previous is None else earliest(previous.get("valid_from"), doc.get("valid_from"))
+        self._set_docs({**self.docs, key: doc})
+        await self._create_job(db, zone_id, key[1], doc, since)
+        return doc
+
+    async def remove(self, db: AsyncIOMotorDatabase, zone_id: str, depth: str) -> bool:
+        result = await db.calibrations.delete_one({"zone_id": zone_id, "depth": depth})
+        field = CALIBRATED_FIELDS[depth]
+        previous = self.docs.get((zone_id, field))
+        if previous is not None:
+            self._set_docs({key: doc for key, doc in self.docs.items() if key != (zone_id, field)})
+        if result.deleted_count:
+            # Retour aux valeurs brutes des lectures étalonnées
+            await self._create_job(db, zone_id, field, None, previous.get("valid_from") if previous else None)
+        return result.deleted_count > 0
+
+    async def load(self, db: AsyncIOMotorDatabase) -> None:
+        """Recharge les courbes ; reprend les recalculs en attente des zones de ce worker."""
+        docs = {
+            (doc["zone_id"], CALIBRATED_FIELDS[doc["depth"]]): doc
+            async for doc in db.calibrations.find({}, {"_id": 0})
+        }
+        if docs != self.docs:
+            self._set_docs(docs)
+        async for job in db.calibration_jobs.find({"status": {"$ne": "done"}}, {"zone_id": 1, "field": 1}):
+            self._enqueue(job["zone_id"], job["field"])
+
+    # ---------- Recalcul ----------
+
+    async def _create_job(self, db: AsyncIOMotorDatabase, zone_id: str, field: str,
+                          curve: Optional[dict], since: Optional[datetime]) -> None:
+        """
+        Remplace le recalcul de (zone, champ) : repart de `since` (None : du
+        début) avec la nouvelle courbe, ou du début du travail remplacé s'il
+        n'était pas terminé.
+        """
+        replaced = await db.calibration_jobs.find_one({"zone_id": zone_id, "field": field}, {"since": 1, "status": 1})
+        if replaced is not None and replaced["status"] != "done":
+            since = earliest(since, replaced.get("since"))
+        job = {
+            "zone_id": zone_id,
+            "field": field,
+            "curve": curve,
+            "since": since,
+            "cursor": None,
+            "status": "pending",
+            "processed": 0,
+            "created_at": datetime.utcnow(),
+            "updated_at": datetime.utcnow(),
+        }
+        await db.calibration_jobs.replace_one({"zone_id": zone_id, "field": field}, job, upsert=True)
+        self._enqueue(zone_id, field)
+
+    def _enqueue(self, zone_id: str, field: str) -> None:
+        if self._queue is None or not self.owns(zone_id) or (zone_id, field) in self._queued:
+            return
+        self._queued.add((zone_id, field))
+        self._queue.put_nowait((zone_id, field))
+
+    async def recalculate_chunk(self, db: AsyncIOMotorDatabase, job: dict) -> Tuple[int, Optional[ObjectId]]:
+        """Recalcule un paquet de lectures du travail ; renvoie (lectures lues, dernier _id)."""
+        zone_id, field, curve_doc = job["zone_id"], job["field"], job["curve"]
+        query: dict = {"zone_id": zone_id}
+        id_range = {}
+        if job.get("since") is not None:
+            id_range["$gte"] = ObjectId.from_datetime(job["since"])
+        if job.get("cursor") is not None:
+            id_range["$gt"] = job["cursor"]
+        if id_range:
+            query["_id"] = id_range
+        if curve_doc is not None:
+            query[f"calibration.{field}"] = {"$ne": curve_doc["version"]}
+        else:
+            query[f"raw.{field}"] = {"$exists": True}
+        projection = {field: 1, f"raw.{field}": 1, "temperature": 1, "created_at": 1}
+        docs = await db.sensor_data.find(query, projection).sort("_id", 1).limit(CALIBRATION_RECALC_CHUNK) \
+            .to_list(CALIBRATION_RECALC_CHUNK)
+        last_id = docs[-1]["_id"] if docs else None
+        read = len(docs)
+
+        if curve_doc is None:
+            reverted, docs = docs, []
+        else:
+            # Antérieures au valid_from de la courbe (comme à l'ingestion) : valeurs brutes
+            valid_from = curve_doc.get("valid_from")
+            reverted = [doc for doc in docs if valid_from is not None and doc["created_at"] < valid_from]
+            docs = [doc for doc in docs if valid_from is None or doc["created_at"] >= valid_from]
+
+        operations = [
+            UpdateOne({"_id": doc["_id"]}, {
+                "$set": {field: doc["raw"][field]},
+                "$unset": {f"raw.{field}": "", f"calibration.{field}": ""},
+            })
+            for doc in reverted if field in (doc.get("raw") or {})
+        ]
+        docs = [doc for doc in docs if (doc.get("raw") or {}).get(field, doc.get(field)) is not None]
+        raw = np.array([(doc.get("raw") or {}).get(field, doc.get(field)) for doc in docs], dtype=np.float64)
+        temperature = np.array(
+            [np.nan if doc.get("temperature") is None else doc["temperature"] for doc in docs], dtype=np.float64
+        )
+        values = Curve(curve_doc).apply_array(raw, temperature).tolist() if docs else []
+        for doc, raw_value, value in zip(docs, raw.tolist(), values):
+            operations.append(UpdateOne({"_id": doc["_id"]}, {"$set": {
+                field: value, f"raw.{field}": raw_value, f"calibration.{field}": curve_doc["version"],
+            }}))
+        if operations:
+            await db.sensor_data.bulk_write(operations, ordered=False)
+        self.counters["recalculated_readings"] += len(operations)
+        return read, last_id
+
+    async def _run_job(self, db: AsyncIOMotorDatabase, zone_id: str, field: str) -> None:
+        while True:
+            job = await db.calibration_jobs.find_one({"zone_id": zone_id, "field": field})
+            if job is None or job["status"] == "done":
+                return
+            created_at = job["created_at"]
+            read, last_id = await self.recalculate_chunk(db, job)
+            done = read < CALIBRATION_RECALC_CHUNK
+            # Mise à jour conditionnelle : un travail remplacé entre-temps n'est pas écrasé
+            await db.calibration_jobs.update_one({"zone_id": zone_id, "field": field, "created_at": created_at}, {
+                "$set": {
+                    "cursor": last_id if last_id is not None else job.get("cursor"),
+                    "status": "done" if done else "running",
+                    "updated_at": datetime.utcnow(),
+                },
+                "$inc": {"processed": read},
+            })
+            if done:
+                self.counters["jobs_completed"] += 1
+                for listener in self.listeners:
+                    await listener(zone_id, field)
+                return
+            await asyncio.sleep(CALIBRATION_RECALC_PAUSE_SECONDS)
+
+    async def _worker(self, db: AsyncIOMotorDatabase) -> None:
+        while True:
+            zone_id, field = await self._queue.get()
+            self._queued.discard((zone_id, field))
+            try:
+                await self._run_job(db, zone_id, field)
+            except Exception as e:
+                self.counters["job_errors"] += 1
+                print(f"Étalonnage {zone_id}/{field}: échec du recalcul - {e}")
+
+    async def _refresh_loop(self, db: AsyncIOMotorDatabase) -> None:
+        while True:
+            await asyncio.sleep(CALIBRATIONS_REFRESH_SECONDS)
+            try:
+                await self.load(db)
+            except Exception as e:
+                print(f"Étalonnages: échec du rechargement - {e}")
+
+    async def start(self, db: AsyncIOMotorDatabase, owns: Callable[[str], bool] = lambda zone_id: True) -> None:
+        self.owns = owns
+        self._queue = asyncio.Queue()
+        await db.calibrations.create_index([("zone_id", 1), ("depth", 1)], unique=True)
+        await db.calibration_jobs.create_index([("zone_id", 1), ("field", 1)], unique=True)
+        await self.load(db)
+        self._tasks = [asyncio.create_task(self._worker(db)), asyncio.create_task(self._refresh_loop(db))]
+
+    async def stop(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        self._tasks = []
+
+    def stats(self) -> dict:
+        return {
+            "curves": len(self.curves),
+            "zones": len(self.by_zone),
+            "calibrated_readings": self.counters["calibrated_readings"],
+            "recalculated_readings": self.counters["recalculated_readings"],
+            "jobs_queued": len(self._queued),
+            "jobs_completed": self.counters["jobs_completed"],
+            "job_errors": self.counters["job_errors"],
+        }
+
+
+calibration_registry = CalibrationRegistry()
@@ -0,0 +1,389 @@
+"""
+Déploiement multi-processus avec routage des zones vers un worker propriétaire.
+
+    python cluster.py --workers 4 --port 8000
+
+Le lanceur ouvre le port public une seule fois et démarre N workers uvicorn
+qui l'acceptent tous ; chaque worker écoute aussi un port privé
+(CLUSTER_PRIVATE_PORT + index, sur 127.0.0.1). Chaque zone a un seul
+worker propriétaire (crc32(zone_id) % N) : ses écritures (/send-data,
+/toggle-valve, /toggle-valve/bulk) et ses lectures servies par l'état en
+mémoire (`?zone_id=` : tampon d'historique, prévision, vannes ouvertes)
+sont relayées vers lui. L'hystérésis de la pompe, la file des relais, la
+bande morte et le détecteur d'anomalies d'une zone restent donc dans un
+seul processus, et l'ingestion se répartit sur les cœurs.
+
+/forecast et /water-usage sans zone sont diffusés à tous les workers,
+chacun répondant pour ses zones. Le dernier état de chaque zone est publié
+dans la table partagée (shared_state.py), lisible par tous sans MongoDB.
+
+Avec un seul worker (défaut, `uvicorn main:app`), le middleware ne fait rien.
+"""
+import argparse
+import asyncio
+import collections
+import contextvars
+import json
+import multiprocessing
+import os
+import signal
+import socket
+import sys
+import tempfile
+import time
+import zlib
+from typing import Callable, Dict, List, Optional
+from urllib.parse import parse_qs
+
+import httpx
+
+CLUSTER_WORKERS = int(os.getenv("CLUSTER_WORKERS", "1"))
+CLUSTER_WORKER_INDEX = int(os.getenv("CLUSTER_WORKER_INDEX", "0"))
+CLUSTER_PRIVATE_HOST = os.getenv("CLUSTER_PRIVATE_HOST", "127.0.0.1")
+CLUSTER_PRIVATE_PORT = int(os.getenv("CLUSTER_PRIVATE_PORT", "9100"))
+CLUSTER_FORWARD_TIMEOUT = float(os.getenv("CLUSTER_FORWARD_TIMEOUT", "10"))
+
+# Posé sur les requêtes relayées entre workers : "1" (zone du destinataire) ou "owned" (diffusion).
+# Honorés seulement sur le port privé du worker, retirés des requêtes du port public.
+FORWARDED_HEADER = b"x-cluster-forwarded"
+CLIENT_HEADER = b"x-cluster-client"
+# Routes dont la zone est dans le corps JSON
+ZONE_BODY_ROUTES = {"/send-data", "/toggle-valve", "/schedules"}
+# Remplacements (PUT) dont le corps porte aussi le zone_id
+ZONE_BODY_PUT_PREFIXES = ("/schedules/",)
+# Remplacements et suppressions dont la zone est le premier segment après le préfixe
+ZONE_PATH_PREFIXES = ("/calibrations/",)
+# Lectures d'état en mémoire du propriétaire : /zones/{zone_id}/<suffixe>
+ZONE_PATH_GET_SUFFIXES = ("/digest",)
+# En-têtes de saut ou recalculés par le worker qui répond au client
+HOP_HEADERS = {
+    b"host", b"content-length", b"transfer-encoding", b"connection", b"accept-encoding",
+    b"content-encoding", b"origin", b"date", b"server", b"keep-alive",
+}
+
+# Requête de diffusion en cours : ne répondre que pour les zones possédées
+owned_only: contextvars.ContextVar[bool] = contextvars.ContextVar("owned_only", default=False)
+
+routing_stats = collections.Counter()
+_client = None
+
+
+def owner_of(zone_id: str) -> int:
+    return zlib.crc32(zone_id.encode()) % CLUSTER_WORKERS
+
+
+def owns(zone_id: str) -> bool:
+    return CLUSTER_WORKERS <= 1 or owner_of(zone_id) == CLUSTER_WORKER_INDEX
+
+
+def serves(zone_id: str) -> bool:
+    """La zone fait partie de la réponse de ce worker (toutes, hors diffusion)."""
+    return not owned_only.get() or owns(zone_id)
+
+
+def merge_forecasts(responses: List[list]) -> list:
+    return [forecast for response in responses for forecast in response]
+
+
+def merge_water_usage(responses: List[dict]) -> dict:
+    merged = dict(responses[0], zones={})
+    for response in responses:
+        merged["zones"].update(response["zones"])
+    merged["zones"] = dict(sorted(merged["zones"].items()))
+    return merged
+
+
+# Routes sans zone_id servies par l'état en mémoire de chaque propriétaire
+SCATTER_ROUTES: Dict[str, Callable[[list], object]] = {
+    "/forecast": merge_forecasts,
+    "/water-usage": merge_water_usage,
+}
+
+
+async def read_body(receive) -> bytes:
+    body = b""
+    more = True
+    while more:
+        message = await receive()
+        body += message.get("body", b"")
+        more = message.get("more_body", False)
+    return body
+
+
+def replay(body: bytes):
+    sent = False
+
+    async def receive():
+        nonlocal sent
+        if sent:
+            return {"type": "http.disconnect"}
+        sent = True
+        return {"type": "http.request", "body": body, "more_body": False}
+    return receive
+
+
+def body_zone_id(path: str, body: bytes) -> Optional[str]:
+    """zone_id du corps JSON ; None si le corps est invalide (erreur de validation renvoyée par la route)."""
+    try:
+        payload = json.loads(body)
+        zone_id = payload.get("zone_id", "zone-1") if path == "/send-data" else payload.get("zone_id")
+    except (ValueError, AttributeError):
+        return None
+    return zone_id if isinstance(zone_id, str) else None
+
+
+def on_private_port(scope) -> bool:
+    """Requête reçue sur le port privé de ce worker (relais d'un autre worker)."""
+    server = scope.get("server")
+    return server is not None and server[1] == CLUSTER_PRIVATE_PORT + CLUSTER_WORKER_INDEX
+
+
+def client_address(scope) -> str:
+    """Adresse du client d'origine, transmise par le worker qui a relayé la requête."""
+    headers = dict(scope.get("headers") or [])
+    if FORWARDED_HEADER in headers and CLIENT_HEADER in headers:
+        return headers[CLIENT_HEADER].decode("latin-1")
+    return scope["client"][0] if scope.get("client") else "inconnu"
+
+
+async def send_json(send, status: int, payload) -> None:
+    body = json.dumps(payload).encode()
+    await send({"type": "http.response.start", "status": status, "headers": [
+        (b"content-type", b"application/json"), (b"content-length", str(len(body)).encode())
+    ]})
+    await send({"type": "http.response.body", "body": body})
+
+
+def cluster_stats() -> dict:
+    return {
+        "workers": CLUSTER_WORKERS,
+        "worker_index": CLUSTER_WORKER_INDEX,
+        "pid": os.getpid(),
+        "forwarded": routing_stats["forwarded"],
+        "scattered": routing_stats["scattered"],
+        "unreachable": routing_stats["unreachable"],
+    }
+
+
+async def close_client() -> None:
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
+
+
+class ZoneRoutingMiddleware:
+    def __init__(self, app):
+        self.app = app
+
+    def worker_url(self, index: int, path: str, query_string: bytes) -> str:
+        url = f"http://{CLUSTER_PRIVATE_HOST}:{CLUSTER_PRIVATE_PORT + index}{path}"
+        return url + "?" + query_string.decode("latin-1") if query_string else url
+
+    async def request(self, index: int, scope, body: Optional[bytes], mode: bytes = b"1"):
+        global _client
+        if _client is None:
+            _client = httpx.AsyncClient(timeout=CLUSTER_FORWARD_TIMEOUT)
+        headers = [(k, v) for k, v in scope["headers"] if k not in HOP_HEADERS and k != CLIENT_HEADER]
+        headers += [(FORWARDED_HEADER, mode), (CLIENT_HEADER, client_address(scope).encode("latin-1"))]
+        return await _client.request(
+            scope["method"], self.worker_url(index, scope["path"], scope["query_string"]),
+            headers=headers, content=body
+        )
+
+    async def forward(self, index: int, scope, body: Optional[bytes], send) -> None:
+        routing_stats["forwarded"] += 1
+        try:
+            response = await self.request(index, scope, body)
+        except httpx.HTTPError as e:
+            routing_stats["unreachable"] += 1
+            await send_json(send, 503, {"detail": f"Worker {index} injoignable: {e}"})
+            return
+        headers = [(k, v) for k, v in response.headers.raw if k.lower() not in HOP_HEADERS]
+        headers.append((b"content-length", str(len(response.content)).encode()))
+        await send({"type": "http.response.start", "status": response.status_code, "headers": headers})
+        await send({"type": "http.response.body", "body": response.content})
+
+    async def scatter(self, scope, send) -> None:
+        """Interroge tous les workers (zones possédées) et fusionne leurs réponses JSON."""
+        routing_stats["scattered"] += 1
+        try:
+            responses = await asyncio.gather(*(
+                self.request(index, scope, None, b"owned") for index in range(CLUSTER_WORKERS)
+            ))
+        except httpx.HTTPError as e:
+            routing_stats["unreachable"] += 1
+            await send_json(send, 503, {"detail": f"Worker injoignable: {e}"})
+            return
+        failed = next((r for r in responses if r.status_code != 200), None)
+        if failed is not None:
+            await send_json(send, failed.status_code, failed.json())
+            return
+        await send_json(send, 200, SCATTER_ROUTES[scope["path"]]([r.json() for r in responses]))
+
+    async def split_bulk(self, scope, body: bytes, send) -> bool:
+        """Répartit une commande groupée par propriétaire ; False si la validation revient à l'application."""
+        from zones import zone_registry
+        try:
+            payload = json.loads(body)
+            targets = {c["zone_id"]: c["valve_open"] for c in payload.get("commands", [])}
+            selected = list(payload.get("zone_ids", [])) + sorted(zone_registry.zones_in_groups(payload.get("groups", [])))
+            if selected and not isinstance(payload.get("valve_open"), bool):
+                return False
+            for zone_id in selected:
+                targets[zone_id] = payload["valve_open"]
+        except (ValueError, TypeError, KeyError, AttributeError):
+            return False
+        if not targets or not all(isinstance(zone_id, str) for zone_id in targets):
+            return False
+
+        by_owner: Dict[int, List[dict]] = {}
+        for zone_id, valve_open in targets.items():
+            by_owner.setdefault(owner_of(zone_id), []).append({"zone_id": zone_id, "valve_open": valve_open})
+        routing_stats["forwarded"] += 1
+        try:
+            responses = await asyncio.gather(*(
+                self.request(index, scope, json.dumps({"commands": commands}).encode())
+                for index, commands in by_owner.items()
+            ))
+        except httpx.HTTPError as e:
+            routing_stats["unreachable"] += 1
+            await send_json(send, 503, {"detail": f"Worker injoignable: {e}"})
+            return True
+        failed = next((r for r in responses if r.status_code != 200), None)
+        if failed is not None:
+            await send_json(send, failed.status_code, failed.json())
+            return True
+        results = {result["zone_id"]: result for r in responses for result in r.json()["results"]}
+        await send_json(send, 200, {
+            "requested": len(targets),
+            "succeeded": sum(r.json()["succeeded"] for r in responses),
+            "results": [results[zone_id] for zone_id in targets],
+        })
+        return True
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or CLUSTER_WORKERS <= 1:
+            await self.app(scope, receive, send)
+            return
+
+        headers = dict(scope.get("headers") or [])
+        mode = headers.get(FORWARDED_HEADER)
+        if (mode is not None or CLIENT_HEADER in headers) and not on_private_port(scope):
+            # En-têtes internes envoyés par un client : ignorés
+            scope = dict(scope, headers=[
+                (k, v) for k, v in scope["headers"] if k not in (FORWARDED_HEADER, CLIENT_HEADER)
+            ])
+            mode = None
+        if mode is not None:
+            # Requête relayée par un autre worker : traitée ici sans nouveau routage
+            token = owned_only.set(mode == b"owned")
+            try:
+                await self.app(scope, receive, send)
+            finally:
+                owned_only.reset(token)
+            return
+
+        path, method = scope["path"], scope["method"]
+        zone_id = parse_qs(scope["query_string"].decode("latin-1")).get("zone_id", [None])[0]
+        body = None
+        if method == "GET" and zone_id is None and path in SCATTER_ROUTES:
+            await self.scatter(scope, send)
+            return
+        if method == "POST" and path == "/toggle-valve/bulk":
+            body = await read_body(receive)
+            if await self.split_bulk(scope, body, send):
+                return
+        elif (method == "POST" and path in ZONE_BODY_ROUTES) or (
+                method == "PUT" and path.startswith(ZONE_BODY_PUT_PREFIXES)):
+            body = await read_body(receive)
+            zone_id = body_zone_id(path, body)
+        elif method in ("PUT", "DELETE") and path.startswith(ZONE_PATH_PREFIXES):
+            zone_id = path.split("/")[2]
+        elif method == "GET" and path.startswith("/zones/") and path.endswith(ZONE_PATH_GET_SUFFIXES):
+            zone_id = path.split("/")[2]
+
+        if zone_id is not None and not owns(zone_id):
+            await self.forward(owner_of(zone_id), scope, body, send)
+            return
+        await self.app(scope, replay(body) if body is not None else receive, send)
+
+
+# ---------- Lanceur ----------
+
+def run_worker(index: int, args, public: socket.socket) -> None:
+    os.environ["CLUSTER_WORKER_INDEX"] = str(index)
+    import uvicorn
+    from shared_state import shared_state
+
+    # Module hérité du lanceur (table anonyme) : ouvrir le fichier partagé
+    shared_state.attach(os.environ["SHARED_STATE_PATH"])
+
+    private = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    private.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    private.bind((CLUSTER_PRIVATE_HOST, args.private_port + index))
+    config = uvicorn.Config("main:app", log_level=args.log_level)
+    uvicorn.Server(config).run(sockets=[public, private])
+
+
+def start_worker(index: int, args, public: socket.socket) -> multiprocessing.Process:
+    process = multiprocessing.get_context("fork").Process(
+        target=run_worker, args=(index, args, public), name=f"worker-{index}"
+    )
+    process.start()
+    return process
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--private-port", type=int, default=CLUSTER_PRIVATE_PORT,
+                        help="port privé du worker 0 (les suivants: +1, +2...)")
+    parser.add_argument("--state-path", default=None,
+                        help="fichier de la table partagée (défaut: /dev/shm ou répertoire temporaire)")
+    parser.add_argument("--log-level", default="info")
+    args = parser.parse_args()
+
+    state_dir = "/dev/shm" if os.path.isdir("/dev/shm") else tempfile.gettempdir()
+    state_path = args.state_path or os.path.join(state_dir, f"irrigation-state-{args.port}")
+    from shared_state import SharedStateTable
+    SharedStateTable.create(state_path)
+
+    # Lu par cluster.py et shared_state.py à l'import dans chaque worker
+    os.environ["CLUSTER_WORKERS"] = str(args.workers)
+    os.environ["CLUSTER_PRIVATE_PORT"] = str(args.private_port)
+    os.environ["SHARED_STATE_PATH"] = state_path
+
+    public = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    public.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    public.bind((args.host, args.port))
+    public.listen(2048)
+    public.set_inheritable(True)
+
+    stopping = False
+
+    def stop(signum, frame):
+        global stopping
+        stopping = True
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+
+    workers = {index: start_worker(index, args, public) for index in range(args.workers)}
+    print(f"🚀 {args.workers} workers sur {args.host}:{args.port} "
+          f"(ports privés {args.private_port}-{args.private_port + args.workers - 1}, état partagé {state_path})")
+    while not stopping:
+        time.sleep(1)
+        for index, process in list(workers.items()):
+            if not process.is_alive() and not stopping:
+                # Le propriétaire de ses zones doit revenir : redémarrage à l'identique
+                print(f"⚠️  worker-{index} arrêté (code {process.exitcode}), redémarrage", file=sys.stderr)
+                workers[index] = start_worker(index, args, public)
+
+    for process in workers.values():
+        process.terminate()
+    for process in workers.values():
+        process.join(timeout=10)
+    os.unlink(state_path)
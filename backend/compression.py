@@ -0,0 +1,111 @@
+"""
+Compression des réponses négociée par `Accept-Encoding` (brotli ou gzip).
+
+Seules les réponses complètes (non streamées) au-dessus de
+`minimum_size` octets sont compressées ; les flux `text/event-stream`
+passent sans attente ni compression ; brotli est utilisé si le module
+optionnel `brotli` est installé et que le client l'accepte.
+"""
+import gzip
+from typing import Optional
+
+try:
+    import brotli
+except ImportError:  # Dépendance optionnelle
+    brotli = None
+
+
+def choose_encoding(accept_encoding: str) -> Optional[str]:
+    """Choisit br ou gzip selon les préférences (q-values) du client."""
+    accepted = {}
+    for part in accept_encoding.split(","):
+        name, _, params = part.strip().partition(";")
+        quality = 1.0
+        if params.strip().startswith("q="):
+            try:
+                quality = float(params.strip()[2:])
+            except ValueError:
+                quality = 0.0
+        if name:
+            accepted[name.strip().lower()] = quality
+
+    candidates = (["br"] if brotli is not None else []) + ["gzip"]
+    best = None
+    for encoding in candidates:
+        quality = accepted.get(encoding, accepted.get("*", 0.0))
+        if quality > 0 and (best is None or quality > best[1]):
+            best = (encoding, quality)
+    return best[0] if best else None
+
+
+def with_vary(headers: list) -> list:
+    """En-têtes avec `Vary: Accept-Encoding`, ajouté aux valeurs existantes."""
+    vary = [value for name, value in headers if name.lower() == b"vary"]
+    if any(b"accept-encoding" in value.lower() for value in vary):
+        return headers
+    headers = [(name, value) for name, value in headers if name.lower() != b"vary"]
+    return headers + [(b"vary", b", ".join(vary + [b"Accept-Encoding"]))]
+
+
+def compress(body: bytes, encoding: str) -> bytes:
+    if encoding == "br":
+        return brotli.compress(body, quality=5)
+    return gzip.compress(body, compresslevel=6)
+
+
+class CompressionMiddleware:
+    def __init__(self, app, minimum_size: int = 1000):
+        self.app = app
+        self.minimum_size = minimum_size
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        headers = dict(scope.get("headers") or [])
+        encoding = choose_encoding(headers.get(b"accept-encoding", b"").decode("latin-1"))
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        start_message = None
+        streaming = False
+
+        async def send_wrapper(message):
+            nonlocal start_message, streaming
+            if message["type"] == "http.response.start":
+                content_type = dict(message.get("headers", [])).get(b"content-type", b"")
+                if content_type.startswith(b"text/event-stream"):
+                    # SSE : en-têtes transmis aussitôt, événements jamais mis en attente
+                    streaming = True
+                    await send(message)
+                    return
+                # Attendre le corps pour décider de compresser
+                start_message = message
+                return
+            if message["type"] != "http.response.body" or streaming:
+                await send(message)
+                return
+
+            body = message.get("body", b"")
+            response_headers = list(start_message.get("headers", []))
+            already_encoded = any(name.lower() == b"content-encoding" for name, _ in response_headers)
+            if message.get("more_body") or already_encoded or len(body) < self.minimum_size:
+                # Réponse streamée, déjà encodée ou trop petite : corps inchangé, mais la
+                # représentation dépend toujours d'Accept-Encoding pour les caches
+                streaming = bool(message.get("more_body"))
+                await send({**start_message, "headers": with_vary(response_headers)})
+                await send(message)
+                return
+
+            compressed = compress(body, encoding)
+            response_headers = [(name, value) for name, value in response_headers if name.lower() != b"content-length"]
+            response_headers += [
+                (b"content-encoding", encoding.encode()),
+                (b"content-length", str(len(compressed)).encode()),
+            ]
+            await send({**start_message, "headers": with_vary(response_headers)})
+            await send({"type": "http.response.body", "body": compressed})
+
+        await self.app(scope, receive, send_wrapper)
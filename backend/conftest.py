@@ -0,0 +1,39 @@
+"""
+Tests pytest du backend : `python -m pytest` depuis backend/ (pytest et mongomock-motor requis).
+
+MongoDB est remplacé par une base mongomock neuve à chaque test ; les
+registres en mémoire (vannes, doublons, programmes) sont partagés par le
+processus, d'où une zone distincte par test.
+"""
+import pytest
+
+# Scripts manuels qui interrogent un serveur lancé (localhost:8000)
+collect_ignore = ["test_api.py", "test_app.py", "test_new_features.py", "test_request.py", "stimulation_test.py"]
+
+
+@pytest.fixture
+def mock_db():
+    mongomock_motor = pytest.importorskip("mongomock_motor")
+    import mongomock.collection
+
+    builder = mongomock.collection.BulkOperationBuilder
+    if not getattr(builder, "_accepts_sort", False):
+        # pymongo >= 4.11 passe `sort` aux UpdateOne de bulk_write, que mongomock ne connaît pas
+        add_update = builder.add_update
+        builder.add_update = lambda self, *args, sort=None, **kwargs: add_update(self, *args, **kwargs)
+        builder._accepts_sort = True
+    return mongomock_motor.AsyncMongoMockClient()["irrigation"]
+
+
+@pytest.fixture
+def client(mock_db):
+    import main
+    from fastapi.testclient import TestClient
+
+    main.db = mock_db
+    with TestClient(main.app) as test_client:
+        yield test_client
+
+
+def reading(zone_id: str, soil_moisture: float, **fields) -> dict:
+    return {"zone_id": zone_id, "humidity": 50.0, "temperature": 25.0, "soil_moisture": soil_moisture, **fields}
@@ -0,0 +1,47 @@
+"""
+Seuils d'irrigation par culture et par saison, côté backend.
+
+Mêmes valeurs que CONFIG_CULTURES / CONFIG_SAISONNIER du simulateur
+(test/config.py), limitées à ce dont la décision a besoin.
+"""
+import os
+from typing import Optional
+
+CONFIG_CULTURES = {
+    'tomates': {'seuil_declenchement': 50, 'seuil_arret': 80, 'categorie': 'Légume-fruit'},
+    'concombres': {'seuil_declenchement': 55, 'seuil_arret': 85, 'categorie': 'Légume-fruit'},
+    'courgettes': {'seuil_declenchement': 50, 'seuil_arret': 80, 'categorie': 'Légume-fruit'},
+    'poivrons': {'seuil_declenchement': 50, 'seuil_arret': 75, 'categorie': 'Légume-fruit'},
+    'salades': {'seuil_declenchement': 40, 'seuil_arret': 70, 'categorie': 'Légume-feuille'},
+    'epinards': {'seuil_declenchement': 40, 'seuil_arret': 70, 'categorie': 'Légume-feuille'},
+    'choux': {'seuil_declenchement': 45, 'seuil_arret': 75, 'categorie': 'Légume-feuille'},
+    'haricots': {'seuil_declenchement': 35, 'seuil_arret': 65, 'categorie': 'Légumineuse'},
+    'carottes': {'seuil_declenchement': 30, 'seuil_arret': 60, 'categorie': 'Légume-racine'},
+    'oignons': {'seuil_declenchement': 25, 'seuil_arret': 55, 'categorie': 'Légume-bulbe'},
+    'ail': {'seuil_declenchement': 20, 'seuil_arret': 50, 'categorie': 'Légume-bulbe'},
+    'pommes_de_terre': {'seuil_declenchement': 30, 'seuil_arret': 60, 'categorie': 'Légume-tubercule'},
+}
+
+# Coefficient appliqué aux seuils de la culture selon la saison
+COEFFICIENT_SAISON = {
+    'printemps': 1.0,   # Normal
+    'ete': 1.2,         # +20% en été (évaporation forte)
+    'automne': 0.9,     # -10% en automne
+    'hiver': 0.7        # -30% en hiver
+}
+
+# Saison appliquée aux zones sans saison propre
+SAISON_PAR_DEFAUT = os.getenv("IRRIGATION_SEASON", "printemps")
+
+
+def obtenir_seuils_intelligents(type_culture: str, saison: Optional[str] = None) -> dict:
+    """
+    Seuils de la culture ajustés à la saison (même calcul que
+    obtenir_seuils_intelligents du simulateur).
+    """
+    seuils_culture = CONFIG_CULTURES.get(type_culture, CONFIG_CULTURES['tomates'])
+    coef = COEFFICIENT_SAISON.get(saison or SAISON_PAR_DEFAUT, 1.0)
+    return {
+        'seuil_declenchement': int(min(seuils_culture['seuil_declenchement'] * coef, 90)),
+        'seuil_arret': int(min(seuils_culture['seuil_arret'] * coef, 95)),
+    }
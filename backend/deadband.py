@@ -0,0 +1,155 @@
+"""
+Stockage en bande morte (deadband) des lectures capteurs.
+
+Une lecture n'est écrite que si un champ suivi s'est écarté de plus de son
+epsilon depuis la dernière valeur *stockée* de la zone, si un champ discret
+(pluie, débit, anomalies) a changé, ou si l'intervalle de battement
+(heartbeat) est écoulé. Les séries sont reconstruites à la lecture, en
+escalier (valeur tenue) ou par interpolation linéaire, sur la grille
+d'échantillonnage des capteurs.
+
+Désactivé par défaut (DEADBAND_ENABLED=1 pour l'activer).
+"""
+import os
+from datetime import datetime, timedelta
+from typing import Dict, List
+
+DEADBAND_ENABLED = os.getenv("DEADBAND_ENABLED", "0").lower() in ("1", "true", "yes")
+# Écriture forcée au moins toutes les N secondes par zone
+DEADBAND_HEARTBEAT_SECONDS = float(os.getenv("DEADBAND_HEARTBEAT_SECONDS", "300"))
+# Période d'échantillonnage des capteurs, grille de reconstruction
+DEADBAND_SAMPLE_SECONDS = float(os.getenv("DEADBAND_SAMPLE_SECONDS", "5"))
+
+# Écart (en unités du champ) au-delà duquel une lecture est stockée
+DEFAULT_EPSILONS = {
+    "soil_moisture": 0.5,
+    "soil_moisture_10cm": 0.5,
+    "soil_moisture_30cm": 0.5,
+    "soil_moisture_60cm": 0.5,
+    "temperature": 0.5,
+    "humidity": 3.0,
+    "light": 2000.0,
+    "wind_speed": 2.0,
+}
+
+# Champs discrets : tout changement force l'écriture
+DISCRETE_FIELDS = ("rainfall", "rainfall_intensity", "flow_rate")
+
+# Champs interpolés linéairement à la reconstruction (les autres sont tenus)
+NUMERIC_FIELDS = tuple(DEFAULT_EPSILONS)
+
+
+def parse_epsilons(spec: str) -> Dict[str, float]:
+    """'soil_moisture_30cm:0.2,humidity:5' → epsilons par défaut surchargés."""
+    epsilons = dict(DEFAULT_EPSILONS)
+    for item in filter(None, (part.strip() for part in spec.split(","))):
+        field, _, value = item.partition(":")
+        epsilons[field.strip()] = float(value)
+    return epsilons
+
+
+class DeadbandFilter:
+    def __init__(self, epsilons: Dict[str, float] = None, heartbeat_seconds: float = DEADBAND_HEARTBEAT_SECONDS):
+        self.epsilons = epsilons if epsilons is not None else parse_epsilons(os.getenv("DEADBAND_EPSILONS", ""))
+        self.heartbeat = timedelta(seconds=heartbeat_seconds)
+        self.last_stored: Dict[str, dict] = {}
+        self.received = 0
+        self.stored = 0
+
+    def should_store(self, zone_id: str, record: dict) -> bool:
+        """Décide si `record` doit être écrit et, si oui, le retient comme référence."""
+        self.received += 1
+        previous = self.last_stored.get(zone_id)
+        if previous is None or self._changed(previous, record):
+            self.last_stored[zone_id] = record
+            self.stored += 1
+            return True
+        return False
+
+    def _changed(self, previous: dict, record: dict) -> bool:
+        if record.get("anomalies"):
+            return True
+        if record["created_at"] - previous["created_at"] >= self.heartbeat:
+            return True
+        for field in DISCRETE_FIELDS:
+            if record.get(field) != previous.get(field):
+                return True
+        for field, epsilon in self.epsilons.items():
+            value, reference = record.get(field), previous.get(field)
+            if value is None or reference is None:
+                if value is not reference:
+                    return True
+            elif abs(value - reference) > epsilon:
+                return True
+        return False
+
+    def stats(self) -> dict:
+        return {
+            "enabled": DEADBAND_ENABLED,
+            "received": self.received,
+            "stored": self.stored,
+            "skipped": self.received - self.stored,
+            "write_reduction": round(1 - self.stored / self.received, 4) if self.received else 0.0,
+            "epsilons": self.epsilons,
+            "heartbeat_seconds": self.heartbeat.total_seconds(),
+        }
+
+
+def _interpolated(a: dict, b: dict, at: datetime, method: str, index: int) -> dict:
+    point = dict(a)
+    point["_id"] = f"{a['_id']}-{index}"
+    point["created_at"] = at
+    point["anomalies"] = []
+    point["interpolated"] = True
+    if method == "linear":
+        ratio = (at - a["created_at"]) / (b["created_at"] - a["created_at"])
+        for field in NUMERIC_FIELDS:
+            if a.get(field) is not None and b.get(field) is not None:
+                point[field] = round(a[field] + (b[field] - a[field]) * ratio, 2)
+    return point
+
+
+def reconstruct(
+    records: List[dict],
+    method: str = "step",
+    sample_seconds: float = DEADBAND_SAMPLE_SECONDS,
+    heartbeat_seconds: float = DEADBAND_HEARTBEAT_SECONDS
+) -> List[dict]:
+    """
+    Série régulière d'une zone à partir des lectures stockées (ordre croissant).
+
+    Les écarts plus longs que le heartbeat ne sont pas comblés : aucune
+    écriture pendant cette durée signifie que le capteur n'émettait pas.
+    """
+    step = timedelta(seconds=sample_seconds)
+    max_gap = timedelta(seconds=heartbeat_seconds) + step
+    series = []
+    for a, b in zip(records, records[1:]):
+        series.append(a)
+        if b["created_at"] - a["created_at"] > max_gap:
+            continue
+        at = a["created_at"] + step
+        index = 1
+        while at < b["created_at"] - step / 2:
+            series.append(_interpolated(a, b, at, method, index))
+            at += step
+            index += 1
+    if records:
+        series.append(records[-1])
+    return series
+
+
+def reconstruct_by_zone(records: List[dict], method: str, newest_first: bool = True) -> List[dict]:
+    """Reconstruit chaque zone séparément puis refusionne dans l'ordre demandé."""
+    by_zone: Dict[str, List[dict]] = {}
+    for record in records:
+        by_zone.setdefault(record["zone_id"], []).append(record)
+    series = []
+    for zone_records in by_zone.values():
+        zone_records.sort(key=lambda r: r["created_at"])
+        series.extend(reconstruct(zone_records, method))
+    series.sort(key=lambda r: r["created_at"], reverse=newest_first)
+    return series
+
+
+deadband = DeadbandFilter()
@@ -0,0 +1,184 @@
+"""
+Suppression des lectures en double (renvois des passerelles après timeout).
+
+Une lecture porte un numéro de séquence du capteur (`seq`) ou une clé
+d'idempotence (`idempotency_key`), uniques par zone. Chaque zone garde :
+
+- un LRU des dernières clés avec la décision renvoyée (acquittement d'un
+  doublon sans accès à MongoDB) ;
+- un filtre de Bloom des clés plus anciennes, en deux générations de
+  DEDUP_BLOOM_BYTES octets : quand la génération courante atteint sa
+  capacité (taux de faux positifs DEDUP_FALSE_POSITIVE_RATE), elle remplace
+  la précédente. Un « peut-être vu » est vérifié dans MongoDB, un « jamais
+  vu » laisse passer la lecture sans requête.
+
+La vérification est faite avant de toucher l'état des zones (anomalies,
+bande morte) et la clé retenue dans le LRU sans attente entre les deux : un
+renvoi simultané trouve la décision de la première réception. Une lecture
+non écrite par la bande morte garde sa clé et sa décision dans
+`reading_keys` (conservées DEDUP_KEY_RETENTION_DAYS jours), à la place de
+l'écriture évitée ; la décision d'origine est relue dans `sensor_data` ou
+dans `reading_keys`. Au démarrage, les filtres sont rechargés avec les clés
+des DEDUP_WARM_HOURS dernières heures des deux collections.
+
+Les index uniques (zone_id, dedup_key) restent la garantie au-delà des
+filtres (clé sortie des deux générations) : la seconde écriture est
+refusée et la décision d'origine renvoyée, mais la lecture a déjà été vue
+par la détection d'anomalies et la bande morte.
+"""
+import hashlib
+import math
+import os
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import Callable, Dict, Optional
+
+from bson import ObjectId
+from motor.motor_asyncio import AsyncIOMotorDatabase
+
+# LRU exact par zone (clé → décision)
+DEDUP_LRU_SIZE = int(os.getenv("DEDUP_LRU_SIZE", "256"))
+# Taille d'une génération du filtre de Bloom par zone (deux générations en mémoire)
+DEDUP_BLOOM_BYTES = int(os.getenv("DEDUP_BLOOM_BYTES", "8192"))
+# Taux de faux positifs visé quand une génération est pleine
+DEDUP_FALSE_POSITIVE_RATE = float(os.getenv("DEDUP_FALSE_POSITIVE_RATE", "0.001"))
+# Clés rechargées dans les filtres au démarrage
+DEDUP_WARM_HOURS = float(os.getenv("DEDUP_WARM_HOURS", "24"))
+# Conservation des clés des lectures non écrites (bande morte)
+DEDUP_KEY_RETENTION_DAYS = float(os.getenv("DEDUP_KEY_RETENTION_DAYS", "7"))
+
+
+class BloomFilter:
+    def __init__(self, size_bytes: int, false_positive_rate: float):
+        self.bits = bytearray(size_bytes)
+        self.m = size_bytes * 8
+        # Capacité et nombre de hachages optimaux pour m bits et le taux visé
+        self.capacity = max(1, int(-self.m * math.log(2) ** 2 / math.log(false_positive_rate)))
+        self.hashes = max(1, round(self.m / self.capacity * math.log(2)))
+        self.count = 0
+
+    def _positions(self, key: str):
+        digest = hashlib.blake2b(key.encode(), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        return ((h1 + i * h2) % self.m for i in range(self.hashes))
+
+    def add(self, key: str) -> None:
+        for position in self._positions(key):
+            self.bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def __contains__(self, key: str) -> bool:
+        return all(self.bits[position >> 3] & (1 << (position & 7)) for position in self._positions(key))
+
+    @property
+    def full(self) -> bool:
+        return self.count >= self.capacity
+
+
+class ZoneDedup:
+    __slots__ = ("recent", "current", "previous")
+
+    def __init__(self):
+        self.recent: "OrderedDict[str, dict]" = OrderedDict()
+        self.current = BloomFilter(DEDUP_BLOOM_BYTES, DEDUP_FALSE_POSITIVE_RATE)
+        self.previous: Optional[BloomFilter] = None
+
+
+class DuplicateFilter:
+    def __init__(self, lru_size: int = DEDUP_LRU_SIZE):
+        self.lru_size = lru_size
+        self.zones: Dict[str, ZoneDedup] = {}
+        self.checked = 0
+        self.duplicates = 0
+        self.db_lookups = 0
+        self.false_positives = 0
+        self.warmed_keys = 0
+
+    def _zone(self, zone_id: str) -> ZoneDedup:
+        zone = self.zones.get(zone_id)
+        if zone is None:
+            zone = self.zones[zone_id] = ZoneDedup()
+        return zone
+
+    def cached(self, zone_id: str, key: str) -> Optional[dict]:
+        """Décision d'origine si la clé est dans le LRU de la zone."""
+        self.checked += 1
+        zone = self.zones.get(zone_id)
+        decision = zone.recent.get(key) if zone else None
+        if decision is not None:
+            zone.recent.move_to_end(key)
+            self.duplicates += 1
+        return decision
+
+    def maybe_seen(self, zone_id: str, key: str) -> bool:
+        """False : clé jamais vue par ce processus depuis deux générations (pas de requête nécessaire)."""
+        zone = self.zones.get(zone_id)
+        if zone is None:
+            return False
+        seen = key in zone.current or (zone.previous is not None and key in zone.previous)
+        if seen:
+            self.db_lookups += 1
+        return seen
+
+    def record_lookup(self, found: bool) -> None:
+        if found:
+            self.duplicates += 1
+        else:
+            self.false_positives += 1
+
+    def remember(self, zone_id: str, key: str, decision: dict) -> None:
+        zone = self._zone(zone_id)
+        zone.recent[key] = decision
+        zone.recent.move_to_end(key)
+        if len(zone.recent) > self.lru_size:
+            zone.recent.popitem(last=False)
+        self._add(zone, key)
+
+    @staticmethod
+    def _add(zone: ZoneDedup, key: str) -> None:
+        if zone.current.full:
+            zone.previous = zone.current
+            zone.current = BloomFilter(DEDUP_BLOOM_BYTES, DEDUP_FALSE_POSITIVE_RATE)
+        zone.current.add(key)
+
+    async def warm(self, db: AsyncIOMotorDatabase, owns: Callable[[str], bool] = lambda zone_id: True) -> None:
+        """Index de `reading_keys` et clés récentes des zones de ce worker dans les filtres de Bloom."""
+        await db.reading_keys.create_index([("zone_id", 1), ("dedup_key", 1)], unique=True)
+        await db.reading_keys.create_index("created_at", expireAfterSeconds=int(DEDUP_KEY_RETENTION_DAYS * 86400))
+        since = datetime.utcnow() - timedelta(hours=DEDUP_WARM_HOURS)
+        sources = (
+            db.sensor_data.find(
+                {"_id": {"$gte": ObjectId.from_datetime(since)}, "dedup_key": {"$type": "string"}},
+                {"zone_id": 1, "dedup_key": 1}
+            ).sort("_id", 1),
+            db.reading_keys.find({"created_at": {"$gte": since}}, {"zone_id": 1, "dedup_key": 1}).sort("created_at", 1),
+        )
+        for cursor in sources:
+            async for doc in cursor:
+                if owns(doc["zone_id"]):
+                    self._add(self._zone(doc["zone_id"]), doc["dedup_key"])
+                    self.warmed_keys += 1
+
+    def stats(self) -> dict:
+        bloom = BloomFilter(DEDUP_BLOOM_BYTES, DEDUP_FALSE_POSITIVE_RATE)
+        return {
+            "checked": self.checked,
+            "duplicates": self.duplicates,
+            "db_lookups": self.db_lookups,
+            "false_positives": self.false_positives,
+            "warmed_keys": self.warmed_keys,
+            "zones": len(self.zones),
+            "lru_size_per_zone": self.lru_size,
+            "bloom_bytes_per_zone": 2 * DEDUP_BLOOM_BYTES,
+            "bloom_capacity": bloom.capacity,
+            "bloom_hashes": bloom.hashes,
+            "target_false_positive_rate": DEDUP_FALSE_POSITIVE_RATE,
+            "bloom_bytes": sum(
+                len(zone.current.bits) + (len(zone.previous.bits) if zone.previous else 0)
+                for zone in self.zones.values()
+            ),
+        }
+
+
+reading_dedup = DuplicateFilter()
@@ -0,0 +1,205 @@
+"""
+Résumé compact d'une zone pour l'assistant IA (/zones/{zone_id}/digest).
+
+Le résumé est assemblé depuis l'état déjà tenu en mémoire sur le chemin
+d'ingestion, sans relire l'historique :
+- pentes par profondeur : EWMA du taux de séchage de forecast.py ;
+- anomalies : dernière analyse de anomalies.py ; alertes actives de rules.py ;
+- seuils de la culture et de la saison : registre des zones ;
+- arrosages : ouverture / fermeture des vannes suivies par water_usage.py.
+
+Chaque zone a une version de données, incrémentée à chaque lecture ingérée
+et à chaque changement de configuration (zone, étalonnage). La partie
+statistique du résumé est gardée en cache sous cette version : des appels
+répétés de l'assistant entre deux lectures sont en O(1). Seules les durées
+(temps depuis le dernier arrosage, âge de la lecture) sont calculées à
+chaque appel. Avec cluster.py, la route est servie par le worker
+propriétaire de la zone.
+"""
+from collections import Counter
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+from anomalies import detector
+from forecast import DEPTH_FIELDS, forecaster
+from rules import rule_engine
+from water_usage import water_usage
+from zones import zone_registry
+
+# Champs météo de la dernière lecture repris dans le résumé
+WEATHER_FIELDS = ("temperature", "humidity", "light", "wind_speed", "rainfall", "rainfall_intensity")
+
+
+def minutes_between(start: Optional[datetime], end: datetime) -> Optional[int]:
+    return None if start is None else max(0, round((end - start).total_seconds() / 60))
+
+
+def format_duration(minutes: int) -> str:
+    hours, minutes = divmod(minutes, 60)
+    return f"{hours} h {minutes:02d}" if hours else f"{minutes} min"
+
+
+def threshold_position(moisture: float, seuil_bas: float, seuil_haut: float) -> str:
+    if moisture < seuil_bas:
+        return "sous_seuil"
+    if moisture > seuil_haut:
+        return "au_dessus"
+    return "dans_plage"
+
+
+POSITION_TEXT = {
+    "sous_seuil": "sous le seuil de déclenchement",
+    "dans_plage": "dans la plage",
+    "au_dessus": "au-dessus du seuil d'arrêt",
+}
+
+
+def digest_text(digest: dict) -> str:
+    """Partie statistique du résumé en une ligne, pour l'invite du modèle."""
+    parts = [f"Zone {digest['zone_id']}" + (f" ({digest['crop']}, {digest['season']})" if digest["crop"] else "")]
+    seuils = digest["thresholds"]
+    moisture = digest["soil_moisture"]
+    if moisture is not None:
+        parts.append(
+            f"humidité {moisture:.1f} % (seuils {seuils['seuil_declenchement']:g}–{seuils['seuil_arret']:g}, "
+            f"{POSITION_TEXT[digest['position']]}, {digest['margin_to_trigger']:+.1f} pts)"
+        )
+    trends = [
+        f"{label} {depth['trend_per_hour']:+.2f}"
+        for label, depth in digest["depths"].items() if depth["trend_per_hour"] is not None
+    ]
+    if trends:
+        parts.append("tendance %/h " + ", ".join(trends))
+    if digest["hours_to_threshold"] is not None:
+        parts.append(f"seuil atteint dans ~{digest['hours_to_threshold']:g} h")
+    if digest["etc_mm_per_hour"] is not None:
+        parts.append(f"ETc {digest['etc_mm_per_hour']:g} mm/h")
+    weather = digest["weather"]
+    if weather:
+        rain = f"pluie {weather.get('rainfall_intensity')}" if weather.get("rainfall") else "pas de pluie"
+        parts.append(
+            f"{weather.get('temperature')} °C, air {weather.get('humidity')} %, "
+            f"vent {weather.get('wind_speed')} km/h, {rain}"
+        )
+    parts.append("anomalies : " + (", ".join(digest["anomalies"]) or "aucune"))
+    alerts = [f"{alert['rule_name']} ({alert['severity']})" for alert in digest["active_alerts"]]
+    parts.append("alertes actives : " + (", ".join(alerts) or "aucune"))
+    return " · ".join(parts)
+
+
+class ZoneDigests:
+    """Résumés des zones, en cache sous la version de données de chaque zone."""
+
+    def __init__(self):
+        self.versions: Dict[str, int] = {}
+        self.last: Dict[str, dict] = {}  # Météo et décision de la dernière lecture
+        self.cache: Dict[str, Tuple[int, dict]] = {}
+        self.counters = Counter()
+
+    def touch(self, zone_id: str, *_) -> None:
+        """Invalide le résumé de la zone (écouteur du registre des zones, étalonnage…)."""
+        self.versions[zone_id] = self.versions.get(zone_id, 0) + 1
+
+    def update(self, zone_id: str, record: dict, pump: bool) -> None:
+        """Lecture ingérée : dernière météo et décision, nouvelle version de la zone."""
+        self.last[zone_id] = {
+            "weather": {field: record.get(field) for field in WEATHER_FIELDS},
+            "pump": pump,
+            "at": record["created_at"],
+        }
+        self.touch(zone_id)
+
+    def build(self, zone_id: str, version: int) -> Optional[dict]:
+        """Partie statistique du résumé ; None si la zone n'est pas connue."""
+        zone = zone_registry.get(zone_id)
+        last = self.last.get(zone_id)
+        if zone is None and last is None:
+            return None
+        seuil_bas, seuil_haut = zone_registry.thresholds_for(zone_id)
+        forecast = forecaster.forecast(zone_id, seuil_bas, zone_registry.crop_coefficient_for(zone_id)) or {}
+        state = forecaster.zones.get(zone_id)
+
+        depths = {}
+        for field, label in DEPTH_FIELDS.items():
+            rate = state.rates.get(field) if state else None
+            depths[label] = {
+                "value": state.last_values.get(field) if state else None,
+                # Tendance : opposé du taux de séchage (négative quand le sol sèche)
+                "trend_per_hour": None if rate is None else round(-rate, 3),
+            }
+        moisture = depths["surface"]["value"]
+        digest = {
+            "zone_id": zone_id,
+            "version": version,
+            "crop": zone.get("crop") if zone else None,
+            "season": zone.get("season") if zone else None,
+            "thresholds": {"seuil_declenchement": seuil_bas, "seuil_arret": seuil_haut},
+            "soil_moisture": moisture,
+            "position": None if moisture is None else threshold_position(moisture, seuil_bas, seuil_haut),
+            "margin_to_trigger": None if moisture is None else round(moisture - seuil_bas, 2),
+            "depths": depths,
+            "hours_to_threshold": forecast.get("hours_to_threshold"),
+            "etc_mm_per_hour": forecast.get("etc_mm_per_hour"),
+            "weather": last["weather"] if last else None,
+            "pump": last["pump"] if last else None,
+            "anomalies": list(detector.latest.get(zone_id, [])),
+            "active_alerts": [
+                {"rule_name": alert["rule_name"], "severity": alert["severity"],
+                 "since": alert["started_at"].isoformat()}
+                for alert in rule_engine.active.get(zone_id, {}).values()
+            ],
+            "reading_at": last["at"].isoformat() if last else None,
+        }
+        digest["text"] = digest_text(digest)
+        return digest
+
+    def digest(self, zone_id: str, now: Optional[datetime] = None) -> Optional[dict]:
+        """Résumé de la zone : partie statistique en cache, durées calculées à l'appel."""
+        version = self.versions.get(zone_id, 0)
+        cached = self.cache.get(zone_id)
+        if cached is not None and cached[0] == version:
+            self.counters["hits"] += 1
+            digest = cached[1]
+        else:
+            self.counters["misses"] += 1
+            digest = self.build(zone_id, version)
+            if digest is None:
+                return None
+            self.cache[zone_id] = (version, digest)
+
+        now = now or datetime.utcnow()
+        opened_at, closed_at = water_usage.valve_times(zone_id)
+        last = self.last.get(zone_id)
+        irrigation = {
+            "valve_open": opened_at is not None,
+            "open_minutes": minutes_between(opened_at, now),
+            "minutes_since_last": None if opened_at is not None else minutes_between(closed_at, now),
+        }
+        reading_age = minutes_between(last["at"], now) if last else None
+        live: List[str] = []
+        if irrigation["valve_open"]:
+            live.append(f"arrosage en cours depuis {format_duration(irrigation['open_minutes'])}")
+        elif irrigation["minutes_since_last"] is not None:
+            live.append(f"dernier arrosage il y a {format_duration(irrigation['minutes_since_last'])}")
+        else:
+            live.append("aucun arrosage enregistré")
+        if reading_age is not None:
+            live.append(f"lecture il y a {format_duration(reading_age)}")
+        return {
+            **digest,
+            "irrigation": irrigation,
+            "reading_age_minutes": reading_age,
+            "text": " · ".join([digest["text"], *live]),
+        }
+
+    def stats(self) -> dict:
+        lookups = self.counters["hits"] + self.counters["misses"]
+        return {
+            "zones": len(self.cache),
+            "hits": self.counters["hits"],
+            "misses": self.counters["misses"],
+            "hit_rate": round(self.counters["hits"] / lookups, 3) if lookups else 0.0,
+        }
+
+
+zone_digests = ZoneDigests()
@@ -0,0 +1,125 @@
+"""
+Évapotranspiration de référence FAO-56 (Penman-Monteith, pas horaire).
+
+    ET0 = [0.408 Δ (Rn - G) + γ 37/(T + 273) u2 (es - ea)] / [Δ + γ (1 + 0.34 u2)]   (mm/h)
+
+Les entrées sont celles des capteurs : température (°C), humidité de l'air
+(%), lumière (lux) et vent (km/h). Le calcul est vectorisé : des tableaux
+NumPy de zones × pas de temps sont traités en un seul appel (diffusion des
+formes NumPy). Les termes coûteux qui ne dépendent que de la température
+(pression de vapeur saturante es, pente Δ, rayonnement σT⁴) sont lus dans
+des tables précalculées au pas de TABLE_STEP °C.
+
+Approximations propres aux capteurs du projet :
+- rayonnement solaire déduit de l'éclairement : 1 W/m² ≈ LUX_PER_WM2 lux ;
+- rayonnement net de grande longueur d'onde calculé avec un rapport
+  Rs/Rso constant (ET_CLEAR_SKY_RATIO), la nébulosité n'étant pas mesurée ;
+- vent mesuré à 2 m.
+
+ETc = Kc × ET0 avec les coefficients culturaux FAO-56 (tableau 12) de
+chaque culture de CONFIG_CULTURES ; converti en baisse d'humidité (%/h)
+sur une zone racinaire de ET_ROOT_ZONE_MM millimètres.
+"""
+import math
+import os
+from typing import Optional
+
+import numpy as np
+
+from crops import CONFIG_CULTURES
+
+# Altitude du site (m) : pression atmosphérique et constante psychrométrique
+ET_ELEVATION_M = float(os.getenv("ET_ELEVATION_M", "100"))
+ET_CLEAR_SKY_RATIO = float(os.getenv("ET_CLEAR_SKY_RATIO", "0.8"))
+# Épaisseur de sol dont l'humidité mesurée représente la réserve (mm)
+ET_ROOT_ZONE_MM = float(os.getenv("ET_ROOT_ZONE_MM", "300"))
+# Horizon d'anticipation de la décision (h), environ l'intervalle entre deux lectures : 0 = seuils seuls
+ET_LOOKAHEAD_HOURS = float(os.getenv("ET_LOOKAHEAD_HOURS", "1"))
+
+LUX_PER_WM2 = 120.0
+ALBEDO = 0.23
+STEFAN_BOLTZMANN_HOURLY = 2.043e-10  # MJ m-2 h-1 K-4
+
+# Coefficients culturaux FAO-56 (tableau 12) : initial, mi-saison, fin de saison
+KC_CULTURES = {
+    'tomates': {'ini': 0.60, 'mid': 1.15, 'end': 0.80},
+    'concombres': {'ini': 0.60, 'mid': 1.00, 'end': 0.75},
+    'courgettes': {'ini': 0.50, 'mid': 0.95, 'end': 0.75},
+    'poivrons': {'ini': 0.60, 'mid': 1.05, 'end': 0.90},
+    'salades': {'ini': 0.70, 'mid': 1.00, 'end': 0.95},
+    'epinards': {'ini': 0.70, 'mid': 1.00, 'end': 0.95},
+    'choux': {'ini': 0.70, 'mid': 1.05, 'end': 0.95},
+    'haricots': {'ini': 0.50, 'mid': 1.05, 'end': 0.90},
+    'carottes': {'ini': 0.70, 'mid': 1.05, 'end': 0.95},
+    'oignons': {'ini': 0.70, 'mid': 1.05, 'end': 0.75},
+    'ail': {'ini': 0.70, 'mid': 1.00, 'end': 0.70},
+    'pommes_de_terre': {'ini': 0.50, 'mid': 1.15, 'end': 0.75},
+}
+assert set(KC_CULTURES) == set(CONFIG_CULTURES), "Kc manquant pour une culture de CONFIG_CULTURES"
+
+# Tables indexées par la température
+TABLE_MIN = -30.0
+TABLE_MAX = 60.0
+TABLE_STEP = 0.05
+_TABLE_T = np.arange(TABLE_MIN, TABLE_MAX + TABLE_STEP / 2, TABLE_STEP)
+SATURATION_VAPOUR_PRESSURE = 0.6108 * np.exp(17.27 * _TABLE_T / (_TABLE_T + 237.3))  # kPa
+VAPOUR_PRESSURE_SLOPE = 4098 * SATURATION_VAPOUR_PRESSURE / (_TABLE_T + 237.3) ** 2  # kPa/°C
+LONGWAVE_EMISSION = STEFAN_BOLTZMANN_HOURLY * (_TABLE_T + 273.16) ** 4  # MJ m-2 h-1
+WIND_TERM = 37 / (_TABLE_T + 273)
+
+PRESSURE_KPA = 101.3 * ((293 - 0.0065 * ET_ELEVATION_M) / 293) ** 5.26
+PSYCHROMETRIC = 0.000665 * PRESSURE_KPA  # kPa/°C
+
+
+def crop_coefficient(crop: Optional[str], stage: str = "mid") -> float:
+    """Kc de la culture au stade donné (`ini`, `mid`, `end`) ; 1.0 sans culture connue."""
+    return KC_CULTURES.get(crop, {}).get(stage, 1.0)
+
+
+def reference_et(temperature, humidity, light, wind_speed) -> np.ndarray:
+    """
+    ET0 horaire (mm/h) ; les arguments sont des scalaires ou des tableaux
+    diffusables. Une température non finie donne NaN (jamais un index hors table).
+    """
+    t = np.asarray(temperature, dtype=np.float64)
+    finite = np.isfinite(t)
+    index = np.rint((np.clip(np.where(finite, t, 0.0), TABLE_MIN, TABLE_MAX) - TABLE_MIN) / TABLE_STEP).astype(np.intp)
+    es = SATURATION_VAPOUR_PRESSURE[index]
+    delta = VAPOUR_PRESSURE_SLOPE[index]
+    ea = es * (np.clip(humidity, 0.0, 100.0) / 100.0)
+    u2 = np.maximum(wind_speed, 0.0) / 3.6
+
+    rs = np.maximum(light, 0.0) * (0.0036 / LUX_PER_WM2)  # MJ m-2 h-1
+    rnl = LONGWAVE_EMISSION[index] * (0.34 - 0.14 * np.sqrt(ea)) * (1.35 * ET_CLEAR_SKY_RATIO - 0.35)
+    rn = (1 - ALBEDO) * rs - rnl
+    # Flux de chaleur du sol : 10 % de Rn le jour, 50 % la nuit
+    g = np.where(rs > 0, 0.1, 0.5) * rn
+
+    numerator = 0.408 * delta * (rn - g) + PSYCHROMETRIC * WIND_TERM[index] * u2 * (es - ea)
+    return np.where(finite, np.maximum(numerator / (delta + PSYCHROMETRIC * (1 + 0.34 * u2)), 0.0), np.nan)
+
+
+def crop_et(temperature, humidity, light, wind_speed, kc=1.0) -> np.ndarray:
+    """ETc = Kc × ET0 (mm/h) ; `kc` peut être un tableau (une valeur par zone)."""
+    return reference_et(temperature, humidity, light, wind_speed) * kc
+
+
+def moisture_loss_per_hour(etc_mm_h, root_zone_mm: float = ET_ROOT_ZONE_MM):
+    """Baisse d'humidité du sol (points de %/h) causée par une ETc en mm/h."""
+    return etc_mm_h / root_zone_mm * 100.0
+
+
+def finite_or(value, default: float) -> float:
+    """Valeur du capteur, ou `default` si absente ou non finie (NaN, ±inf)."""
+    return default if value is None or not math.isfinite(value) else value
+
+
+def reading_et(reading: dict, kc: float = 1.0) -> float:
+    """ETc (mm/h) d'une lecture capteur (champs absents ou non finis : valeurs neutres)."""
+    return float(crop_et(
+        finite_or(reading.get("temperature"), 0.0),
+        finite_or(reading.get("humidity"), 60.0),
+        finite_or(reading.get("light"), 0.0),
+        finite_or(reading.get("wind_speed"), 0.0),
+        kc,
+    ))
@@ -0,0 +1,173 @@
+"""
+Prévision du temps restant avant le seuil de déclenchement, par zone.
+
+Chaque lecture met à jour en O(1) une moyenne mobile exponentielle (EWMA)
+du taux de séchage du sol : l'historique n'est jamais relu. La pente est
+ajustée à l'évapotranspiration de référence (FAO-56) du moment ; tant
+qu'aucune pente n'est apprise, la baisse est estimée par l'ETc de la culture.
+"""
+import math
+import os
+from datetime import datetime, timedelta
+from typing import Callable, Dict, List, Optional
+
+from evapotranspiration import moisture_loss_per_hour, reading_et
+from irrigation_logic import SEUIL_BAS
+
+# Constante de temps de l'EWMA (heures) : poids d'un échantillon = 1 - exp(-dt / tau)
+FORECAST_TAU_HOURS = float(os.getenv("FORECAST_TAU_HOURS", "1.0"))
+# Au-delà de cet écart entre deux lectures, la pente n'est pas calculée
+FORECAST_MAX_GAP_HOURS = float(os.getenv("FORECAST_MAX_GAP_HOURS", "6.0"))
+# Intervalle minimal entre deux points de pente (évite le bruit des rafales de lectures)
+FORECAST_MIN_INTERVAL_SECONDS = float(os.getenv("FORECAST_MIN_INTERVAL_SECONDS", "60"))
+
+DEPTH_FIELDS = {
+    "soil_moisture": "surface",
+    "soil_moisture_10cm": "10cm",
+    "soil_moisture_30cm": "30cm",
+    "soil_moisture_60cm": "60cm",
+}
+
+
+# Demande évaporative minimale (mm/h), évite les rapports infinis la nuit
+MIN_DEMAND_MM_H = 0.01
+
+
+def evaporative_demand(reading: dict) -> float:
+    """ET0 FAO-56 de la lecture (mm/h), bornée inférieurement."""
+    return max(MIN_DEMAND_MM_H, reading_et(reading))
+
+
+class ZoneDryingEstimate:
+    """État incrémental d'une zone : dernières valeurs et EWMA des pentes."""
+
+    __slots__ = ("anchor_at", "anchor_values", "last_at", "last_values", "rates", "demand", "last_demand", "samples")
+
+    def __init__(self):
+        # Point de référence de la prochaine pente
+        self.anchor_at: Optional[datetime] = None
+        self.anchor_values: Dict[str, float] = {}
+        # Dernière lecture reçue
+        self.last_at: Optional[datetime] = None
+        self.last_values: Dict[str, float] = {}
+        self.rates: Dict[str, float] = {}  # %/h, positif = le sol sèche
+        self.demand: Optional[float] = None  # EWMA de l'ET0 (mm/h)
+        self.last_demand: float = MIN_DEMAND_MM_H
+        self.samples = 0
+
+
+class DryingRateForecaster:
+    """Estime le taux de séchage de chaque zone à partir des lectures ingérées."""
+
+    def __init__(
+        self,
+        tau_hours: float = FORECAST_TAU_HOURS,
+        max_gap_hours: float = FORECAST_MAX_GAP_HOURS,
+        min_interval_seconds: float = FORECAST_MIN_INTERVAL_SECONDS,
+    ):
+        self.tau_hours = tau_hours
+        self.max_gap_hours = max_gap_hours
+        self.min_interval_hours = min_interval_seconds / 3600
+        self.zones: Dict[str, ZoneDryingEstimate] = {}
+
+    def update(self, zone_id: str, reading: dict, at: datetime, irrigating: bool = False) -> None:
+        """
+        Intègre une lecture. Les intervalles avec irrigation ou pluie ne
+        représentent pas un séchage : ils avancent l'état sans modifier les pentes.
+        """
+        state = self.zones.get(zone_id)
+        if state is None:
+            state = self.zones[zone_id] = ZoneDryingEstimate()
+
+        demand = evaporative_demand(reading)
+
+        for field in DEPTH_FIELDS:
+            value = reading.get(field)
+            if value is not None:
+                state.last_values[field] = value
+        state.last_demand = demand
+        state.last_at = at
+
+        dt_hours = None if state.anchor_at is None else (at - state.anchor_at).total_seconds() / 3600
+        if irrigating or dt_hours is None or dt_hours <= 0 or dt_hours > self.max_gap_hours:
+            self._move_anchor(state, at)
+            return
+        if dt_hours < self.min_interval_hours:
+            return
+
+        weight = 1 - math.exp(-dt_hours / self.tau_hours)
+        for field in DEPTH_FIELDS:
+            value = state.last_values.get(field)
+            previous = state.anchor_values.get(field)
+            if value is None or previous is None:
+                continue
+            slope = (previous - value) / dt_hours
+            current = state.rates.get(field)
+            state.rates[field] = slope if current is None else current + weight * (slope - current)
+        state.demand = demand if state.demand is None else state.demand + weight * (demand - state.demand)
+        state.samples += 1
+        self._move_anchor(state, at)
+
+    @staticmethod
+    def _move_anchor(state: ZoneDryingEstimate, at: datetime) -> None:
+        state.anchor_at = at
+        state.anchor_values = dict(state.last_values)
+
+    def forecast(self, zone_id: str, threshold: float = SEUIL_BAS, kc: float = 1.0) -> Optional[dict]:
+        """Temps estimé avant que `soil_moisture` ne passe sous `threshold` (`kc` : coefficient cultural)."""
+        state = self.zones.get(zone_id)
+        if state is None or state.last_at is None:
+            return None
+
+        moisture = state.last_values.get("soil_moisture")
+        rate = state.rates.get("soil_moisture")
+        rate_source = "observed"
+        if rate is not None and state.demand:
+            # Ajuste la pente moyenne à la demande évaporative actuelle
+            rate *= min(4.0, max(0.25, state.last_demand / state.demand))
+        elif rate is None:
+            # Pas encore de pente mesurée : baisse due à l'ETc de la culture
+            rate = moisture_loss_per_hour(state.last_demand * kc)
+            rate_source = "evapotranspiration"
+
+        hours = None
+        crossing_at = None
+        below = moisture is not None and moisture < threshold
+        if below:
+            hours = 0.0
+            crossing_at = state.last_at
+        elif moisture is not None and rate is not None and rate > 0:
+            hours = (moisture - threshold) / rate
+            crossing_at = state.last_at + timedelta(hours=hours)
+
+        return {
+            "zone_id": zone_id,
+            "soil_moisture": moisture,
+            "threshold": threshold,
+            "below_threshold": below,
+            "drying_rate_per_hour": None if rate is None else round(rate, 3),
+            "drying_rate_source": rate_source,
+            "et0_mm_per_hour": round(state.last_demand, 3),
+            "etc_mm_per_hour": round(state.last_demand * kc, 3),
+            "depth_rates_per_hour": {
+                label: round(state.rates[field], 3)
+                for field, label in DEPTH_FIELDS.items()
+                if field in state.rates and field != "soil_moisture"
+            },
+            "hours_to_threshold": None if hours is None else round(hours, 2),
+            "estimated_crossing_at": crossing_at.isoformat() if crossing_at else None,
+            "samples": state.samples,
+            "updated_at": state.last_at.isoformat(),
+        }
+
+    def forecast_all(
+        self,
+        threshold_for: Callable[[str], float] = lambda zone_id: SEUIL_BAS,
+        kc_for: Callable[[str], float] = lambda zone_id: 1.0,
+    ) -> List[dict]:
+        """Prévision de chaque zone, avec le seuil et le Kc propres à la zone."""
+        forecasts = (self.forecast(zone_id, threshold_for(zone_id), kc_for(zone_id)) for zone_id in self.zones)
+        return [f for f in forecasts if f]
+
+
+forecaster = DryingRateForecaster()
@@ -0,0 +1,80 @@
+"""
+Formats de sortie de l'historique.
+
+- lignes : un objet camelCase par lecture (format historique du frontend) ;
+- colonnaire : une liste par champ au lieu d'un objet par lecture, et des
+  horodatages encodés en delta (premier timestamp en millisecondes puis écarts).
+"""
+from typing import List
+
+# Colonne de sortie (camelCase du frontend) → champ sensor_data et valeur par défaut
+COLUMNS = {
+    "moisture": ("soil_moisture", None),
+    "temperature": ("temperature", None),
+    "humidity": ("humidity", None),
+    "soilMoisture10cm": ("soil_moisture_10cm", None),
+    "soilMoisture30cm": ("soil_moisture_30cm", None),
+    "soilMoisture60cm": ("soil_moisture_60cm", None),
+    "light": ("light", 450.0),
+    "windSpeed": ("wind_speed", 8.0),
+    "rainfall": ("rainfall", False),
+    "rainfallIntensity": ("rainfall_intensity", "none"),
+}
+
+# Profondeurs absentes des anciens documents : dérivées de soil_moisture
+DEPTH_RATIOS = {"soil_moisture_10cm": 0.9, "soil_moisture_30cm": 1.0, "soil_moisture_60cm": 1.1}
+
+
+def format_reading(r: dict) -> dict:
+    """Convertit un document sensor_data au format du frontend."""
+    return {
+        "id": str(r["_id"]),
+        "zone_id": r["zone_id"],
+        "timestamp": int(r["created_at"].timestamp() * 1000),
+        "moisture": r["soil_moisture"],
+        "temperature": r["temperature"],
+        "humidity": r["humidity"],
+        "soilMoisture10cm": r.get("soil_moisture_10cm", r["soil_moisture"] * 0.9),
+        "soilMoisture30cm": r.get("soil_moisture_30cm", r["soil_moisture"]),
+        "soilMoisture60cm": r.get("soil_moisture_60cm", r["soil_moisture"] * 1.1),
+        "light": r.get("light", 450.0),
+        "windSpeed": r.get("wind_speed", 8.0),
+        "rainfall": r["rainfall"],
+        "rainfallIntensity": r["rainfall_intensity"],
+        "anomalies": r.get("anomalies", []),
+        "created_at": r["created_at"].isoformat()
+    }
+
+
+def delta_encode(values: List[int]) -> dict:
+    deltas = []
+    previous = values[0] if values else 0
+    for value in values[1:]:
+        deltas.append(value - previous)
+        previous = value
+    return {"base": values[0] if values else None, "deltas": deltas}
+
+
+def to_columnar(records: List[dict]) -> dict:
+    """Convertit des documents sensor_data (dans l'ordre reçu) en colonnes."""
+    zone_ids = {r["zone_id"] for r in records}
+    columns = {}
+    for name, (field, default) in COLUMNS.items():
+        if field in DEPTH_RATIOS:
+            ratio = DEPTH_RATIOS[field]
+            columns[name] = [r.get(field, r["soil_moisture"] * ratio) for r in records]
+        elif default is None:
+            columns[name] = [r[field] for r in records]
+        else:
+            columns[name] = [r.get(field, default) for r in records]
+
+    return {
+        "format": "columnar",
+        "count": len(records),
+        # Une seule zone : valeur scalaire au lieu d'une colonne répétée
+        "zone_id": zone_ids.pop() if len(zone_ids) == 1 else [r["zone_id"] for r in records],
+        "id": [str(r["_id"]) for r in records],
+        "timestamp": delta_encode([int(r["created_at"].timestamp() * 1000) for r in records]),
+        "columns": columns,
+        "anomalies": [r.get("anomalies", []) for r in records],
+    }
@@ -1,20 +1,30 @@
-def irrigation_decision(soil_moisture: float, pump_was_active: bool = False) -> dict:
+# Seuils d'irrigation basés sur l'humidité du sol
+SEUIL_BAS = 40    # Déclenche irrigation si < 40%
+SEUIL_HAUT = 70   # Arrête irrigation si >= 70%
+
+
+def irrigation_decision(
+    soil_moisture: float,
+    pump_was_active: bool = False,
+    seuil_bas: float = SEUIL_BAS,
+    seuil_haut: float = SEUIL_HAUT,
+    projected_drop: float = 0.0
+) -> dict:
     """
     Soil moisture scale: 0 (dry) → 100 (wet)
     Simple logic based on soil humidity thresholds
-    Logic: Start irrigation at <40%, continue until >=70%
+    Logic: Start irrigation below seuil_bas (40% par défaut), continue until >= seuil_haut (70%)
+    Les seuils d'une zone viennent du registre des zones (culture/saison).
+    projected_drop : baisse d'humidité attendue d'ici la prochaine décision
+    (ETc de la culture), pour démarrer avant que le sol ne passe sous seuil_bas.
     """
     
-    # Seuils d'irrigation basés sur l'humidité du sol
-    SEUIL_BAS = 40    # Déclenche irrigation si < 40%
-    SEUIL_HAUT = 70   # Arrête irrigation si >= 70%
-    
     # Si la pompe était déjà active, continuer jusqu'à atteindre le seuil haut
     if pump_was_active:
-        if soil_moisture >= SEUIL_HAUT:
+        if soil_moisture >= seuil_haut:
             return {
                 "pump": False,
-                "message": f"✅ Objectif atteint ({soil_moisture:.1f}% >= {SEUIL_HAUT}%) → Irrigation OFF",
+                "message": f"✅ Objectif atteint ({soil_moisture:.1f}% >= {seuil_haut:g}%) → Irrigation OFF",
                 "visual_emojis": "⛔🌱😴",
                 "animation_type": "stopped",
                 "sound_message": "L'arrosage est arrêté",
@@ -23,7 +33,7 @@ def irrigation_decision(soil_moisture: float, pump_was_active: bool = False) ->
         else:
             return {
                 "pump": True,
-                "message": f"💦 Irrigation en cours ({soil_moisture:.1f}% → objectif {SEUIL_HAUT}%)",
+                "message": f"💦 Irrigation en cours ({soil_moisture:.1f}% → objectif {seuil_haut:g}%)",
                 "visual_emojis": "🚿🌱🌿💧💦",
                 "animation_type": "watering",
                 "sound_message": "Le champ est en train de se faire arroser",
@@ -31,10 +41,13 @@ def irrigation_decision(soil_moisture: float, pump_was_active: bool = False) ->
             }
     
     # Si la pompe était inactive, vérifier s'il faut démarrer
-    if soil_moisture < SEUIL_BAS:
+    if soil_moisture - projected_drop < seuil_bas:
+        message = f"💦 Sol sec ({soil_moisture:.1f}%) → Irrigation ON"
+        if soil_moisture >= seuil_bas:
+            message = f"💦 Sol bientôt sec ({soil_moisture:.1f}% → {soil_moisture - projected_drop:.1f}% par évapotranspiration) → Irrigation ON"
         return {
             "pump": True,
-            "message": f"💦 Sol sec ({soil_moisture:.1f}%) → Irrigation ON",
+            "message": message,
             "visual_emojis": "🚿🌱🌿💧💦",
             "animation_type": "watering",
             "sound_message": "Le champ est en train de se faire arroser",
@@ -49,3 +62,46 @@ def irrigation_decision(soil_moisture: float, pump_was_active: bool = False) ->
             "sound_message": "L'arrosage est arrêté",
             "sound_url": "/static/sounds/irrigation_stopped.mp3"
         }
+
+
+def anomaly_veto_decision(soil_moisture: float, anomalies: list) -> dict:
+    """
+    Décision forcée à l'arrêt quand le capteur d'humidité est jugé défaillant :
+    une sonde figée ou aberrante ne doit pas piloter la pompe.
+    """
+    return {
+        "pump": False,
+        "message": f"⚠️ Capteur suspect ({', '.join(anomalies)}) - lecture {soil_moisture:.1f}% ignorée → Irrigation bloquée",
+        "visual_emojis": "⚠️🌱🔧",
+        "animation_type": "stopped",
+        "sound_message": "Capteur défaillant, l'arrosage est bloqué",
+        "sound_url": "/static/sounds/irrigation_stopped.mp3",
+        "anomalies": anomalies
+    }
+
+
+def scheduled_run_decision(soil_moisture: float) -> dict:
+    """Arrosage programmé en cours : la vanne reste ouverte jusqu'à la fin prévue."""
+    return {
+        "pump": True,
+        "message": f"⏰ Arrosage programmé en cours ({soil_moisture:.1f}%) → Irrigation ON",
+        "visual_emojis": "⏰🚿🌱💧",
+        "animation_type": "watering",
+        "sound_message": "Arrosage programmé en cours",
+        "sound_url": "/static/sounds/irrigation_started.mp3"
+    }
+
+
+def window_veto_decision(soil_moisture: float) -> dict:
+    """
+    Irrigation demandée hors des fenêtres autorisées de la zone (heure ou
+    météo défavorable) : reportée à la prochaine fenêtre.
+    """
+    return {
+        "pump": False,
+        "message": f"🕒 Sol sec ({soil_moisture:.1f}%) mais hors fenêtre d'arrosage → Irrigation reportée",
+        "visual_emojis": "🕒🌱😴",
+        "animation_type": "stopped",
+        "sound_message": "L'arrosage est reporté à la prochaine fenêtre",
+        "sound_url": "/static/sounds/irrigation_stopped.mp3"
+    }
@@ -1,18 +1,84 @@
-from fastapi import FastAPI, Depends, HTTPException
+from fastapi import FastAPI, Depends, Header, HTTPException, Query
+from fastapi.encoders import jsonable_encoder
+from fastapi.exceptions import RequestValidationError
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
 from motor.motor_asyncio import AsyncIOMotorDatabase
-from datetime import datetime
+from pymongo import UpdateOne
+from bson import ObjectId
+from pymongo.errors import BulkWriteError, DuplicateKeyError
+from datetime import datetime, timedelta, timezone
+import asyncio
+import json
+import math
+import os
 
 from database import db
-from models import SensorData, SensorDataCreate, IrrigationDecision, ValveState, ValveToggleRequest, ValveToggleResponse
-from irrigation_logic import irrigation_decision
+from models import (
+    SensorDataCreate, IrrigationDecision, ValveState, ValveToggleRequest, ValveToggleResponse,
+    ValveBulkToggleRequest, ValveBulkResult, ValveBulkToggleResponse, ZoneConfig,
+    ProfilingSettings,
+    AlertRule,
+    IrrigationSchedule,
+    CalibrationCurve
+)
+from irrigation_logic import (
+    irrigation_decision, anomaly_veto_decision, scheduled_run_decision, window_veto_decision
+)
+from anomalies import detector
+from forecast import forecaster
+from history_format import format_reading, to_columnar
+from compression import CompressionMiddleware
+from water_usage import water_usage
+from audit import valve_audit
+from actuation import actuator
+from zones import zone_registry, zone_groups
+from deadband import DEADBAND_ENABLED, deadband, reconstruct_by_zone
+from recent_buffer import recent_history
+from profiling import DEBUG_TOKEN, ProfilingMiddleware, authorized, mark, phase, profile_process, profiler
+from cluster import CLUSTER_WORKERS, ZoneRoutingMiddleware, close_client, cluster_stats, owns, serves
+from shared_state import shared_state
+from dedup import reading_dedup
+from admission import AdmissionMiddleware, admission
+from evapotranspiration import ET_LOOKAHEAD_HOURS, moisture_loss_per_hour, reading_et
+from rules import alert_view, rule_engine
+from scheduler import schedule_document, scheduler
+from calibration import CALIBRATED_FIELDS, calibration_registry
+from digest import zone_digests
+from aggregates import (
+    RESOLUTIONS, SEASON_MONTHS, aggregate_cache, combine_buckets, season_range
+)
+from crops import SAISON_PAR_DEFAUT, obtenir_seuils_intelligents
 
 app = FastAPI()
 
+
+def finite_json(value):
+    """Valeurs non finies (NaN, Infinity) remplacées par leur texte, non sérialisables en JSON."""
+    if isinstance(value, float) and not math.isfinite(value):
+        return str(value)
+    if isinstance(value, dict):
+        return {key: finite_json(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [finite_json(item) for item in value]
+    return value
+
+
+@app.exception_handler(RequestValidationError)
+async def validation_error_handler(request, exc: RequestValidationError):
+    """422 habituel ; l'entrée refusée peut être une valeur non finie (`1e400`, `NaN`)."""
+    return JSONResponse(status_code=422, content={"detail": finite_json(jsonable_encoder(exc.errors()))})
+
 # Mount static files
 # app.mount("/static", StaticFiles(directory="static"), name="static")
 
+# Limites de débit par zone et par client, requêtes MongoDB simultanées bornées (429/503)
+app.add_middleware(AdmissionMiddleware)
+
+# Multi-worker (cluster.py) : requêtes d'une zone relayées vers son worker propriétaire
+app.add_middleware(ZoneRoutingMiddleware)
+
 # Configure CORS
 app.add_middleware(
     CORSMiddleware,
@@ -22,6 +88,12 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Compression gzip/brotli négociée par Accept-Encoding
+app.add_middleware(CompressionMiddleware, minimum_size=1000)
+
+# Profilage opt-in (X-Profile: 1 ou échantillonnage, voir /debug/profiling)
+app.add_middleware(ProfilingMiddleware)
+
 
 # Dependency: DB
 async def get_db() -> AsyncIOMotorDatabase:
@@ -30,6 +102,91 @@ async def get_db() -> AsyncIOMotorDatabase:
     return db
 
 
+def sync_zone_flow_rate(zone_id: str, zone: dict = None):
+    """Le débit déclaré dans le registre sert au comptage de l'eau."""
+    water_usage.set_flow_rate(zone_id, zone.get("flow_rate_lpm") if zone else None)
+
+
+zone_registry.subscribe(sync_zone_flow_rate)
+# Culture ou saison modifiée : résumé de la zone recalculé
+zone_registry.subscribe(zone_digests.touch)
+
+
+async def calibration_recalculated(zone_id: str, field: str):
+    """Lectures passées réécrites par un recalcul d'étalonnage : caches de la zone rechargés."""
+    await recent_history.reload_zone(db, zone_id)
+    aggregate_cache.invalidate_zone(zone_id)
+    zone_digests.touch(zone_id)
+
+
+calibration_registry.subscribe(calibration_recalculated)
+
+
+@app.on_event("startup")
+async def startup():
+    if db is not None:
+        # Index du curseur de /history/changes
+        await db.sensor_data.create_index([("zone_id", 1), ("_id", 1)])
+        # Garantie d'unicité des lectures renvoyées (seq / idempotency_key)
+        await db.sensor_data.create_index(
+            [("zone_id", 1), ("dedup_key", 1)],
+            unique=True,
+            partialFilterExpression={"dedup_key": {"$type": "string"}}
+        )
+        # Registre des zones (culture, saison, débit, groupes) en mémoire
+        await zone_registry.start(db)
+        # Historique récent des zones en mémoire pour /history
+        await recent_history.warm(db, owns)
+        # Clés de déduplication récentes : renvois reconnus dès le redémarrage
+        await reading_dedup.warm(db, owns)
+        # Règles d'alerte indexées et alertes actives des zones de ce worker
+        await rule_engine.start(db, owns, shared=CLUSTER_WORKERS > 1)
+        # Arrosages programmés des zones de ce worker (roue temporelle)
+        await scheduler.start(db, scheduled_valve, owns)
+        # Courbes d'étalonnage des sondes ; recalculs en attente des zones de ce worker
+        await calibration_registry.start(db, owns)
+        # Restaurer les vannes ouvertes pour le comptage de l'eau
+        await water_usage.load(db)
+        valve_audit.start(db)
+        actuator.start(confirm_relay_state, record_relay_failure)
+
+
+@app.on_event("shutdown")
+async def shutdown():
+    await actuator.stop()
+    await valve_audit.stop()
+    await zone_registry.stop()
+    await rule_engine.stop()
+    await scheduler.stop()
+    await calibration_registry.stop()
+    await close_client()
+
+
+async def confirm_relay_state(zone_id: str, relay_open: bool, at: datetime):
+    """Reporte l'état réellement lu sur le relais dans valve_states."""
+    await db.valve_states.update_one(
+        {"zone_id": zone_id},
+        {
+            "$set": {"relay_open": relay_open, "actuated_at": at},
+            "$unset": {"actuation_error": "", "actuation_failed_at": ""},
+            "$setOnInsert": {"is_open": relay_open, "updated_at": at}
+        },
+        upsert=True
+    )
+
+
+async def record_relay_failure(zone_id: str, requested_open: bool, relay_open, error: str, at: datetime):
+    """Commande non appliquée par le relais (réessayée) : erreur gardée jusqu'à la confirmation suivante."""
+    update = {"actuation_error": error, "actuation_failed_at": at}
+    if relay_open is not None:
+        update["relay_open"] = relay_open
+    await db.valve_states.update_one(
+        {"zone_id": zone_id},
+        {"$set": update, "$setOnInsert": {"is_open": requested_open, "updated_at": at}},
+        upsert=True
+    )
+
+
 # ---------- ROUTES ----------
 
 @app.get("/")
@@ -43,57 +200,291 @@ def home():
 @app.post("/send-data", response_model=IrrigationDecision)
 async def receive_sensor_data(data: SensorDataCreate, db: AsyncIOMotorDatabase = Depends(get_db)):
 
-    # Save to database with all fields
-    record = SensorData(
-        zone_id=data.zone_id,
-        humidity=data.humidity,
-        temperature=data.temperature,
-        soil_moisture=data.soil_moisture,
-        soil_moisture_10cm=data.soil_moisture_10cm or data.soil_moisture * 0.9,
-        soil_moisture_30cm=data.soil_moisture_30cm or data.soil_moisture,
-        soil_moisture_60cm=data.soil_moisture_60cm or data.soil_moisture * 1.1,
-        light=data.light or 450.0,
-        wind_speed=data.wind_speed or 8.0,
-        rainfall=data.rainfall,
-        rainfall_intensity=data.rainfall_intensity
-    )
-    await db.sensor_data.insert_one(record.dict(by_alias=True))
+    # Requête profilée : lecture du corps et validation jusqu'ici
+    mark("validation")
+
+    # Document stocké construit directement depuis la requête validée
+    record = data.to_document()
+
+    # Renvoi d'une passerelle : décision d'origine, sans seconde écriture
+    dedup_key = data.dedup_key
+    if dedup_key is not None:
+        with phase("dedup"):
+            original = await original_decision(db, data.zone_id, dedup_key)
+        if original is not None:
+            return original
+        # Plus d'attente jusqu'à `reading_dedup.remember` : un renvoi simultané y trouvera la décision
+
+    # Étalonnage des sondes de la zone (valeurs brutes gardées dans `raw`)
+    with phase("decision"):
+        calibration_registry.calibrate(record)
+        soil_moisture = record["soil_moisture"]
+
+    # Détection des capteurs défaillants (stockée avec la lecture)
+    with phase("decision"):
+        record["anomalies"] = detector.check(data.zone_id, record, irrigating=data.pump_was_active)
+
+    # Decision based on soil moisture + previous pump state, seuils de la zone (lecture en mémoire)
+    with phase("decision"):
+        seuil_bas, seuil_haut = zone_registry.thresholds_for(data.zone_id)
+        # Évapotranspiration de la culture : baisse attendue sur l'horizon d'anticipation
+        etc = reading_et(record, zone_registry.crop_coefficient_for(data.zone_id))
+        projected_drop = moisture_loss_per_hour(etc) * ET_LOOKAHEAD_HOURS
+        # Fin d'un arrosage programmé : la pompe active était celle du programme, pas de l'hystérésis
+        pump_was_active = data.pump_was_active and not scheduler.run_ended(data.zone_id)
+        decision = irrigation_decision(soil_moisture, pump_was_active, seuil_bas, seuil_haut, projected_drop)
+        if record["anomalies"]:
+            decision["anomalies"] = record["anomalies"]
+            if decision["pump"] and detector.vetoes_pump(record["anomalies"]):
+                decision = anomaly_veto_decision(soil_moisture, record["anomalies"])
+        # Programmation : arrosage programmé en cours, ou zone limitée à ses fenêtres d'arrosage
+        override = scheduler.decision_override(data.zone_id, record["created_at"], record)
+        if override == "running":
+            decision = scheduled_run_decision(soil_moisture)
+        elif override == "outside_window" and decision["pump"]:
+            decision = window_veto_decision(soil_moisture)
+        decision["etc_mm_h"] = round(etc, 3)
+    if dedup_key is not None:
+        # Décision stockée avec la lecture pour acquitter ses renvois
+        record["decision"] = dict(decision)
+        reading_dedup.remember(data.zone_id, dedup_key, record["decision"])
 
-    # Decision based on soil moisture + previous pump state
-    decision = irrigation_decision(data.soil_moisture, data.pump_was_active)
+    # Bande morte : lecture écrite seulement si elle diffère de la dernière stockée
+    if not DEADBAND_ENABLED or deadband.should_store(data.zone_id, record):
+        try:
+            with phase("db"):
+                await db.sensor_data.insert_one(record)
+        except DuplicateKeyError:
+            # Clé sortie des filtres en mémoire : l'index unique tranche
+            stored = await db.sensor_data.find_one({"zone_id": data.zone_id, "dedup_key": dedup_key}, {"decision": 1})
+            reading_dedup.record_lookup(True)
+            reading_dedup.remember(data.zone_id, dedup_key, stored["decision"])
+            return {**stored["decision"], "duplicate": True}
+        recent_history.append(record)
+        # Intervalle ouvert des agrégats de la zone périmé
+        aggregate_cache.bump(data.zone_id)
+    elif dedup_key is not None:
+        # Lecture non écrite : clé et décision gardées à sa place pour acquitter ses renvois
+        try:
+            with phase("db"):
+                await db.reading_keys.insert_one({
+                    "zone_id": data.zone_id, "dedup_key": dedup_key,
+                    "decision": record["decision"], "created_at": record["created_at"]
+                })
+        except DuplicateKeyError:
+            decision = await stored_decision(db, data.zone_id, dedup_key)
+            reading_dedup.record_lookup(decision is not None)
+            if decision is not None:
+                reading_dedup.remember(data.zone_id, dedup_key, decision)
+                return {**decision, "duplicate": True}
+
+    # Comptage de l'eau : transition de la pompe décidée pour cette zone
+    if data.flow_rate is not None:
+        water_usage.record_flow(data.zone_id, data.flow_rate)
+    # Pompe pilotée par la décision, sauf pendant une retenue manuelle (actuation.py)
+    if actuator.allows_automatic(data.zone_id):
+        # Arrosage programmé en cours : la vanne est tenue par le programme seul, sa fin la referme
+        decision_open = decision["pump"] and override != "running"
+        with phase("db"):
+            valve_open = await water_usage.transition(db, data.zone_id, decision_open, record["created_at"], "decision")
+        actuator.submit(data.zone_id, valve_open)
+    # Dernier état de la zone, lisible par tous les workers
+    shared_state.update_reading(data.zone_id, record, decision["pump"])
+
+    # Mise à jour O(1) de l'estimation du taux de séchage de la zone
+    with phase("decision"):
+        forecaster.update(
+            data.zone_id,
+            record,
+            record["created_at"],
+            irrigating=data.pump_was_active or decision["pump"] or data.rainfall or bool(record["anomalies"])
+        )
+
+    # Règles d'alerte : seules les règles indexées qui peuvent correspondre sont évaluées
+    with phase("decision"):
+        await rule_engine.evaluate(
+            db, data.zone_id, {**record, "pump": decision["pump"], "etc_mm_h": etc}, record["created_at"]
+        )
+    # Nouvelle version de données : résumé de l'assistant invalidé
+    zone_digests.update(data.zone_id, record, decision["pump"])
 
     return decision
 
 
-@app.get("/history")
-async def get_history(zone_id: str = None, db: AsyncIOMotorDatabase = Depends(get_db)):
-    query = {}
+async def stored_decision(db: AsyncIOMotorDatabase, zone_id: str, dedup_key: str):
+    """Décision stockée avec la lecture, ou avec sa clé si la bande morte ne l'a pas écrite."""
+    query = {"zone_id": zone_id, "dedup_key": dedup_key, "decision": {"$exists": True}}
+    stored = await db.sensor_data.find_one(query, {"decision": 1})
+    if stored is None:
+        stored = await db.reading_keys.find_one(query, {"decision": 1})
+    return stored["decision"] if stored else None
+
+
+async def original_decision(db: AsyncIOMotorDatabase, zone_id: str, dedup_key: str):
+    """Décision renvoyée à la première réception de la clé, ou None si la lecture est nouvelle."""
+    decision = reading_dedup.cached(zone_id, dedup_key)
+    if decision is None and reading_dedup.maybe_seen(zone_id, dedup_key):
+        decision = await stored_decision(db, zone_id, dedup_key)
+        reading_dedup.record_lookup(decision is not None)
+        if decision is None:
+            # Renvoi simultané traité pendant la requête
+            decision = reading_dedup.cached(zone_id, dedup_key)
+    return {**decision, "duplicate": True} if decision is not None else None
+
+
+@app.get("/forecast")
+async def get_forecast(zone_id: str = None):
+    """
+    Temps estimé avant que chaque zone ne passe sous son seuil de déclenchement.
+    Calculé à partir des estimations en mémoire, sans relire l'historique.
+    """
     if zone_id:
-        query["zone_id"] = zone_id
-    
-    cursor = db.sensor_data.find(query).sort("created_at", -1).limit(100)
-    records = await cursor.to_list(length=100)
+        forecast = forecaster.forecast(
+            zone_id, zone_registry.thresholds_for(zone_id)[0], zone_registry.crop_coefficient_for(zone_id)
+        )
+        if forecast is None:
+            raise HTTPException(status_code=404, detail=f"Aucune donnée de prévision pour {zone_id}")
+        return [forecast]
+    forecasts = forecaster.forecast_all(
+        lambda zone_id: zone_registry.thresholds_for(zone_id)[0], zone_registry.crop_coefficient_for
+    )
+    return [forecast for forecast in forecasts if serves(forecast["zone_id"])]
+
+
+@app.get("/anomalies/stats")
+async def get_anomaly_stats():
+    """
+    Compteurs du détecteur d'anomalies et coût ajouté par lecture.
+    """
+    return detector.stats()
+
+
+@app.get("/deadband/stats")
+async def get_deadband_stats():
+    """
+    Lectures reçues, écrites et évitées par le stockage en bande morte.
+    """
+    return deadband.stats()
+
+
+@app.get("/dedup/stats")
+async def get_dedup_stats():
+    """
+    Lectures renvoyées acquittées, requêtes de vérification et mémoire des filtres de doublons.
+    """
+    return reading_dedup.stats()
+
+
+@app.get("/audit/stats")
+async def get_audit_stats():
+    """
+    Entrées du journal des vannes écrites, en attente et abandonnées pendant une panne de MongoDB.
+    """
+    return valve_audit.stats()
+
+
+@app.get("/admission/stats")
+async def get_admission_stats():
+    """
+    Requêtes admises et délestées (par motif), requêtes MongoDB en cours et en attente.
+    """
+    return admission.stats()
+
+
+@app.get("/history")
+async def get_history(
+    zone_id: str = None,
+    format: str = Query("rows", pattern="^(rows|columnar)$"),
+    interpolate: str = Query(None, pattern="^(none|step|linear)$"),
+    minutes: int = Query(None, ge=1),
+    limit: int = Query(100, ge=1, le=5000),
+    db: AsyncIOMotorDatabase = Depends(get_db)
+):
+    since = datetime.utcnow() - timedelta(minutes=minutes) if minutes else None
+
+    # Fenêtre d'une zone contenue dans le tampon en mémoire : pas de requête MongoDB
+    records = recent_history.query(zone_id, limit, since) if zone_id else None
+    if records is None:
+        query = {}
+        if zone_id:
+            query["zone_id"] = zone_id
+        if since:
+            query["created_at"] = {"$gte": since}
+
+        # Même ordre que le tampon pour les lectures de la même milliseconde
+        cursor = db.sensor_data.find(query).sort([("created_at", -1), ("_id", -1)]).limit(limit)
+        records = await cursor.to_list(length=limit)
+
+    # Bande morte : série régulière reconstruite (escalier par défaut)
+    method = interpolate or ("step" if DEADBAND_ENABLED else "none")
+    if method != "none":
+        records = reconstruct_by_zone(records, method)[:limit]
     
+    if format == "columnar":
+        # Une liste par champ, horodatages encodés en delta
+        return to_columnar(records)
+
     # Convert to frontend format
-    return [
-        {
-            "id": str(r["_id"]),
-            "zone_id": r["zone_id"],
-            "timestamp": int(r["created_at"].timestamp() * 1000),
-            "moisture": r["soil_moisture"],
-            "temperature": r["temperature"],
-            "humidity": r["humidity"],
-            "soilMoisture10cm": r.get("soil_moisture_10cm", r["soil_moisture"] * 0.9),
-            "soilMoisture30cm": r.get("soil_moisture_30cm", r["soil_moisture"]),
-            "soilMoisture60cm": r.get("soil_moisture_60cm", r["soil_moisture"] * 1.1),
-            "light": r.get("light", 450.0),
-            "windSpeed": r.get("wind_speed", 8.0),
-            "rainfall": r["rainfall"],
-            "rainfallIntensity": r["rainfall_intensity"],
-            "created_at": r["created_at"].isoformat()
-        }
-        for r in records
-    ]
+    return [format_reading(r) for r in records]
+
+
+@app.get("/history/buffer/stats")
+async def get_history_buffer_stats():
+    """
+    Occupation mémoire du tampon d'historique récent et part des requêtes servies en mémoire.
+    """
+    return recent_history.stats()
+
+
+# Fenêtre relue avant le curseur de /history/changes (lectures validées dans le désordre)
+HISTORY_CHANGES_OVERLAP_SECONDS = float(os.getenv("HISTORY_CHANGES_OVERLAP_SECONDS", "10"))
+
+
+@app.get("/history/changes")
+async def get_history_changes(
+    zone_id: str,
+    since: str = None,
+    limit: int = Query(100, ge=1, le=1000),
+    db: AsyncIOMotorDatabase = Depends(get_db)
+):
+    """
+    Lectures d'une zone insérées après le curseur `since` (ordre croissant),
+    servies par l'index (zone_id, _id). Sans curseur : les `limit` dernières.
+    Le client renvoie le `cursor` reçu à l'appel suivant.
+
+    L'_id est attribué avant l'écriture : une lecture peut être validée après
+    une lecture d'_id plus grand, déjà passée sous le curseur. Les lectures des
+    HISTORY_CHANGES_OVERLAP_SECONDS secondes qui précèdent le curseur sont donc
+    renvoyées à nouveau (`overlap` premiers éléments) ; le client les
+    dédoublonne par `id`.
+    """
+    query = {"zone_id": zone_id}
+    overlap = []
+    if since:
+        if not ObjectId.is_valid(since):
+            raise HTTPException(status_code=400, detail="Curseur invalide")
+        since_id = ObjectId(since)
+        window_start = ObjectId.from_datetime(
+            since_id.generation_time - timedelta(seconds=HISTORY_CHANGES_OVERLAP_SECONDS)
+        )
+        cursor = db.sensor_data.find(
+            {"zone_id": zone_id, "_id": {"$gte": window_start, "$lte": since_id}}
+        ).sort("_id", -1).limit(limit)
+        overlap = (await cursor.to_list(length=limit))[::-1]
+        query["_id"] = {"$gt": since_id}
+        cursor = db.sensor_data.find(query).sort("_id", 1).limit(limit)
+        records = await cursor.to_list(length=limit)
+    else:
+        cursor = db.sensor_data.find(query).sort("_id", -1).limit(limit)
+        records = (await cursor.to_list(length=limit))[::-1]
+
+    return {
+        "zone_id": zone_id,
+        "items": [format_reading(r) for r in overlap + records],
+        "overlap": len(overlap),
+        "cursor": str(records[-1]["_id"]) if records else since,
+        "has_more": bool(since) and len(records) == limit
+    }
 
 
 @app.post("/toggle-valve", response_model=ValveToggleResponse)
@@ -102,21 +493,46 @@ async def toggle_valve(request: ValveToggleRequest, db: AsyncIOMotorDatabase = D
     Contrôle manuel de la vanne d'irrigation pour une zone.
     Active ou désactive la pompe/électrovanne.
     """
+    actuator.hold(request.zone_id)
+    await set_valve(db, request.zone_id, request.valve_open, "toggle", "manual")
+    return ValveToggleResponse(zone_id=request.zone_id, **valve_feedback(request.zone_id, request.valve_open))
+
+
+async def set_valve(db: AsyncIOMotorDatabase, zone_id: str, valve_open: bool, source: str, usage_source: str):
+    """État de la vanne, comptage de l'eau, audit et commande du relais d'une zone."""
+    now = datetime.utcnow()
+    # État compté : la vanne reste ouverte tant qu'une autre source la veut ouverte
+    is_open = await water_usage.transition(db, zone_id, valve_open, now, usage_source)
     # Upsert the valve state
     await db.valve_states.update_one(
-        {"zone_id": request.zone_id},
-        {"$set": {"is_open": request.valve_open, "updated_at": datetime.utcnow()}},
+        {"zone_id": zone_id},
+        {"$set": {"is_open": is_open, "updated_at": now}},
         upsert=True
     )
+    valve_audit.append([{
+        "zone_id": zone_id, "valve_open": valve_open,
+        "source": source, "success": True, "at": now
+    }])
+
+    # Commande du relais (GPIO ou simulé) hors du gestionnaire de requête
+    actuator.submit(zone_id, is_open)
+    shared_state.update_valve(zone_id, is_open, now)
+
+
+async def scheduled_valve(zone_id: str, valve_open: bool):
+    """Ouverture/fermeture commandée par un programme d'arrosage (sauf retenue manuelle)."""
+    if not actuator.allows_automatic(zone_id):
+        print(f"Programmation {zone_id}: commande ignorée, vanne en mode manuel")
+        return
+    await set_valve(db, zone_id, valve_open, "schedule", "schedule")
+
+
+def valve_feedback(zone_id: str, valve_open: bool) -> dict:
+    """Message, emojis et son associés à l'état d'une vanne."""
+    status = "ouverte" if valve_open else "fermée"
+    action = "💦 IRRIGATION ACTIVÉE" if valve_open else "🛑 IRRIGATION ARRÊTÉE"
     
-    # TODO: Intégration matérielle - Contrôler le GPIO/relais
-    # import RPi.GPIO as GPIO
-    # GPIO.output(VALVE_PIN, GPIO.HIGH if request.valve_open else GPIO.LOW)
-    
-    status = "ouverte" if request.valve_open else "fermée"
-    action = "💦 IRRIGATION ACTIVÉE" if request.valve_open else "🛑 IRRIGATION ARRÊTÉE"
-    
-    if request.valve_open:
+    if valve_open:
         visual_emojis = "🚿🌱🌿💧💦"
         animation_type = "watering"
         sound_message = "Le champ est en train de se faire arroser"
@@ -127,14 +543,74 @@ async def toggle_valve(request: ValveToggleRequest, db: AsyncIOMotorDatabase = D
         sound_message = "L'arrosage est arrêté"
         sound_url = "/static/sounds/irrigation_stopped.mp3"
     
-    return ValveToggleResponse(
-        zone_id=request.zone_id,
-        valve_open=request.valve_open,
-        message=f"{action} - Vanne {status} pour {request.zone_id}",
-        visual_emojis=visual_emojis,
-        animation_type=animation_type,
-        sound_message=sound_message,
-        sound_url=sound_url
+    return {
+        "valve_open": valve_open,
+        "message": f"{action} - Vanne {status} pour {zone_id}",
+        "visual_emojis": visual_emojis,
+        "animation_type": animation_type,
+        "sound_message": sound_message,
+        "sound_url": sound_url
+    }
+
+
+@app.post("/toggle-valve/bulk", response_model=ValveBulkToggleResponse)
+async def toggle_valve_bulk(request: ValveBulkToggleRequest, db: AsyncIOMotorDatabase = Depends(get_db)):
+    """
+    Contrôle groupé des vannes (ex: avant un gel, après un relevé de terrain).
+    Toutes les zones sont écrites avec un seul bulk_write.
+    """
+    # Une commande par zone : la dernière l'emporte
+    targets = {command.zone_id: command.valve_open for command in request.commands}
+    for zone_id in request.zone_ids:
+        targets[zone_id] = request.valve_open
+    for zone_id in sorted(zone_registry.zones_in_groups(request.groups)):
+        targets[zone_id] = request.valve_open
+    if not targets:
+        raise HTTPException(status_code=404, detail="Aucune zone dans les groupes demandés")
+    zones = list(targets.items())
+
+    now = datetime.utcnow()
+    operations = [
+        UpdateOne(
+            {"zone_id": zone_id},
+            {"$set": {"is_open": valve_open, "updated_at": now}},
+            upsert=True
+        )
+        for zone_id, valve_open in zones
+    ]
+    failed = {}
+    try:
+        await db.valve_states.bulk_write(operations, ordered=False)
+    except BulkWriteError as e:
+        for error in e.details.get("writeErrors", []):
+            failed[zones[error["index"]][0]] = error.get("errmsg", "Erreur d'écriture")
+
+    results = []
+    audit_entries = []
+    for zone_id, valve_open in zones:
+        success = zone_id not in failed
+        if success:
+            actuator.hold(zone_id)
+            actuator.submit(zone_id, valve_open)
+            shared_state.update_valve(zone_id, valve_open, now)
+            message = valve_feedback(zone_id, valve_open)["message"]
+        else:
+            message = f"❌ Échec de la commande pour {zone_id}: {failed[zone_id]}"
+        results.append(ValveBulkResult(zone_id=zone_id, valve_open=valve_open, success=success, message=message))
+        audit_entries.append({
+            "zone_id": zone_id, "valve_open": valve_open,
+            "source": "bulk", "success": success, "at": now
+        })
+
+    await water_usage.transitions(
+        db, [(zone_id, valve_open) for zone_id, valve_open in zones if zone_id not in failed], now, "manual"
+    )
+    valve_audit.append(audit_entries)
+
+    return ValveBulkToggleResponse(
+        requested=len(zones),
+        succeeded=len(zones) - len(failed),
+        results=results
     )
 
 
@@ -153,11 +629,479 @@ async def get_valve_state(zone_id: str, db: AsyncIOMotorDatabase = Depends(get_d
             "message": "Aucun état trouvé - vanne fermée par défaut"
         }
     
-    return {
+    state = {
         "zone_id": valve_state["zone_id"],
         "valve_open": valve_state["is_open"],
         "updated_at": valve_state["updated_at"].isoformat()
     }
+    if "relay_open" in valve_state:
+        # État confirmé par le relais
+        state["relay_open"] = valve_state["relay_open"]
+        if "actuated_at" in valve_state:
+            state["actuated_at"] = valve_state["actuated_at"].isoformat()
+    if "actuation_error" in valve_state:
+        # Relais pas encore dans l'état demandé (commande réessayée) : état réel, sinon inchangé
+        state["requested_open"] = valve_state["is_open"]
+        state["valve_open"] = valve_state.get("relay_open", not valve_state["is_open"])
+        state["actuation_error"] = valve_state["actuation_error"]
+        state["actuation_failed_at"] = valve_state["actuation_failed_at"].isoformat()
+    return state
+
+
+@app.get("/actuation/metrics")
+async def get_actuation_metrics():
+    """
+    Commandes reçues, fusionnées, appliquées et latence commande → relais.
+    """
+    return actuator.metrics()
+
+
+@app.get("/latest")
+async def get_latest_states():
+    """
+    Dernier état connu de toutes les zones (table partagée entre workers, sans MongoDB).
+    """
+    return shared_state.read_all()
+
+
+@app.get("/latest/{zone_id}")
+async def get_latest_state(zone_id: str):
+    """
+    Dernière lecture, décision de la pompe et état de la vanne d'une zone.
+    """
+    state = shared_state.read(zone_id)
+    if state is None:
+        raise HTTPException(status_code=404, detail=f"Aucun état récent pour {zone_id}")
+    return state
+
+
+@app.get("/cluster/stats")
+async def get_cluster_stats():
+    """
+    Worker ayant répondu, requêtes relayées et occupation de la table partagée.
+    """
+    return {**cluster_stats(), "shared_state": shared_state.stats()}
+
+
+def zone_view(zone_id: str, zone: dict) -> dict:
+    """Configuration de la zone avec ses groupes et seuils effectifs."""
+    seuil_bas, seuil_haut = zone_registry.thresholds_for(zone_id)
+    return {
+        **zone,
+        "groups": sorted(zone_groups(zone)),
+        "thresholds": {"seuil_declenchement": seuil_bas, "seuil_arret": seuil_haut}
+    }
+
+
+@app.get("/zones")
+async def list_zones(group: str = None):
+    """
+    Zones du registre (servies depuis l'index en mémoire), éventuellement filtrées par groupe.
+    """
+    zone_ids = zone_registry.zones_in_groups([group]) if group else zone_registry.zones
+    return [zone_view(zone_id, zone_registry.zones[zone_id]) for zone_id in sorted(zone_ids)]
+
+
+@app.get("/zones/{zone_id}")
+async def get_zone(zone_id: str):
+    zone = zone_registry.get(zone_id)
+    if zone is None:
+        raise HTTPException(status_code=404, detail=f"Zone inconnue: {zone_id}")
+    return zone_view(zone_id, zone)
+
+
+@app.get("/zones/{zone_id}/digest")
+async def get_zone_digest(zone_id: str):
+    """
+    Résumé compact de la zone pour l'assistant IA : tendances par profondeur,
+    position par rapport aux seuils de la culture, anomalies, alertes actives,
+    temps depuis le dernier arrosage, et le tout en une ligne (`text`).
+    Servi depuis la mémoire, en cache jusqu'à la prochaine lecture de la zone.
+    """
+    digest = zone_digests.digest(zone_id)
+    if digest is None:
+        raise HTTPException(status_code=404, detail=f"Zone inconnue: {zone_id}")
+    return digest
+
+
+@app.get("/digests/stats")
+async def get_digest_stats():
+    """Résumés en cache et taux de réponses servies sans recalcul."""
+    return zone_digests.stats()
+
+
+@app.put("/zones/{zone_id}")
+async def put_zone(zone_id: str, config: ZoneConfig, db: AsyncIOMotorDatabase = Depends(get_db)):
+    """
+    Crée ou remplace la configuration d'une zone (culture, saison, débit, capteurs, groupes).
+    L'index en mémoire et les seuils de décision sont mis à jour immédiatement.
+    """
+    zone = {"zone_id": zone_id, **config.model_dump(), "updated_at": datetime.utcnow()}
+    zone = await zone_registry.upsert(db, zone)
+    return zone_view(zone_id, zone)
+
+
+@app.delete("/zones/{zone_id}")
+async def delete_zone(zone_id: str, db: AsyncIOMotorDatabase = Depends(get_db)):
+    if not await zone_registry.remove(db, zone_id):
+        raise HTTPException(status_code=404, detail=f"Zone inconnue: {zone_id}")
+    return {"zone_id": zone_id, "deleted": True}
+
+
+@app.get("/rules")
+async def list_rules():
+    return sorted(rule_engine.rules.values(), key=lambda rule: rule["rule_id"])
+
+
+@app.get("/rules/{rule_id}")
+async def get_rule(rule_id: str):
+    rule = rule_engine.rules.get(rule_id)
+    if rule is None:
+        raise HTTPException(status_code=404, detail=f"Règle inconnue: {rule_id}")
+    return rule
+
+
+@app.put("/rules/{rule_id}")
+async def put_rule(rule_id: str, rule: AlertRule, db: AsyncIOMotorDatabase = Depends(get_db)):
+    """
+    Crée ou remplace une règle d'alerte ; l'index de ce worker est reconstruit
+    immédiatement, celui des autres au prochain rechargement.
+    """
+    return await rule_engine.upsert(db, rule_id, {**rule.model_dump(), "updated_at": datetime.utcnow()})
+
+
+@app.delete("/rules/{rule_id}")
+async def delete_rule(rule_id: str, db: AsyncIOMotorDatabase = Depends(get_db)):
+    if not await rule_engine.remove(db, rule_id):
+        raise HTTPException(status_code=404, detail=f"Règle inconnue: {rule_id}")
+    return {"rule_id": rule_id, "deleted": True}
+
+
+@app.get("/alerts")
+async def get_alerts(
+    zone_id: str = None,
+    status: str = Query(None, pattern="^(active|resolved)$"),
+    limit: int = Query(100, ge=1, le=1000),
+    db: AsyncIOMotorDatabase = Depends(get_db)
+):
+    """Alertes stockées, les plus récentes d'abord."""
+    query = {}
+    if zone_id:
+        query["zone_id"] = zone_id
+    if status:
+        query["status"] = status
+    alerts = await db.alerts.find(query).sort("fired_at", -1).limit(limit).to_list(limit)
+    return [alert_view(alert) for alert in alerts]
+
+
+@app.get("/alerts/stream")
+async def stream_alerts():
+    """
+    Flux Server-Sent Events : alertes actives à la connexion (`active`),
+    puis chaque création (`fired`) et résolution (`resolved`), toutes zones
+    confondues (avec cluster.py, celles des autres workers sont relues dans MongoDB).
+    """
+    queue = rule_engine.subscribe()
+
+    async def events():
+        try:
+            # Premier octet aussitôt : en-têtes envoyés sans attendre une alerte ou le keep-alive
+            yield ": connected\n\n"
+            for alert in await rule_engine.stream_snapshot(db):
+                yield f"event: active\ndata: {json.dumps(alert_view(alert))}\n\n"
+            while True:
+                try:
+                    event, alert = await asyncio.wait_for(queue.get(), 15)
+                except asyncio.TimeoutError:
+                    yield ": keep-alive\n\n"
+                    continue
+                yield f"event: {event}\ndata: {json.dumps(alert)}\n\n"
+        finally:
+            rule_engine.unsubscribe(queue)
+
+    return StreamingResponse(events(), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
+
+
+@app.get("/alerts/stats")
+async def get_alert_stats():
+    """Règles indexées, candidats évalués par lecture, alertes créées/résolues."""
+    return rule_engine.stats()
+
+
+@app.get("/schedules")
+async def list_schedules(zone_id: str = None, db: AsyncIOMotorDatabase = Depends(get_db)):
+    """Programmes d'arrosage (toutes zones, ou `?zone_id=`) avec leur dernier résultat."""
+    query = {"zone_id": zone_id} if zone_id else {}
+    return await db.schedules.find(query, {"_id": 0}).sort("schedule_id", 1).to_list(None)
+
+
+@app.post("/schedules")
+async def create_schedule(schedule: IrrigationSchedule, db: AsyncIOMotorDatabase = Depends(get_db)):
+    """Crée une fenêtre récurrente ou un arrosage unique ; planifié aussitôt par le worker de la zone."""
+    return await scheduler.upsert(db, schedule_document(str(ObjectId()), schedule.model_dump()))
+
+
+@app.put("/schedules/{schedule_id}")
+async def put_schedule(schedule_id: str, schedule: IrrigationSchedule, db: AsyncIOMotorDatabase = Depends(get_db)):
+    """Remplace un programme ; un arrosage en cours de ce programme est arrêté."""
+    return await scheduler.upsert(db, schedule_document(schedule_id, schedule.model_dump()))
+
+
+@app.delete("/schedules/{schedule_id}")
+async def delete_schedule(schedule_id: str, db: AsyncIOMotorDatabase = Depends(get_db)):
+    if not await scheduler.remove(db, schedule_id):
+        raise HTTPException(status_code=404, detail=f"Programme inconnu: {schedule_id}")
+    return {"schedule_id": schedule_id, "deleted": True}
+
+
+@app.get("/scheduler/stats")
+async def get_scheduler_stats():
+    """Programmes suivis par ce worker, arrosages en cours et occupation de la roue temporelle."""
+    return scheduler.stats()
+
+
+@app.get("/calibrations")
+async def list_calibrations(zone_id: str = None, db: AsyncIOMotorDatabase = Depends(get_db)):
+    """Courbes d'étalonnage (toutes zones, ou `?zone_id=`)."""
+    query = {"zone_id": zone_id} if zone_id else {}
+    return await db.calibrations.find(query, {"_id": 0}).sort([("zone_id", 1), ("depth", 1)]).to_list(None)
+
+
+@app.put("/calibrations/{zone_id}/{depth}")
+async def put_calibration(zone_id: str, depth: str, curve: CalibrationCurve,
+                          db: AsyncIOMotorDatabase = Depends(get_db)):
+    """
+    Crée ou remplace la courbe d'une sonde (`depth` : soil_moisture, 10cm, 30cm, 60cm).
+    Les lectures stockées depuis `valid_from` sont recalculées en tâche de fond.
+    """
+    if depth not in CALIBRATED_FIELDS:
+        raise HTTPException(status_code=404, detail=f"Profondeur inconnue: {depth}")
+    doc = await calibration_registry.upsert(db, zone_id, depth, curve.model_dump())
+    # Nouvelle échelle : pas de faux saut détecté à la lecture suivante
+    detector.forget(zone_id)
+    zone_digests.touch(zone_id)
+    return doc
+
+
+@app.delete("/calibrations/{zone_id}/{depth}")
+async def delete_calibration(zone_id: str, depth: str, db: AsyncIOMotorDatabase = Depends(get_db)):
+    """Supprime la courbe ; les lectures étalonnées reprennent leurs valeurs brutes."""
+    if depth not in CALIBRATED_FIELDS or not await calibration_registry.remove(db, zone_id, depth):
+        raise HTTPException(status_code=404, detail=f"Étalonnage inconnu: {zone_id}/{depth}")
+    detector.forget(zone_id)
+    zone_digests.touch(zone_id)
+    return {"zone_id": zone_id, "depth": depth, "deleted": True}
+
+
+@app.get("/calibrations/jobs")
+async def list_calibration_jobs(db: AsyncIOMotorDatabase = Depends(get_db)):
+    """Recalculs des lectures : avancement (`processed`, `cursor`) et état."""
+    jobs = await db.calibration_jobs.find({}, {"_id": 0, "curve": 0}).to_list(None)
+    for job in jobs:
+        job["cursor"] = str(job["cursor"]) if job.get("cursor") is not None else None
+    return jobs
+
+
+@app.get("/calibrations/stats")
+async def get_calibration_stats():
+    """Courbes en mémoire, lectures étalonnées à l'ingestion et recalculées."""
+    return calibration_registry.stats()
+
+
+def require_debug_token(x_debug_token: str = Header(None)):
+    if DEBUG_TOKEN is None:
+        raise HTTPException(status_code=404, detail="Routes de débogage désactivées (DEBUG_TOKEN non défini)")
+    if not authorized(x_debug_token.encode("latin-1") if x_debug_token else None):
+        raise HTTPException(status_code=403, detail="X-Debug-Token invalide")
+
+
+@app.get("/debug/profiling", dependencies=[Depends(require_debug_token)])
+async def get_profiling_settings():
+    """
+    Échantillonnage en cours et derniers profils de requêtes écrits.
+    """
+    return profiler.settings()
+
+
+@app.put("/debug/profiling", dependencies=[Depends(require_debug_token)])
+async def put_profiling_settings(settings: ProfilingSettings):
+    """
+    Active le profilage d'une fraction des requêtes (0 désactive), sans redéploiement.
+    """
+    profiler.sample_rate = settings.sample_rate
+    if settings.paths is not None:
+        profiler.paths = settings.paths
+    return profiler.settings()
+
+
+@app.get("/debug/profile", dependencies=[Depends(require_debug_token)])
+async def profile_whole_process(
+    seconds: float = Query(5, gt=0, le=60),
+    interval_ms: float = Query(5, ge=1, le=100),
+    format: str = Query("speedscope", pattern="^(speedscope|collapsed)$")
+):
+    """
+    Échantillonne tous les threads du processus pendant `seconds` secondes.
+    Renvoie le profil (speedscope ou collapsed pour flamegraph.pl), aussi écrit dans PROFILE_DIR.
+    """
+    sampler, name, files = await profile_process(seconds, interval_ms)
+    headers = {"X-Profile-File": ", ".join(files)}
+    if format == "collapsed":
+        return PlainTextResponse(sampler.to_collapsed(), headers=headers)
+    return JSONResponse(sampler.to_speedscope(name), headers=headers)
+
+
+@app.get("/water-usage")
+async def get_water_usage(
+    zone_id: str = None,
+    start: str = None,
+    end: str = None,
+    period: str = "day",
+    db: AsyncIOMotorDatabase = Depends(get_db)
+):
+    """
+    Consommation d'eau (litres) par zone, agrégée par jour, mois ou sur toute la période.
+    Dates au format AAAA-MM-JJ ; par défaut les 7 derniers jours.
+    """
+    if period not in ("day", "month", "total"):
+        raise HTTPException(status_code=400, detail="period doit être 'day', 'month' ou 'total'")
+    today = datetime.utcnow()
+    try:
+        end_day = datetime.strptime(end, "%Y-%m-%d") if end else today
+        start_day = datetime.strptime(start, "%Y-%m-%d") if start else end_day - timedelta(days=6)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Dates attendues au format AAAA-MM-JJ")
+    report = await water_usage.report(
+        db, zone_id, start_day.strftime("%Y-%m-%d"), end_day.strftime("%Y-%m-%d"), period
+    )
+    # Diffusion multi-worker : seulement les zones dont ce worker suit les vannes ouvertes
+    report["zones"] = {zone: usage for zone, usage in report["zones"].items() if serves(zone)}
+    return report
+
+
+def parse_utc(value: str) -> datetime:
+    """Date AAAA-MM-JJ ou ISO 8601 → UTC sans fuseau (comme created_at)."""
+    parsed = datetime.fromisoformat(value)
+    return parsed.astimezone(timezone.utc).replace(tzinfo=None) if parsed.tzinfo else parsed
+
+
+# Plage par défaut de /aggregates selon la résolution
+DEFAULT_AGGREGATE_SPANS = {"hour": timedelta(days=2), "day": timedelta(days=30), "month": timedelta(days=365)}
+
+
+@app.get("/aggregates")
+async def get_aggregates(
+    zone_id: str,
+    start: str = None,
+    end: str = None,
+    resolution: str = "day",
+    fields: str = None,
+    db: AsyncIOMotorDatabase = Depends(get_db)
+):
+    """
+    Lectures d'une zone agrégées par heure, jour ou mois (UTC) : nombre de
+    lectures, min / moyenne / max par champ (`?fields=` pour restreindre),
+    lectures de pluie et avec anomalie. Les intervalles clos sont servis
+    depuis le cache ; seul l'intervalle ouvert est relu après une nouvelle lecture.
+    Avec `deadband`, comptes et moyennes portent sur la série reconstruite
+    en escalier, pondérée par la durée (voir aggregates.py).
+    """
+    if resolution not in RESOLUTIONS:
+        raise HTTPException(status_code=400, detail=f"resolution doit être parmi {', '.join(RESOLUTIONS)}")
+    try:
+        end_at = parse_utc(end) if end else datetime.utcnow()
+        start_at = parse_utc(start) if start else end_at - DEFAULT_AGGREGATE_SPANS[resolution]
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Dates attendues au format AAAA-MM-JJ ou ISO 8601")
+    try:
+        buckets = await aggregate_cache.buckets(db, zone_id, start_at, end_at, resolution)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    selected = set(fields.split(",")) if fields else None
+    return {
+        "zone_id": zone_id,
+        "resolution": resolution,
+        "start": start_at.isoformat(),
+        "end": end_at.isoformat(),
+        "deadband": DEADBAND_ENABLED,
+        "buckets": [
+            {
+                "start": bucket_at.isoformat(),
+                "closed": closed,
+                **bucket,
+                "fields": {f: s for f, s in bucket["fields"].items() if selected is None or f in selected},
+            }
+            for bucket_at, bucket, closed in buckets
+        ],
+    }
+
+
+@app.get("/reports/season")
+async def get_season_report(
+    zone_id: str,
+    season: str = None,
+    year: int = None,
+    db: AsyncIOMotorDatabase = Depends(get_db)
+):
+    """
+    Rapport de saison d'une zone : agrégats mensuels des lectures (en cache
+    pour les mois clos), consommation d'eau et comparaison de l'humidité
+    moyenne aux seuils de la culture pour la saison.
+    """
+    zone = zone_registry.get(zone_id) or {}
+    season = season or zone.get("season") or SAISON_PAR_DEFAUT
+    if season not in SEASON_MONTHS:
+        raise HTTPException(status_code=400, detail=f"season doit être parmi {', '.join(SEASON_MONTHS)}")
+    start_at, end_at = season_range(season, year or datetime.utcnow().year)
+    months = await aggregate_cache.buckets(db, zone_id, start_at, end_at, "month")
+    usage = await water_usage.report(
+        db, zone_id, start_at.strftime("%Y-%m-%d"), (end_at - timedelta(days=1)).strftime("%Y-%m-%d"), "month"
+    )
+    litres = {period["period"]: period for period in usage["zones"].get(zone_id, {}).get("periods", [])}
+    if zone.get("crop"):
+        seuils = obtenir_seuils_intelligents(zone["crop"], season)
+        seuil_bas, seuil_haut = seuils["seuil_declenchement"], seuils["seuil_arret"]
+    else:
+        seuil_bas, seuil_haut = zone_registry.thresholds_for(zone_id)
+
+    def month_view(key: str, bucket: dict) -> dict:
+        moisture = bucket["fields"].get("soil_moisture", {}).get("avg")
+        water = litres.get(key, {})
+        return {
+            **bucket,
+            "litres": water.get("litres", 0.0),
+            "open_minutes": water.get("open_minutes", 0.0),
+            "below_trigger": moisture is not None and moisture < seuil_bas,
+        }
+
+    total = combine_buckets([bucket for _, bucket, _ in months])
+    return {
+        "zone_id": zone_id,
+        "season": season,
+        "start": start_at.isoformat(),
+        "end": end_at.isoformat(),
+        "crop": zone.get("crop"),
+        "thresholds": {"seuil_declenchement": seuil_bas, "seuil_arret": seuil_haut},
+        "deadband": DEADBAND_ENABLED,
+        "months": [
+            {"month": month_at.strftime("%Y-%m"), "closed": closed, **month_view(month_at.strftime("%Y-%m"), bucket)}
+            for month_at, bucket, closed in months
+        ],
+        "total": {**total, "litres": usage["zones"].get(zone_id, {}).get("total_litres", 0.0)},
+    }
+
+
+@app.get("/aggregates/cache/stats")
+async def get_aggregate_cache_stats():
+    """Occupation du cache des agrégats, taux de réponses servies depuis le cache, évictions."""
+    return aggregate_cache.stats()
+
+
+@app.delete("/aggregates/cache")
+async def clear_aggregate_cache(zone_id: str = None):
+    """Vide le cache d'une zone (ou de toutes), ex. après un import de lectures passées."""
+    dropped = aggregate_cache.invalidate_zone(zone_id) if zone_id else aggregate_cache.clear()
+    return {"zone_id": zone_id, "dropped": dropped}
 
 
 if __name__ == "__main__":
@@ -1,26 +1,34 @@
-from pydantic import BaseModel, Field
-from typing import Literal, Optional
-from datetime import datetime
+from pydantic import BaseModel, ConfigDict, Field, PlainSerializer, PlainValidator, WithJsonSchema, model_validator
+from typing import Annotated, List, Literal, Optional, Tuple, Union
+from datetime import datetime, timezone
 from bson import ObjectId
 
-# Custom ObjectId field for Pydantic
-class PyObjectId(ObjectId):
-    @classmethod
-    def __get_validators__(cls):
-        yield cls.validate
+from crops import CONFIG_CULTURES
 
-    @classmethod
-    def validate(cls, v):
-        if not ObjectId.is_valid(v):
-            raise ValueError("Invalid objectid")
-        return ObjectId(v)
 
-    @classmethod
-    def __get_pydantic_json_schema__(cls, core_schema, handler):
-        return {"type": "string"}
+def validate_object_id(v) -> ObjectId:
+    if isinstance(v, ObjectId):
+        return v
+    if not ObjectId.is_valid(v):
+        raise ValueError("Invalid objectid")
+    return ObjectId(v)
+
+
+# ObjectId MongoDB : accepte un ObjectId ou sa forme texte, sérialisé en str en JSON
+PyObjectId = Annotated[
+    ObjectId,
+    PlainValidator(validate_object_id),
+    PlainSerializer(str, return_type=str, when_used="json"),
+    WithJsonSchema({"type": "string"}),
+]
+
+MONGO_MODEL_CONFIG = ConfigDict(validate_by_name=True, arbitrary_types_allowed=True)
+
 
 class SensorData(BaseModel):
-    id: PyObjectId = Field(default_factory=PyObjectId, alias="_id")
+    model_config = MONGO_MODEL_CONFIG
+
+    id: PyObjectId = Field(default_factory=ObjectId, alias="_id")
     zone_id: str = "zone-1"
     humidity: float
     temperature: float
@@ -32,27 +40,39 @@ class SensorData(BaseModel):
     wind_speed: Optional[float] = None
     rainfall: bool = False
     rainfall_intensity: str = "none"
+    flow_rate: Optional[float] = None
+    anomalies: List[str] = []  # Anomalies détectées à l'ingestion
     created_at: datetime = Field(default_factory=datetime.utcnow)
 
-    class Config:
-        validate_by_name = True
-        arbitrary_types_allowed = True
-        json_encoders = {ObjectId: str}
-
 class ValveState(BaseModel):
-    id: PyObjectId = Field(default_factory=PyObjectId, alias="_id")
+    model_config = MONGO_MODEL_CONFIG
+
+    id: PyObjectId = Field(default_factory=ObjectId, alias="_id")
     zone_id: str
     is_open: bool = False
     updated_at: datetime = Field(default_factory=datetime.utcnow)
 
-    class Config:
-        validate_by_name = True
-        arbitrary_types_allowed = True
-        json_encoders = {ObjectId: str}
+
+def apply_reading_defaults(doc: dict) -> dict:
+    """
+    Valeurs par défaut des profondeurs, de la lumière et du vent quand le
+    capteur ne les envoie pas (dérivées de soil_moisture).
+    """
+    soil_moisture = doc["soil_moisture"]
+    doc["soil_moisture_10cm"] = doc.get("soil_moisture_10cm") or soil_moisture * 0.9
+    doc["soil_moisture_30cm"] = doc.get("soil_moisture_30cm") or soil_moisture
+    doc["soil_moisture_60cm"] = doc.get("soil_moisture_60cm") or soil_moisture * 1.1
+    doc["light"] = doc.get("light") or 450.0
+    doc["wind_speed"] = doc.get("wind_speed") or 8.0
+    return doc
+
 
 # ---------- Pydantic Models for API ----------
 
 class SensorDataCreate(BaseModel):
+    # NaN / Infinity (ou 1e400) refusés : ils casseraient l'ET, la compression et les agrégats
+    model_config = ConfigDict(allow_inf_nan=False)
+
     zone_id: str = "zone-1"
     humidity: float
     temperature: float
@@ -64,7 +84,32 @@ class SensorDataCreate(BaseModel):
     wind_speed: Optional[float] = None
     rainfall: bool = False
     rainfall_intensity: Literal['light', 'moderate', 'heavy', 'none'] = 'none'
+    flow_rate: Optional[float] = None  # Débit mesuré (L/min) si la zone a un débitmètre
     pump_was_active: bool = False  # État précédent de la pompe
+    # Renvois des passerelles : numéro de séquence du capteur ou clé d'idempotence (unique par zone)
+    seq: Optional[int] = Field(default=None, ge=0)
+    idempotency_key: Optional[str] = Field(default=None, min_length=1, max_length=128)
+
+    @property
+    def dedup_key(self) -> Optional[str]:
+        if self.idempotency_key is not None:
+            return f"key:{self.idempotency_key}"
+        if self.seq is not None:
+            return f"seq:{self.seq}"
+        return None
+
+    def to_document(self) -> dict:
+        """
+        Document `sensor_data` construit directement depuis la requête validée
+        (même forme que SensorData ; `_id` est ajouté par le driver à l'insertion).
+        """
+        doc = self.model_dump(exclude={"pump_was_active", "seq", "idempotency_key"})
+        apply_reading_defaults(doc)
+        doc["anomalies"] = []
+        doc["created_at"] = datetime.utcnow()
+        if self.dedup_key is not None:
+            doc["dedup_key"] = self.dedup_key
+        return doc
 
 class SensorDataResponse(BaseModel):
     id: str
@@ -89,6 +134,9 @@ class IrrigationDecision(BaseModel):
     animation_type: str  # Type d'animation (e.g., "watering", "stopped")
     sound_message: str  # Message vocal à jouer
     sound_url: Optional[str] = None  # URL du fichier audio si disponible
+    anomalies: List[str] = []  # Anomalies capteur détectées sur la lecture
+    duplicate: bool = False  # Lecture déjà reçue : décision d'origine, rien n'est réécrit
+    etc_mm_h: Optional[float] = None  # Évapotranspiration de la culture (FAO-56) au moment de la lecture
 
 class ValveToggleRequest(BaseModel):
     zone_id: str
@@ -102,3 +150,147 @@ class ValveToggleResponse(BaseModel):
     animation_type: str  # Type d'animation
     sound_message: str  # Message vocal
     sound_url: Optional[str] = None  # URL audio
+
+class ValveBulkToggleRequest(BaseModel):
+    # Paires zone/état explicites...
+    commands: List[ValveToggleRequest] = []
+    # ... ou un sélecteur de zones avec un état commun
+    zone_ids: List[str] = []
+    # ... ou des groupes du registre des zones (ex: "serre-nord", "crop:tomates")
+    groups: List[str] = []
+    valve_open: Optional[bool] = None
+
+    @model_validator(mode="after")
+    def check_selector(self):
+        if (self.zone_ids or self.groups) and self.valve_open is None:
+            raise ValueError("valve_open est requis avec zone_ids ou groups")
+        if not self.commands and not self.zone_ids and not self.groups:
+            raise ValueError("Aucune zone à commander")
+        return self
+
+class ValveBulkResult(BaseModel):
+    zone_id: str
+    valve_open: bool
+    success: bool
+    message: str
+
+class ValveBulkToggleResponse(BaseModel):
+    requested: int
+    succeeded: int
+    results: List[ValveBulkResult]
+
+class ZoneConfig(BaseModel):
+    """Configuration d'une zone dans le registre (collection `zones`)."""
+    name: Optional[str] = None
+    crop: Optional[str] = None
+    # Saison propre à la zone, sinon IRRIGATION_SEASON
+    season: Optional[Literal["printemps", "ete", "automne", "hiver"]] = None
+    flow_rate_lpm: Optional[float] = Field(default=None, gt=0)
+    sensor_ids: List[str] = []
+    groups: List[str] = []
+
+    @model_validator(mode="after")
+    def check_crop(self):
+        if self.crop is not None and self.crop not in CONFIG_CULTURES:
+            raise ValueError(f"Culture inconnue: {self.crop} (attendu: {', '.join(CONFIG_CULTURES)})")
+        return self
+
+# Champs utilisables dans une règle d'alerte : la lecture, plus la décision (`pump`) et l'ETc
+RULE_NUMERIC_FIELDS = {
+    "humidity", "temperature", "soil_moisture", "soil_moisture_10cm", "soil_moisture_30cm",
+    "soil_moisture_60cm", "light", "wind_speed", "flow_rate", "etc_mm_h",
+}
+RULE_BOOLEAN_FIELDS = {"rainfall", "pump"}
+RULE_TEXT_FIELDS = {"rainfall_intensity"}
+
+class AlertCondition(BaseModel):
+    field: str
+    op: Literal["<", "<=", ">", ">=", "==", "!="]
+    value: Union[bool, float, str]
+
+    @model_validator(mode="after")
+    def check_field(self):
+        if self.field in RULE_NUMERIC_FIELDS:
+            if isinstance(self.value, (bool, str)):
+                raise ValueError(f"{self.field} attend une valeur numérique")
+        elif self.field in RULE_BOOLEAN_FIELDS | RULE_TEXT_FIELDS:
+            if self.op not in ("==", "!="):
+                raise ValueError(f"{self.field} n'accepte que == et !=")
+            expected = bool if self.field in RULE_BOOLEAN_FIELDS else str
+            if not isinstance(self.value, expected):
+                raise ValueError(f"{self.field} attend une valeur de type {expected.__name__}")
+        else:
+            fields = sorted(RULE_NUMERIC_FIELDS | RULE_BOOLEAN_FIELDS | RULE_TEXT_FIELDS)
+            raise ValueError(f"Champ inconnu: {self.field} (attendu: {', '.join(fields)})")
+        return self
+
+class AlertRule(BaseModel):
+    """Règle d'alerte (collection `alert_rules`) : toutes les conditions doivent être vraies."""
+    name: str
+    # La première condition sert à l'index : y mettre la plus sélective
+    conditions: List[AlertCondition] = Field(min_length=1)
+    # Portée : zones et groupes (ex. `crop:tomates`) ; les deux vides = toutes les zones
+    zone_ids: List[str] = []
+    groups: List[str] = []
+    # Durée pendant laquelle la règle doit rester vraie avant l'alerte
+    duration_seconds: float = Field(default=0, ge=0)
+    severity: Literal["info", "warning", "critical"] = "warning"
+    enabled: bool = True
+
+class CalibrationCurve(BaseModel):
+    """Courbe d'étalonnage d'une sonde (collection `calibrations`), par zone et profondeur."""
+    kind: Literal["piecewise", "polynomial"]
+    points: List[Tuple[float, float]] = []  # (brut, étalonné), linéaire par morceaux
+    coefficients: List[float] = []  # c0 + c1·x + c2·x² …
+    offset: float = 0.0  # Décalage propre au type de sol, ajouté après la courbe
+    temperature_coefficient: float = 0.0  # Compensation (points de brut par °C au-dessus de la référence)
+    reference_temperature: float = 25.0
+    valid_from: Optional[datetime] = None  # Lectures recalculées à partir de cette date (UTC), toutes sinon
+
+    @model_validator(mode="after")
+    def check_curve(self):
+        if self.kind == "piecewise":
+            xs = [x for x, _ in self.points]
+            if len(xs) < 2 or len(set(xs)) != len(xs):
+                raise ValueError("Une courbe par morceaux demande au moins 2 points de valeurs brutes distinctes")
+        elif not self.coefficients:
+            raise ValueError("Une courbe polynomiale demande `coefficients`")
+        if self.valid_from is not None and self.valid_from.tzinfo is not None:
+            self.valid_from = self.valid_from.astimezone(timezone.utc).replace(tzinfo=None)
+        return self
+
+class IrrigationSchedule(BaseModel):
+    """Arrosage programmé d'une zone (collection `schedules`)."""
+    zone_id: str
+    name: Optional[str] = None
+    # `window` : fenêtre récurrente (heures locales SCHEDULER_TIMEZONE) ; `once` : arrosage unique à `at`
+    kind: Literal["window", "once"]
+    start: Optional[str] = Field(default=None, pattern=r"^([01]\d|2[0-3]):[0-5]\d$")
+    end: Optional[str] = Field(default=None, pattern=r"^([01]\d|2[0-3]):[0-5]\d$")
+    days: List[Annotated[int, Field(ge=0, le=6)]] = []  # 0 = lundi ; vide = tous les jours
+    at: Optional[datetime] = None  # UTC
+    duration_minutes: float = Field(gt=0, le=1440)
+    # Conditions météo vérifiées sur la dernière lecture de la zone (cf. CONFIG_CAPTEURS du simulateur)
+    max_wind_speed: Optional[float] = None
+    min_temperature: Optional[float] = None
+    max_temperature: Optional[float] = None
+    min_light: Optional[float] = None
+    skip_if_raining: bool = True
+    # Hors de ses fenêtres (ou météo défavorable), l'irrigation automatique de la zone est bloquée
+    restrict_decisions: bool = False
+    enabled: bool = True
+
+    @model_validator(mode="after")
+    def check_kind(self):
+        if self.kind == "window" and (self.start is None or self.end is None):
+            raise ValueError("Une fenêtre demande `start` et `end` (HH:MM)")
+        if self.kind == "once" and self.at is None:
+            raise ValueError("Un arrosage unique demande `at`")
+        if self.kind == "once" and self.restrict_decisions:
+            raise ValueError("`restrict_decisions` ne s'applique qu'aux fenêtres")
+        return self
+
+class ProfilingSettings(BaseModel):
+    """Échantillonnage des requêtes profilées (/debug/profiling)."""
+    sample_rate: float = Field(ge=0, le=1)
+    paths: Optional[List[str]] = None
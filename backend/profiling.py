@@ -0,0 +1,352 @@
+"""
+Profilage à la demande des requêtes et du processus.
+
+- Chronomètres par phase (`with phase("db"):`) : sans requête profilée en
+  cours, `phase()` renvoie un gestionnaire de contexte vide partagé.
+- Requêtes profilées : en-tête `X-Profile: 1` ou échantillonnage d'une
+  fraction des requêtes (PROFILE_SAMPLE_RATE, modifiable à chaud via
+  /debug/profiling). Les phases sont renvoyées dans l'en-tête
+  `Server-Timing` et la pile est échantillonnée par pyinstrument s'il est
+  installé, sinon par un échantillonneur intégré (sys._current_frames).
+- Profil du processus entier pendant N secondes (/debug/profile).
+
+Les profils sont écrits dans PROFILE_DIR au format speedscope
+(https://www.speedscope.app) et, pour l'échantillonneur intégré, au format
+« collapsed » de flamegraph.pl, hors de la boucle d'événements ; seuls les
+PROFILE_MAX_FILES fichiers les plus récents sont gardés.
+
+Sans DEBUG_TOKEN, les routes /debug/* et l'en-tête X-Profile sont
+désactivés ; seul l'échantillonnage configuré au démarrage reste possible.
+"""
+import asyncio
+import contextvars
+import hmac
+import json
+import os
+import random
+import sys
+import threading
+import time
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+try:
+    from pyinstrument import Profiler as PyinstrumentProfiler
+    from pyinstrument.renderers import SpeedscopeRenderer
+except ImportError:  # Dépendance optionnelle
+    PyinstrumentProfiler = None
+
+PROFILE_DIR = os.getenv("PROFILE_DIR", "profiles")
+PROFILE_SAMPLE_RATE = float(os.getenv("PROFILE_SAMPLE_RATE", "0"))
+PROFILE_INTERVAL_MS = float(os.getenv("PROFILE_INTERVAL_MS", "2"))
+# Nombre de fichiers de profil gardés dans PROFILE_DIR (les plus anciens sont supprimés)
+PROFILE_MAX_FILES = int(os.getenv("PROFILE_MAX_FILES", "200"))
+PROFILE_SUFFIXES = (".speedscope.json", ".folded")
+# Requis dans l'en-tête X-Debug-Token pour /debug/* et X-Profile (désactivés s'il n'est pas défini)
+DEBUG_TOKEN = os.getenv("DEBUG_TOKEN")
+
+Frame = Tuple[str, str, int]
+
+
+class _NoPhase:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+NO_PHASE = _NoPhase()
+
+
+class RequestProfile:
+    """Durées cumulées par phase d'une requête profilée."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.started = time.perf_counter()
+        self.last_mark = self.started
+        self.phases: Dict[str, float] = {}
+
+    def add(self, name: str, started: float, ended: float) -> None:
+        self.phases[name] = self.phases.get(name, 0.0) + (ended - started)
+        self.last_mark = ended
+
+    def mark(self, name: str) -> None:
+        """Attribue à `name` le temps écoulé depuis la dernière phase."""
+        now = time.perf_counter()
+        self.add(name, self.last_mark, now)
+
+    def server_timing(self) -> str:
+        total = (time.perf_counter() - self.started) * 1000
+        parts = [f"{name};dur={seconds * 1000:.3f}" for name, seconds in self.phases.items()]
+        return ", ".join(parts + [f"total;dur={total:.3f}"])
+
+
+class _Phase:
+    __slots__ = ("profile", "name", "started")
+
+    def __init__(self, profile: RequestProfile, name: str):
+        self.profile = profile
+        self.name = name
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.profile.add(self.name, self.started, time.perf_counter())
+        return False
+
+
+current_profile: contextvars.ContextVar[Optional[RequestProfile]] = contextvars.ContextVar(
+    "current_profile", default=None
+)
+
+
+def phase(name: str):
+    """Chronomètre une phase de la requête en cours si elle est profilée."""
+    profile = current_profile.get()
+    if profile is None:
+        return NO_PHASE
+    return _Phase(profile, name)
+
+
+def mark(name: str) -> None:
+    """Clôt la phase `name` au moment présent (ex: validation à l'entrée du handler)."""
+    profile = current_profile.get()
+    if profile is not None:
+        profile.mark(name)
+
+
+class StackSampler:
+    """Échantillonne les piles des threads à intervalle fixe depuis un thread dédié."""
+
+    def __init__(self, interval_ms: float = PROFILE_INTERVAL_MS, thread_ids: Optional[List[int]] = None):
+        self.interval = interval_ms / 1000
+        self.thread_ids = thread_ids
+        self.samples: Dict[int, List[Tuple[Frame, ...]]] = {}
+        self.started = 0.0
+        self.duration = 0.0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="stack-sampler", daemon=True)
+
+    def start(self) -> "StackSampler":
+        self.started = time.perf_counter()
+        self._thread.start()
+        return self
+
+    def stop(self) -> "StackSampler":
+        self._stop.set()
+        self._thread.join()
+        self.duration = time.perf_counter() - self.started
+        return self
+
+    def _run(self) -> None:
+        own = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own or (self.thread_ids is not None and thread_id not in self.thread_ids):
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append((code.co_name, code.co_filename, code.co_firstlineno))
+                    frame = frame.f_back
+                self.samples.setdefault(thread_id, []).append(tuple(reversed(stack)))
+
+    def thread_names(self) -> Dict[int, str]:
+        names = {thread.ident: thread.name for thread in threading.enumerate()}
+        return {thread_id: names.get(thread_id, f"thread-{thread_id}") for thread_id in self.samples}
+
+    def to_speedscope(self, name: str) -> dict:
+        frames: List[Frame] = []
+        index: Dict[Frame, int] = {}
+        profiles = []
+        interval_ms = self.interval * 1000
+        for thread_id, thread_name in self.thread_names().items():
+            samples = []
+            for stack in self.samples[thread_id]:
+                sample = []
+                for frame in stack:
+                    if frame not in index:
+                        index[frame] = len(frames)
+                        frames.append(frame)
+                    sample.append(index[frame])
+                samples.append(sample)
+            profiles.append({
+                "type": "sampled",
+                "name": thread_name,
+                "unit": "milliseconds",
+                "startValue": 0,
+                "endValue": len(samples) * interval_ms,
+                "samples": samples,
+                "weights": [interval_ms] * len(samples),
+            })
+        return {
+            "$schema": "https://www.speedscope.app/file-format-schema.json",
+            "name": name,
+            "exporter": "irrigation-backend",
+            "shared": {"frames": [{"name": n, "file": f, "line": line} for n, f, line in frames]},
+            "profiles": profiles,
+        }
+
+    def to_collapsed(self) -> str:
+        """Une ligne `thread;f1;f2;... nombre` par pile distincte (flamegraph.pl)."""
+        counts: Dict[str, int] = {}
+        for thread_id, thread_name in self.thread_names().items():
+            for stack in self.samples[thread_id]:
+                key = ";".join([thread_name] + [f"{n} ({os.path.basename(f)}:{line})" for n, f, line in stack])
+                counts[key] = counts.get(key, 0) + 1
+        return "\n".join(f"{stack} {count}" for stack, count in sorted(counts.items())) + "\n"
+
+
+def prune_profiles(keep: int = PROFILE_MAX_FILES) -> int:
+    """Supprime les fichiers de profil les plus anciens au-delà de `keep` ; retourne le nombre supprimé."""
+    entries = [entry for entry in os.scandir(PROFILE_DIR) if entry.is_file() and entry.name.endswith(PROFILE_SUFFIXES)]
+    if len(entries) <= keep:
+        return 0
+    entries.sort(key=lambda entry: entry.stat().st_mtime)
+    removed = 0
+    for entry in entries[:len(entries) - keep]:
+        try:
+            os.unlink(entry.path)
+            removed += 1
+        except FileNotFoundError:
+            pass
+    return removed
+
+
+def write_profile(name: str, speedscope: Optional[str], collapsed: Optional[str] = None) -> List[str]:
+    """Écrit les fichiers d'un profil (appel bloquant : à lancer hors de la boucle d'événements)."""
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    written = []
+    for content, suffix in zip((speedscope, collapsed), PROFILE_SUFFIXES):
+        if content is None:
+            continue
+        filename = name + suffix
+        with open(os.path.join(PROFILE_DIR, filename), "w", encoding="utf-8") as handle:
+            handle.write(content)
+        written.append(filename)
+    prune_profiles()
+    return written
+
+
+class RequestProfiler:
+    def __init__(self):
+        self.sample_rate = PROFILE_SAMPLE_RATE
+        self.paths = ["/send-data"]
+        self.use_pyinstrument = PyinstrumentProfiler is not None
+        self.active = False
+        self.profiled = 0
+        self.recent: List[dict] = []
+
+    def settings(self) -> dict:
+        return {
+            "sample_rate": self.sample_rate,
+            "paths": self.paths,
+            "sampler": "pyinstrument" if self.use_pyinstrument else "builtin",
+            "interval_ms": PROFILE_INTERVAL_MS,
+            "profile_dir": os.path.abspath(PROFILE_DIR),
+            "profiled": self.profiled,
+            "recent": self.recent,
+        }
+
+    def should_profile(self, path: str, headers: Dict[bytes, bytes]) -> bool:
+        # Une seule requête profilée à la fois : les piles seraient mélangées
+        if self.active:
+            return False
+        if headers.get(b"x-profile") == b"1":
+            return authorized(headers.get(b"x-debug-token"))
+        return self.sample_rate > 0 and path in self.paths and random.random() < self.sample_rate
+
+    def start_sampler(self):
+        if self.use_pyinstrument:
+            sampler = PyinstrumentProfiler(interval=PROFILE_INTERVAL_MS / 1000, async_mode="enabled")
+            sampler.start()
+            return sampler
+        return StackSampler(thread_ids=[threading.get_ident()]).start()
+
+    def render(self, sampler, name: str) -> List[str]:
+        if self.use_pyinstrument:
+            return write_profile(name, sampler.output(renderer=SpeedscopeRenderer()))
+        return write_profile(name, json.dumps(sampler.to_speedscope(name)), sampler.to_collapsed())
+
+    async def finish(self, sampler, profile: RequestProfile) -> List[str]:
+        stamp = datetime.utcnow().strftime("%Y%m%dT%H%M%S.%f")
+        name = f"{stamp}-{profile.path.strip('/').replace('/', '_') or 'root'}"
+        sampler.stop()
+        # Rendu et écriture dans un thread : la boucle continue de servir les autres requêtes
+        loop = asyncio.get_running_loop()
+        files = await loop.run_in_executor(None, self.render, sampler, name)
+        self.profiled += 1
+        self.recent = ([{"path": profile.path, "files": files, "phases_ms": {
+            phase_name: round(seconds * 1000, 3) for phase_name, seconds in profile.phases.items()
+        }}] + self.recent)[:20]
+        return files
+
+
+def authorized(token: Optional[bytes]) -> bool:
+    """Jeton X-Debug-Token valide ; toujours False si DEBUG_TOKEN n'est pas défini."""
+    if DEBUG_TOKEN is None or token is None:
+        return False
+    return hmac.compare_digest(token, DEBUG_TOKEN.encode("latin-1"))
+
+
+async def profile_process(seconds: float, interval_ms: float = PROFILE_INTERVAL_MS) -> Tuple[StackSampler, str, List[str]]:
+    """Échantillonne tous les threads du processus pendant `seconds` secondes."""
+    sampler = StackSampler(interval_ms=interval_ms).start()
+    await asyncio.sleep(seconds)
+    loop = asyncio.get_running_loop()
+    await loop.run_in_executor(None, sampler.stop)
+    name = f"{datetime.utcnow().strftime('%Y%m%dT%H%M%S')}-process-{seconds:g}s"
+    files = await loop.run_in_executor(
+        None, lambda: write_profile(name, json.dumps(sampler.to_speedscope(name)), sampler.to_collapsed())
+    )
+    return sampler, name, files
+
+
+class ProfilingMiddleware:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        headers = dict(scope.get("headers") or [])
+        if not profiler.should_profile(scope["path"], headers):
+            await self.app(scope, receive, send)
+            return
+
+        profiler.active = True
+        profile = RequestProfile(scope["path"])
+        token = current_profile.set(profile)
+        sampler = profiler.start_sampler()
+        finished = False
+
+        async def send_wrapper(message):
+            nonlocal finished
+            if message["type"] == "http.response.start" and not finished:
+                finished = True
+                # Sérialisation de la réponse après la dernière phase du handler
+                profile.mark("encoding")
+                files = await profiler.finish(sampler, profile)
+                response_headers = list(message.get("headers", []))
+                response_headers.append((b"server-timing", profile.server_timing().encode()))
+                response_headers.append((b"x-profile-file", ", ".join(files).encode()))
+                message = {**message, "headers": response_headers}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            if not finished:
+                sampler.stop()
+            current_profile.reset(token)
+            profiler.active = False
+
+
+profiler = RequestProfiler()
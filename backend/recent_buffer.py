@@ -0,0 +1,356 @@
+"""
+Historique récent compressé en mémoire, par zone.
+
+Chaque worker garde les dernières lectures stockées de chaque zone dans un
+tampon circulaire par blocs :
+
+- le bloc courant garde des listes simples (ajout en O(1)) ;
+- un bloc plein est compressé : horodatages (ms) en delta-of-delta,
+  chaque mesure en entiers décimaux (au plus petit nombre de décimales qui
+  restitue exactement toutes les valeurs du bloc, sinon flottants 64 bits
+  bruts) encodés en delta, puis zigzag + varint dans un `bytearray` ;
+  identifiants dans un tableau d'octets, pluie et intensité dans des
+  tableaux `array('B')` ;
+- les autres champs du document (débit, valeurs brutes d'étalonnage,
+  décision, clé de renvoi) sont gardés tels quels pour les seules lignes
+  où ils diffèrent de la forme courante (débit absent) ;
+- les blocs les plus anciens sont évincés au-delà de RECENT_BUFFER_SIZE
+  lectures, ce qui borne la mémoire par zone.
+
+`/history` est servi depuis ce tampon quand la fenêtre demandée y tient
+entièrement, sinon depuis MongoDB : les documents restitués sont ceux de
+MongoDB, à pleine précision.
+"""
+import bisect
+import functools
+import os
+from array import array
+from datetime import datetime, timedelta
+from typing import Callable, Dict, List, Optional, Tuple
+
+from bson import ObjectId
+from motor.motor_asyncio import AsyncIOMotorDatabase
+
+from history_format import DEPTH_RATIOS
+
+# Lectures gardées par zone (0 désactive le tampon) ; 1440 ≈ 2 h à 5 s
+RECENT_BUFFER_SIZE = int(os.getenv("RECENT_BUFFER_SIZE", "1440"))
+BLOCK_SIZE = 128
+# Blocs décompressés gardés en cache (toutes zones confondues)
+DECODED_BLOCK_CACHE = int(os.getenv("RECENT_BUFFER_DECODED_BLOCKS", "64"))
+
+# Mesures stockées en colonnes compressées
+FIELDS = (
+    "soil_moisture", "soil_moisture_10cm", "soil_moisture_30cm", "soil_moisture_60cm",
+    "temperature", "humidity", "light", "wind_speed",
+)
+FIELD_DEFAULTS = {"light": 450.0, "wind_speed": 8.0}
+# Décimales essayées avant de garder une colonne en flottants bruts
+MAX_DECIMALS = 6
+# Entiers mis à l'échelle représentables par l'encodage zigzag 64 bits
+MAX_SCALED = 2 ** 62
+INTENSITIES = ("none", "light", "moderate", "heavy")
+# Champs encodés à part ; les autres sont gardés ligne par ligne s'ils diffèrent de USUAL_EXTRAS
+BASE_KEYS = frozenset(FIELDS + ("_id", "zone_id", "created_at", "rainfall", "rainfall_intensity", "anomalies"))
+USUAL_EXTRAS = {"flow_rate": None}
+
+EPOCH = datetime(1970, 1, 1)
+MILLISECOND = timedelta(milliseconds=1)
+
+
+def encode_deltas(values: List[int]) -> bytearray:
+    """Entiers → deltas zigzag encodés en varint."""
+    out = bytearray()
+    previous = 0
+    for value in values:
+        delta = value - previous
+        previous = value
+        zigzag = (delta << 1) ^ (delta >> 63)
+        while zigzag >= 0x80:
+            out.append((zigzag & 0x7F) | 0x80)
+            zigzag >>= 7
+        out.append(zigzag)
+    return out
+
+
+def decode_deltas(data: bytes, count: int) -> List[int]:
+    values = []
+    append = values.append
+    previous = 0
+    position = 0
+    for _ in range(count):
+        zigzag = 0
+        shift = 0
+        while True:
+            byte = data[position]
+            position += 1
+            zigzag |= (byte & 0x7F) << shift
+            if byte < 0x80:
+                break
+            shift += 7
+        previous += (zigzag >> 1) ^ -(zigzag & 1)
+        append(previous)
+    return values
+
+
+def encode_column(column: List[float]) -> Tuple[Optional[int], bytes]:
+    """
+    (décimales, entiers en delta) qui restituent exactement chaque valeur de
+    la colonne ; (None, flottants 64 bits) si aucune échelle ne convient.
+    """
+    for decimals in range(MAX_DECIMALS + 1):
+        scale = 10 ** decimals
+        try:
+            scaled = [round(v * scale) for v in column]
+        except (OverflowError, ValueError):
+            break
+        # Même division qu'au décodage : égalité exacte, pas d'arrondi
+        if all(abs(n) < MAX_SCALED and n / scale == v for n, v in zip(scaled, column)):
+            return decimals, bytes(encode_deltas(scaled))
+    return None, array("d", column).tobytes()
+
+
+def decode_column(decimals: Optional[int], data: bytes, count: int) -> List[float]:
+    if decimals is None:
+        return array("d", data).tolist()
+    scale = 10 ** decimals
+    return [n / scale for n in decode_deltas(data, count)]
+
+
+def reading_values(record: dict) -> List[float]:
+    """Mesures d'un document sensor_data, avec les mêmes défauts que format_reading."""
+    values = []
+    for field in FIELDS:
+        value = record.get(field)
+        if value is None:
+            if field in DEPTH_RATIOS:
+                value = record["soil_moisture"] * DEPTH_RATIOS[field]
+            else:
+                value = FIELD_DEFAULTS[field]
+        values.append(value)
+    return values
+
+
+class CompressedBlock:
+    """Bloc de BLOCK_SIZE lectures figé et compressé."""
+    __slots__ = ("count", "first_ms", "last_ms", "timestamps", "decimals", "columns", "ids", "rainfall", "intensity",
+                 "anomalies", "extras")
+
+    def __init__(self, block: "OpenBlock"):
+        self.count = len(block.timestamps)
+        self.first_ms = block.timestamps[0]
+        self.last_ms = block.timestamps[-1]
+        # Deltas des deltas : quasi constants à échantillonnage régulier → 1 octet
+        deltas = [b - a for a, b in zip([0] + block.timestamps, block.timestamps)]
+        self.timestamps = bytes(encode_deltas(deltas))
+        self.decimals, self.columns = zip(*(encode_column(column) for column in block.columns))
+        self.ids = bytes(block.ids)
+        self.rainfall = block.rainfall
+        self.intensity = block.intensity
+        self.anomalies = block.anomalies
+        self.extras = block.extras
+
+    def decode_timestamps(self) -> List[int]:
+        return decoded_columns(self)[0]
+
+    def decode(self, zone_id: str, start: int = 0) -> List[dict]:
+        """Documents du bloc à partir de la ligne `start`, du plus ancien au plus récent."""
+        timestamps, columns = decoded_columns(self)
+        return [
+            build_record(zone_id, self.ids[12 * i:12 * i + 12], timestamps[i],
+                         [column[i] for column in columns], self.rainfall[i], self.intensity[i],
+                         self.anomalies.get(i), self.extras.get(i))
+            for i in range(start, self.count)
+        ]
+
+    def nbytes(self) -> int:
+        return (len(self.timestamps) + sum(len(c) for c in self.columns) + len(self.ids)
+                + len(self.rainfall) + len(self.intensity))
+
+
+@functools.lru_cache(maxsize=DECODED_BLOCK_CACHE)
+def decoded_columns(block: CompressedBlock) -> Tuple[List[int], List[List[float]]]:
+    """
+    Colonnes décodées d'un bloc. Les blocs étant immuables, les derniers
+    décodés sont gardés : les requêtes successives d'un tableau de bord
+    relisent le plus souvent les mêmes blocs récents.
+    """
+    timestamps = []
+    current = 0
+    for delta in decode_deltas(block.timestamps, block.count):
+        current += delta
+        timestamps.append(current)
+    return timestamps, [
+        decode_column(decimals, data, block.count) for decimals, data in zip(block.decimals, block.columns)
+    ]
+
+
+class OpenBlock:
+    """Bloc en cours de remplissage, non compressé."""
+    __slots__ = ("timestamps", "columns", "ids", "rainfall", "intensity", "anomalies", "extras")
+
+    def __init__(self):
+        self.timestamps: List[int] = []
+        self.columns: List[List[float]] = [[] for _ in FIELDS]
+        self.ids = bytearray()
+        self.rainfall = array("B")
+        self.intensity = array("B")
+        self.anomalies: Dict[int, List[str]] = {}
+        self.extras: Dict[int, dict] = {}
+
+    def append(self, record: dict) -> None:
+        index = len(self.timestamps)
+        self.timestamps.append((record["created_at"] - EPOCH) // MILLISECOND)
+        for column, value in zip(self.columns, reading_values(record)):
+            column.append(value)
+        self.ids += record["_id"].binary
+        self.rainfall.append(bool(record.get("rainfall")))
+        self.intensity.append(INTENSITIES.index(record.get("rainfall_intensity") or "none"))
+        if record.get("anomalies"):
+            self.anomalies[index] = list(record["anomalies"])
+        extras = {key: value for key, value in record.items() if key not in BASE_KEYS}
+        if extras != USUAL_EXTRAS:
+            self.extras[index] = extras
+
+    def decode_timestamps(self) -> List[int]:
+        return self.timestamps
+
+    def decode(self, zone_id: str, start: int = 0) -> List[dict]:
+        return [
+            build_record(zone_id, self.ids[12 * i:12 * i + 12], self.timestamps[i],
+                         [column[i] for column in self.columns], self.rainfall[i], self.intensity[i],
+                         self.anomalies.get(i), self.extras.get(i))
+            for i in range(start, len(self.timestamps))
+        ]
+
+
+def build_record(zone_id, oid, ms, values, rainfall, intensity, anomalies, extras) -> dict:
+    record = dict(USUAL_EXTRAS if extras is None else extras)
+    record.update(zip(FIELDS, values))
+    record["_id"] = ObjectId(bytes(oid))
+    record["zone_id"] = zone_id
+    record["created_at"] = EPOCH + ms * MILLISECOND
+    record["rainfall"] = bool(rainfall)
+    record["rainfall_intensity"] = INTENSITIES[intensity]
+    record["anomalies"] = anomalies or []
+    return record
+
+
+class ZoneRingBuffer:
+    def __init__(self, zone_id: str, capacity: int, complete: bool):
+        self.zone_id = zone_id
+        self.max_blocks = max(1, -(-capacity // BLOCK_SIZE))
+        self.blocks: List[CompressedBlock] = []
+        self.current = OpenBlock()
+        # True tant que le tampon contient toutes les lectures stockées de la zone
+        self.complete = complete
+
+    def append(self, record: dict) -> None:
+        self.current.append(record)
+        if len(self.current.timestamps) >= BLOCK_SIZE:
+            self.blocks.append(CompressedBlock(self.current))
+            self.current = OpenBlock()
+            if len(self.blocks) >= self.max_blocks:
+                self.blocks.pop(0)
+                self.complete = False
+
+    def __len__(self) -> int:
+        return sum(block.count for block in self.blocks) + len(self.current.timestamps)
+
+    def query(self, limit: int, since: Optional[datetime] = None) -> Optional[List[dict]]:
+        """
+        Les `limit` dernières lectures (plus récentes en premier), postérieures
+        à `since` ; None si le tampon ne couvre pas toute la fenêtre.
+        """
+        since_ms = (since - EPOCH) // MILLISECOND if since is not None else None
+        records: List[dict] = []
+        for block in [self.current] + self.blocks[::-1]:
+            # Seules les lignes utiles du bloc sont reconstruites
+            timestamps = block.decode_timestamps()
+            start = max(0, len(timestamps) - (limit - len(records)))
+            reached_window_start = False
+            if since_ms is not None:
+                window_start = bisect.bisect_left(timestamps, since_ms)
+                if window_start > start:
+                    start = window_start
+                    reached_window_start = True
+            records.extend(reversed(block.decode(self.zone_id, start)))
+            if len(records) == limit or reached_window_start:
+                return records
+        return records if self.complete else None
+
+    def nbytes(self) -> int:
+        current = self.current
+        return (sum(block.nbytes() for block in self.blocks)
+                + len(current.timestamps) * 8 * (1 + len(FIELDS)) + len(current.ids) + 2 * len(current.rainfall))
+
+
+class RecentHistory:
+    def __init__(self, capacity: int = RECENT_BUFFER_SIZE):
+        self.capacity = capacity
+        self.zones: Dict[str, ZoneRingBuffer] = {}
+        self.warmed = False
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.capacity > 0
+
+    def append(self, record: dict) -> None:
+        """À appeler après l'insertion d'une lecture (le document porte son _id)."""
+        if not self.enabled:
+            return
+        buffer = self.zones.get(record["zone_id"])
+        if buffer is None:
+            # Zone inconnue au préchauffage : elle n'avait aucune lecture stockée
+            buffer = self.zones[record["zone_id"]] = ZoneRingBuffer(record["zone_id"], self.capacity, self.warmed)
+        buffer.append(record)
+
+    def query(self, zone_id: str, limit: int, since: Optional[datetime] = None) -> Optional[List[dict]]:
+        buffer = self.zones.get(zone_id) if self.enabled else None
+        if buffer is None:
+            records = [] if self.enabled and self.warmed else None
+        else:
+            records = buffer.query(limit, since)
+        if records is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return records
+
+    async def warm(self, db: AsyncIOMotorDatabase, owns: Callable[[str], bool] = lambda zone_id: True) -> None:
+        """Recharge les dernières lectures de chaque zone (possédée par ce worker) depuis MongoDB."""
+        if not self.enabled:
+            return
+        for zone_id in await db.sensor_data.distinct("zone_id"):
+            if not owns(zone_id):
+                continue
+            await self.reload_zone(db, zone_id)
+        self.warmed = True
+
+    async def reload_zone(self, db: AsyncIOMotorDatabase, zone_id: str) -> None:
+        """Recharge le tampon d'une zone depuis MongoDB (lectures réécrites, ex. recalcul d'étalonnage)."""
+        if not self.enabled:
+            return
+        cursor = db.sensor_data.find({"zone_id": zone_id}).sort("_id", -1).limit(self.capacity)
+        records = await cursor.to_list(length=self.capacity)
+        buffer = ZoneRingBuffer(zone_id, self.capacity, complete=len(records) < self.capacity)
+        for record in reversed(records):
+            buffer.append(record)
+        self.zones[zone_id] = buffer
+
+    def stats(self) -> dict:
+        return {
+            "enabled": self.enabled,
+            "capacity_per_zone": self.capacity,
+            "hits": self.hits,
+            "misses": self.misses,
+            "zones": {
+                zone_id: {"readings": len(buffer), "bytes": buffer.nbytes(), "complete": buffer.complete}
+                for zone_id, buffer in self.zones.items()
+            },
+        }
+
+
+recent_history = RecentHistory()
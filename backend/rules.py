@@ -0,0 +1,352 @@
+"""
+Moteur de règles d'alerte évalué à l'ingestion des lectures.
+
+Une règle est une conjonction de conditions `champ op valeur` sur la
+lecture (plus `pump`, la décision, et `etc_mm_h`), limitée à des zones ou à
+des groupes (`crop:tomates`…), et peut exiger que la règle reste vraie
+pendant `duration_seconds` ; ex. « soil_moisture_10cm < 20 pendant 15 min
+dans une zone de tomates » ou « pump == true et rainfall == true ».
+
+Index : chaque règle est rangée sous sa portée (`*`, `zone:<id>` ou un
+groupe) et le champ de sa première condition, dans des listes triées par
+seuil (`<`, `<=`, `>`, `>=`) ou un dictionnaire (`==`). Une lecture ne
+parcourt que les portées de sa zone et, par dichotomie, les règles dont la
+première condition est vraie : le coût dépend du nombre de règles qui
+correspondent, pas du nombre total de règles.
+
+Durées : un minuteur par (zone, règle) part de la première lecture qui
+vérifie la règle, sans relire l'historique. L'alerte est créée quand la
+durée est atteinte et résolue à la première lecture qui ne vérifie plus la
+règle ; tant qu'elle est active elle n'est pas répétée (index unique
+partiel sur (rule_id, zone_id) des alertes actives, partagé entre workers
+et redémarrages). Créations et résolutions sont poussées aux abonnés de
+/alerts/stream. Avec cluster.py, chaque worker relit aussi la collection
+`alerts` toutes les ALERT_STREAM_POLL_SECONDS secondes, tant qu'il a des
+abonnés, pour leur relayer les alertes des zones des autres workers.
+"""
+import asyncio
+import bisect
+import operator
+import os
+from collections import Counter
+from datetime import datetime, timedelta
+from typing import Callable, Dict, Iterator, List, Optional, Set, Tuple
+
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from pymongo.errors import DuplicateKeyError
+
+from zones import zone_groups, zone_registry
+
+ALERT_RULES_REFRESH_SECONDS = float(os.getenv("ALERT_RULES_REFRESH_SECONDS", "30"))
+# Événements en attente par abonné de /alerts/stream (les plus anciens sont perdus au-delà)
+ALERT_STREAM_QUEUE_SIZE = int(os.getenv("ALERT_STREAM_QUEUE_SIZE", "100"))
+# Cluster : intervalle de relecture des alertes des autres workers pour /alerts/stream
+ALERT_STREAM_POLL_SECONDS = float(os.getenv("ALERT_STREAM_POLL_SECONDS", "2"))
+# Fenêtre relue à chaque passage (alertes écrites après leur date), en nombre d'intervalles
+ALERT_STREAM_POLL_OVERLAP = 5
+
+ALL_ZONES = "*"
+OPERATORS = {
+    "<": operator.lt, "<=": operator.le, ">": operator.gt, ">=": operator.ge,
+    "==": operator.eq, "!=": operator.ne,
+}
+
+
+class FieldIndex:
+    """Règles dont la première condition porte sur un même champ, triées par seuil."""
+
+    def __init__(self):
+        self.thresholds: Dict[str, tuple] = {op: ([], []) for op in ("<", "<=", ">", ">=")}
+        self.equal: Dict[object, List[str]] = {}
+        self.not_equal: List[tuple] = []
+
+    def add(self, op: str, value, rule_id: str) -> None:
+        if op == "==":
+            self.equal.setdefault(value, []).append(rule_id)
+        elif op == "!=":
+            self.not_equal.append((value, rule_id))
+        else:
+            values, rule_ids = self.thresholds[op]
+            position = bisect.bisect(values, value)
+            values.insert(position, value)
+            rule_ids.insert(position, rule_id)
+
+    def matching(self, x) -> Iterator[str]:
+        """Règles dont la première condition est vraie pour la valeur `x`."""
+        if not isinstance(x, (bool, str)):
+            values, rule_ids = self.thresholds["<"]  # x < seuil
+            yield from rule_ids[bisect.bisect_right(values, x):]
+            values, rule_ids = self.thresholds["<="]
+            yield from rule_ids[bisect.bisect_left(values, x):]
+            values, rule_ids = self.thresholds[">"]  # x > seuil
+            yield from rule_ids[:bisect.bisect_left(values, x)]
+            values, rule_ids = self.thresholds[">="]
+            yield from rule_ids[:bisect.bisect_right(values, x)]
+        yield from self.equal.get(x, ())
+        for value, rule_id in self.not_equal:
+            if x != value:
+                yield rule_id
+
+    def __len__(self) -> int:
+        return (sum(len(rule_ids) for _, rule_ids in self.thresholds.values())
+                + sum(map(len, self.equal.values())) + len(self.not_equal))
+
+
+def rule_scopes(rule: dict) -> List[str]:
+    scopes = [f"zone:{zone_id}" for zone_id in rule.get("zone_ids") or []] + list(rule.get("groups") or [])
+    return scopes or [ALL_ZONES]
+
+
+def rule_holds(rule: dict, values: dict) -> bool:
+    for condition in rule["conditions"]:
+        x = values.get(condition["field"])
+        if x is None or not OPERATORS[condition["op"]](x, condition["value"]):
+            return False
+    return True
+
+
+def alert_view(alert: dict) -> dict:
+    """Alerte sérialisable en JSON (identifiant et dates en texte)."""
+    view = {key: value for key, value in alert.items() if key != "_id"}
+    view["id"] = str(alert["_id"])
+    for key in ("started_at", "fired_at", "resolved_at"):
+        if isinstance(view.get(key), datetime):
+            view[key] = view[key].isoformat()
+    return view
+
+
+class RuleEngine:
+    def __init__(self):
+        self.rules: Dict[str, dict] = {}
+        # portée → champ → règles
+        self.index: Dict[str, Dict[str, FieldIndex]] = {}
+        # zone → règle → début de la période où la règle est vraie
+        self.timers: Dict[str, Dict[str, datetime]] = {}
+        # zone → règle → alerte active
+        self.active: Dict[str, Dict[str, dict]] = {}
+        self.subscribers: Set[asyncio.Queue] = set()
+        self.counters = Counter()
+        self.owns: Callable[[str], bool] = lambda zone_id: True
+        self.shared = False  # Alertes d'autres workers relayées depuis MongoDB (cluster)
+        self._task: Optional[asyncio.Task] = None
+        self._tail_task: Optional[asyncio.Task] = None
+
+    def _rebuild(self) -> None:
+        index: Dict[str, Dict[str, FieldIndex]] = {}
+        for rule_id, rule in self.rules.items():
+            if not rule.get("enabled", True):
+                continue
+            first = rule["conditions"][0]
+            for scope in rule_scopes(rule):
+                field_index = index.setdefault(scope, {}).setdefault(first["field"], FieldIndex())
+                field_index.add(first["op"], first["value"], rule_id)
+        self.index = index
+
+    def matching_rules(self, zone_id: str, values: dict) -> Set[str]:
+        """Règles de la zone entièrement vérifiées par `values`."""
+        zone = zone_registry.get(zone_id)
+        scopes = [ALL_ZONES, f"zone:{zone_id}", *(zone_groups(zone) if zone else ())]
+        matched = set()
+        for scope in scopes:
+            fields = self.index.get(scope)
+            if not fields:
+                continue
+            for field, field_index in fields.items():
+                x = values.get(field)
+                if x is None:
+                    continue
+                for rule_id in field_index.matching(x):
+                    self.counters["candidates"] += 1
+                    if rule_id not in matched and rule_holds(self.rules[rule_id], values):
+                        matched.add(rule_id)
+        return matched
+
+    async def evaluate(self, db: AsyncIOMotorDatabase, zone_id: str, values: dict, at: datetime) -> None:
+        """Met à jour minuteurs et alertes de la zone après une lecture."""
+        self.counters["readings"] += 1
+        matched = self.matching_rules(zone_id, values)
+        timers = self.timers.get(zone_id)
+        active = self.active.get(zone_id)
+        if not matched and not timers and not active:
+            return
+
+        timers = self.timers.setdefault(zone_id, {})
+        active = self.active.setdefault(zone_id, {})
+        for rule_id in matched:
+            since = timers.setdefault(rule_id, at)
+            rule = self.rules[rule_id]
+            if rule_id not in active and (at - since).total_seconds() >= rule.get("duration_seconds", 0):
+                await self._fire(db, rule_id, rule, zone_id, values, since, at)
+        for rule_id in [rule_id for rule_id in timers if rule_id not in matched]:
+            del timers[rule_id]
+        for rule_id in [rule_id for rule_id in active if rule_id not in matched]:
+            await self._resolve(db, active.pop(rule_id), at)
+        if not timers:
+            del self.timers[zone_id]
+        if not active:
+            del self.active[zone_id]
+
+    async def _fire(self, db, rule_id: str, rule: dict, zone_id: str, values: dict, since: datetime, at: datetime):
+        alert = {
+            "rule_id": rule_id,
+            "rule_name": rule["name"],
+            "zone_id": zone_id,
+            "severity": rule.get("severity", "warning"),
+            "status": "active",
+            "started_at": since,
+            "fired_at": at,
+            "resolved_at": None,
+            "values": {c["field"]: values.get(c["field"]) for c in rule["conditions"]},
+        }
+        try:
+            await db.alerts.insert_one(alert)
+        except DuplicateKeyError:
+            # Déjà active (autre worker, ou état perdu au redémarrage) : pas de nouvelle alerte
+            self.counters["deduplicated"] += 1
+            alert = await db.alerts.find_one({"rule_id": rule_id, "zone_id": zone_id, "status": "active"})
+            if alert is not None:
+                self.active[zone_id][rule_id] = alert
+            return
+        self.active[zone_id][rule_id] = alert
+        self.counters["fired"] += 1
+        self.publish("fired", alert)
+
+    async def _resolve(self, db, alert: dict, at: datetime) -> None:
+        await db.alerts.update_one({"_id": alert["_id"]}, {"$set": {"status": "resolved", "resolved_at": at}})
+        alert.update(status="resolved", resolved_at=at)
+        self.counters["resolved"] += 1
+        self.publish("resolved", alert)
+
+    def publish(self, event: str, alert: dict) -> None:
+        message = (event, alert_view(alert))
+        for queue in self.subscribers:
+            if queue.full():
+                queue.get_nowait()
+                self.counters["stream_dropped"] += 1
+            queue.put_nowait(message)
+
+    def subscribe(self) -> asyncio.Queue:
+        queue = asyncio.Queue(maxsize=ALERT_STREAM_QUEUE_SIZE)
+        self.subscribers.add(queue)
+        return queue
+
+    def unsubscribe(self, queue: asyncio.Queue) -> None:
+        self.subscribers.discard(queue)
+
+    def active_alerts(self) -> List[dict]:
+        return [alert for alerts in self.active.values() for alert in alerts.values()]
+
+    async def stream_snapshot(self, db: AsyncIOMotorDatabase) -> List[dict]:
+        """Alertes actives à la connexion d'un abonné, y compris celles des autres workers."""
+        alerts = self.active_alerts()
+        if self.shared:
+            alerts += [alert async for alert in db.alerts.find({"status": "active"}) if not self.owns(alert["zone_id"])]
+        return alerts
+
+    async def _tail_loop(self, db: AsyncIOMotorDatabase) -> None:
+        """Relaie aux abonnés de ce worker les alertes créées ou résolues par les autres workers."""
+        overlap = timedelta(seconds=ALERT_STREAM_POLL_SECONDS * ALERT_STREAM_POLL_OVERLAP)
+        since = datetime.utcnow()
+        seen: Dict[Tuple[str, str], datetime] = {}  # (alerte, événement) déjà relayés dans la fenêtre
+        while True:
+            await asyncio.sleep(ALERT_STREAM_POLL_SECONDS)
+            now = datetime.utcnow()
+            if not self.subscribers:
+                since = now
+                seen.clear()
+                continue
+            window = since - overlap
+            query = {"$or": [{"fired_at": {"$gte": window}}, {"resolved_at": {"$gte": window}}]}
+            try:
+                async for alert in db.alerts.find(query).sort("fired_at", 1):
+                    if self.owns(alert["zone_id"]):
+                        continue
+                    for event, at in (("fired", alert["fired_at"]), ("resolved", alert.get("resolved_at"))):
+                        key = (str(alert["_id"]), event)
+                        if at is None or at < window or key in seen:
+                            continue
+                        seen[key] = at
+                        self.counters["stream_relayed"] += 1
+                        self.publish(event, alert)
+            except Exception as e:
+                print(f"Alertes: échec de la relecture pour /alerts/stream - {e}")
+                continue
+            since = now
+            seen = {key: at for key, at in seen.items() if at >= window}
+
+    async def upsert(self, db: AsyncIOMotorDatabase, rule_id: str, rule: dict) -> dict:
+        await db.alert_rules.replace_one({"rule_id": rule_id}, {"rule_id": rule_id, **rule}, upsert=True)
+        self.rules[rule_id] = {"rule_id": rule_id, **rule}
+        self._rebuild()
+        return self.rules[rule_id]
+
+    async def remove(self, db: AsyncIOMotorDatabase, rule_id: str) -> bool:
+        result = await db.alert_rules.delete_one({"rule_id": rule_id})
+        if self.rules.pop(rule_id, None) is not None:
+            self._rebuild()
+        return result.deleted_count > 0
+
+    async def load(self, db: AsyncIOMotorDatabase) -> None:
+        """Recharge les règles depuis `alert_rules` ; l'index n'est reconstruit que si elles ont changé."""
+        loaded = {rule["rule_id"]: rule async for rule in db.alert_rules.find({}, {"_id": 0})}
+        if loaded != self.rules:
+            self.rules = loaded
+            self._rebuild()
+
+    async def _refresh_loop(self, db: AsyncIOMotorDatabase) -> None:
+        while True:
+            await asyncio.sleep(ALERT_RULES_REFRESH_SECONDS)
+            try:
+                await self.load(db)
+            except Exception as e:
+                print(f"Règles d'alerte: échec du rechargement - {e}")
+
+    async def start(self, db: AsyncIOMotorDatabase, owns: Callable[[str], bool] = lambda zone_id: True,
+                    shared: bool = False) -> None:
+        self.owns = owns
+        self.shared = shared
+        await db.alert_rules.create_index("rule_id", unique=True)
+        await db.alerts.create_index(
+            [("rule_id", 1), ("zone_id", 1)],
+            unique=True,
+            partialFilterExpression={"status": "active"}
+        )
+        await db.alerts.create_index([("zone_id", 1), ("fired_at", -1)])
+        await self.load(db)
+        # Alertes encore actives des zones de ce worker : résolues à la prochaine lecture qui ne vérifie plus la règle
+        async for alert in db.alerts.find({"status": "active"}):
+            if owns(alert["zone_id"]):
+                self.active.setdefault(alert["zone_id"], {})[alert["rule_id"]] = alert
+        self._task = asyncio.create_task(self._refresh_loop(db))
+        if shared:
+            await db.alerts.create_index("fired_at")
+            await db.alerts.create_index("resolved_at", sparse=True)
+            self._tail_task = asyncio.create_task(self._tail_loop(db))
+
+    async def stop(self) -> None:
+        for task in (self._task, self._tail_task):
+            if task:
+                task.cancel()
+        self._task = self._tail_task = None
+
+    def stats(self) -> dict:
+        readings = self.counters["readings"]
+        return {
+            "rules": len(self.rules),
+            "enabled_rules": sum(1 for rule in self.rules.values() if rule.get("enabled", True)),
+            "indexed_entries": sum(len(fi) for fields in self.index.values() for fi in fields.values()),
+            "scopes": len(self.index),
+            "readings": readings,
+            "candidates_per_reading": round(self.counters["candidates"] / readings, 3) if readings else 0.0,
+            "fired": self.counters["fired"],
+            "resolved": self.counters["resolved"],
+            "deduplicated": self.counters["deduplicated"],
+            "active_alerts": sum(map(len, self.active.values())),
+            "pending_timers": sum(map(len, self.timers.values())),
+            "stream_subscribers": len(self.subscribers),
+            "stream_dropped": self.counters["stream_dropped"],
+            "stream_relayed": self.counters["stream_relayed"],
+        }
+
+
+rule_engine = RuleEngine()
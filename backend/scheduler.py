@@ -0,0 +1,436 @@
+"""
+Arrosages programmés : fenêtres récurrentes et arrosages uniques par zone.
+
+- Fenêtre (`window`) : chaque jour choisi, de `start` à `end` (heure locale
+  SCHEDULER_TIMEZONE), la vanne est ouverte `duration_minutes` si la météo
+  de la dernière lecture de la zone le permet (vent, température, lumière,
+  pluie) ; sinon la vérification est refaite toutes les
+  SCHEDULER_RETRY_SECONDS jusqu'à la fin de la fenêtre. Avec
+  `restrict_decisions`, l'irrigation automatique de la zone n'est permise
+  que dans ses fenêtres.
+- Arrosage unique (`once`) : ouverture à `at` pendant `duration_minutes`.
+
+Les échéances sont rangées dans une roue temporelle hiérarchique
+(SCHEDULER_WHEEL_LEVELS niveaux de 64 cases, case de SCHEDULER_TICK_SECONDS
+au premier niveau, ×64 à chaque niveau) : un tic ne traite que la case
+courante, plus la redistribution d'une case du niveau supérieur tous les 64
+tics ; son coût dépend des échéances, pas du nombre de zones. Une échéance
+annulée (programme modifié ou supprimé) est ignorée à son passage grâce au
+numéro de génération du programme.
+
+Les programmes et l'arrosage en cours (`running_until`) sont stockés dans
+la collection `schedules` : au redémarrage, une vanne ouverte par un
+programme est refermée à l'heure prévue (ou aussitôt si elle est dépassée).
+Avec cluster.py, seul le worker propriétaire d'une zone exécute ses
+programmes.
+"""
+import asyncio
+import os
+import time
+from collections import Counter
+from datetime import date, datetime, timedelta, timezone
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+from zoneinfo import ZoneInfo
+
+from motor.motor_asyncio import AsyncIOMotorDatabase
+
+from shared_state import shared_state
+
+SCHEDULER_TIMEZONE = ZoneInfo(os.getenv("SCHEDULER_TIMEZONE", "UTC"))
+SCHEDULER_TICK_SECONDS = float(os.getenv("SCHEDULER_TICK_SECONDS", "1"))
+SCHEDULER_WHEEL_LEVELS = int(os.getenv("SCHEDULER_WHEEL_LEVELS", "4"))
+SCHEDULER_RETRY_SECONDS = float(os.getenv("SCHEDULER_RETRY_SECONDS", "300"))
+SCHEDULES_REFRESH_SECONDS = float(os.getenv("SCHEDULES_REFRESH_SECONDS", "30"))
+
+WHEEL_BITS = 6
+WHEEL_SLOTS = 1 << WHEEL_BITS
+WHEEL_MASK = WHEEL_SLOTS - 1
+
+Actuate = Callable[[str, bool], Awaitable[None]]
+
+
+class TimingWheel:
+    """Roue temporelle hiérarchique ; les entrées sont (tic d'échéance, charge utile)."""
+
+    def __init__(self, now: float, resolution: float = SCHEDULER_TICK_SECONDS, levels: int = SCHEDULER_WHEEL_LEVELS):
+        self.resolution = resolution
+        self.levels = levels
+        self.tick = int(now // resolution)
+        self.wheels: List[List[list]] = [[[] for _ in range(WHEEL_SLOTS)] for _ in range(levels)]
+        self.overflow: list = []  # au-delà de la portée de la roue, redistribué à chaque tour complet
+        self.ready: list = []  # échéances déjà passées à l'insertion
+        self.size = 0
+        self.cascaded = 0
+
+    def _place(self, due_tick: int, item) -> None:
+        delta = due_tick - self.tick
+        if delta <= 0:
+            self.ready.append(item)
+            return
+        for level in range(self.levels):
+            if delta < 1 << (WHEEL_BITS * (level + 1)):
+                self.wheels[level][(due_tick >> (WHEEL_BITS * level)) & WHEEL_MASK].append((due_tick, item))
+                return
+        self.overflow.append((due_tick, item))
+
+    def schedule(self, due: float, item) -> None:
+        """Insère `item` pour l'instant `due` (secondes epoch) ; O(1)."""
+        self.size += 1
+        self._place(-int(-due // self.resolution), item)
+
+    def _cascade(self, level: int) -> None:
+        if level == self.levels:
+            entries, self.overflow = self.overflow, []
+        else:
+            index = (self.tick >> (WHEEL_BITS * level)) & WHEEL_MASK
+            entries, self.wheels[level][index] = self.wheels[level][index], []
+        self.cascaded += len(entries)
+        for due_tick, item in entries:
+            self._place(due_tick, item)
+
+    def advance(self, now: float) -> list:
+        """Avance jusqu'à `now` et renvoie les charges utiles échues."""
+        due, self.ready = self.ready, []
+        target = int(now // self.resolution)
+        while self.tick < target:
+            self.tick += 1
+            # Redistribution des niveaux supérieurs dont la case commence à ce tic, du plus haut au plus bas
+            top = 0
+            while top < self.levels and not self.tick & ((1 << (WHEEL_BITS * (top + 1))) - 1):
+                top += 1
+            for level in range(top, 0, -1):
+                self._cascade(level)
+            slot = self.wheels[0][self.tick & WHEEL_MASK]
+            if slot:
+                due.extend(item for _, item in slot)
+                slot.clear()
+            due.extend(self.ready)
+            self.ready = []
+        self.size -= len(due)
+        return due
+
+    def stats(self) -> dict:
+        return {
+            "tick_seconds": self.resolution,
+            "entries": self.size,
+            "entries_per_level": [sum(map(len, wheel)) for wheel in self.wheels],
+            "overflow": len(self.overflow),
+            "horizon_seconds": self.resolution * (1 << (WHEEL_BITS * self.levels)),
+            "cascaded": self.cascaded,
+        }
+
+
+def to_utc(local: datetime) -> datetime:
+    return local.astimezone(timezone.utc).replace(tzinfo=None)
+
+
+def windows_after(schedule: dict, after: datetime):
+    """Fenêtres (début, fin) UTC du programme qui se terminent après `after`, dans l'ordre."""
+    start = datetime.strptime(schedule["start"], "%H:%M").time()
+    end = datetime.strptime(schedule["end"], "%H:%M").time()
+    local_day = after.replace(tzinfo=timezone.utc).astimezone(SCHEDULER_TIMEZONE).date()
+    days = set(schedule.get("days") or range(7))
+    # La veille : une fenêtre qui passe minuit peut être encore ouverte
+    for offset in range(-1, 8):
+        day: date = local_day + timedelta(days=offset)
+        if day.weekday() not in days:
+            continue
+        window_start = datetime.combine(day, start, SCHEDULER_TIMEZONE)
+        window_end = datetime.combine(day + timedelta(days=1) if end <= start else day, end, SCHEDULER_TIMEZONE)
+        window = (to_utc(window_start), to_utc(window_end))
+        if window[1] > after:
+            yield window
+
+
+def weather_allows(schedule: dict, reading: Optional[dict]) -> Tuple[bool, str]:
+    """(autorisé, motif) d'après la dernière lecture de la zone."""
+    limits = {
+        "wind_speed": (None, schedule.get("max_wind_speed")),
+        "temperature": (schedule.get("min_temperature"), schedule.get("max_temperature")),
+        "light": (schedule.get("min_light"), None),
+    }
+    needed = any(low is not None or high is not None for low, high in limits.values())
+    if reading is None:
+        return (False, "aucune lecture récente") if needed else (True, "")
+    if schedule.get("skip_if_raining", True) and reading.get("rainfall"):
+        return False, "pluie"
+    for field, (low, high) in limits.items():
+        value = reading.get(field)
+        if value is None and (low is not None or high is not None):
+            return False, f"{field} inconnu"
+        if low is not None and value < low:
+            return False, f"{field} {value:g} < {low:g}"
+        if high is not None and value > high:
+            return False, f"{field} {value:g} > {high:g}"
+    return True, ""
+
+
+def current_window_start(schedule: dict, now: datetime) -> Optional[datetime]:
+    """Début de la fenêtre ouverte à `now`, ou None."""
+    window = next(windows_after(schedule, now), None)
+    return window[0] if window is not None and window[0] <= now else None
+
+
+def utcnow() -> datetime:
+    """Heure UTC à la milliseconde (précision des dates MongoDB : l'état relu reste identique)."""
+    now = datetime.utcnow()
+    return now.replace(microsecond=now.microsecond // 1000 * 1000)
+
+
+def schedule_document(schedule_id: str, fields: dict) -> dict:
+    """Document `schedules` d'un programme créé ou remplacé (état d'exécution remis à zéro)."""
+    at = fields.get("at")
+    if at is not None and at.tzinfo is not None:
+        at = to_utc(at)
+    if at is not None:
+        at = at.replace(microsecond=at.microsecond // 1000 * 1000)
+    return {
+        "schedule_id": schedule_id, **fields, "at": at,
+        "running_until": None, "last_run_at": None, "last_window_start": None, "last_result": None,
+        "updated_at": utcnow(),
+    }
+
+
+def epoch(at: datetime) -> float:
+    return at.replace(tzinfo=timezone.utc).timestamp()
+
+
+class IrrigationScheduler:
+    def __init__(self):
+        self.schedules: Dict[str, dict] = {}
+        self.generations: Dict[str, int] = {}
+        # zone → programmes `restrict_decisions` de la zone
+        self.restricting: Dict[str, List[dict]] = {}
+        # zone → programme → fin de l'arrosage en cours
+        self.running: Dict[str, Dict[str, datetime]] = {}
+        # Zones dont l'arrosage programmé vient de finir, jusqu'à leur lecture suivante
+        self.ended: set = set()
+        self.wheel = TimingWheel(time.time())
+        self.counters = Counter()
+        self.db: Optional[AsyncIOMotorDatabase] = None
+        self.actuate: Optional[Actuate] = None
+        self.owns: Callable[[str], bool] = lambda zone_id: True
+        self._task: Optional[asyncio.Task] = None
+        self._refresh_task: Optional[asyncio.Task] = None
+
+    # ---------- Programmes ----------
+
+    def _index(self, schedule: dict) -> None:
+        schedule_id = schedule["schedule_id"]
+        self._unindex(schedule_id)
+        self.schedules[schedule_id] = schedule
+        if schedule.get("restrict_decisions") and schedule.get("enabled", True):
+            self.restricting.setdefault(schedule["zone_id"], []).append(schedule)
+        self._plan(schedule, utcnow())
+
+    def _unindex(self, schedule_id: str) -> Optional[dict]:
+        # Les échéances déjà dans la roue deviennent caduques
+        self.generations[schedule_id] = self.generations.get(schedule_id, 0) + 1
+        previous = self.schedules.pop(schedule_id, None)
+        if previous is not None:
+            restricting = self.restricting.get(previous["zone_id"])
+            if restricting is not None:
+                restricting[:] = [s for s in restricting if s["schedule_id"] != schedule_id]
+                if not restricting:
+                    del self.restricting[previous["zone_id"]]
+        return previous
+
+    def _at(self, at: datetime, schedule_id: str, action: str, window_end: Optional[datetime] = None) -> None:
+        self.wheel.schedule(epoch(at), (schedule_id, self.generations[schedule_id], action, window_end))
+
+    def _plan(self, schedule: dict, now: datetime) -> None:
+        """Prochaine échéance du programme (ouverture, vérification ou fermeture)."""
+        schedule_id = schedule["schedule_id"]
+        running_until = schedule.get("running_until")
+        if running_until is not None:
+            self.running.setdefault(schedule["zone_id"], {})[schedule_id] = running_until
+            self._at(running_until, schedule_id, "stop")
+            return
+        if not schedule.get("enabled", True):
+            return
+        if schedule["kind"] == "once":
+            if schedule.get("last_run_at") is None:
+                self._at(schedule["at"], schedule_id, "start", schedule["at"] + timedelta(minutes=schedule["duration_minutes"]))
+            return
+        last_start = schedule.get("last_window_start")
+        for window_start, window_end in windows_after(schedule, now):
+            if last_start is None or window_start > last_start:
+                self._at(max(window_start, now), schedule_id, "start", window_end)
+                return
+
+    async def upsert(self, db: AsyncIOMotorDatabase, schedule: dict) -> dict:
+        await db.schedules.replace_one({"schedule_id": schedule["schedule_id"]}, schedule, upsert=True)
+        schedule.pop("_id", None)
+        previous = self._unindex(schedule["schedule_id"])
+        if previous is not None and previous.get("running_until") is not None:
+            # Programme remplacé pendant un arrosage : la vanne est refermée
+            await self._close_valve(previous)
+        if self.owns(schedule["zone_id"]):
+            self._index(schedule)
+        return schedule
+
+    async def remove(self, db: AsyncIOMotorDatabase, schedule_id: str) -> bool:
+        result = await db.schedules.delete_one({"schedule_id": schedule_id})
+        previous = self._unindex(schedule_id)
+        if previous is not None and previous.get("running_until") is not None:
+            await self._close_valve(previous)
+        return result.deleted_count > 0
+
+    async def load(self, db: AsyncIOMotorDatabase) -> None:
+        """Recharge les programmes des zones de ce worker (modifications faites ailleurs)."""
+        loaded = {
+            schedule["schedule_id"]: schedule
+            async for schedule in db.schedules.find({}, {"_id": 0})
+            if self.owns(schedule["zone_id"])
+        }
+        for schedule_id in list(self.schedules):
+            if schedule_id not in loaded:
+                previous = self._unindex(schedule_id)
+                if previous.get("running_until") is not None:
+                    await self._close_valve(previous)
+        for schedule_id, schedule in loaded.items():
+            if self.schedules.get(schedule_id) != schedule:
+                self._index(schedule)
+
+    # ---------- Exécution ----------
+
+    async def _run(self, schedule_id: str, generation: int, action: str, window_end: Optional[datetime]) -> None:
+        if self.generations.get(schedule_id) != generation:
+            self.counters["stale"] += 1
+            return
+        schedule = self.schedules[schedule_id]
+        now = utcnow()
+        if action == "stop":
+            await self._stop(schedule, now, "completed")
+            return
+        if await self.db.schedules.count_documents({"schedule_id": schedule_id}, limit=1) == 0:
+            # Supprimé par un autre worker depuis le dernier rechargement
+            self._unindex(schedule_id)
+            return
+
+        if window_end <= now:
+            await self._finish(schedule, now, "missed", None)
+            return
+        allowed, reason = weather_allows(schedule, self._latest_reading(schedule["zone_id"]))
+        if not allowed:
+            if now + timedelta(seconds=SCHEDULER_RETRY_SECONDS) < window_end:
+                self.counters["deferred"] += 1
+                self._at(now + timedelta(seconds=SCHEDULER_RETRY_SECONDS), schedule_id, "start", window_end)
+            else:
+                await self._finish(schedule, now, f"skipped: {reason}", None)
+            return
+
+        until = min(now + timedelta(minutes=schedule["duration_minutes"]), window_end)
+        window_start = now if schedule["kind"] == "once" else current_window_start(schedule, now) or now
+        schedule.update(running_until=until, last_run_at=now, last_window_start=window_start, last_result="running")
+        await self.db.schedules.update_one({"schedule_id": schedule_id}, {"$set": {
+            "running_until": until, "last_run_at": now, "last_window_start": window_start, "last_result": "running"
+        }})
+        self.running.setdefault(schedule["zone_id"], {})[schedule_id] = until
+        self.ended.discard(schedule["zone_id"])
+        self.counters["started"] += 1
+        await self.actuate(schedule["zone_id"], True)
+        self._at(until, schedule_id, "stop")
+
+    def _latest_reading(self, zone_id: str) -> Optional[dict]:
+        state = shared_state.read(zone_id)
+        return state["reading"] if state else None
+
+    async def _close_valve(self, schedule: dict) -> None:
+        running = self.running.get(schedule["zone_id"], {})
+        running.pop(schedule["schedule_id"], None)
+        if not running:
+            self.running.pop(schedule["zone_id"], None)
+            self.ended.add(schedule["zone_id"])
+            # Un autre programme de la zone en cours garde la vanne ouverte
+            await self.actuate(schedule["zone_id"], False)
+
+    async def _stop(self, schedule: dict, now: datetime, result: str) -> None:
+        await self._close_valve(schedule)
+        self.counters["completed"] += 1
+        await self._finish(schedule, now, result, schedule.get("last_window_start"))
+
+    async def _finish(self, schedule: dict, now: datetime, result: str, window_start: Optional[datetime]) -> None:
+        """Enregistre le résultat et planifie la fenêtre suivante."""
+        if result.startswith(("skipped", "missed")):
+            self.counters["skipped"] += 1
+            # Fenêtre consommée : la suivante sera planifiée
+            window_start = now if schedule["kind"] == "once" else current_window_start(schedule, now) or now
+        update = {"running_until": None, "last_result": result, "last_window_start": window_start}
+        if schedule["kind"] == "once":
+            update["last_run_at"] = schedule.get("last_run_at") or now
+        schedule.update(update)
+        await self.db.schedules.update_one({"schedule_id": schedule["schedule_id"]}, {"$set": update})
+        self._plan(schedule, now)
+
+    async def _loop(self) -> None:
+        while True:
+            await asyncio.sleep(self.wheel.resolution)
+            self.counters["ticks"] += 1
+            for schedule_id, generation, action, window_end in self.wheel.advance(time.time()):
+                self.counters["due"] += 1
+                try:
+                    await self._run(schedule_id, generation, action, window_end)
+                except Exception as e:
+                    self.counters["errors"] += 1
+                    print(f"Programmation {schedule_id}: échec de {action} - {e}")
+
+    async def _refresh_loop(self, db: AsyncIOMotorDatabase) -> None:
+        while True:
+            await asyncio.sleep(SCHEDULES_REFRESH_SECONDS)
+            try:
+                await self.load(db)
+            except Exception as e:
+                print(f"Programmations: échec du rechargement - {e}")
+
+    async def start(self, db: AsyncIOMotorDatabase, actuate: Actuate,
+                    owns: Callable[[str], bool] = lambda zone_id: True) -> None:
+        self.db = db
+        self.actuate = actuate
+        self.owns = owns
+        await db.schedules.create_index("schedule_id", unique=True)
+        await db.schedules.create_index("zone_id")
+        self.wheel = TimingWheel(time.time())
+        await self.load(db)
+        self._task = asyncio.create_task(self._loop())
+        self._refresh_task = asyncio.create_task(self._refresh_loop(db))
+
+    async def stop(self) -> None:
+        for task in (self._task, self._refresh_task):
+            if task:
+                task.cancel()
+        self._task = self._refresh_task = None
+
+    # ---------- Décision d'irrigation ----------
+
+    def decision_override(self, zone_id: str, now: datetime, reading: dict) -> Optional[str]:
+        """`running` pendant un arrosage programmé ; `outside_window` si la zone n'a aucune fenêtre ouverte favorable."""
+        if zone_id in self.running:
+            return "running"
+        restricting = self.restricting.get(zone_id)
+        if not restricting:
+            return None
+        for schedule in restricting:
+            if current_window_start(schedule, now) is not None and weather_allows(schedule, reading)[0]:
+                return None
+        return "outside_window"
+
+    def run_ended(self, zone_id: str) -> bool:
+        """Vrai une fois, à la première lecture qui suit la fin d'un arrosage programmé de la zone."""
+        if zone_id in self.ended:
+            self.ended.discard(zone_id)
+            return True
+        return False
+
+    def stats(self) -> dict:
+        return {
+            "schedules": len(self.schedules),
+            "restricted_zones": len(self.restricting),
+            "running": sum(map(len, self.running.values())),
+            "wheel": self.wheel.stats(),
+            **{name: self.counters[name] for name in
+               ("ticks", "due", "started", "completed", "deferred", "skipped", "stale", "errors")},
+        }
+
+
+scheduler = IrrigationScheduler()
@@ -0,0 +1,235 @@
+"""
+Dernier état connu de chaque zone, partagé entre les workers.
+
+Table à emplacements fixes dans un fichier projeté en mémoire (mmap, sous
+/dev/shm par défaut avec cluster.py) : dernière lecture, décision de la
+pompe et état de la vanne de chaque zone. N'importe quel worker la lit sans
+requête MongoDB (/latest).
+
+- Emplacement d'une zone : empreinte crc32 de zone_id, sondage linéaire.
+  Un emplacement attribué n'est jamais libéré ; l'attribution est protégée
+  par un verrou fcntl sur le fichier (une fois par zone et par processus).
+- Un seul écrivain par zone (le worker propriétaire, voir cluster.py) ; les
+  lecteurs suivent un seqlock : compteur impair pendant l'écriture, relu
+  après la copie, lecture recommencée s'il a changé.
+
+Sans SHARED_STATE_PATH, la table est anonyme et propre au processus.
+Les zone_id de plus de 32 octets ne sont pas reflétés dans la table.
+"""
+import fcntl
+import math
+import mmap
+import os
+import struct
+import zlib
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+
+SHARED_STATE_PATH = os.getenv("SHARED_STATE_PATH")
+SHARED_STATE_SLOTS = int(os.getenv("SHARED_STATE_SLOTS", "1024"))
+
+MAGIC = b"IRST"
+VERSION = 1
+HEADER = struct.Struct("<4sIII")  # magic, version, nombre d'emplacements, taille d'un emplacement
+SEQ = struct.Struct("<I")
+READING_FIELDS = (
+    "soil_moisture", "soil_moisture_10cm", "soil_moisture_30cm", "soil_moisture_60cm",
+    "temperature", "humidity", "light", "wind_speed", "flow_rate",
+)
+# Après le compteur : clé, ms de la lecture, ms de la vanne, champs (NaN si absent), pluie, pompe, vanne, drapeaux
+BODY = struct.Struct(f"<32sqq{len(READING_FIELDS)}dBBBB")
+SLOT_SIZE = SEQ.size + BODY.size  # 128 octets
+KEY_SIZE = 32
+
+HAS_READING = 1
+HAS_VALVE = 2
+
+EPOCH = datetime(1970, 1, 1)
+READ_RETRIES = 1000
+
+
+def to_ms(at: datetime) -> int:
+    return (at - EPOCH) // timedelta(milliseconds=1)
+
+
+def from_ms(ms: int) -> datetime:
+    return EPOCH + timedelta(milliseconds=ms)
+
+
+def zone_key(zone_id: str) -> Optional[bytes]:
+    key = zone_id.encode()
+    return key.ljust(KEY_SIZE, b"\0") if 0 < len(key) <= KEY_SIZE else None
+
+
+class SharedStateTable:
+    def __init__(self, path: Optional[str] = SHARED_STATE_PATH, slots: int = SHARED_STATE_SLOTS):
+        self.skipped = 0
+        self._open(path, slots)
+
+    def _open(self, path: Optional[str], slots: int) -> None:
+        self.path = path
+        self.offsets: Dict[str, int] = {}  # Emplacements déjà résolus par ce processus
+        if path is None:
+            self.fd = None
+            self.slots = slots
+            self.map = mmap.mmap(-1, HEADER.size + slots * SLOT_SIZE)
+            HEADER.pack_into(self.map, 0, MAGIC, VERSION, slots, SLOT_SIZE)
+            return
+        self.fd = os.open(path, os.O_RDWR)
+        self.map = mmap.mmap(self.fd, 0)
+        magic, version, self.slots, slot_size = HEADER.unpack_from(self.map, 0)
+        if magic != MAGIC or version != VERSION or slot_size != SLOT_SIZE:
+            raise ValueError(f"{path} n'est pas une table d'état partagé compatible")
+
+    def attach(self, path: str) -> None:
+        """
+        Remplace la table courante par celle du fichier `path` : appelé dans
+        chaque worker forké, dont le module a été importé par le lanceur avant
+        que SHARED_STATE_PATH ne soit connu.
+        """
+        previous, fd = self.map, self.fd
+        self._open(path, self.slots)
+        previous.close()
+        if fd is not None:
+            os.close(fd)
+
+    @staticmethod
+    def create(path: str, slots: int = SHARED_STATE_SLOTS) -> None:
+        """Crée (ou remet à zéro) le fichier de la table ; appelé par le lanceur avant les workers."""
+        with open(path, "wb") as handle:
+            handle.write(HEADER.pack(MAGIC, VERSION, slots, SLOT_SIZE))
+            handle.truncate(HEADER.size + slots * SLOT_SIZE)
+
+    def _key_at(self, offset: int) -> bytes:
+        return self.map[offset + SEQ.size:offset + SEQ.size + KEY_SIZE]
+
+    def _probe(self, key: bytes):
+        """Offsets des emplacements dans l'ordre de sondage de la clé."""
+        start = zlib.crc32(key) % self.slots
+        for i in range(self.slots):
+            yield HEADER.size + ((start + i) % self.slots) * SLOT_SIZE
+
+    def _find(self, zone_id: str, claim: bool = False) -> Optional[int]:
+        offset = self.offsets.get(zone_id)
+        if offset is not None:
+            return offset
+        key = zone_key(zone_id)
+        if key is None:
+            return None
+        for offset in self._probe(key):
+            stored = self._key_at(offset)
+            if stored == key:
+                self.offsets[zone_id] = offset
+                return offset
+            if stored.strip(b"\0"):
+                continue
+            # Emplacement libre : la zone n'a pas encore d'état
+            return self._claim(zone_id, key) if claim else None
+        return None
+
+    def _claim(self, zone_id: str, key: bytes) -> Optional[int]:
+        if self.fd is not None:
+            fcntl.flock(self.fd, fcntl.LOCK_EX)
+        try:
+            # Relecture sous verrou : un autre worker a pu attribuer l'emplacement entre-temps
+            for offset in self._probe(key):
+                stored = self._key_at(offset)
+                if stored == key or not stored.strip(b"\0"):
+                    if stored != key:
+                        self.map[offset + SEQ.size:offset + SEQ.size + KEY_SIZE] = key
+                    self.offsets[zone_id] = offset
+                    return offset
+            return None
+        finally:
+            if self.fd is not None:
+                fcntl.flock(self.fd, fcntl.LOCK_UN)
+
+    def _read_body(self, offset: int) -> tuple:
+        for _ in range(READ_RETRIES):
+            seq = SEQ.unpack_from(self.map, offset)[0]
+            if seq & 1:
+                continue
+            body = BODY.unpack_from(self.map, offset + SEQ.size)
+            if SEQ.unpack_from(self.map, offset)[0] == seq:
+                return body
+        raise RuntimeError("Emplacement d'état partagé instable")
+
+    def _write(self, zone_id: str, update) -> None:
+        offset = self._find(zone_id, claim=True)
+        if offset is None:
+            self.skipped += 1
+            return
+        key, reading_ms, valve_ms, *values, rainfall, pump, valve_open, flags = self._read_body(offset)
+        fields = update(dict(
+            reading_ms=reading_ms, valve_ms=valve_ms, values=values, rainfall=rainfall,
+            pump=pump, valve_open=valve_open, flags=flags,
+        ))
+        seq = SEQ.unpack_from(self.map, offset)[0]
+        SEQ.pack_into(self.map, offset, (seq + 1) & 0xFFFFFFFF)
+        BODY.pack_into(
+            self.map, offset + SEQ.size, key, fields["reading_ms"], fields["valve_ms"], *fields["values"],
+            fields["rainfall"], fields["pump"], fields["valve_open"], fields["flags"]
+        )
+        SEQ.pack_into(self.map, offset, (seq + 2) & 0xFFFFFFFF)
+
+    def update_reading(self, zone_id: str, record: dict, pump: bool) -> None:
+        """Dernière lecture reçue et décision de la pompe associée."""
+        def update(fields):
+            fields["reading_ms"] = to_ms(record["created_at"])
+            fields["values"] = [math.nan if record.get(name) is None else float(record[name])
+                                for name in READING_FIELDS]
+            fields["rainfall"] = int(bool(record.get("rainfall")))
+            fields["pump"] = int(pump)
+            fields["flags"] |= HAS_READING
+            return fields
+        self._write(zone_id, update)
+
+    def update_valve(self, zone_id: str, is_open: bool, at: datetime) -> None:
+        def update(fields):
+            fields["valve_ms"] = to_ms(at)
+            fields["valve_open"] = int(is_open)
+            fields["flags"] |= HAS_VALVE
+            return fields
+        self._write(zone_id, update)
+
+    def _view(self, zone_id: str, body: tuple) -> dict:
+        _key, reading_ms, valve_ms, *values, rainfall, pump, valve_open, flags = body
+        state = {"zone_id": zone_id, "reading": None, "pump": None, "valve_open": None, "valve_updated_at": None}
+        if flags & HAS_READING:
+            reading = {name: None if math.isnan(value) else value for name, value in zip(READING_FIELDS, values)}
+            reading["rainfall"] = bool(rainfall)
+            reading["created_at"] = from_ms(reading_ms).isoformat()
+            state["reading"] = reading
+            state["pump"] = bool(pump)
+        if flags & HAS_VALVE:
+            state["valve_open"] = bool(valve_open)
+            state["valve_updated_at"] = from_ms(valve_ms).isoformat()
+        return state
+
+    def read(self, zone_id: str) -> Optional[dict]:
+        offset = self._find(zone_id)
+        if offset is None:
+            return None
+        return self._view(zone_id, self._read_body(offset))
+
+    def read_all(self) -> List[dict]:
+        states = []
+        for index in range(self.slots):
+            offset = HEADER.size + index * SLOT_SIZE
+            key = self._key_at(offset).rstrip(b"\0")
+            if key:
+                states.append(self._view(key.decode(errors="replace"), self._read_body(offset)))
+        return sorted(states, key=lambda state: state["zone_id"])
+
+    def stats(self) -> dict:
+        used = sum(1 for index in range(self.slots) if self._key_at(HEADER.size + index * SLOT_SIZE).strip(b"\0"))
+        return {
+            "path": self.path,
+            "slots": self.slots,
+            "used": used,
+            "slot_bytes": SLOT_SIZE,
+            "skipped_writes": self.skipped,
+        }
+
+
+shared_state = SharedStateTable()
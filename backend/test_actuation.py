@@ -0,0 +1,72 @@
+import asyncio
+
+from actuation import ActuationManager, SimulatedValveDriver
+
+
+class FlakyDriver(SimulatedValveDriver):
+    """Relais qui échoue aux `failures` premières commandes."""
+
+    def __init__(self, failures: int):
+        super().__init__(latency_seconds=0)
+        self.failures = failures
+
+    async def apply(self, zone_id: str, is_open: bool) -> bool:
+        if self.failures:
+            self.failures -= 1
+            raise OSError("relais injoignable")
+        return await super().apply(zone_id, is_open)
+
+
+def run(coroutine):
+    loop = asyncio.new_event_loop()
+    try:
+        return loop.run_until_complete(coroutine)
+    finally:
+        loop.close()
+
+
+def test_failed_command_is_retried_and_recorded():
+    events = []
+
+    async def confirmed(zone_id, relay_open, at):
+        events.append(("confirmed", relay_open))
+
+    async def failed(zone_id, requested_open, relay_open, error, at):
+        events.append(("failed", requested_open, error))
+
+    async def scenario():
+        driver = FlakyDriver(failures=2)
+        actuator = ActuationManager(driver, min_interval=0, retry=0.01)
+        actuator.start(confirmed, failed)
+        actuator.submit("z", True)
+        for _ in range(100):
+            if driver.relays.get("z"):
+                break
+            await asyncio.sleep(0.01)
+        await asyncio.sleep(0.01)
+        metrics = actuator.metrics()
+        await actuator.stop()
+        return driver, metrics
+
+    driver, metrics = run(scenario())
+    assert driver.relays["z"] is True
+    assert events == [("failed", True, "relais injoignable")] * 2 + [("confirmed", True)]
+    assert metrics["failures"] == 2 and metrics["retries"] == 2 and metrics["failing_zones"] == 0
+
+
+def test_newer_command_replaces_failed_one():
+    async def scenario():
+        driver = FlakyDriver(failures=1)
+        actuator = ActuationManager(driver, min_interval=0, retry=0.05)
+        actuator.start()
+        actuator.submit("z", True)
+        await asyncio.sleep(0.02)
+        # Fermeture demandée pendant l'attente du nouvel essai : l'ouverture n'est pas rejouée
+        actuator.submit("z", False)
+        await asyncio.sleep(0.1)
+        await actuator.stop()
+        return driver
+
+    driver = run(scenario())
+    assert driver.relays.get("z", False) is False
+    assert driver.switches == 0
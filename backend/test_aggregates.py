@@ -0,0 +1,104 @@
+import asyncio
+import math
+from datetime import datetime, timedelta
+
+from bson import ObjectId
+
+from aggregates import AggregateCache, combine_buckets, time_weighted_buckets
+from deadband import DeadbandFilter
+
+START = datetime(2024, 6, 1)
+SAMPLE_SECONDS = 5
+HEARTBEAT_SECONDS = 300
+
+
+def dense_series(hours: int) -> list:
+    """Lecture toutes les 5 s : sol stable la plupart du temps, arrosage de 20 min par heure."""
+    series = []
+    for i in range(hours * 3600 // SAMPLE_SECONDS):
+        at = START + timedelta(seconds=SAMPLE_SECONDS * i)
+        minute = (at - START).total_seconds() / 60 % 60
+        moisture = 40.0 + (minute - 40) * 0.75 if minute >= 40 else 40.0
+        series.append({
+            "zone_id": "z", "created_at": at, "soil_moisture": round(moisture, 2),
+            "temperature": 20.0 + math.sin(i / 500), "rainfall": minute >= 50, "anomalies": [],
+        })
+    return series
+
+
+def stored_rows(series: list) -> list:
+    deadband = DeadbandFilter(heartbeat_seconds=HEARTBEAT_SECONDS)
+    return [record for record in series if deadband.should_store("z", record)]
+
+
+def dense_stats(series: list, field: str) -> dict:
+    values = [record[field] for record in series]
+    return {"n": len(values), "avg": sum(values) / len(values), "min": min(values), "max": max(values)}
+
+
+def test_deadband_buckets_match_dense_series():
+    # Une heure de plus : la dernière heure comparée est close par les lectures suivantes
+    series = dense_series(4)
+    rows = stored_rows(series)
+    assert len(rows) < len(series) / 5
+    buckets = time_weighted_buckets(rows, START, START + timedelta(hours=3), "hour",
+                                    sample_seconds=SAMPLE_SECONDS, heartbeat_seconds=HEARTBEAT_SECONDS)
+    assert sorted(buckets) == ["2024-06-01T00", "2024-06-01T01", "2024-06-01T02"]
+    series = [r for r in series if r["created_at"] < START + timedelta(hours=3)]
+    for hour, key in enumerate(sorted(buckets)):
+        dense = [r for r in series if START + timedelta(hours=hour) <= r["created_at"] < START + timedelta(hours=hour + 1)]
+        bucket = buckets[key]
+        assert bucket["count"] == len(dense)
+        assert bucket["rain_readings"] == sum(r["rainfall"] for r in dense)
+        for field in ("soil_moisture", "temperature"):
+            expected = dense_stats(dense, field)
+            stats = bucket["fields"][field]
+            assert stats["n"] == expected["n"]
+            # Écart borné par l'epsilon de la bande morte (0.5)
+            assert abs(stats["avg"] - expected["avg"]) < 0.5
+            assert abs(stats["min"] - expected["min"]) <= 0.5
+            assert abs(stats["max"] - expected["max"]) <= 0.5
+        # Pondérées par ligne, les périodes de variation pèsent trop : moyenne nettement biaisée
+        stored = [r["soil_moisture"] for r in rows if r["created_at"] in {d["created_at"] for d in dense}]
+        assert abs(sum(stored) / len(stored) - dense_stats(dense, "soil_moisture")["avg"]) > 1.0
+
+
+def test_gap_longer_than_heartbeat_is_not_filled():
+    rows = [
+        {"created_at": START, "soil_moisture": 30.0},
+        {"created_at": START + timedelta(minutes=30), "soil_moisture": 50.0},
+    ]
+    bucket = time_weighted_buckets(rows, START, START + timedelta(hours=1), "hour",
+                                   sample_seconds=SAMPLE_SECONDS, heartbeat_seconds=HEARTBEAT_SECONDS)["2024-06-01T00"]
+    # Capteur muet pendant l'écart : une lecture chacune
+    assert bucket["count"] == 2
+    assert bucket["fields"]["soil_moisture"]["avg"] == 40.0
+
+
+def test_combined_report_is_time_weighted(mock_db):
+    """Rapport sur plusieurs intervalles en cache (comme /reports/season) comparé à la série dense."""
+    series = dense_series(49)
+    rows = stored_rows(series)
+    for index, row in enumerate(rows):
+        row["_id"] = ObjectId(f"{int(row['created_at'].timestamp()):08x}{index:016x}")
+    cache = AggregateCache(time_weighted=True)
+    end = START + timedelta(days=2)
+
+    async def report():
+        await mock_db.sensor_data.insert_many(rows)
+        first = await cache.buckets(mock_db, "z", START, end, "day", now=end + timedelta(days=1))
+        again = await cache.buckets(mock_db, "z", START, end, "day", now=end + timedelta(days=1))
+        return first, again
+
+    loop = asyncio.new_event_loop()
+    try:
+        first, again = loop.run_until_complete(report())
+    finally:
+        loop.close()
+    assert [bucket for _, bucket, _ in first] == [bucket for _, bucket, _ in again]
+    assert cache.stats()["hits"] == 2
+    total = combine_buckets([bucket for _, bucket, _ in first])
+    dense = [r for r in series if r["created_at"] < end]
+    assert total["count"] == len(dense)
+    assert total["fields"]["soil_moisture"]["n"] == len(dense)
+    assert abs(total["fields"]["soil_moisture"]["avg"] - dense_stats(dense, "soil_moisture")["avg"]) < 0.5
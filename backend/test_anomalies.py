@@ -0,0 +1,44 @@
+from datetime import datetime, timedelta
+
+from anomalies import SensorAnomalyDetector
+
+
+def readings(start: datetime, values, minutes: int = 5):
+    for i, value in enumerate(values):
+        yield {"soil_moisture": value, "soil_moisture_10cm": value, "created_at": start + timedelta(minutes=minutes * i)}
+
+
+def test_flatline_alone_does_not_veto():
+    detector = SensorAnomalyDetector(flatline_minutes=45)
+    flags = [detector.check("z", reading) for reading in readings(datetime(2024, 6, 1), [50.0] * 12)]
+    assert "flatline:soil_moisture_10cm" in flags[-1]
+    assert not detector.vetoes_pump(flags[-1])
+
+
+def test_probe_frozen_while_irrigating_vetoes_until_it_moves():
+    detector = SensorAnomalyDetector(flatline_minutes=45)
+    start = datetime(2024, 6, 1)
+    # Sonde figée à 35 % : une heure de lectures plates avant l'arrosage
+    for reading in readings(start, [35.0] * 12):
+        assert not detector.vetoes_pump(detector.check("z", reading))
+
+    irrigating = list(readings(start + timedelta(hours=1), [35.0] * 10))
+    flags = [detector.check("z", reading, irrigating=True) for reading in irrigating]
+    # Pas de veto au démarrage de l'arrosage, seulement après une fenêtre complète sans réponse
+    assert not detector.vetoes_pump(flags[0])
+    assert detector.vetoes_pump(flags[9])
+
+    # Arrosage arrêté : le veto reste tant que la valeur ne bouge pas
+    later = {"soil_moisture": 35.0, "soil_moisture_10cm": 35.0, "created_at": start + timedelta(hours=2)}
+    assert detector.vetoes_pump(detector.check("z", later))
+    moved = {"soil_moisture": 36.0, "soil_moisture_10cm": 36.0, "created_at": start + timedelta(hours=2, minutes=5)}
+    assert not detector.vetoes_pump(detector.check("z", moved))
+
+
+def test_responding_probe_is_not_vetoed():
+    detector = SensorAnomalyDetector(flatline_minutes=45)
+    flags = [
+        detector.check("z", reading, irrigating=True)
+        for reading in readings(datetime(2024, 6, 1), [35.0 + 0.5 * i for i in range(15)])
+    ]
+    assert not any(detector.vetoes_pump(f) for f in flags)
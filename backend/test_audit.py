@@ -0,0 +1,72 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+from pymongo.errors import AutoReconnect, BulkWriteError
+
+from audit import ValveAuditLog
+
+
+class FlakyCollection:
+    """Premier insert_many interrompu après une partie du lot, comme une coupure réseau."""
+
+    def __init__(self, collection, written: int, error: Exception):
+        self.collection = collection
+        self.written = written
+        self.error = error
+
+    async def insert_many(self, documents, ordered=True):
+        if self.error is None:
+            return await self.collection.insert_many(documents, ordered=ordered)
+        error, self.error = self.error, None
+        await self.collection.insert_many(documents[:self.written], ordered=ordered)
+        raise error
+
+
+def run(coroutine):
+    loop = asyncio.new_event_loop()
+    try:
+        return loop.run_until_complete(coroutine)
+    finally:
+        loop.close()
+
+
+def entries(count: int) -> list:
+    return [{"zone_id": "z", "valve_open": i % 2 == 0, "source": "bulk", "success": True} for i in range(count)]
+
+
+def test_retry_after_partial_write_does_not_loop(mock_db):
+    audit = ValveAuditLog()
+    audit.db = SimpleNamespace(valve_audit=FlakyCollection(mock_db.valve_audit, 3, AutoReconnect("coupure")))
+
+    async def scenario():
+        audit.append(entries(5))
+        with pytest.raises(AutoReconnect):
+            await audit.flush()
+        assert len(audit.pending) == 5
+        # Les 3 entrées déjà insérées reviennent en clé dupliquée : comptées écrites
+        await audit.flush()
+        return await mock_db.valve_audit.count_documents({})
+
+    assert run(scenario()) == 5
+    assert audit.stats()["pending"] == 0
+    assert audit.stats()["written"] == 5
+    assert audit.stats()["failed_flushes"] == 1
+
+
+def test_only_rejected_entries_are_requeued(mock_db):
+    batch = entries(4)
+    rejected = BulkWriteError({"writeErrors": [{"index": 3, "code": 121, "errmsg": "Document failed validation"}],
+                               "nInserted": 3})
+    audit = ValveAuditLog()
+    audit.db = SimpleNamespace(valve_audit=FlakyCollection(mock_db.valve_audit, 3, rejected))
+
+    async def scenario():
+        audit.append(batch)
+        with pytest.raises(BulkWriteError):
+            await audit.flush()
+        return await mock_db.valve_audit.count_documents({})
+
+    assert run(scenario()) == 3
+    assert audit.pending == [batch[3]]
+    assert audit.stats()["written"] == 3
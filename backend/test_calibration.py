@@ -0,0 +1,80 @@
+import asyncio
+from datetime import datetime, timedelta
+
+from bson import ObjectId
+
+from calibration import CalibrationRegistry
+
+START = datetime(2024, 6, 1)
+ZONE = "test-calibration"
+
+
+def run(coroutine):
+    loop = asyncio.new_event_loop()
+    try:
+        return loop.run_until_complete(coroutine)
+    finally:
+        loop.close()
+
+
+def curve(offset: float, valid_from) -> dict:
+    # Brut + offset à partir de valid_from
+    return {"kind": "polynomial", "coefficients": [0.0, 1.0], "offset": offset, "valid_from": valid_from}
+
+
+async def readings(db) -> list:
+    return [doc async for doc in db.sensor_data.find({"zone_id": ZONE}).sort("_id", 1)]
+
+
+def recalculate(db, registry, zone_id, depth, new_curve):
+    async def scenario():
+        doc = await registry.upsert(db, zone_id, depth, new_curve)
+        await registry._run_job(db, zone_id, "soil_moisture")
+        return doc
+    return scenario()
+
+
+def test_later_valid_from_reverts_readings_before_it(mock_db):
+    registry = CalibrationRegistry()
+    hours = [START + timedelta(hours=h) for h in range(5)]
+
+    async def scenario():
+        await mock_db.sensor_data.insert_many([
+            {"_id": ObjectId(f"{int(at.timestamp()):08x}{i:016x}"), "zone_id": ZONE, "created_at": at,
+             "soil_moisture": 30.0 + i, "temperature": 25.0}
+            for i, at in enumerate(hours)
+        ])
+        await recalculate(mock_db, registry, ZONE, "soil_moisture", curve(10.0, hours[1]))
+        first = await readings(mock_db)
+        await asyncio.sleep(0.002)  # Version (ms) distincte
+        replaced = await recalculate(mock_db, registry, ZONE, "soil_moisture", curve(20.0, hours[3]))
+        return first, replaced, await readings(mock_db)
+
+    first, replaced, docs = run(scenario())
+    assert [doc["soil_moisture"] for doc in first] == [30.0, 41.0, 42.0, 43.0, 44.0]
+    # Avant le nouveau valid_from : valeurs brutes, plus de trace de l'ancienne courbe
+    assert [doc["soil_moisture"] for doc in docs] == [30.0, 31.0, 32.0, 53.0, 54.0]
+    for doc in docs[:3]:
+        assert "soil_moisture" not in (doc.get("raw") or {})
+        assert "soil_moisture" not in (doc.get("calibration") or {})
+    assert all(doc["calibration"]["soil_moisture"] == replaced["version"] for doc in docs[3:])
+
+
+def test_earlier_valid_from_recalculates_from_the_new_start(mock_db):
+    registry = CalibrationRegistry()
+    hours = [START + timedelta(hours=h) for h in range(4)]
+
+    async def scenario():
+        await mock_db.sensor_data.insert_many([
+            {"_id": ObjectId(f"{int(at.timestamp()):08x}{i:016x}"), "zone_id": ZONE, "created_at": at,
+             "soil_moisture": 30.0 + i, "temperature": 25.0}
+            for i, at in enumerate(hours)
+        ])
+        await recalculate(mock_db, registry, ZONE, "soil_moisture", curve(10.0, hours[2]))
+        await asyncio.sleep(0.002)
+        await recalculate(mock_db, registry, ZONE, "soil_moisture", curve(5.0, None))
+        return await readings(mock_db)
+
+    docs = run(scenario())
+    assert [doc["soil_moisture"] for doc in docs] == [35.0, 36.0, 37.0, 38.0]
+    assert [doc["raw"]["soil_moisture"] for doc in docs] == [30.0, 31.0, 32.0, 33.0]
@@ -0,0 +1,72 @@
+import asyncio
+
+import httpx
+
+import main
+from conftest import reading
+from dedup import DuplicateFilter
+
+
+def test_retry_returns_original_decision_without_touching_zone_state(client):
+    zone_id = "test-dedup-retry"
+    first = client.post("/send-data", json=reading(zone_id, 30.0, seq=1)).json()
+    checked = main.detector.checked
+    retry = client.post("/send-data", json=reading(zone_id, 80.0, seq=1)).json()
+    assert retry == {**first, "duplicate": True}
+    assert main.detector.checked == checked
+
+
+def test_deadband_skipped_retry_is_acknowledged_after_restart(client, mock_db, monkeypatch):
+    zone_id = "test-dedup-deadband"
+    monkeypatch.setattr(main, "DEADBAND_ENABLED", True)
+    client.post("/send-data", json=reading(zone_id, 50.0, seq=1))
+    skipped = client.post("/send-data", json=reading(zone_id, 50.0, seq=2)).json()
+    stored = client.portal.call(mock_db.sensor_data.count_documents, {"zone_id": zone_id})
+    assert stored == 1
+
+    # Redémarrage : filtres vides, rechargés depuis MongoDB
+    restarted = DuplicateFilter()
+    client.portal.call(restarted.warm, mock_db)
+    monkeypatch.setattr(main, "reading_dedup", restarted)
+    assert restarted.warmed_keys >= 2
+    checked = main.detector.checked
+    retry = client.post("/send-data", json=reading(zone_id, 50.0, seq=2)).json()
+    assert retry == {**skipped, "duplicate": True}
+    assert main.detector.checked == checked
+
+
+def test_key_beyond_filters_is_rejected_by_unique_index(client, mock_db, monkeypatch):
+    zone_id = "test-dedup-index"
+    first = client.post("/send-data", json=reading(zone_id, 30.0, seq=7)).json()
+    monkeypatch.setattr(main, "reading_dedup", DuplicateFilter())
+    retry = client.post("/send-data", json=reading(zone_id, 30.0, seq=7)).json()
+    assert retry == {**first, "duplicate": True}
+    assert client.portal.call(mock_db.sensor_data.count_documents, {"zone_id": zone_id}) == 1
+
+
+def test_concurrent_retry_is_processed_once(client, monkeypatch):
+    zone_id = "test-dedup-concurrent"
+    dedup = DuplicateFilter()
+    # Faux positif forcé : les deux requêtes attendent la vérification en base
+    monkeypatch.setattr(dedup, "maybe_seen", lambda zone, key: True)
+    monkeypatch.setattr(main, "reading_dedup", dedup)
+    stored_decision = main.stored_decision
+
+    async def slow_lookup(*args):
+        decision = await stored_decision(*args)
+        await asyncio.sleep(0.05)
+        return decision
+
+    monkeypatch.setattr(main, "stored_decision", slow_lookup)
+    checked = main.detector.checked
+
+    async def send_twice():
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as http:
+            return await asyncio.gather(*(
+                http.post("/send-data", json=reading(zone_id, 30.0, seq=1)) for _ in range(2)
+            ))
+
+    first, second = (response.json() for response in client.portal.call(send_twice))
+    assert main.detector.checked == checked + 1
+    assert sorted([first.get("duplicate", False), second.get("duplicate", False)]) == [False, True]
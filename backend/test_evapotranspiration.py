@@ -0,0 +1,29 @@
+import importlib.util
+import os
+
+import pytest
+
+from conftest import reading
+from evapotranspiration import moisture_loss_per_hour, reference_et
+
+SENSORS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "test", "sensors.py")
+
+
+def test_simulator_copy_matches_backend_model():
+    """Le simulateur (test/sensors.py) recopie le modèle FAO-56 : mêmes valeurs que le backend."""
+    spec = importlib.util.spec_from_file_location("simulator_sensors", SENSORS_PATH)
+    sensors = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(sensors)
+    for temperature in (-5.0, 12.3, 25.0, 38.7):
+        for humidity, light, wind in ((25.0, 90000, 20.0), (60.0, 30000, 5.0), (95.0, 0, 0.0)):
+            expected = float(reference_et(temperature, humidity, light, wind))
+            assert sensors.reference_et(temperature, humidity, light, wind) == pytest.approx(expected, rel=1e-3, abs=1e-5)
+    assert sensors.moisture_loss_per_hour(0.5, 100.0) == moisture_loss_per_hour(0.5, 100.0)
+
+
+def test_evapotranspiration_starts_irrigation_before_threshold(client):
+    # Zone hors registre : seuils 40 % / 70 %, anticipation d'une heure par défaut
+    hot = {"humidity": 25.0, "temperature": 35.0, "light": 90000, "wind_speed": 20.0}
+    night = {"humidity": 90.0, "temperature": 15.0, "light": 0, "wind_speed": 0.0}
+    assert client.post("/send-data", json={**reading("test-et-hot", 40.1), **hot}).json()["pump"] is True
+    assert client.post("/send-data", json={**reading("test-et-night", 40.1), **night}).json()["pump"] is False
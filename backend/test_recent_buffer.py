@@ -0,0 +1,63 @@
+import random
+from datetime import datetime, timedelta
+
+from bson import ObjectId
+
+import admission
+import main
+from conftest import reading
+from recent_buffer import BLOCK_SIZE, RecentHistory, ZoneRingBuffer
+
+
+def documents(zone_id: str, count: int) -> list:
+    rng = random.Random(7)
+    start = datetime(2024, 6, 1)
+    docs = []
+    for i in range(count):
+        moisture = rng.uniform(20, 80)
+        doc = {
+            "_id": ObjectId(), "zone_id": zone_id, "created_at": start + timedelta(seconds=5 * i),
+            # Valeurs étalonnées : pleine précision flottante
+            "soil_moisture": moisture, "soil_moisture_10cm": round(moisture * 0.9, 1),
+            "soil_moisture_30cm": 41.5, "soil_moisture_60cm": 50.0, "temperature": rng.uniform(10, 30),
+            "humidity": 55.5, "light": float(rng.randrange(0, 80000)), "wind_speed": 1e300 if i == 3 else 4.25,
+            "rainfall": i % 40 == 0, "rainfall_intensity": "light" if i % 40 == 0 else "none",
+            "flow_rate": 8.1 if i % 3 == 0 else None, "anomalies": ["flatline:humidity"] if i == 5 else [],
+            "raw": {"soil_moisture": round(moisture, 1)}, "calibration": {"soil_moisture": 2},
+        }
+        if i % 2:
+            doc["dedup_key"] = f"seq:{i}"
+            doc["decision"] = {"pump": moisture < 40, "message": f"{moisture:.1f}%"}
+        docs.append(doc)
+    return docs
+
+
+def test_buffer_returns_stored_documents_unchanged():
+    docs = documents("z", 3 * BLOCK_SIZE + 10)
+    buffer = ZoneRingBuffer("z", capacity=10 * BLOCK_SIZE, complete=True)
+    for doc in docs:
+        buffer.append(doc)
+    assert len(buffer.blocks) == 3
+    assert buffer.query(len(docs)) == docs[::-1]
+    since = docs[100]["created_at"]
+    assert buffer.query(len(docs), since) == [doc for doc in docs[::-1] if doc["created_at"] >= since]
+
+
+def test_history_is_the_same_from_memory_and_mongodb(client, monkeypatch):
+    zone_id = "test-buffer-history"
+    # Plus d'un bloc de lectures d'affilée : limite de débit par zone levée
+    monkeypatch.setattr(admission, "ADMISSION_ENABLED", False)
+    for i in range(BLOCK_SIZE + 20):
+        payload = reading(zone_id, 40 + i / 7, temperature=20 + i / 3, humidity=50.123456, flow_rate=7.77)
+        client.post("/send-data", json=payload if i % 2 else {**payload, "seq": i})
+    params = {"zone_id": zone_id, "limit": 5000, "interpolate": "none"}
+
+    hits = main.recent_history.hits
+    from_memory = client.get("/history", params=params).json()
+    assert main.recent_history.hits == hits + 1
+    columnar_memory = client.get("/history", params={**params, "format": "columnar"}).json()
+
+    monkeypatch.setattr(main, "recent_history", RecentHistory(capacity=0))
+    assert client.get("/history", params=params).json() == from_memory
+    assert client.get("/history", params={**params, "format": "columnar"}).json() == columnar_memory
+    assert len(from_memory) == BLOCK_SIZE + 20
@@ -0,0 +1,38 @@
+import time
+from datetime import datetime
+
+from conftest import reading
+
+
+def wait_for(condition, timeout: float = 10.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if condition():
+            return True
+        time.sleep(0.1)
+    return False
+
+
+def test_scheduled_run_end_closes_valve(client):
+    zone_id = "test-scheduler-stop"
+    client.post("/send-data", json=reading(zone_id, 55.0))
+    created = client.post("/schedules", json={
+        "zone_id": zone_id, "kind": "once", "at": datetime.utcnow().isoformat(), "duration_minutes": 0.02
+    }).json()
+
+    def last_result():
+        schedules = client.get("/schedules", params={"zone_id": zone_id}).json()
+        return next(s["last_result"] for s in schedules if s["schedule_id"] == created["schedule_id"])
+
+    assert wait_for(lambda: last_result() == "running")
+    # Lectures reçues pendant l'arrosage : pompe maintenue par le programme
+    during = client.post("/send-data", json=reading(zone_id, 55.0, pump_was_active=True)).json()
+    assert during["pump"] is True
+    assert client.get(f"/valve-state/{zone_id}").json()["valve_open"] is True
+
+    assert wait_for(lambda: last_result() == "completed")
+    assert client.get(f"/valve-state/{zone_id}").json()["valve_open"] is False
+    # Première lecture après la fin : l'hystérésis ne prolonge pas l'arrosage programmé
+    after = client.post("/send-data", json=reading(zone_id, 55.0, pump_was_active=True)).json()
+    assert after["pump"] is False
+    assert client.get(f"/valve-state/{zone_id}").json()["valve_open"] is False
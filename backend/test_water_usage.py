@@ -0,0 +1,89 @@
+import asyncio
+from datetime import datetime, timedelta
+
+import pytest
+
+from water_usage import WaterUsageTracker
+
+START = datetime(2024, 6, 1, 6)
+
+
+class SlowTracker(WaterUsageTracker):
+    """Écritures lentes : laisse une commande concurrente s'intercaler."""
+
+    fail = False
+
+    async def persist(self, db, changes):
+        await asyncio.sleep(0.01)
+        if self.fail:
+            raise RuntimeError("MongoDB indisponible")
+        await super().persist(db, changes)
+
+
+def run(coroutine):
+    loop = asyncio.new_event_loop()
+    try:
+        return loop.run_until_complete(coroutine)
+    finally:
+        loop.close()
+
+
+async def usage_rows(db, zone_id: str):
+    events = [e async for e in db.valve_events.find({"zone_id": zone_id}).sort("at", 1)]
+    daily = [d async for d in db.water_usage_daily.find({"zone_id": zone_id})]
+    return events, daily
+
+
+def test_sources_are_combined(mock_db):
+    tracker = WaterUsageTracker(default_flow_rate=6.0)
+
+    async def scenario():
+        assert await tracker.transition(mock_db, "z", True, START, "decision")
+        assert await tracker.transition(mock_db, "z", True, START + timedelta(minutes=5), "schedule")
+        # La décision se ferme, le programme garde la vanne ouverte
+        assert await tracker.transition(mock_db, "z", False, START + timedelta(minutes=8), "decision")
+        assert not await tracker.transition(mock_db, "z", False, START + timedelta(minutes=10), "schedule")
+        return await usage_rows(mock_db, "z")
+
+    events, daily = run(scenario())
+    assert [(e["is_open"], e["source"]) for e in events] == [(True, "decision"), (False, "schedule")]
+    assert daily[0]["litres"] == pytest.approx(60.0)
+    assert daily[0]["open_seconds"] == 600
+
+
+def test_concurrent_transitions_are_counted_once(mock_db):
+    tracker = SlowTracker(default_flow_rate=6.0)
+
+    async def scenario():
+        await asyncio.gather(
+            tracker.transition(mock_db, "z", True, START, "decision"),
+            tracker.transition(mock_db, "z", True, START, "schedule"),
+        )
+        await asyncio.gather(
+            tracker.transition(mock_db, "z", False, START + timedelta(minutes=10), "decision"),
+            tracker.transition(mock_db, "z", False, START + timedelta(minutes=10), "schedule"),
+            tracker.transitions(mock_db, [("z", False), ("other", False)], START + timedelta(minutes=10), "manual"),
+        )
+        return await usage_rows(mock_db, "z")
+
+    events, daily = run(scenario())
+    assert [e["is_open"] for e in events] == [True, False]
+    assert len(daily) == 1
+    assert daily[0]["litres"] == pytest.approx(60.0)
+
+
+def test_failed_write_leaves_state_unchanged(mock_db):
+    tracker = SlowTracker()
+    tracker.fail = True
+
+    async def scenario():
+        with pytest.raises(RuntimeError):
+            await tracker.transition(mock_db, "z", True, START, "decision")
+        assert not tracker.is_open("z")
+        # L'écriture revient : la même commande est de nouveau une transition
+        tracker.fail = False
+        assert await tracker.transition(mock_db, "z", True, START, "decision")
+        return await usage_rows(mock_db, "z")
+
+    events, _ = run(scenario())
+    assert len(events) == 1
@@ -0,0 +1,236 @@
+"""
+Migration des bases SQLite des passerelles vers MongoDB.
+
+    python tools/migrate_sqlite.py passerelle-nord.db passerelle-sud.db
+    python tools/migrate_sqlite.py irrigation.db --source-name serre-1 --workers 8 --chunk-size 2000
+
+Schéma attendu : celui de backend/irrigation.db (tables `sensor_data` et
+`valve_states`). Les lignes sont lues par paquets (fetchmany), converties
+au format SensorData avec les mêmes valeurs par défaut que /send-data
+(profondeurs, lumière, vent), puis écrites par `insert_many` non ordonnés
+répartis sur un pool de threads.
+
+Reprise et idempotence :
+- l'_id de chaque lecture est déterministe : horodatage de created_at
+  (4 octets, l'ordre chronologique des _id est conservé) + empreinte de
+  (source, id SQLite) ; une lecture déjà migrée est ignorée (doublon) ;
+- le dernier id SQLite dont tous les paquets précédents sont écrits est
+  enregistré dans le fichier de reprise (--checkpoint) ; une relance
+  repart de là.
+
+Les lectures migrées ont des _id antérieurs aux curseurs déjà distribués
+par /history/changes : les clients en synchronisation incrémentale doivent
+recharger l'historique complet après un import.
+
+Les courbes d'étalonnage de la collection `calibrations` sont appliquées à
+chaque paquet (évaluation vectorisée, valeurs brutes gardées dans `raw`),
+sauf avec --sans-etalonnage.
+"""
+import argparse
+import calendar
+import collections
+import hashlib
+import json
+import os
+import sqlite3
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+from bson import ObjectId
+from pydantic import ValidationError
+from pymongo import MongoClient
+from pymongo.errors import BulkWriteError
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from models import SensorData, apply_reading_defaults  # noqa: E402
+from calibration import calibrate_batch, curves_from_documents  # noqa: E402
+
+RAINFALL_INTENSITIES = ("light", "moderate", "heavy", "none")
+DUPLICATE_KEY = 11000
+
+
+def parse_sqlite_datetime(value):
+    """CURRENT_TIMESTAMP de SQLite : UTC, sans fuseau."""
+    if isinstance(value, datetime):
+        return value
+    return datetime.fromisoformat(str(value).replace("Z", "")).replace(tzinfo=None)
+
+
+def deterministic_id(created_at, source, row_id):
+    """ObjectId stable : secondes UTC de created_at + 8 octets d'empreinte de (source, id)."""
+    seconds = calendar.timegm(created_at.utctimetuple())
+    digest = hashlib.blake2b(f"{source}:{row_id}".encode(), digest_size=8).digest()
+    return ObjectId(seconds.to_bytes(4, "big") + digest)
+
+
+def row_to_document(row, source):
+    """Ligne sensor_data SQLite → document sensor_data MongoDB."""
+    created_at = parse_sqlite_datetime(row["created_at"])
+    intensity = row["rainfall_intensity"] if "rainfall_intensity" in row.keys() else None
+    doc = {
+        "_id": deterministic_id(created_at, source, row["id"]),
+        "zone_id": row["zone_id"] or "zone-1",
+        "humidity": row["humidity"],
+        "temperature": row["temperature"],
+        "soil_moisture": row["soil_moisture"],
+        "rainfall": bool(row["rainfall"]),
+        "rainfall_intensity": intensity if intensity in RAINFALL_INTENSITIES else "none",
+        "created_at": created_at,
+    }
+    for field in ("soil_moisture_10cm", "soil_moisture_30cm", "soil_moisture_60cm", "light", "wind_speed"):
+        doc[field] = row[field] if field in row.keys() else None
+    apply_reading_defaults(doc)
+    return SensorData.model_validate(doc).model_dump(by_alias=True)
+
+
+def load_checkpoint(path):
+    if not os.path.exists(path):
+        return {}
+    with open(path, encoding="utf-8") as handle:
+        return json.load(handle)
+
+
+def save_checkpoint(path, checkpoint):
+    # Écriture atomique : un arrêt brutal ne laisse jamais un fichier tronqué
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as handle:
+        json.dump(checkpoint, handle, indent=2)
+    os.replace(tmp, path)
+
+
+def insert_chunk(collection, documents):
+    """insert_many non ordonné ; retourne (insérés, doublons)."""
+    try:
+        result = collection.insert_many(documents, ordered=False)
+        return len(result.inserted_ids), 0
+    except BulkWriteError as e:
+        errors = e.details.get("writeErrors", [])
+        other = [error for error in errors if error.get("code") != DUPLICATE_KEY]
+        if other:
+            raise
+        return e.details.get("nInserted", 0), len(errors)
+
+
+class SqliteMigration:
+    def __init__(self, db, workers, chunk_size, checkpoint_path, rejects_path=None, calibrate=True):
+        self.db = db
+        self.curves = curves_from_documents(db.calibrations.find({}, {"_id": 0})) if calibrate else {}
+        self.workers = workers
+        self.chunk_size = chunk_size
+        self.checkpoint_path = checkpoint_path
+        self.checkpoint = load_checkpoint(checkpoint_path)
+        self.rejects_path = rejects_path
+        self.stats = collections.Counter()
+
+    def migrate_sensor_data(self, path, source):
+        state = self.checkpoint.setdefault(source, {"path": os.path.abspath(path), "last_id": 0})
+        connection = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+        connection.row_factory = sqlite3.Row
+        cursor = connection.execute("SELECT * FROM sensor_data WHERE id > ? ORDER BY id", (state["last_id"],))
+
+        # Paquets en vol, dans l'ordre de lecture : (dernier id du paquet, future)
+        pending = collections.deque()
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            while True:
+                rows = cursor.fetchmany(self.chunk_size)
+                if not rows:
+                    break
+                documents = []
+                for row in rows:
+                    try:
+                        documents.append(row_to_document(row, source))
+                    except (ValidationError, TypeError, ValueError) as e:
+                        self.stats["rejected"] += 1
+                        self.reject(source, row, e)
+                self.stats["read"] += len(rows)
+                if self.curves:
+                    self.stats["calibrated"] += calibrate_batch(documents, self.curves)
+                future = pool.submit(insert_chunk, self.db.sensor_data, documents) if documents else None
+                pending.append((rows[-1]["id"], future))
+                # Contre-pression : pas plus de 2 paquets en attente par worker
+                while len(pending) >= 2 * self.workers:
+                    self._complete(pending.popleft(), state)
+            while pending:
+                self._complete(pending.popleft(), state)
+        connection.close()
+
+    def reject(self, source, row, error):
+        if self.rejects_path:
+            with open(self.rejects_path, "a", encoding="utf-8") as handle:
+                handle.write(json.dumps({"source": source, "row": dict(row), "error": str(error)}, default=str) + "\n")
+
+    def _complete(self, chunk, state):
+        last_id, future = chunk
+        if future is not None:
+            inserted, duplicates = future.result()
+            self.stats["inserted"] += inserted
+            self.stats["duplicates"] += duplicates
+        # Les paquets sont terminés dans l'ordre de lecture : point de reprise contigu
+        state["last_id"] = last_id
+        save_checkpoint(self.checkpoint_path, self.checkpoint)
+        print(f"   … id {last_id} | lues {self.stats['read']} | insérées {self.stats['inserted']} "
+              f"| doublons {self.stats['duplicates']} | rejetées {self.stats['rejected']}", end="\r")
+
+    def migrate_valve_states(self, path):
+        """État courant des vannes : gardé seulement s'il est plus récent que celui de MongoDB."""
+        connection = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+        connection.row_factory = sqlite3.Row
+        rows = connection.execute("SELECT zone_id, is_open, updated_at FROM valve_states").fetchall()
+        connection.close()
+        for row in rows:
+            updated_at = parse_sqlite_datetime(row["updated_at"])
+            current = self.db.valve_states.find_one({"zone_id": row["zone_id"]}, {"updated_at": 1})
+            if current and current.get("updated_at") and current["updated_at"] >= updated_at:
+                self.stats["valve_states_skipped"] += 1
+                continue
+            self.db.valve_states.update_one(
+                {"zone_id": row["zone_id"]},
+                {"$set": {"is_open": bool(row["is_open"]), "updated_at": updated_at}},
+                upsert=True
+            )
+            self.stats["valve_states_upserted"] += 1
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("sources", nargs="+", help="fichiers SQLite des passerelles")
+    parser.add_argument("--source-name", action="append", default=None,
+                        help="nom stable de chaque source (défaut: nom du fichier) ; entre dans le calcul des _id")
+    parser.add_argument("--mongodb-url", default=os.getenv("MONGODB_URL", "mongodb://localhost:27017"))
+    parser.add_argument("--database", default="irrigation")
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--chunk-size", type=int, default=1000)
+    parser.add_argument("--checkpoint", default="migration_checkpoint.json")
+    parser.add_argument("--rejects", default="migration_rejects.jsonl", help="lignes invalides (JSON lines)")
+    parser.add_argument("--sans-etalonnage", action="store_true",
+                        help="importer les valeurs brutes sans appliquer les courbes de `calibrations`")
+    args = parser.parse_args()
+
+    names = args.source_name or [os.path.splitext(os.path.basename(path))[0] for path in args.sources]
+    if len(names) != len(args.sources) or len(set(names)) != len(names):
+        parser.error("un --source-name unique est requis par fichier (les noms de fichier sont en double)")
+
+    client = MongoClient(args.mongodb_url, maxPoolSize=args.workers + 2)
+    db = client[args.database]
+    migration = SqliteMigration(db, args.workers, args.chunk_size, args.checkpoint, args.rejects,
+                                calibrate=not args.sans_etalonnage)
+    started = time.perf_counter()
+    for path, source in zip(args.sources, names):
+        print(f"📦 {source} ({path}) - reprise après l'id {migration.checkpoint.get(source, {}).get('last_id', 0)}")
+        migration.migrate_sensor_data(path, source)
+        migration.migrate_valve_states(path)
+        print()
+    elapsed = time.perf_counter() - started
+
+    stats = migration.stats
+    print("=" * 60)
+    print(f"📥 Lues: {stats['read']} | ✅ Insérées: {stats['inserted']} | 🔁 Doublons: {stats['duplicates']} "
+          f"| ❌ Rejetées: {stats['rejected']}")
+    if migration.curves:
+        print(f"📐 Valeurs étalonnées: {stats['calibrated']} ({len(migration.curves)} courbes)")
+    print(f"🚰 Vannes: {stats['valve_states_upserted']} mises à jour, {stats['valve_states_skipped']} plus anciennes")
+    print(f"⏱️  {elapsed:.1f}s ({stats['read'] / elapsed if elapsed else 0:.0f} lignes/s)")
+    print("=" * 60)
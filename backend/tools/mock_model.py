@@ -0,0 +1,131 @@
+"""
+Serveur de modèle local pour tester l'assistant IA sans clé ni réseau.
+
+    python tools/mock_model.py [--port 8787] [--latency 0.3] [--log prompts.jsonl]
+
+Répond à `POST /v1beta/models/<modèle>:generateContent` au format de l'API
+Gemini (celui de @google/genai) : le frontend s'y branche avec
+`ADVISOR_MODEL_URL=http://127.0.0.1:8787` dans `.env.local`. Le conseil
+renvoyé est déterministe, déduit du résumé de zone (/zones/{id}/digest)
+contenu dans l'invite ; `usageMetadata` estime les jetons (4 caractères par
+jeton) pour suivre la taille des invites. `--log` enregistre chaque invite
+reçue (JSON lines).
+"""
+import argparse
+import json
+import re
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+ROUTE = re.compile(r"^/v1(?:beta)?/models/(?P<model>[^/:]+):generateContent$")
+MOISTURE = re.compile(r"humidité (?P<value>[\d.]+) %")
+ANOMALIES = re.compile(r"anomalies : (?P<flags>[^·]+)")
+
+
+def estimate_tokens(text: str) -> int:
+    return max(1, len(text) // 4)
+
+
+def prompt_text(payload: dict) -> str:
+    return "\n".join(
+        part.get("text", "")
+        for content in payload.get("contents", [])
+        for part in content.get("parts", [])
+    )
+
+
+def advice_for(prompt: str) -> str:
+    """Conseil déterministe à partir du résumé de zone."""
+    anomalies = ANOMALIES.search(prompt)
+    if anomalies and anomalies.group("flags").strip() != "aucune":
+        return (f"⚠️ Capteurs suspects ({anomalies.group('flags').strip()}) : vérifiez les sondes "
+                "avant de vous fier à l'humidité mesurée.")
+    moisture = MOISTURE.search(prompt)
+    if moisture is None:
+        return "ℹ️ Pas encore de lecture pour cette zone : attendez les premières mesures."
+    value = float(moisture.group("value"))
+    if "sous le seuil" in prompt:
+        return f"🚨 Humidité de {value:.1f} % sous le seuil de la culture : lancez l'irrigation."
+    if "au-dessus du seuil" in prompt:
+        return f"💧 Humidité de {value:.1f} % au-dessus du seuil d'arrêt : suspendez l'irrigation."
+    return f"✅ Humidité de {value:.1f} % dans la plage de la culture : maintenez la stratégie actuelle."
+
+
+class MockModelHandler(BaseHTTPRequestHandler):
+    latency = 0.0
+    log_path = None
+
+    def _send(self, status: int, body: dict) -> None:
+        data = json.dumps(body, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(data)))
+        self.send_header("Access-Control-Allow-Origin", "*")
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_OPTIONS(self):
+        # Pré-vérification CORS du navigateur
+        self.send_response(204)
+        self.send_header("Access-Control-Allow-Origin", "*")
+        self.send_header("Access-Control-Allow-Methods", "POST, OPTIONS")
+        self.send_header("Access-Control-Allow-Headers", "*")
+        self.end_headers()
+
+    def do_POST(self):
+        match = ROUTE.match(self.path.split("?", 1)[0])
+        if match is None:
+            self._send(404, {"error": {"code": 404, "message": f"Route inconnue: {self.path}"}})
+            return
+        length = int(self.headers.get("Content-Length") or 0)
+        try:
+            payload = json.loads(self.rfile.read(length) or b"{}")
+        except json.JSONDecodeError as e:
+            self._send(400, {"error": {"code": 400, "message": str(e)}})
+            return
+
+        prompt = prompt_text(payload)
+        advice = advice_for(prompt)
+        if self.log_path:
+            with open(self.log_path, "a", encoding="utf-8") as handle:
+                handle.write(json.dumps({"model": match.group("model"), "prompt": prompt,
+                                         "characters": len(prompt)}, ensure_ascii=False) + "\n")
+        if self.latency:
+            time.sleep(self.latency)
+        prompt_tokens = estimate_tokens(prompt)
+        answer_tokens = estimate_tokens(advice)
+        self._send(200, {
+            "candidates": [{
+                "content": {"role": "model", "parts": [{"text": advice}]},
+                "finishReason": "STOP",
+                "index": 0,
+            }],
+            "usageMetadata": {
+                "promptTokenCount": prompt_tokens,
+                "candidatesTokenCount": answer_tokens,
+                "totalTokenCount": prompt_tokens + answer_tokens,
+            },
+            "modelVersion": match.group("model"),
+        })
+
+    def log_message(self, format, *args):
+        print(f"🤖 {self.address_string()} {format % args}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8787)
+    parser.add_argument("--latency", type=float, default=0.0, help="délai simulé de chaque réponse (s)")
+    parser.add_argument("--log", default=None, help="fichier JSON lines des invites reçues")
+    args = parser.parse_args()
+
+    MockModelHandler.latency = args.latency
+    MockModelHandler.log_path = args.log
+    server = ThreadingHTTPServer((args.host, args.port), MockModelHandler)
+    print(f"🤖 Modèle local sur http://{args.host}:{args.port} (ADVISOR_MODEL_URL)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    server.server_close()
@@ -0,0 +1,241 @@
+"""
+Rejoue des lectures réelles contre un backend de recette.
+
+Sources (lues en flux, jamais chargées entièrement en mémoire) :
+    sqlite:backend/irrigation.db     table sensor_data (schéma SQLite historique)
+    bson:dump/irrigation/sensor_data.bson     sortie de mongodump
+    jsonl:sensor_data.json                    sortie de mongoexport
+
+Exemples :
+    python tools/replay_traffic.py sqlite:irrigation.db --speed 100
+    python tools/replay_traffic.py sqlite:irrigation.db --speed max --record-baseline base.jsonl
+    python tools/replay_traffic.py sqlite:irrigation.db --speed max --baseline base.jsonl
+
+Chaque zone est rejouée dans l'ordre d'origine par un seul worker ; les zones
+sont réparties sur --concurrency workers. `pump_was_active` est renseigné avec
+la décision précédente de la zone, comme le fait le simulateur. Pour comparer
+à une référence, rejouer contre un backend vierge (les détecteurs par zone
+gardent un état).
+
+Le contrôle d'admission du backend (actif par défaut) limite chaque zone à
+ADMISSION_ZONE_RATE lectures/s : pour rejouer en accéléré, lancer le backend
+avec ADMISSION_ENABLED=0. Les réponses 429 sont comptées à part.
+"""
+import argparse
+import json
+import queue
+import sqlite3
+import sys
+import threading
+import time
+from datetime import datetime
+
+import requests
+
+PAYLOAD_FIELDS = (
+    "zone_id", "humidity", "temperature", "soil_moisture",
+    "soil_moisture_10cm", "soil_moisture_30cm", "soil_moisture_60cm",
+    "light", "wind_speed", "rainfall", "rainfall_intensity", "flow_rate",
+)
+
+
+def to_datetime(value):
+    if isinstance(value, datetime):
+        return value
+    if isinstance(value, str):
+        return datetime.fromisoformat(value.replace("Z", "+00:00")).replace(tzinfo=None)
+    return None
+
+
+def iter_sqlite(path):
+    connection = sqlite3.connect(path)
+    connection.row_factory = sqlite3.Row
+    try:
+        for row in connection.execute("SELECT * FROM sensor_data ORDER BY created_at, id"):
+            yield dict(row)
+    finally:
+        connection.close()
+
+
+def iter_bson(path):
+    import bson
+
+    with open(path, "rb") as handle:
+        yield from bson.decode_file_iter(handle)
+
+
+def iter_jsonl(path):
+    from bson import json_util
+
+    with open(path, encoding="utf-8") as handle:
+        for line in handle:
+            if line.strip():
+                yield json_util.loads(line)
+
+
+SOURCES = {"sqlite": iter_sqlite, "bson": iter_bson, "jsonl": iter_jsonl}
+
+
+def to_payload(doc):
+    payload = {field: doc[field] for field in PAYLOAD_FIELDS if doc.get(field) is not None}
+    payload.setdefault("zone_id", "zone-1")
+    payload["rainfall"] = bool(payload.get("rainfall", False))
+    if payload.get("rainfall_intensity") not in ("light", "moderate", "heavy", "none"):
+        payload["rainfall_intensity"] = "none"
+    return payload
+
+
+def load_baseline(path):
+    """Décisions de référence, compactées en un octet par lecture et par zone."""
+    baseline = {}
+    with open(path, encoding="utf-8") as handle:
+        for line in handle:
+            entry = json.loads(line)
+            decisions = baseline.setdefault(entry["zone_id"], bytearray())
+            index = entry["index"]
+            if len(decisions) <= index:
+                decisions.extend(b"\x02" * (index + 1 - len(decisions)))
+            decisions[index] = 1 if entry["pump"] else 0
+    return baseline
+
+
+class Replayer:
+    def __init__(self, url, concurrency, baseline=None, record_path=None):
+        self.url = url.rstrip("/") + "/send-data"
+        self.queues = [queue.Queue(maxsize=1000) for _ in range(concurrency)]
+        self.baseline = baseline
+        self.record = open(record_path, "w", encoding="utf-8") if record_path else None
+        self.lock = threading.Lock()
+        self.latencies = []
+        self.sent = 0
+        self.errors = 0
+        self.throttled = 0  # 429 du contrôle d'admission
+        self.mismatches = 0
+        self.mismatch_examples = []
+
+    def worker(self, work):
+        session = requests.Session()
+        pump_state = {}
+        zone_index = {}
+        while True:
+            payload = work.get()
+            if payload is None:
+                return
+            zone_id = payload["zone_id"]
+            payload["pump_was_active"] = pump_state.get(zone_id, False)
+            index = zone_index.get(zone_id, 0)
+            zone_index[zone_id] = index + 1
+
+            started = time.perf_counter()
+            try:
+                response = session.post(self.url, json=payload, timeout=30)
+                latency = time.perf_counter() - started
+                if response.status_code == 429:
+                    with self.lock:
+                        self.throttled += 1
+                    continue
+                response.raise_for_status()
+                pump = response.json()["pump"]
+            except Exception:
+                with self.lock:
+                    self.errors += 1
+                continue
+            pump_state[zone_id] = pump
+
+            with self.lock:
+                self.sent += 1
+                self.latencies.append(latency)
+                if self.record:
+                    self.record.write(json.dumps({"zone_id": zone_id, "index": index, "pump": pump}) + "\n")
+                if self.baseline is not None:
+                    expected = self.baseline.get(zone_id, b"")
+                    if index >= len(expected) or expected[index] != int(pump):
+                        self.mismatches += 1
+                        if len(self.mismatch_examples) < 10:
+                            self.mismatch_examples.append((zone_id, index, pump))
+
+    def run(self, docs, speed, limit=None):
+        threads = [threading.Thread(target=self.worker, args=(q,), daemon=True) for q in self.queues]
+        for t in threads:
+            t.start()
+
+        started = time.perf_counter()
+        first_ts = None
+        dispatched = 0
+        for doc in docs:
+            if limit is not None and dispatched >= limit:
+                break
+            payload = to_payload(doc)
+            ts = to_datetime(doc.get("created_at"))
+            if speed is not None and ts is not None:
+                # Respecter l'écart temporel d'origine divisé par le facteur d'accélération
+                first_ts = first_ts or ts
+                delay = (ts - first_ts).total_seconds() / speed - (time.perf_counter() - started)
+                if delay > 0:
+                    time.sleep(delay)
+            self.queues[hash(payload["zone_id"]) % len(self.queues)].put(payload)
+            dispatched += 1
+
+        for q in self.queues:
+            q.put(None)
+        for t in threads:
+            t.join()
+        if self.record:
+            self.record.close()
+        return time.perf_counter() - started
+
+    def report(self, elapsed):
+        latencies = sorted(self.latencies)
+
+        def pct(p):
+            return latencies[min(len(latencies) - 1, int(len(latencies) * p / 100))] * 1000 if latencies else 0.0
+
+        print("=" * 60)
+        print(f"📤 Lectures rejouées: {self.sent} | ❌ Erreurs: {self.errors}")
+        if self.throttled:
+            print(f"🚦 Refusées par le contrôle d'admission (429): {self.throttled} "
+                  "— relancer le backend avec ADMISSION_ENABLED=0")
+        print(f"⏱️  Durée: {elapsed:.1f}s | Débit atteint: {self.sent / elapsed if elapsed else 0:.1f} req/s")
+        print(f"📊 Latence p50: {pct(50):.1f} ms | p90: {pct(90):.1f} ms | p99: {pct(99):.1f} ms | max: {pct(100):.1f} ms")
+        if self.baseline is not None:
+            status = "✅" if self.mismatches == 0 else "⚠️"
+            print(f"{status} Décisions différentes de la référence: {self.mismatches}")
+            for zone_id, index, pump in self.mismatch_examples:
+                print(f"   {zone_id} #{index}: pompe={'ON' if pump else 'OFF'}")
+        print("=" * 60)
+
+
+def parse_speed(value):
+    if value == "max":
+        return None
+    speed = float(value.rstrip("x"))
+    if speed <= 0:
+        raise argparse.ArgumentTypeError("la vitesse doit être positive")
+    return speed
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("source", help="sqlite:<fichier.db> | bson:<fichier.bson> | jsonl:<fichier.json>")
+    parser.add_argument("--url", default="http://127.0.0.1:8000")
+    parser.add_argument("--speed", type=parse_speed, default=1.0, help="1, 100, ... ou 'max'")
+    parser.add_argument("--concurrency", type=int, default=8, help="Nombre de workers (zones en parallèle)")
+    parser.add_argument("--limit", type=int, help="Nombre maximal de lectures")
+    parser.add_argument("--baseline", help="Fichier de décisions de référence à vérifier")
+    parser.add_argument("--record-baseline", help="Enregistrer les décisions obtenues")
+    args = parser.parse_args()
+
+    kind, _, path = args.source.partition(":")
+    if kind not in SOURCES or not path:
+        parser.error("source attendue: sqlite:<chemin>, bson:<chemin> ou jsonl:<chemin>")
+
+    replayer = Replayer(
+        args.url,
+        args.concurrency,
+        baseline=load_baseline(args.baseline) if args.baseline else None,
+        record_path=args.record_baseline,
+    )
+    print(f"🔁 Rejeu de {args.source} vers {replayer.url} (vitesse: {'max' if args.speed is None else f'{args.speed:g}x'})")
+    elapsed = replayer.run(SOURCES[kind](path), args.speed, args.limit)
+    replayer.report(elapsed)
+    sys.exit(1 if replayer.mismatches or replayer.errors else 0)
@@ -0,0 +1,424 @@
+"""
+Test d'endurance du backend : trafic mixte soutenu pendant des heures.
+
+Le backend tourne dans ce processus (transport ASGI de httpx, sans réseau)
+pour que la mémoire et la latence de la boucle asyncio mesurées soient les
+siennes. Stockage :
+    --storage memory    MongoDB en mémoire (mongomock_motor) ; les lectures
+                        plus anciennes que --retention-minutes sont purgées
+                        pour que la base simulée ne soit pas comptée comme fuite
+    --storage mongodb   vraie base (MONGODB_URL, défaut localhost:27017)
+
+Exemples :
+    python tools/soak_test.py --duration 10m --zones 8 --rate 40
+    python tools/soak_test.py --duration 6h --storage mongodb --report soak.csv
+
+Chaque zone est simulée avec les capteurs de test/sensors.py. Toutes les
+--sample-interval secondes sont relevés : RSS, mémoire tracée par
+tracemalloc (totale et hors stockage simulé), curseurs MongoDB ouverts,
+tâches asyncio, retard de la boucle d'événements et latences HTTP.
+Le test échoue (code 1) si la mémoire croît au-delà de --growth-budget
+Mo/heure après la période de chauffe, si le p99 du retard de boucle
+dépasse --lag-budget-ms, ou si plus de 1 % des requêtes échouent.
+Le contrôle d'admission est coupé (ADMISSION_ENABLED=0) sauf avec
+--admission ; les réponses 429 sont comptées à part.
+
+tracemalloc ralentit fortement le backend (retard de boucle ~×10) : juger
+le retard de boucle avec --no-tracemalloc, et la croissance mémoire sur une
+chauffe assez longue pour remplir les tampons bornés (historique récent,
+fenêtres d'anomalies, cache de blocs décodés).
+"""
+import argparse
+import asyncio
+import csv
+import gc
+import json
+import os
+import random
+import resource
+import sys
+import time
+import tracemalloc
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+sys.path.append(os.path.join(os.path.dirname(BACKEND_DIR), "test"))
+
+from config import CONFIG_SIMULATION, obtenir_seuils_culture  # noqa: E402
+from sensors import (  # noqa: E402
+    CapteurDebitEau, CapteurHumidite, CapteurHumiditeAir, CapteurLumiere, CapteurPluie, CapteurTemperature,
+    CapteurVent
+)
+
+INTENSITES = {'légère': 'light', 'modérée': 'moderate', 'forte': 'heavy'}
+
+# Part de chaque type de requête dans le trafic
+TRAFFIC_MIX = (
+    ("send-data", 0.70),
+    ("history", 0.08),
+    ("history-changes", 0.08),
+    ("forecast", 0.05),
+    ("valve-state", 0.04),
+    ("toggle-valve", 0.03),
+    ("water-usage", 0.02),
+)
+
+
+def parse_duration(value):
+    units = {"s": 1, "m": 60, "h": 3600}
+    if value[-1] in units:
+        return float(value[:-1]) * units[value[-1]]
+    return float(value)
+
+
+def percentile(values, p):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p / 100))]
+
+
+def rss_mb():
+    try:
+        with open("/proc/self/statm") as handle:
+            return int(handle.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 1024 ** 2
+    except OSError:
+        # Hors Linux : pic de RSS seulement
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak / 1024 ** 2 if sys.platform == "darwin" else peak / 1024
+
+
+def growth_per_hour(samples, key):
+    """Pente (moindres carrés) de `key` en Mo/heure."""
+    points = [(s["elapsed_s"], s[key]) for s in samples if s.get(key) is not None]
+    if len(points) < 3:
+        return 0.0
+    mean_t = sum(t for t, _ in points) / len(points)
+    mean_v = sum(v for _, v in points) / len(points)
+    variance = sum((t - mean_t) ** 2 for t, _ in points)
+    if variance == 0:
+        return 0.0
+    slope = sum((t - mean_t) * (v - mean_v) for t, v in points) / variance
+    return slope * 3600
+
+
+class ZoneSimulator:
+    """Une zone simulée avec les capteurs du simulateur de test."""
+
+    def __init__(self, zone_id, saison):
+        self.zone_id = zone_id
+        self.saison = saison
+        self.heure = random.uniform(0, 24)
+        self.pompe = False
+        kc = obtenir_seuils_culture(CONFIG_SIMULATION['type_culture'])['kc']
+        self.capteurs = {
+            '10cm': CapteurHumidite(random.uniform(50, 70), "10cm", kc),
+            '30cm': CapteurHumidite(random.uniform(55, 75), "30cm", kc),
+            '60cm': CapteurHumidite(random.uniform(60, 80), "60cm", kc),
+            'air': CapteurHumiditeAir(),
+            'temperature': CapteurTemperature(),
+            'lumiere': CapteurLumiere(),
+            'pluie': CapteurPluie(),
+            'vent': CapteurVent(),
+            'debit': CapteurDebitEau(),
+        }
+
+    def reading(self, hours_per_reading):
+        self.heure = (self.heure + hours_per_reading) % 24
+        c = self.capteurs
+        pleut, intensite = c['pluie'].simuler()
+        vent = c['vent'].simuler()
+        temperature = c['temperature'].simuler(self.heure, self.saison)
+        lumiere = c['lumiere'].simuler(self.heure)
+        humidite_air = c['air'].simuler(self.saison, pleut)
+        profondeurs = {
+            p: c[p].simuler(300, temperature, lumiere, vent, self.pompe, pleut, humidite_air)
+            for p in ('10cm', '30cm', '60cm')
+        }
+        debit, _ = c['debit'].simuler(self.pompe)
+        return {
+            "zone_id": self.zone_id,
+            "humidity": humidite_air,
+            "temperature": temperature,
+            "soil_moisture": profondeurs['10cm'],
+            "soil_moisture_10cm": profondeurs['10cm'],
+            "soil_moisture_30cm": profondeurs['30cm'],
+            "soil_moisture_60cm": profondeurs['60cm'],
+            "light": lumiere,
+            "wind_speed": vent,
+            "rainfall": pleut,
+            "rainfall_intensity": INTENSITES.get(intensite, "none"),
+            "flow_rate": debit if self.pompe else None,
+            "pump_was_active": self.pompe,
+        }
+
+
+def use_memory_storage():
+    """Remplace la base par mongomock_motor avant l'import du backend."""
+    from mongomock_motor import AsyncMongoMockClient
+    import mongomock.collection
+
+    # mongomock ne connaît pas l'option `sort` des UpdateOne de pymongo >= 4.9
+    add_update = mongomock.collection.BulkOperationBuilder.add_update
+
+    def add_update_without_sort(self, *args, sort=None, **kwargs):
+        return add_update(self, *args, **kwargs)
+
+    mongomock.collection.BulkOperationBuilder.add_update = add_update_without_sort
+
+    import database
+    database.db = AsyncMongoMockClient()[database.DATABASE_NAME]
+
+
+class SoakTest:
+    def __init__(self, args, app, db):
+        self.args = args
+        self.app = app
+        self.db = db
+        self.zones = [ZoneSimulator(f"zone-{i + 1}", args.season) for i in range(args.zones)]
+        self.cursors = {}
+        self.latencies = []
+        self.lags = []
+        self.requests = 0
+        self.errors = 0
+        self.throttled = 0  # 429 du contrôle d'admission
+        self.total_requests = 0
+        self.total_errors = 0
+        self.samples = []
+        self.started = 0.0
+        self.baseline_snapshot = None
+        self.last_snapshot = None
+        # Incrémenté au début et à la fin de chaque relevé (bloquant)
+        self.sampling_generation = 0
+
+    async def request(self, client, kind):
+        zone = random.choice(self.zones)
+        if kind == "send-data":
+            response = await client.post("/send-data", json=zone.reading(self.args.sim_hours_per_reading))
+            if response.status_code == 200:
+                zone.pompe = response.json()["pump"]
+        elif kind == "history":
+            response = await client.get("/history", params={"zone_id": zone.zone_id, "format": "columnar"})
+        elif kind == "history-changes":
+            params = {"zone_id": zone.zone_id}
+            if self.cursors.get(zone.zone_id):
+                params["since"] = self.cursors[zone.zone_id]
+            response = await client.get("/history/changes", params=params)
+            if response.status_code == 200:
+                self.cursors[zone.zone_id] = response.json()["cursor"]
+        elif kind == "forecast":
+            response = await client.get("/forecast")
+        elif kind == "valve-state":
+            response = await client.get(f"/valve-state/{zone.zone_id}")
+        elif kind == "toggle-valve":
+            response = await client.post("/toggle-valve", json={"zone_id": zone.zone_id, "valve_open": not zone.pompe})
+        else:
+            response = await client.get("/water-usage", params={"zone_id": zone.zone_id})
+        return response.status_code
+
+    async def worker(self, client, deadline, interval):
+        kinds = [kind for kind, _ in TRAFFIC_MIX]
+        weights = [weight for _, weight in TRAFFIC_MIX]
+        next_at = time.perf_counter()
+        while time.perf_counter() < deadline:
+            next_at += interval
+            started = time.perf_counter()
+            try:
+                status = await self.request(client, random.choices(kinds, weights)[0])
+                failed = status >= 500
+                self.throttled += status == 429
+            except Exception:
+                failed = True
+            self.latencies.append(time.perf_counter() - started)
+            self.requests += 1
+            self.errors += failed
+            delay = next_at - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            else:
+                next_at = time.perf_counter()
+
+    async def lag_probe(self, deadline, interval=0.05):
+        loop = asyncio.get_running_loop()
+        while time.perf_counter() < deadline:
+            generation = self.sampling_generation
+            expected = loop.time() + interval
+            await asyncio.sleep(interval)
+            # Le relevé (snapshot tracemalloc, gc) bloque la boucle : ne pas le compter
+            if generation == self.sampling_generation:
+                self.lags.append(max(0.0, loop.time() - expected))
+
+    async def retention(self, deadline):
+        """Stockage en mémoire : purge des documents anciens (la base simulée n'est pas une fuite)."""
+        from datetime import datetime, timedelta
+
+        while time.perf_counter() < deadline:
+            await asyncio.sleep(min(60, self.args.sample_interval))
+            cutoff = datetime.utcnow() - timedelta(minutes=self.args.retention_minutes)
+            await self.db.sensor_data.delete_many({"created_at": {"$lt": cutoff}})
+            await self.db.valve_events.delete_many({"at": {"$lt": cutoff}})
+            await self.db.valve_audit.delete_many({"at": {"$lt": cutoff}})
+
+    async def open_cursors(self):
+        if self.args.storage != "mongodb":
+            return None
+        try:
+            status = await self.db.client.admin.command("serverStatus")
+            return status["metrics"]["cursor"]["open"]["total"]
+        except Exception:
+            return None
+
+    async def sample(self):
+        self.sampling_generation += 1
+        elapsed = time.perf_counter() - self.started
+        row = {
+            "elapsed_s": round(elapsed, 1),
+            "requests": self.requests,
+            "errors": self.errors,
+            "rps": round(self.requests / self.args.sample_interval, 1),
+            "p50_ms": round(percentile(self.latencies, 50) * 1000, 2),
+            "p99_ms": round(percentile(self.latencies, 99) * 1000, 2),
+            "lag_p99_ms": round(percentile(self.lags, 99) * 1000, 2),
+            "lag_max_ms": round(max(self.lags, default=0.0) * 1000, 2),
+            "rss_mb": round(rss_mb(), 2),
+            "traced_mb": None,
+            "backend_traced_mb": None,
+            "tasks": len(asyncio.all_tasks()),
+            "open_cursors": await self.open_cursors(),
+            "gc_objects": len(gc.get_objects()),
+        }
+        if tracemalloc.is_tracing():
+            snapshot = tracemalloc.take_snapshot()
+            row["traced_mb"] = round(tracemalloc.get_traced_memory()[0] / 1024 ** 2, 2)
+            backend = snapshot.filter_traces([tracemalloc.Filter(False, "*mongomock*"), tracemalloc.Filter(False, tracemalloc.__file__)])
+            row["backend_traced_mb"] = round(sum(stat.size for stat in backend.statistics("filename")) / 1024 ** 2, 2)
+            if self.baseline_snapshot is None and elapsed >= self.args.warmup:
+                self.baseline_snapshot = backend
+            self.last_snapshot = backend
+        self.total_requests += self.requests
+        self.total_errors += self.errors
+        self.requests = self.errors = 0
+        self.latencies = []
+        self.lags = []
+        self.samples.append(row)
+        self.sampling_generation += 1
+        print(f"⏱️  {row['elapsed_s']:>8.0f}s | {row['rps']:6.1f} req/s | p99 {row['p99_ms']:6.1f} ms | "
+              f"retard boucle p99 {row['lag_p99_ms']:6.1f} ms | RSS {row['rss_mb']:7.1f} Mo | "
+              f"tracé {row['backend_traced_mb'] if row['backend_traced_mb'] is not None else '-'} Mo")
+
+    async def sampler(self, deadline):
+        while time.perf_counter() < deadline:
+            await asyncio.sleep(min(self.args.sample_interval, max(0.0, deadline - time.perf_counter())))
+            await self.sample()
+
+    async def run(self):
+        import httpx
+
+        for handler in self.app.router.on_startup:
+            await handler()
+        self.started = time.perf_counter()
+        deadline = self.started + self.args.duration
+        interval = self.args.concurrency / self.args.rate
+        transport = httpx.ASGITransport(app=self.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://soak") as client:
+            jobs = [self.worker(client, deadline, interval) for _ in range(self.args.concurrency)]
+            jobs += [self.lag_probe(deadline), self.sampler(deadline)]
+            if self.args.storage == "memory":
+                jobs.append(self.retention(deadline))
+            await asyncio.gather(*jobs)
+        for handler in self.app.router.on_shutdown:
+            await handler()
+
+    def verdict(self):
+        failures = []
+        steady = [s for s in self.samples if s["elapsed_s"] >= self.args.warmup]
+        key = "backend_traced_mb" if tracemalloc.is_tracing() else "rss_mb"
+        growth = {"rss_mb": growth_per_hour(steady, "rss_mb"), key: growth_per_hour(steady, key)}
+        if len(steady) >= 3:
+            third = max(1, len(steady) // 3)
+            first = sum(s[key] for s in steady[:third]) / third
+            last = sum(s[key] for s in steady[-third:]) / third
+            # Croissance soutenue : pente au-delà du budget et dernier tiers au-dessus du premier
+            if growth[key] > self.args.growth_budget and last > first:
+                failures.append(f"mémoire ({key}) en croissance de {growth[key]:.1f} Mo/h "
+                                f"(budget {self.args.growth_budget} Mo/h, {first:.1f} → {last:.1f} Mo)")
+        else:
+            failures.append("trop peu d'échantillons après la chauffe pour juger la croissance mémoire")
+        worst_lag = max((s["lag_p99_ms"] for s in steady), default=0.0)
+        if worst_lag > self.args.lag_budget_ms:
+            failures.append(f"retard de boucle p99 {worst_lag:.1f} ms > budget {self.args.lag_budget_ms} ms")
+        if self.total_requests and self.total_errors / self.total_requests > 0.01:
+            failures.append(f"{self.total_errors} requêtes en échec sur {self.total_requests}")
+        return failures, growth, worst_lag
+
+    def top_growth(self, limit=10):
+        if self.baseline_snapshot is None or self.last_snapshot is None:
+            return []
+        stats = self.last_snapshot.compare_to(self.baseline_snapshot, "lineno")
+        return [str(stat) for stat in stats[:limit]]
+
+
+def write_report(path, samples):
+    if path.endswith(".json"):
+        with open(path, "w", encoding="utf-8") as handle:
+            json.dump(samples, handle, indent=2)
+        return
+    with open(path, "w", newline="", encoding="utf-8") as handle:
+        writer = csv.DictWriter(handle, fieldnames=list(samples[0]))
+        writer.writeheader()
+        writer.writerows(samples)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--duration", type=parse_duration, default=parse_duration("10m"), help="ex: 90s, 30m, 6h")
+    parser.add_argument("--storage", choices=("memory", "mongodb"), default="memory")
+    parser.add_argument("--zones", type=int, default=8)
+    parser.add_argument("--rate", type=float, default=40, help="requêtes par seconde (toutes zones)")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--season", default="ete", choices=("printemps", "ete", "automne", "hiver"))
+    parser.add_argument("--sim-hours-per-reading", type=float, default=0.25)
+    parser.add_argument("--sample-interval", type=float, default=30)
+    parser.add_argument("--warmup", type=parse_duration, default=None, help="défaut: 10 %% de la durée (min 60s)")
+    parser.add_argument("--retention-minutes", type=float, default=10)
+    parser.add_argument("--growth-budget", type=float, default=5.0, help="Mo/heure")
+    parser.add_argument("--lag-budget-ms", type=float, default=100.0)
+    parser.add_argument("--no-tracemalloc", action="store_true")
+    parser.add_argument("--admission", action="store_true",
+                        help="garder le contrôle d'admission (429 au-delà de ADMISSION_ZONE_RATE par zone)")
+    parser.add_argument("--report", default="soak_report.csv", help=".csv ou .json")
+    args = parser.parse_args()
+    if args.warmup is None:
+        args.warmup = min(args.duration / 2, max(60.0, args.duration * 0.1))
+
+    if args.storage == "memory":
+        use_memory_storage()
+    if not args.no_tracemalloc:
+        tracemalloc.start(1)
+
+    if not args.admission:
+        os.environ["ADMISSION_ENABLED"] = "0"
+    import main  # noqa: E402  (après le choix du stockage et de l'admission)
+
+    print(f"🧪 Test d'endurance: {args.duration:.0f}s, {args.zones} zones, {args.rate:g} req/s, stockage {args.storage}")
+    test = SoakTest(args, main.app, main.db)
+    asyncio.run(test.run())
+
+    write_report(args.report, test.samples)
+    failures, growth, worst_lag = test.verdict()
+    print("=" * 60)
+    print(f"📤 Requêtes: {test.total_requests} | ❌ Erreurs: {test.total_errors}")
+    if test.throttled:
+        print(f"🚦 Refusées par le contrôle d'admission (429): {test.throttled}")
+    print(f"📈 Croissance après chauffe: " + " | ".join(f"{k} {v:+.2f} Mo/h" for k, v in growth.items()))
+    print(f"🐢 Pire retard de boucle p99: {worst_lag:.1f} ms")
+    for line in test.top_growth():
+        print(f"   {line}")
+    print(f"📄 Série temporelle: {args.report}")
+    if failures:
+        for failure in failures:
+            print(f"❌ {failure}")
+        print("=" * 60)
+        sys.exit(1)
+    print("✅ Aucune croissance mémoire ni retard de boucle au-delà des budgets")
+    print("=" * 60)
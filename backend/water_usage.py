@@ -0,0 +1,288 @@
+"""
+Comptage incrémental de l'eau consommée par zone.
+
+Chaque ouverture/fermeture de vanne est journalisée dans `valve_events`.
+À la fermeture, le volume (débit × durée) est ajouté par `$inc` aux
+compteurs journaliers `water_usage_daily` : les rapports ne relisent jamais
+l'historique brut.
+
+Les sources de commande (`decision`, `schedule`, `manual`) sont suivies
+séparément : la vanne comptée est ouverte si l'une d'elles la veut ouverte.
+Une commande manuelle remplace les autres sources (priorité manuelle, voir
+actuation.py) ; une commande automatique met fin à la source manuelle.
+L'état en mémoire n'est modifié qu'une fois les écritures faites ; un
+verrou par zone sérialise calcul, écritures et mise à jour, pour que deux
+commandes simultanées (décision, programme, commande manuelle) ne partent
+pas du même état.
+"""
+import asyncio
+import os
+from contextlib import AsyncExitStack
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from pymongo import UpdateOne
+
+# Débit par défaut d'une électrovanne (L/min), comme CapteurDebitEau du simulateur
+DEFAULT_FLOW_RATE_LPM = float(os.getenv("DEFAULT_FLOW_RATE_LPM", "8.5"))
+
+
+def day_key(at: datetime) -> str:
+    return at.strftime("%Y-%m-%d")
+
+
+def split_by_day(start: datetime, end: datetime) -> List[Tuple[str, float]]:
+    """Découpe l'intervalle [start, end] en secondes par jour (UTC)."""
+    slices = []
+    cursor = start
+    while cursor < end:
+        midnight = datetime(cursor.year, cursor.month, cursor.day) + timedelta(days=1)
+        stop = min(end, midnight)
+        slices.append((day_key(cursor), (stop - cursor).total_seconds()))
+        cursor = stop
+    return slices
+
+
+MANUAL_SOURCE = "manual"
+
+
+class ZoneValve:
+    """État courant de la vanne d'une zone et débits mesurés pendant l'ouverture."""
+
+    __slots__ = ("is_open", "sources", "opened_at", "closed_at", "flow_sum", "flow_count")
+
+    def __init__(self):
+        self.is_open = False
+        self.sources: Dict[str, bool] = {}  # État demandé par chaque source de commande
+        self.opened_at: Optional[datetime] = None
+        self.closed_at: Optional[datetime] = None  # Fin du dernier arrosage
+        self.flow_sum = 0.0
+        self.flow_count = 0
+
+
+class ValveTransition:
+    """Changement calculé sans toucher l'état : écritures à faire, puis `apply`."""
+
+    __slots__ = ("zone_id", "sources", "is_open", "at", "event", "increments")
+
+    def __init__(self, zone_id: str, sources: Dict[str, bool], is_open: bool, at: datetime):
+        self.zone_id = zone_id
+        self.sources = sources
+        self.is_open = is_open
+        self.at = at
+        self.event: Optional[dict] = None  # None : sources changées, vanne comptée inchangée
+        self.increments: List[UpdateOne] = []
+
+
+class WaterUsageTracker:
+    def __init__(self, default_flow_rate: float = DEFAULT_FLOW_RATE_LPM):
+        self.default_flow_rate = default_flow_rate
+        self.flow_rates: Dict[str, float] = {}  # Débit configuré par zone (L/min)
+        self.zones: Dict[str, ZoneValve] = {}
+        self.locks: Dict[str, asyncio.Lock] = {}
+
+    def _lock(self, zone_id: str) -> asyncio.Lock:
+        lock = self.locks.get(zone_id)
+        if lock is None:
+            lock = self.locks[zone_id] = asyncio.Lock()
+        return lock
+
+    def _zone(self, zone_id: str) -> ZoneValve:
+        valve = self.zones.get(zone_id)
+        if valve is None:
+            valve = self.zones[zone_id] = ZoneValve()
+        return valve
+
+    def set_flow_rate(self, zone_id: str, litres_per_minute: Optional[float]) -> None:
+        if litres_per_minute is None:
+            self.flow_rates.pop(zone_id, None)
+        else:
+            self.flow_rates[zone_id] = litres_per_minute
+
+    def is_open(self, zone_id: str) -> bool:
+        valve = self.zones.get(zone_id)
+        return valve is not None and valve.is_open
+
+    def valve_times(self, zone_id: str) -> Tuple[Optional[datetime], Optional[datetime]]:
+        """(ouverture de l'arrosage en cours, fin du dernier arrosage) ; None si inconnues."""
+        valve = self.zones.get(zone_id)
+        if valve is None:
+            return None, None
+        return (valve.opened_at if valve.is_open else None), valve.closed_at
+
+    def record_flow(self, zone_id: str, litres_per_minute: float) -> None:
+        """Débit mesuré par un débitmètre pendant l'ouverture de la vanne."""
+        valve = self.zones.get(zone_id)
+        if valve is not None and valve.is_open:
+            valve.flow_sum += litres_per_minute
+            valve.flow_count += 1
+
+    def _rate(self, zone_id: str, valve: ZoneValve) -> float:
+        if valve.flow_count:
+            return valve.flow_sum / valve.flow_count
+        return self.flow_rates.get(zone_id, self.default_flow_rate)
+
+    def _open_usage(self, zone_id: str, valve: ZoneValve, now: datetime) -> List[Tuple[str, float, float]]:
+        rate = self._rate(zone_id, valve)
+        return [(day, seconds, rate * seconds / 60) for day, seconds in split_by_day(valve.opened_at, now)]
+
+    def record_transition(self, zone_id: str, is_open: bool, at: datetime,
+                          source: str) -> Optional[ValveTransition]:
+        """
+        Calcule la commande d'une source sans modifier l'état en mémoire :
+        écritures à faire (événement, incréments journaliers) si la vanne
+        comptée change, à appliquer ensuite avec `apply`. None si rien ne change.
+        """
+        valve = self._zone(zone_id)
+        if source == MANUAL_SOURCE:
+            sources = {source: is_open}
+        else:
+            sources = {name: state for name, state in valve.sources.items() if name != MANUAL_SOURCE}
+            sources[source] = is_open
+        if sources == valve.sources:
+            return None
+
+        change = ValveTransition(zone_id, sources, any(sources.values()), at)
+        if change.is_open == valve.is_open:
+            return change
+        change.event = {"zone_id": zone_id, "is_open": change.is_open, "source": source, "at": at}
+        if not change.is_open:
+            usage = self._open_usage(zone_id, valve, at) if valve.opened_at else []
+            change.event["litres"] = round(sum(litres for _, _, litres in usage), 3)
+            change.increments = [
+                UpdateOne(
+                    {"zone_id": zone_id, "day": day},
+                    {"$inc": {"litres": litres, "open_seconds": seconds}},
+                    upsert=True
+                )
+                for day, seconds, litres in usage
+            ]
+        return change
+
+    def apply(self, changes: List[ValveTransition]) -> None:
+        """Reporte en mémoire des transitions dont les écritures ont réussi."""
+        for change in changes:
+            valve = self._zone(change.zone_id)
+            valve.sources = change.sources
+            if change.event is None:
+                continue
+            valve.is_open = change.is_open
+            if change.is_open:
+                valve.opened_at = change.at
+                valve.flow_sum = 0.0
+                valve.flow_count = 0
+            else:
+                valve.opened_at = None
+                valve.closed_at = change.at
+
+    async def transition(self, db: AsyncIOMotorDatabase, zone_id: str, is_open: bool,
+                         at: datetime, source: str) -> bool:
+        """
+        Enregistre la commande d'une source et retourne l'état compté de la
+        vanne (ouverte si une source la veut ouverte), à appliquer au relais.
+        """
+        async with self._lock(zone_id):
+            await self._transitions(db, [(zone_id, is_open)], at, source)
+            return self.is_open(zone_id)
+
+    async def transitions(self, db: AsyncIOMotorDatabase, commands: List[Tuple[str, bool]],
+                          at: datetime, source: str) -> None:
+        """Commandes d'une même source sur plusieurs zones, écrites en un seul lot."""
+        async with AsyncExitStack() as stack:
+            # Ordre fixe : pas d'interblocage entre deux lots qui se recouvrent
+            for zone_id in sorted({zone_id for zone_id, _ in commands}):
+                await stack.enter_async_context(self._lock(zone_id))
+            await self._transitions(db, commands, at, source)
+
+    async def _transitions(self, db: AsyncIOMotorDatabase, commands: List[Tuple[str, bool]],
+                           at: datetime, source: str) -> None:
+        """Calcul, écritures puis mise à jour en mémoire ; verrous des zones déjà pris."""
+        changes = []
+        for zone_id, is_open in commands:
+            change = self.record_transition(zone_id, is_open, at, source)
+            if change is not None:
+                changes.append(change)
+        if changes:
+            await self.persist(db, changes)
+            self.apply(changes)
+
+    @staticmethod
+    async def persist(db: AsyncIOMotorDatabase, changes: List[ValveTransition]) -> None:
+        """Écrit un lot de transitions : un insert_many et un bulk_write au plus."""
+        events = [change.event for change in changes if change.event is not None]
+        increments = [op for change in changes for op in change.increments]
+        if events:
+            await db.valve_events.insert_many(events, ordered=False)
+        if increments:
+            await db.water_usage_daily.bulk_write(increments, ordered=False)
+
+    async def load(self, db: AsyncIOMotorDatabase) -> None:
+        """Restaure les vannes ouvertes (et la fin du dernier arrosage) depuis le dernier événement de chaque zone."""
+        await db.valve_events.create_index([("zone_id", 1), ("at", -1)])
+        await db.water_usage_daily.create_index([("zone_id", 1), ("day", 1)], unique=True)
+        pipeline = [
+            {"$sort": {"zone_id": 1, "at": -1}},
+            {"$group": {"_id": "$zone_id", "is_open": {"$first": "$is_open"}, "at": {"$first": "$at"},
+                        "source": {"$first": "$source"}}},
+        ]
+        async for last in db.valve_events.aggregate(pipeline):
+            valve = self._zone(last["_id"])
+            if last["is_open"]:
+                valve.is_open = True
+                valve.sources = {last.get("source") or MANUAL_SOURCE: True}
+                valve.opened_at = last["at"]
+            else:
+                valve.closed_at = last["at"]
+
+    async def report(self, db: AsyncIOMotorDatabase, zone_id: Optional[str], start: str, end: str,
+                     period: str = "day", now: Optional[datetime] = None) -> dict:
+        """
+        Consommation par zone et par période (`day`, `month` ou `total`)
+        entre les jours `start` et `end` inclus, au format AAAA-MM-JJ.
+        """
+        query = {"day": {"$gte": start, "$lte": end}}
+        if zone_id:
+            query["zone_id"] = zone_id
+        rows = [
+            (r["zone_id"], r["day"], r.get("litres", 0.0), r.get("open_seconds", 0.0))
+            async for r in db.water_usage_daily.find(query)
+        ]
+
+        # Ajouter les vannes encore ouvertes (volume non encore compté)
+        now = now or datetime.utcnow()
+        for open_zone, valve in self.zones.items():
+            if valve.is_open and valve.opened_at and (zone_id is None or open_zone == zone_id):
+                for day, seconds, litres in self._open_usage(open_zone, valve, now):
+                    if start <= day <= end:
+                        rows.append((open_zone, day, litres, seconds))
+
+        zones: Dict[str, Dict[str, dict]] = {}
+        for row_zone, day, litres, seconds in rows:
+            key = {"day": day, "month": day[:7]}.get(period, f"{start}/{end}")
+            bucket = zones.setdefault(row_zone, {}).setdefault(key, {"litres": 0.0, "open_seconds": 0.0})
+            bucket["litres"] += litres
+            bucket["open_seconds"] += seconds
+
+        return {
+            "start": start,
+            "end": end,
+            "period": period,
+            "zones": {
+                row_zone: {
+                    "total_litres": round(sum(b["litres"] for b in periods.values()), 2),
+                    "periods": [
+                        {
+                            "period": key,
+                            "litres": round(b["litres"], 2),
+                            "open_minutes": round(b["open_seconds"] / 60, 1),
+                        }
+                        for key, b in sorted(periods.items())
+                    ],
+                }
+                for row_zone, periods in sorted(zones.items())
+            },
+        }
+
+
+water_usage = WaterUsageTracker()
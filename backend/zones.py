@@ -0,0 +1,132 @@
+"""
+Registre des zones (culture, saison, débit, capteurs, groupes).
+
+La collection `zones` est la source de vérité ; chaque worker en garde un
+index en mémoire par zone et par groupe, avec les seuils effectifs déjà
+calculés : la décision résout les seuils d'une zone par simple lecture de
+dictionnaire, sans requête par lecture.
+"""
+import asyncio
+import os
+from typing import Callable, Dict, Iterable, List, Optional, Set, Tuple
+
+from motor.motor_asyncio import AsyncIOMotorDatabase
+
+from crops import obtenir_seuils_intelligents
+from evapotranspiration import crop_coefficient
+from irrigation_logic import SEUIL_BAS, SEUIL_HAUT
+
+# Rechargement périodique (prise en compte des modifications faites par d'autres workers)
+ZONES_REFRESH_SECONDS = float(os.getenv("ZONES_REFRESH_SECONDS", "30"))
+
+ZoneListener = Callable[[str, Optional[dict]], None]
+
+
+def zone_groups(zone: dict) -> Set[str]:
+    """Groupes explicites de la zone, plus un groupe implicite par culture."""
+    groups = set(zone.get("groups") or [])
+    if zone.get("crop"):
+        groups.add(f"crop:{zone['crop']}")
+    return groups
+
+
+class ZoneRegistry:
+    def __init__(self):
+        self.zones: Dict[str, dict] = {}
+        self.groups: Dict[str, Set[str]] = {}
+        self.thresholds: Dict[str, Tuple[float, float]] = {}
+        self.listeners: List[ZoneListener] = []
+        self._task: Optional[asyncio.Task] = None
+
+    def subscribe(self, listener: ZoneListener) -> None:
+        """`listener(zone_id, zone)` est appelé à chaque changement (zone=None si supprimée)."""
+        self.listeners.append(listener)
+
+    def thresholds_for(self, zone_id: str) -> Tuple[float, float]:
+        """Seuils (déclenchement, arrêt) effectifs de la zone."""
+        return self.thresholds.get(zone_id, (SEUIL_BAS, SEUIL_HAUT))
+
+    def crop_coefficient_for(self, zone_id: str) -> float:
+        """Kc FAO-56 (mi-saison) de la culture de la zone ; 1.0 sans culture."""
+        zone = self.zones.get(zone_id)
+        return crop_coefficient(zone.get("crop")) if zone else 1.0
+
+    def get(self, zone_id: str) -> Optional[dict]:
+        return self.zones.get(zone_id)
+
+    def zones_in_groups(self, groups: Iterable[str]) -> Set[str]:
+        selected = set()
+        for group in groups:
+            selected |= self.groups.get(group, set())
+        return selected
+
+    def _index(self, zone: dict) -> None:
+        zone_id = zone["zone_id"]
+        self._unindex(zone_id)
+        self.zones[zone_id] = zone
+        for group in zone_groups(zone):
+            self.groups.setdefault(group, set()).add(zone_id)
+        if zone.get("crop"):
+            seuils = obtenir_seuils_intelligents(zone["crop"], zone.get("season"))
+            self.thresholds[zone_id] = (seuils["seuil_declenchement"], seuils["seuil_arret"])
+        for listener in self.listeners:
+            listener(zone_id, zone)
+
+    def _unindex(self, zone_id: str) -> None:
+        previous = self.zones.pop(zone_id, None)
+        self.thresholds.pop(zone_id, None)
+        if previous is None:
+            return
+        for group in zone_groups(previous):
+            members = self.groups.get(group)
+            if members is not None:
+                members.discard(zone_id)
+                if not members:
+                    del self.groups[group]
+
+    async def upsert(self, db: AsyncIOMotorDatabase, zone: dict) -> dict:
+        await db.zones.replace_one({"zone_id": zone["zone_id"]}, zone, upsert=True)
+        zone.pop("_id", None)
+        self._index(zone)
+        return zone
+
+    async def remove(self, db: AsyncIOMotorDatabase, zone_id: str) -> bool:
+        result = await db.zones.delete_one({"zone_id": zone_id})
+        if zone_id in self.zones:
+            self._unindex(zone_id)
+            for listener in self.listeners:
+                listener(zone_id, None)
+        return result.deleted_count > 0
+
+    async def load(self, db: AsyncIOMotorDatabase) -> None:
+        """Reconstruit l'index depuis la collection `zones`."""
+        loaded = {zone["zone_id"]: zone async for zone in db.zones.find({}, {"_id": 0})}
+        for zone_id in list(self.zones):
+            if zone_id not in loaded:
+                self._unindex(zone_id)
+                for listener in self.listeners:
+                    listener(zone_id, None)
+        for zone_id, zone in loaded.items():
+            if self.zones.get(zone_id) != zone:
+                self._index(zone)
+
+    async def _refresh_loop(self, db: AsyncIOMotorDatabase) -> None:
+        while True:
+            await asyncio.sleep(ZONES_REFRESH_SECONDS)
+            try:
+                await self.load(db)
+            except Exception as e:
+                print(f"Registre des zones: échec du rechargement - {e}")
+
+    async def start(self, db: AsyncIOMotorDatabase) -> None:
+        await db.zones.create_index("zone_id", unique=True)
+        await self.load(db)
+        self._task = asyncio.create_task(self._refresh_loop(db))
+
+    async def stop(self) -> None:
+        if self._task:
+            self._task.cancel()
+            self._task = None
+
+
+zone_registry = ZoneRegistry()
@@ -4,7 +4,7 @@ const API_BASE_URL = 'http://127.0.0.1:8000';
 
 // Backend response now matches frontend format
 interface BackendSensorData {
-  id: number;
+  id: string;
   zone_id: string;
   timestamp: number;
   moisture: number;
@@ -20,31 +20,60 @@ interface BackendSensorData {
   created_at: string;
 }
 
-export async function fetchZoneHistory(zoneId: string): Promise<SensorData[]> {
+interface BackendHistoryChanges {
+  zone_id: string;
+  items: BackendSensorData[];
+  cursor: string | null;
+  has_more: boolean;
+}
+
+export interface ZoneHistoryChanges {
+  items: SensorData[];
+  cursor: string | null;
+  hasMore: boolean;
+}
+
+// Backend data is now in the correct format - just pick the fields
+function toSensorData(d: BackendSensorData): SensorData {
+  return {
+    id: d.id,
+    timestamp: d.timestamp,
+    moisture: d.moisture,
+    temperature: d.temperature,
+    humidity: d.humidity,
+    soilMoisture10cm: d.soilMoisture10cm,
+    soilMoisture30cm: d.soilMoisture30cm,
+    soilMoisture60cm: d.soilMoisture60cm,
+    light: d.light,
+    windSpeed: d.windSpeed,
+    rainfall: d.rainfall,
+    rainfallIntensity: d.rainfallIntensity
+  };
+}
+
+// Only the readings inserted after `since` (oldest first); without a cursor,
+// the latest readings. Returns null on error so the caller keeps its cursor.
+export async function fetchZoneHistoryChanges(
+  zoneId: string,
+  since: string | null,
+  limit = 100
+): Promise<ZoneHistoryChanges | null> {
   try {
-    const response = await fetch(`${API_BASE_URL}/history?zone_id=${zoneId}`);
+    const params = new URLSearchParams({ zone_id: zoneId, limit: String(limit) });
+    if (since) params.set('since', since);
+    const response = await fetch(`${API_BASE_URL}/history/changes?${params}`);
     if (!response.ok) {
       throw new Error(`HTTP error! status: ${response.status}`);
     }
-    const backendData: BackendSensorData[] = await response.json();
-    
-    // Backend data is now in the correct format - just return it
-    return backendData.map(d => ({
-      timestamp: d.timestamp,
-      moisture: d.moisture,
-      temperature: d.temperature,
-      humidity: d.humidity,
-      soilMoisture10cm: d.soilMoisture10cm,
-      soilMoisture30cm: d.soilMoisture30cm,
-      soilMoisture60cm: d.soilMoisture60cm,
-      light: d.light,
-      windSpeed: d.windSpeed,
-      rainfall: d.rainfall,
-      rainfallIntensity: d.rainfallIntensity
-    }));
+    const changes: BackendHistoryChanges = await response.json();
+    return {
+      items: changes.items.map(toSensorData),
+      cursor: changes.cursor,
+      hasMore: changes.has_more
+    };
   } catch (error) {
-    console.error('Error fetching zone history:', error);
-    return [];
+    console.error('Error fetching zone history changes:', error);
+    return null;
   }
 }
 
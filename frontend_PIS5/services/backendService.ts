@@ -1,7 +1,8 @@
 import { Zone, CropType, WeatherCondition, SensorData } from '../types';
-import { fetchZoneHistory } from './apiService';
+import { fetchZoneHistoryChanges } from './apiService';
 
 const API_BASE_URL = 'http://127.0.0.1:8000';
+const MAX_HISTORY = 100; // Taille du ring sensorHistory par zone
 
 type Listener = (zones: Zone[], weather: WeatherCondition) => void;
 
@@ -12,6 +13,7 @@ class BackendService {
   private intervalId: number | null = null;
   private isRunning = false;
   private pollRate = 3000; // Poll backend every 3 seconds
+  private historyCursors: Record<string, string | null> = {}; // Curseur delta-sync par zone
 
   constructor() {
     this.initializeZones();
@@ -192,13 +194,22 @@ class BackendService {
         const isValveOpen = valveData.valve_open || false;
         console.log(`💧 [BackendService] Valve state for ${zone.id}: ${isValveOpen ? 'OPEN (Irrigation active)' : 'CLOSED (Irrigation inactive)'}`);
         
-        const history = await fetchZoneHistory(zone.id);
-        console.log(`📊 [BackendService] Received ${history.length} records for ${zone.id}`);
+        // Delta-sync : seulement les lectures insérées depuis le dernier curseur
+        let changes = await fetchZoneHistoryChanges(zone.id, this.historyCursors[zone.id] ?? null, MAX_HISTORY);
+        if (!changes) continue;
+        // Plus de nouvelles lectures que le ring : le remplacer par les plus récentes
+        const replaceHistory = changes.hasMore;
+        if (replaceHistory) {
+          changes = await fetchZoneHistoryChanges(zone.id, null, MAX_HISTORY);
+          if (!changes) continue;
+        }
+        this.historyCursors[zone.id] = changes.cursor;
+        console.log(`📊 [BackendService] Received ${changes.items.length} new records for ${zone.id}`);
         
-        if (history.length > 0) {
+        if (changes.items.length > 0) {
           // Update zone with backend data
-          // IMPORTANT: history[0] est le plus récent (ordre décroissant du backend)
-          const currentReading = history[0];
+          // Les lectures arrivent du plus ancien au plus récent
+          const currentReading = changes.items[changes.items.length - 1];
           console.log('📡 [BackendService] Latest reading:', {
             temp: currentReading.temperature,
             humidity: currentReading.humidity,
@@ -227,10 +238,16 @@ class BackendService {
           // Update zone - CRÉER UN NOUVEAU TABLEAU pour que React détecte le changement
           const zoneIndex = this.zones.findIndex(z => z.id === zone.id);
           if (zoneIndex !== -1) {
+            // Fusionner les nouvelles lectures dans le ring (du plus ancien au plus récent) ;
+            // la fenêtre relue avant le curseur est dédoublonnée par id
+            const previous = replaceHistory ? [] : this.zones[zoneIndex].sensorHistory;
+            const known = new Set(previous.map(r => r.id));
+            const merged = [...previous, ...changes.items.filter(r => !known.has(r.id))]
+              .sort((a, b) => a.timestamp - b.timestamp);
             const updatedZone = {
               ...this.zones[zoneIndex],
               currentReading,
-              sensorHistory: history.reverse(), // Inverser pour avoir du plus ancien au plus récent
+              sensorHistory: merged.slice(-MAX_HISTORY),
               status,
               isValveOpen  // Ajouter l'état de la valve
             };
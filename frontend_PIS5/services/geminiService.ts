@@ -1,12 +1,27 @@
+import { GoogleGenAI } from '@google/genai';
 import { Zone } from '../types';
 
-export async function getIrrigationAdvice(
-  zone: Zone,
-  weatherCondition: string
-): Promise<string> {
-  // Service AI désactivé - retourne un conseil générique
+const API_BASE_URL = 'http://127.0.0.1:8000';
+const ADVISOR_MODEL = 'gemini-2.5-flash';
+
+// Résumé compact de /zones/{zone_id}/digest (seuls les champs utilisés ici)
+export interface ZoneDigest {
+  zone_id: string;
+  version: number;
+  soil_moisture: number | null;
+  position: 'sous_seuil' | 'dans_plage' | 'au_dessus' | null;
+  anomalies: string[];
+  text: string;
+}
+
+const SYSTEM_INSTRUCTION =
+  "Tu es l'assistant agronome de SmartIrrig. À partir du résumé d'une zone, donne en 2 ou 3 phrases " +
+  "un conseil d'irrigation concret en français, avec un emoji au début. Signale les capteurs suspects.";
+
+// Conseil générique, sans modèle (aucune clé ni serveur configuré, ou échec de l'appel)
+function ruleBasedAdvice(zone: Zone): string {
   const soilMoisture = zone.currentReading.soilMoisture10cm;
-  
+
   if (soilMoisture < 30) {
     return "🚨 Niveau d'humidité critique ! Irrigation immédiate recommandée pour éviter le stress hydrique de vos cultures.";
   } else if (soilMoisture < 50) {
@@ -17,3 +32,46 @@ export async function getIrrigationAdvice(
     return "✅ Conditions optimales ! Maintenez votre stratégie d'irrigation actuelle.";
   }
 }
+
+export async function fetchZoneDigest(zoneId: string): Promise<ZoneDigest | null> {
+  try {
+    const response = await fetch(`${API_BASE_URL}/zones/${encodeURIComponent(zoneId)}/digest`);
+    return response.ok ? await response.json() : null;
+  } catch (error) {
+    console.error('Résumé de zone indisponible:', error);
+    return null;
+  }
+}
+
+// Client du modèle : Gemini avec GEMINI_API_KEY, ou un serveur local compatible
+// (ADVISOR_MODEL_URL, ex: python tools/mock_model.py) pour tester sans clé
+function advisorClient(): GoogleGenAI | null {
+  const apiKey = process.env.GEMINI_API_KEY;
+  const baseUrl = process.env.ADVISOR_MODEL_URL;
+  if (!apiKey && !baseUrl) return null;
+  return new GoogleGenAI({ apiKey: apiKey || 'local', ...(baseUrl ? { httpOptions: { baseUrl } } : {}) });
+}
+
+export async function getIrrigationAdvice(
+  zone: Zone,
+  weatherCondition: string
+): Promise<string> {
+  const client = advisorClient();
+  if (!client) return ruleBasedAdvice(zone);
+
+  // Le résumé du backend remplace l'historique brut dans l'invite (quelques centaines de caractères)
+  const digest = await fetchZoneDigest(zone.id);
+  if (!digest) return ruleBasedAdvice(zone);
+
+  try {
+    const response = await client.models.generateContent({
+      model: ADVISOR_MODEL,
+      contents: `${digest.text} · météo affichée : ${weatherCondition}`,
+      config: { systemInstruction: SYSTEM_INSTRUCTION, maxOutputTokens: 200 },
+    });
+    return response.text?.trim() || ruleBasedAdvice(zone);
+  } catch (error) {
+    console.error('Assistant IA indisponible:', error);
+    return ruleBasedAdvice(zone);
+  }
+}
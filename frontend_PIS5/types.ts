@@ -6,6 +6,7 @@ export enum CropType {
 }
 
 export interface SensorData {
+  id?: string; // _id MongoDB des lectures du backend
   timestamp: number;
   moisture: number; // %
   temperature: number; // Celsius
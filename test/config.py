@@ -24,6 +24,7 @@ CONFIG_CULTURES = {
     'tomates': {
         'seuil_declenchement': 50,     # Déclenche si < 50%
         'seuil_arret': 80,             # Arrête si >= 80%
+        'kc': 1.15,                    # Coefficient cultural FAO-56 (mi-saison)
         'categorie': 'Légume-fruit',
         'consommation': 'Élevée 💧💧💧',
         'description': 'Besoin constant en eau, sensibles à la sécheresse'
@@ -31,6 +32,7 @@ CONFIG_CULTURES = {
     'concombres': {
         'seuil_declenchement': 55,
         'seuil_arret': 85,
+        'kc': 1.00,
         'categorie': 'Légume-fruit',
         'consommation': 'Très élevée 💧💧💧',
         'description': '90% d\'eau, besoin énorme et constant'
@@ -38,6 +40,7 @@ CONFIG_CULTURES = {
     'courgettes': {
         'seuil_declenchement': 50,
         'seuil_arret': 80,
+        'kc': 0.95,
         'categorie': 'Légume-fruit',
         'consommation': 'Élevée 💧💧💧',
         'description': 'Croissance rapide, besoin important'
@@ -45,6 +48,7 @@ CONFIG_CULTURES = {
     'poivrons': {
         'seuil_declenchement': 50,
         'seuil_arret': 75,
+        'kc': 1.05,
         'categorie': 'Légume-fruit',
         'consommation': 'Élevée 💧💧💧',
         'description': 'Besoin régulier, pas de stress hydrique'
@@ -54,6 +58,7 @@ CONFIG_CULTURES = {
     'salades': {
         'seuil_declenchement': 40,
         'seuil_arret': 70,
+        'kc': 1.00,
         'categorie': 'Légume-feuille',
         'consommation': 'Moyenne 💧💧',
         'description': 'Besoin régulier mais modéré'
@@ -61,6 +66,7 @@ CONFIG_CULTURES = {
     'epinards': {
         'seuil_declenchement': 40,
         'seuil_arret': 70,
+        'kc': 1.00,
         'categorie': 'Légume-feuille',
         'consommation': 'Moyenne 💧💧',
         'description': 'Préfère sol frais sans excès'
@@ -68,6 +74,7 @@ CONFIG_CULTURES = {
     'choux': {
         'seuil_declenchement': 45,
         'seuil_arret': 75,
+        'kc': 1.05,
         'categorie': 'Légume-feuille',
         'consommation': 'Moyenne 💧💧',
         'description': 'Besoin constant mais résiste mieux'
@@ -75,6 +82,7 @@ CONFIG_CULTURES = {
     'haricots': {
         'seuil_declenchement': 35,
         'seuil_arret': 65,
+        'kc': 1.05,
         'categorie': 'Légumineuse',
         'consommation': 'Moyenne 💧💧',
         'description': 'Fixe l\'azote, besoin modéré'
@@ -84,6 +92,7 @@ CONFIG_CULTURES = {
     'carottes': {
         'seuil_declenchement': 30,
         'seuil_arret': 60,
+        'kc': 1.05,
         'categorie': 'Légume-racine',
         'consommation': 'Faible 💧',
         'description': 'Racines profondes, résiste à la sécheresse'
@@ -91,6 +100,7 @@ CONFIG_CULTURES = {
     'oignons': {
         'seuil_declenchement': 25,
         'seuil_arret': 55,
+        'kc': 1.05,
         'categorie': 'Légume-bulbe',
         'consommation': 'Faible 💧',
         'description': 'Éviter l\'excès d\'eau (pourriture)'
@@ -98,6 +108,7 @@ CONFIG_CULTURES = {
     'ail': {
         'seuil_declenchement': 20,
         'seuil_arret': 50,
+        'kc': 1.00,
         'categorie': 'Légume-bulbe',
         'consommation': 'Très faible 💧',
         'description': 'Craint l\'excès d\'eau, préfère sec'
@@ -105,6 +116,7 @@ CONFIG_CULTURES = {
     'pommes_de_terre': {
         'seuil_declenchement': 30,
         'seuil_arret': 60,
+        'kc': 1.15,
         'categorie': 'Légume-tubercule',
         'consommation': 'Faible 💧',
         'description': 'Besoin modéré, éviter engorgement'
@@ -0,0 +1,230 @@
+"""
+Simulateur de champ en grille : humidité du sol de zones voisines qui
+échangent de l'eau, sur trois profondeurs (10, 30, 60 cm).
+
+Contrairement à CapteurHumidite (une sonde isolée), chaque cellule de la
+grille est une zone ; à chaque pas, des opérations NumPy vectorisées
+(pochoir à 5 points) calculent :
+- l'écoulement latéral entre cellules voisines (diffusion, bords étanches,
+  conductivité propre à chaque cellule) ;
+- l'infiltration entre couches (diffusion + drainage gravitaire au-dessus
+  de la capacité au champ) et le drainage profond sous 60 cm ;
+- la pluie et l'irrigation en surface, l'évapotranspiration FAO-56
+  (ET0 × Kc de chaque cellule, comme CapteurHumidite, réduite en profondeur).
+
+Les flux sont conservatifs (ce qui sort d'une cellule entre dans sa
+voisine) ; le pas est découpé en sous-pas stables.
+
+    python field_grid.py --taille 1000 --pas 20
+    python field_grid.py --taille 50 --envoyer 16 --url http://127.0.0.1:8000/send-data
+"""
+import argparse
+import math
+import random
+import time
+
+import numpy as np
+
+from config import CONFIG_SIMULATION, obtenir_seuils_culture
+from sensors import (
+    EPAISSEUR_SURFACE_MM, CapteurHumiditeAir, CapteurLumiere, CapteurPluie, CapteurTemperature, CapteurVent,
+    moisture_loss_per_hour, reference_et
+)
+
+PROFONDEURS = ("10cm", "30cm", "60cm")
+# Humidité minimale (%) par couche, comme CapteurHumidite
+HUMIDITE_MIN = np.array([15.0, 25.0, 35.0], dtype=np.float32)
+# Capacité au champ (%) : au-delà, l'eau draine vers la couche inférieure
+CAPACITE_CHAMP = np.array([70.0, 75.0, 80.0], dtype=np.float32)
+# Part de l'évaporation subie par chaque couche (50 % de moins à 30 cm, 70 % à 60 cm)
+FACTEUR_EVAPORATION = np.array([1.0, 0.5, 0.3], dtype=np.float32)
+# Apport de pluie en surface (%/h) selon l'intensité de CapteurPluie
+PLUIE_PAR_HEURE = {"légère": 5.0, "modérée": 10.0, "forte": 18.0}
+INTENSITES = {"légère": "light", "modérée": "moderate", "forte": "heavy"}
+
+# Coefficients par heure (fraction de l'écart échangée)
+DIFFUSION_LATERALE = 0.05
+DIFFUSION_VERTICALE = 0.10
+DRAINAGE_GRAVITAIRE = 0.20
+DRAINAGE_PROFOND = 0.02
+IRRIGATION_PAR_HEURE = 10.0  # %/h en surface sous une vanne ouverte
+# Plus grande fraction échangée par une cellule à chaque sous-pas, toutes faces confondues
+# (schéma explicite stable tant qu'elle reste sous 1)
+FRACTION_MAX_SOUS_PAS = 0.4
+# Bornes de la conductivité relative (évite qu'une cellule extrême impose des sous-pas à toute la grille)
+CONDUCTIVITE_BORNES = (0.2, 3.0)
+
+
+class GrilleSol:
+    """Humidité (%) de `lignes × colonnes` zones sur trois couches."""
+
+    def __init__(self, lignes, colonnes, humidite_initiale=(65.0, 70.0, 75.0), heterogeneite=0.3, graine=None, kc=1.0):
+        self.lignes = lignes
+        self.colonnes = colonnes
+        rng = np.random.default_rng(graine)
+        self.humidite = np.empty((3, lignes, colonnes), dtype=np.float32)
+        for couche, valeur in enumerate(humidite_initiale):
+            self.humidite[couche] = valeur
+        # Conductivité relative de chaque cellule (sol plus ou moins filtrant)
+        self.conductivite = np.clip(
+            rng.lognormal(0.0, heterogeneite, (lignes, colonnes)), *CONDUCTIVITE_BORNES
+        ).astype(np.float32)
+        self.conductivite_max = float(self.conductivite.max())
+        # Conductivité d'une face = moyenne harmonique des deux cellules
+        c = self.conductivite
+        self.conductivite_x = (2 * c[:, 1:] * c[:, :-1] / (c[:, 1:] + c[:, :-1])).astype(np.float32)
+        self.conductivite_y = (2 * c[1:, :] * c[:-1, :] / (c[1:, :] + c[:-1, :])).astype(np.float32)
+        # Coefficient cultural : un scalaire pour tout le champ ou une valeur par cellule
+        self.kc = np.float32(kc) if np.ndim(kc) == 0 else np.asarray(kc, dtype=np.float32).reshape(lignes, colonnes)
+        self.irrigation = np.zeros((lignes, colonnes), dtype=bool)
+        self.temps_heures = 0.0
+        self.meteo = {"temperature": 25.0, "lumiere": 0.0, "vent": 8.0, "humidite_air": 60.0,
+                      "pluie": False, "intensite": None}
+        # Tampons réutilisés à chaque sous-pas (pas d'allocation dans la boucle)
+        self._flux_x = np.empty((3, lignes, colonnes - 1), dtype=np.float32)
+        self._flux_y = np.empty((3, lignes - 1, colonnes), dtype=np.float32)
+        self._flux_z = np.empty((lignes, colonnes), dtype=np.float32)
+        self._exces = np.empty((lignes, colonnes), dtype=np.float32)
+        self._min = HUMIDITE_MIN[:, None, None]
+
+    def irriguer(self, lignes, colonnes, active=True):
+        """Ouvre ou ferme les vannes des cellules données (indices ou tranches)."""
+        self.irrigation[lignes, colonnes] = active
+
+    def pas(self, duree_heures, temperature, lumiere, vitesse_vent, pluie=False, intensite=None, humidite_air=60.0):
+        """Avance la simulation de `duree_heures` avec une météo uniforme sur le champ."""
+        self.meteo = {"temperature": temperature, "lumiere": lumiere, "vent": vitesse_vent,
+                      "humidite_air": humidite_air, "pluie": pluie, "intensite": intensite}
+        # Couche de 30 cm : deux faces verticales, plus les quatre faces latérales
+        taux_max = (4 * DIFFUSION_LATERALE + 2 * (DIFFUSION_VERTICALE + DRAINAGE_GRAVITAIRE)) * self.conductivite_max
+        sous_pas = max(1, math.ceil(duree_heures * taux_max / FRACTION_MAX_SOUS_PAS))
+        dt = duree_heures / sous_pas
+
+        et0 = reference_et(temperature, humidite_air, lumiere, vitesse_vent)
+        evaporation = self.kc * np.float32(moisture_loss_per_hour(et0, EPAISSEUR_SURFACE_MM) * dt)
+        evaporation_couches = FACTEUR_EVAPORATION[:, None, None] * evaporation
+        apport_pluie = PLUIE_PAR_HEURE.get(intensite, 5.0) * dt if pluie else 0.0
+        apport_irrigation = np.float32(IRRIGATION_PAR_HEURE * dt)
+        # Coefficients du sous-pas, calculés une fois par pas
+        echange_x = self.conductivite_x * np.float32(DIFFUSION_LATERALE * dt)
+        echange_y = self.conductivite_y * np.float32(DIFFUSION_LATERALE * dt)
+        echange_z = self.conductivite * np.float32(dt)
+        drainage_profond = self.conductivite * np.float32(DRAINAGE_PROFOND * dt)
+
+        h = self.humidite
+        for _ in range(sous_pas):
+            # Surface : pluie, irrigation, évaporation (réduite en profondeur)
+            if apport_pluie:
+                h[0] += apport_pluie
+            np.add(h[0], apport_irrigation, out=h[0], where=self.irrigation)
+            h -= evaporation_couches
+
+            # Écoulement latéral : flux aux faces, bords étanches
+            np.subtract(h[:, :, 1:], h[:, :, :-1], out=self._flux_x)
+            self._flux_x *= echange_x
+            h[:, :, :-1] += self._flux_x
+            h[:, :, 1:] -= self._flux_x
+            np.subtract(h[:, 1:, :], h[:, :-1, :], out=self._flux_y)
+            self._flux_y *= echange_y
+            h[:, :-1, :] += self._flux_y
+            h[:, 1:, :] -= self._flux_y
+
+            # Infiltration entre couches : diffusion + drainage au-dessus de la capacité au champ
+            for couche in range(2):
+                haut, bas = h[couche], h[couche + 1]
+                np.subtract(haut, bas, out=self._flux_z)
+                self._flux_z *= np.float32(DIFFUSION_VERTICALE)
+                np.subtract(haut, CAPACITE_CHAMP[couche], out=self._exces)
+                np.maximum(self._exces, 0, out=self._exces)
+                self._exces *= np.float32(DRAINAGE_GRAVITAIRE)
+                self._flux_z += self._exces
+                self._flux_z *= echange_z
+                haut -= self._flux_z
+                bas += self._flux_z
+            # Drainage profond sous 60 cm
+            np.subtract(h[2], CAPACITE_CHAMP[2], out=self._exces)
+            np.maximum(self._exces, 0, out=self._exces)
+            self._exces *= drainage_profond
+            h[2] -= self._exces
+
+            np.clip(h, self._min, 100.0, out=h)
+        self.temps_heures += duree_heures
+
+    def lectures(self, lignes, colonnes, prefixe="cellule"):
+        """Lectures au format de /send-data pour les cellules (lignes[i], colonnes[i])."""
+        lignes = np.asarray(lignes, dtype=np.intp)
+        colonnes = np.asarray(colonnes, dtype=np.intp)
+        valeurs = np.round(self.humidite[:, lignes, colonnes].astype(np.float64), 1)
+        irrigation = self.irrigation[lignes, colonnes]
+        meteo = self.meteo
+        return [
+            {
+                "zone_id": f"{prefixe}-{ligne}-{colonne}",
+                "humidity": meteo["humidite_air"],
+                "temperature": meteo["temperature"],
+                "soil_moisture": float(valeurs[0, i]),
+                "soil_moisture_10cm": float(valeurs[0, i]),
+                "soil_moisture_30cm": float(valeurs[1, i]),
+                "soil_moisture_60cm": float(valeurs[2, i]),
+                "light": meteo["lumiere"],
+                "wind_speed": meteo["vent"],
+                "rainfall": meteo["pluie"],
+                "rainfall_intensity": INTENSITES.get(meteo["intensite"], "none") if meteo["pluie"] else "none",
+                "pump_was_active": bool(irrigation[i]),
+            }
+            for i, (ligne, colonne) in enumerate(zip(lignes.tolist(), colonnes.tolist()))
+        ]
+
+    def eau_totale(self):
+        """Somme de l'humidité de toutes les cellules et couches (contrôle de conservation)."""
+        return float(self.humidite.sum(dtype=np.float64))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--taille", type=int, default=1000, help="côté de la grille (cellules)")
+    parser.add_argument("--pas", type=int, default=20, help="nombre de pas simulés")
+    parser.add_argument("--heures-par-pas", type=float, default=1.0)
+    parser.add_argument("--envoyer", type=int, default=0, help="cellules tirées au hasard envoyées au backend à chaque pas")
+    parser.add_argument("--url", default="http://127.0.0.1:8000/send-data")
+    parser.add_argument("--saison", default="ete")
+    parser.add_argument("--culture", default=CONFIG_SIMULATION['type_culture'], help="culture simulée (Kc FAO-56)")
+    parser.add_argument("--graine", type=int, default=None)
+    args = parser.parse_args()
+
+    grille = GrilleSol(args.taille, args.taille, graine=args.graine, kc=obtenir_seuils_culture(args.culture)['kc'])
+    temperature, lumiere, vent, pluie = CapteurTemperature(), CapteurLumiere(), CapteurVent(), CapteurPluie()
+    air = CapteurHumiditeAir()
+    rng = random.Random(args.graine)
+    cellules = [(rng.randrange(args.taille), rng.randrange(args.taille)) for _ in range(args.envoyer)]
+    if cellules:
+        import requests
+
+    print(f"🌱 Grille {args.taille}×{args.taille} × {len(PROFONDEURS)} couches "
+          f"({grille.humidite.nbytes / 1e6:.0f} Mo), {args.pas} pas de {args.heures_par_pas:g} h")
+    durees = []
+    for numero in range(args.pas):
+        heure = grille.temps_heures % 24
+        pleut, intensite = pluie.simuler()
+        debut = time.perf_counter()
+        grille.pas(args.heures_par_pas, temperature.simuler(heure, args.saison), lumiere.simuler(heure),
+                   vent.simuler(), pleut, intensite, air.simuler(args.saison, pleut))
+        durees.append(time.perf_counter() - debut)
+
+        for lecture in grille.lectures([l for l, _ in cellules], [c for _, c in cellules]):
+            reponse = requests.post(args.url, json=lecture, timeout=5)
+            if reponse.status_code == 200:
+                ligne, colonne = map(int, lecture["zone_id"].rsplit("-", 2)[1:])
+                grille.irriguer(ligne, colonne, reponse.json()["pump"])
+            else:
+                print(f"⚠️  {lecture['zone_id']}: HTTP {reponse.status_code}")
+
+        couches = [f"{grille.humidite[k].mean():.1f}%" for k in range(3)]
+        print(f"⏰ {heure:02.0f}h | humidité moyenne {' / '.join(couches)} "
+              f"| {'🌧️ ' if pleut else ''}pas {durees[-1] * 1000:.1f} ms")
+
+    durees.sort()
+    print("=" * 60)
+    print(f"⏱️  Pas médian: {durees[len(durees) // 2] * 1000:.1f} ms | max: {durees[-1] * 1000:.1f} ms "
+          f"| {1 / durees[len(durees) // 2]:.1f} pas/s")
+    print("=" * 60)
@@ -1,17 +1,19 @@
 import time
 import random
-from sensors import CapteurHumidite, CapteurTemperature, CapteurLumiere, CapteurPluie, CapteurVent, CapteurDebitEau
+from sensors import CapteurHumidite, CapteurHumiditeAir, CapteurTemperature, CapteurLumiere, CapteurPluie, CapteurVent, CapteurDebitEau
 from config import CONFIG_SIMULATION, CONFIG_CAPTEURS, SIMULATION_CONFIG, SENSOR_CONFIG, CONFIG_SAISONNIER, CONFIG_CULTURES, obtenir_seuils_saison, obtenir_seuils_culture, obtenir_seuils_intelligents
 from utils import obtenir_statut_systeme
 
 print("🌱 SmartIrrig - Système d'Irrigation Ultra-Intelligent")
 print("✅ Initialisation des capteurs...\n")
 
-# Initialisation des capteurs
+# Initialisation des capteurs (Kc de la culture simulée)
+kc = obtenir_seuils_culture(CONFIG_SIMULATION['type_culture'])['kc']
 capteurs = {
-    'humidite_10cm': CapteurHumidite(65, "10cm"),
-    'humidite_30cm': CapteurHumidite(70, "30cm"),
-    'humidite_60cm': CapteurHumidite(75, "60cm"),
+    'humidite_10cm': CapteurHumidite(65, "10cm", kc),
+    'humidite_30cm': CapteurHumidite(70, "30cm", kc),
+    'humidite_60cm': CapteurHumidite(75, "60cm", kc),
+    'humidite_air': CapteurHumiditeAir(),
     'temperature': CapteurTemperature(),
     'lumiere': CapteurLumiere(),
     'pluie': CapteurPluie(),
@@ -50,6 +52,7 @@ while True:
     # Simulation capteurs
     temperature = capteurs['temperature'].simuler(heure_actuelle, saison)
     lumiere = capteurs['lumiere'].simuler(heure_actuelle)
+    humidite_air = capteurs['humidite_air'].simuler(saison, pleut)
     
     # Vérifier AVANT si on doit irriguer
     # Critères pour DÉCLENCHER l'irrigation (adapté à la culture ET saison)
@@ -76,16 +79,16 @@ while True:
             est_en_irrigation = False
     
     # MAINTENANT on simule AVEC le bon état d'irrigation
-    humidite_10cm = capteurs['humidite_10cm'].simuler(300, temperature, lumiere, vitesse_vent, est_en_irrigation, pleut)
-    humidite_30cm = capteurs['humidite_30cm'].simuler(300, temperature, lumiere, vitesse_vent, est_en_irrigation, pleut)
-    humidite_60cm = capteurs['humidite_60cm'].simuler(300, temperature, lumiere, vitesse_vent, est_en_irrigation, pleut)
+    humidite_10cm = capteurs['humidite_10cm'].simuler(300, temperature, lumiere, vitesse_vent, est_en_irrigation, pleut, humidite_air)
+    humidite_30cm = capteurs['humidite_30cm'].simuler(300, temperature, lumiere, vitesse_vent, est_en_irrigation, pleut, humidite_air)
+    humidite_60cm = capteurs['humidite_60cm'].simuler(300, temperature, lumiere, vitesse_vent, est_en_irrigation, pleut, humidite_air)
     
     # Simulation eau
     debit, eau_totale = capteurs['debit_eau'].simuler(est_en_irrigation)
     
     # Affichage
     print(f"⏰ {int(heure_actuelle):02d}:00 | 💧 Humidité 10cm: {humidite_10cm}% | 🌡️ Temp: {temperature:.1f}°C")
-    print(f"☀️  Lux: {lumiere} | 🌬️ Vent: {vitesse_vent} km/h | 🌧️ Pluie: {'Oui' if pleut else 'Non'}")
+    print(f"☀️  Lux: {lumiere} | 🌬️ Vent: {vitesse_vent} km/h | 🌧️ Pluie: {'Oui' if pleut else 'Non'} | 💨 Air: {humidite_air}%")
     print(f"💦 Irrigation: {'ACTIVE' if est_en_irrigation else 'INACTIVE'} | Débit: {debit:.1f} L/min")
     print(f"📊 Statut: {obtenir_statut_systeme(humidite_10cm)}")
     print("-" * 50)
@@ -1,16 +1,52 @@
 import random
 import math
 
+# Durée simulée d'un appel à CapteurHumidite.simuler (h)
+HEURES_PAR_PAS = 1.0
+# Épaisseur de sol représentée par la sonde de surface (mm) : 1 mm d'ETc ≈ 1 % d'humidité
+EPAISSEUR_SURFACE_MM = 100.0
+
+# Évapotranspiration de référence FAO-56 (Penman-Monteith horaire) : mêmes
+# formules et constantes que backend/evapotranspiration.py, sans les tables NumPy
+ALTITUDE_M = 100
+RAPPORT_CIEL_CLAIR = 0.8
+LUX_PAR_WM2 = 120.0
+ALBEDO = 0.23
+PSYCHROMETRIQUE = 0.000665 * 101.3 * ((293 - 0.0065 * ALTITUDE_M) / 293) ** 5.26  # kPa/°C
+
+
+def reference_et(temperature, humidite_air, lumiere, vitesse_vent):
+    """ET0 horaire (mm/h) à partir des capteurs : °C, % d'humidité de l'air, lux, km/h"""
+    es = 0.6108 * math.exp(17.27 * temperature / (temperature + 237.3))
+    delta = 4098 * es / (temperature + 237.3) ** 2
+    ea = es * max(0.0, min(100.0, humidite_air)) / 100
+    u2 = max(vitesse_vent, 0.0) / 3.6
+
+    rs = max(lumiere, 0.0) * 0.0036 / LUX_PAR_WM2
+    rnl = 2.043e-10 * (temperature + 273.16) ** 4 * (0.34 - 0.14 * math.sqrt(ea)) * (1.35 * RAPPORT_CIEL_CLAIR - 0.35)
+    rn = (1 - ALBEDO) * rs - rnl
+    g = (0.1 if rs > 0 else 0.5) * rn
+
+    numerateur = 0.408 * delta * (rn - g) + PSYCHROMETRIQUE * 37 / (temperature + 273) * u2 * (es - ea)
+    return max(numerateur / (delta + PSYCHROMETRIQUE * (1 + 0.34 * u2)), 0.0)
+
+
+def moisture_loss_per_hour(etc_mm_h, epaisseur_mm):
+    """Baisse d'humidité du sol (points de %/h) causée par une ETc en mm/h"""
+    return etc_mm_h / epaisseur_mm * 100.0
+
 class CapteurHumidite:
     """Capteur d'humidité du sol à différentes profondeurs"""
-    def __init__(self, humidite_initiale, profondeur):
+    def __init__(self, humidite_initiale, profondeur, kc=1.0):
         self.humidite = humidite_initiale
         self.profondeur = profondeur
+        self.kc = kc  # Coefficient cultural FAO-56 de la culture simulée
         self.temps_derniere_irrigation = 0
         
-    def simuler(self, temps_ecoule, temperature, lumiere, vitesse_vent, est_en_irrigation, pleut):
-        # Évaporation basée sur la température, lumière et vent
-        taux_evaporation = (temperature - 15) * 0.1 + lumiere * 0.0001 + vitesse_vent * 0.05
+    def simuler(self, temps_ecoule, temperature, lumiere, vitesse_vent, est_en_irrigation, pleut, humidite_air=60):
+        # Évapotranspiration FAO-56 (température, humidité de l'air, lumière, vent) × Kc
+        etc = reference_et(temperature, humidite_air, lumiere, vitesse_vent) * self.kc
+        taux_evaporation = moisture_loss_per_hour(etc, EPAISSEUR_SURFACE_MM) * HEURES_PAR_PAS
         
         # Réduire l'évaporation en profondeur (le sol profond garde mieux l'eau)
         if self.profondeur == "30cm":
@@ -132,6 +168,23 @@ class CapteurVent:
         vitesse_vent = self.vent_base + random.uniform(-3, 8)
         return round(max(0, vitesse_vent), 1)
 
+class CapteurHumiditeAir:
+    """Capteur d'humidité de l'air (%) : plus sec en été, plus humide sous la pluie"""
+    def simuler(self, saison, pleut):
+        base = {
+            'printemps': 60,
+            'ete': 45,
+            'automne': 70,
+            'hiver': 80
+        }.get(saison, 60)
+        
+        if pleut:
+            humidite_air = base + random.uniform(15, 30)
+        else:
+            humidite_air = base + random.uniform(-10, 10)
+            
+        return round(max(20, min(100, humidite_air)), 1)
+
 class CapteurDebitEau:
     """Capteur de débit d'eau pour l'irrigation"""
     def __init__(self):
@@ -1,9 +1,8 @@
 import time
 import requests
-import random
 import math
-from sensors import CapteurHumidite, CapteurTemperature, CapteurLumiere, CapteurPluie, CapteurVent, CapteurDebitEau
-from config import CONFIG_SIMULATION, CONFIG_CAPTEURS
+from sensors import CapteurHumidite, CapteurHumiditeAir, CapteurTemperature, CapteurLumiere, CapteurPluie, CapteurVent, CapteurDebitEau
+from config import CONFIG_SIMULATION, CONFIG_CAPTEURS, obtenir_seuils_culture
 
 # Configuration de l'API backend
 BACKEND_URL = "http://127.0.0.1:8000/send-data"
@@ -13,11 +12,13 @@ print("=" * 60)
 print("📡 Connexion au backend:", BACKEND_URL)
 print("=" * 60)
 
-# Initialisation des capteurs
+# Initialisation des capteurs (Kc de la culture simulée)
+kc = obtenir_seuils_culture(CONFIG_SIMULATION['type_culture'])['kc']
 capteurs = {
-    'humidite_10cm': CapteurHumidite(65, "10cm"),
-    'humidite_30cm': CapteurHumidite(70, "30cm"),
-    'humidite_60cm': CapteurHumidite(75, "60cm"),
+    'humidite_10cm': CapteurHumidite(65, "10cm", kc),
+    'humidite_30cm': CapteurHumidite(70, "30cm", kc),
+    'humidite_60cm': CapteurHumidite(75, "60cm", kc),
+    'humidite_air': CapteurHumiditeAir(),
     'temperature': CapteurTemperature(),
     'lumiere': CapteurLumiere(),
     'pluie': CapteurPluie(),
@@ -46,35 +47,20 @@ try:
         temperature = capteurs['temperature'].simuler(heure_actuelle, saison)
         lumiere = capteurs['lumiere'].simuler(heure_actuelle)
         
+        humidite_air = capteurs['humidite_air'].simuler(saison, pleut)
+        
         # Simulation humidité du sol (3 profondeurs)
         # IMPORTANT : Utiliser l'état de la pompe reçu du backend
         humidite_10cm = capteurs['humidite_10cm'].simuler(
-            300, temperature, lumiere, vitesse_vent, irrigation_active, pleut
+            300, temperature, lumiere, vitesse_vent, irrigation_active, pleut, humidite_air
         )
         humidite_30cm = capteurs['humidite_30cm'].simuler(
-            300, temperature, lumiere, vitesse_vent, irrigation_active, pleut
+            300, temperature, lumiere, vitesse_vent, irrigation_active, pleut, humidite_air
         )
         humidite_60cm = capteurs['humidite_60cm'].simuler(
-            300, temperature, lumiere, vitesse_vent, irrigation_active, pleut
+            300, temperature, lumiere, vitesse_vent, irrigation_active, pleut, humidite_air
         )
         
-        # Calculer l'humidité de l'air (simulation basique)
-        # En été : plus sec, En hiver : plus humide
-        humidite_air_base = {
-            'printemps': 60,
-            'ete': 45,
-            'automne': 70,
-            'hiver': 80
-        }.get(saison, 60)
-        
-        # Ajustement selon la pluie
-        if pleut:
-            humidite_air = min(100, humidite_air_base + random.uniform(15, 30))
-        else:
-            humidite_air = humidite_air_base + random.uniform(-10, 10)
-        
-        humidite_air = round(max(20, min(100, humidite_air)), 1)
-        
         # Déterminer l'intensité de la pluie
         intensite_pluie_str = 'none'
         if pleut: